@@ -95,12 +95,17 @@ def build_parser():
     parser.add_argument('--cudnn_benchmark', type=strtobool, default=True,
                         help='use CuDNN benchmark mode')
     parser.add_argument("--train_dtype", default="float32",
-                        choices=["float16", "float32", "float64", "O0", "O1", "O2", "O3"],
-                        help="Data type for training")
+                        choices=["float16", "float32", "float64", "O0", "O1", "O2", "O3",
+                                 "autocast_float16", "autocast_bfloat16"],
+                        help="Data type for training (O0-O3: apex, autocast_*: native mixed precision)")
+    parser.add_argument('--activation_checkpointing', type=int, default=0,
+                        help='recompute activations in backward every N layers of Transformer/Conformer encoder and decoder (0: disabled)')
     parser.add_argument('--model_save_dir', type=str, default=False,
                         help='directory to save a model')
     parser.add_argument('--resume', type=str, default=False, nargs='?',
                         help='model path to resume training')
+    parser.add_argument('--async_checkpoint', type=strtobool, default=False,
+                        help='serialize checkpoints in a background thread')
     parser.add_argument('--job_name', type=str, default=False,
                         help='job name')
     parser.add_argument('--stdout', type=strtobool, default=False,
@@ -212,6 +217,10 @@ def build_parser():
                         help='epoch to converto to SGD fine-tuning')
     parser.add_argument('--print_step', type=int, default=200,
                         help='print log per this value')
+    parser.add_argument('--profile_start_step', type=int, default=0,
+                        help='step to start the PyTorch profiler (0: disabled)')
+    parser.add_argument('--profile_n_steps', type=int, default=5,
+                        help='number of steps to run the PyTorch profiler')
     parser.add_argument('--metric', type=str, default='edit_distance',
                         choices=['edit_distance', 'loss', 'accuracy', 'ppl', 'bleu', 'mse'],
                         help='metric for evaluation during training')
@@ -258,6 +267,8 @@ def build_parser():
     # regularization
     parser.add_argument('--clip_grad_norm', type=float, default=5.0,
                         help='')
+    parser.add_argument('--ema_decay', type=float, default=0.0,
+                        help='decay rate for exponential moving average of parameters (0 disables)')
     parser.add_argument('--dropout_in', type=float, default=0.0,
                         help='dropout probability for the input')
     parser.add_argument('--dropout_enc', type=float, default=0.0,
@@ -344,6 +355,10 @@ def build_parser():
                         help='Teacher ASR model for knowledge distillation')
     parser.add_argument('--teacher_lm', default=False, nargs='?',
                         help='Teacher LM for knowledge distillation')
+    parser.add_argument('--teacher_logit_cache', default=False, nargs='?',
+                        help='directory of teacher logits precomputed by cache_teacher_logits.py')
+    parser.add_argument('--teacher_logit_topk', type=int, default=8,
+                        help='number of teacher logits to cache per output position')
     parser.add_argument('--distillation_weight', type=float, default=0.1,
                         help='soft label weight for knowledge distillation')
     # special label
@@ -402,7 +417,7 @@ def build_parser():
     parser.add_argument('--recog_ctc_weight', type=float, default=0.0,
                         help='weight of CTC score')
     parser.add_argument('--recog_lm', type=str, default=False, nargs='?',
-                        help='path to first path LM for shallow fusion')
+                        help='path to first path LM for shallow fusion (ARPA n-gram LM if ending with .arpa or .arpa.gz)')
     parser.add_argument('--recog_lm_second', type=str, default=False, nargs='?',
                         help='path to second path LM for rescoring')
     parser.add_argument('--recog_lm_bwd', type=str, default=False, nargs='?',
@@ -419,10 +434,27 @@ def build_parser():
                         help='carry over ASR decoder state')
     parser.add_argument('--recog_lm_state_carry_over', type=strtobool, default=False,
                         help='carry over LM state')
+    parser.add_argument('--recog_lm_state_cache_size', type=int, default=500,
+                        help='maximum number of token prefixes whose RNNLM states are cached for shallow fusion')
+    parser.add_argument('--recog_shortlist_freq', type=int, default=0,
+                        help='number of the most frequent tokens (the head of the dictionary) in the vocabulary shortlist '
+                        '(shortlisting is disabled if both this and --recog_shortlist_ctc_topk are 0)')
+    parser.add_argument('--recog_shortlist_ctc_topk', type=int, default=0,
+                        help='number of CTC candidates per frame added to the vocabulary shortlist '
+                        '(used with --recog_ctc_weight > 0)')
+    parser.add_argument('--recog_shortlist_lm_topk', type=int, default=0,
+                        help='number of LM candidates per hypothesis added to the vocabulary shortlist at each step. '
+                        'The LM output layer is also shortlisted if 0')
+    parser.add_argument('--recog_shortlist_backoff', type=float, default=-1e10,
+                        help='log-probability of tokens out of the vocabulary shortlist')
+    parser.add_argument('--recog_shortlist_max_ratio', type=float, default=0.5,
+                        help='fall back to the full softmax when the shortlist covers more than this ratio of the vocabulary')
     parser.add_argument('--recog_softmax_smoothing', type=float, default=1.0,
                         help='softmax smoothing (beta) for diverse hypothesis generation')
     parser.add_argument('--recog_wordlm', type=strtobool, default=False,
-                        help='')
+                        help='fuse the word-level LM with character/word-piece decoders via look-ahead')
+    parser.add_argument('--recog_use_ema', type=strtobool, default=False,
+                        help='use exponential moving average of parameters saved in the checkpoint')
     parser.add_argument('--recog_n_average', type=int, default=1,
                         help='number of models for the model averaging of Transformer')
     parser.add_argument('--recog_streaming', type=strtobool, default=False,
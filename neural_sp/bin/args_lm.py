@@ -72,12 +72,15 @@ def build_parser():
     parser.add_argument('--cudnn_benchmark', type=strtobool, default=True,
                         help='use CuDNN benchmark mode')
     parser.add_argument("--train_dtype", default="float32",
-                        choices=["float16", "float32", "float64", "O0", "O1", "O2", "O3"],
-                        help="Data type for training")
+                        choices=["float16", "float32", "float64", "O0", "O1", "O2", "O3",
+                                 "autocast_float16", "autocast_bfloat16"],
+                        help="Data type for training (O0-O3: apex, autocast_*: native mixed precision)")
     parser.add_argument('--model_save_dir', type=str, default=False,
                         help='directory to save a model')
     parser.add_argument('--resume', type=str, default=False, nargs='?',
                         help='model path to resume training')
+    parser.add_argument('--async_checkpoint', type=strtobool, default=False,
+                        help='serialize checkpoints in a background thread')
     parser.add_argument('--job_name', type=str, default=False,
                         help='job name')
     parser.add_argument('--stdout', type=strtobool, default=False,
@@ -125,6 +128,11 @@ def build_parser():
                         help='mini-batch size')
     parser.add_argument('--bptt', type=int, default=200,
                         help='BPTT length')
+    parser.add_argument('--sentence_batching', type=strtobool, default=False, nargs='?',
+                        help='make mini-batches of sentences of similar lengths instead of BPTT windows')
+    parser.add_argument('--max_n_tokens', type=int, default=0,
+                        help='maximum number of tokens including padding in a mini-batch '
+                        'for sentence_batching (0: no limit)')
     parser.add_argument('--optimizer', type=str, default='adam',
                         choices=['adam', 'adadelta', 'adagrad', 'sgd', 'momentum', 'nesterov', 'noam'],
                         help='type of optimizer')
@@ -169,6 +177,8 @@ def build_parser():
     # regularization
     parser.add_argument('--clip_grad_norm', type=float, default=5.0,
                         help='')
+    parser.add_argument('--ema_decay', type=float, default=0.0,
+                        help='decay rate for exponential moving average of parameters (0 disables)')
     parser.add_argument('--dropout_in', type=float, default=0.0,
                         help='dropout probability for the input embedding layer')
     parser.add_argument('--dropout_hidden', type=float, default=0.0,
@@ -201,6 +211,8 @@ def build_parser():
                         help='directory to save decoding results')
     parser.add_argument('--recog_batch_size', type=int, default=1,
                         help='size of mini-batch in evaluation')
+    parser.add_argument('--recog_use_ema', type=strtobool, default=False,
+                        help='use exponential moving average of parameters saved in the checkpoint')
     parser.add_argument('--recog_n_average', type=int, default=5,
                         help='number of models for the model averaging of Transformer')
     parser.add_argument('--recog_n_caches', type=int, default=0,
@@ -0,0 +1,105 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Precompute teacher logits over the training set for knowledge distillation."""
+
+import argparse
+import copy
+import logging
+import os
+import sys
+import torch
+from tqdm import tqdm
+
+from neural_sp.bin.args_asr import parse_args_train
+from neural_sp.bin.train_utils import (
+    compute_susampling_factor,
+    load_checkpoint,
+    load_config,
+    set_logger
+)
+from neural_sp.datasets.asr import Dataset
+from neural_sp.datasets.teacher_cache import TeacherLogitWriter
+from neural_sp.models.lm.build import build_lm
+from neural_sp.models.seq2seq.speech2text import Speech2Text
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+
+    args = parse_args_train(sys.argv[1:])
+    args_teacher = copy.deepcopy(args)
+    assert args.teacher_logit_cache, 'Set --teacher_logit_cache.'
+    assert args.teacher or args.teacher_lm, 'Set --teacher or --teacher_lm.'
+
+    os.makedirs(args.teacher_logit_cache, exist_ok=True)
+    set_logger(os.path.join(args.teacher_logit_cache, 'cache.log'), stdout=args.stdout)
+
+    # Load the teacher ASR model
+    teacher, teacher_lm = None, None
+    if args.teacher:
+        assert os.path.isfile(args.teacher), 'There is no checkpoint.'
+        conf_teacher = load_config(os.path.join(os.path.dirname(args.teacher), 'conf.yml'))
+        for k, v in conf_teacher.items():
+            setattr(args_teacher, k, v)
+        args_teacher.ss_prob = 0
+        teacher = Speech2Text(args_teacher)
+        load_checkpoint(args.teacher, teacher)
+        teacher.eval()
+        if args.n_gpus >= 1:
+            teacher.cuda()
+
+    # Load the teacher LM
+    if args.teacher_lm:
+        assert os.path.isfile(args.teacher_lm), 'There is no checkpoint.'
+        conf_lm = load_config(os.path.join(os.path.dirname(args.teacher_lm), 'conf.yml'))
+        args_lm = argparse.Namespace()
+        for k, v in conf_lm.items():
+            setattr(args_lm, k, v)
+        teacher_lm = build_lm(args_lm)
+        load_checkpoint(args.teacher_lm, teacher_lm)
+        teacher_lm.eval()
+        if args.n_gpus >= 1:
+            teacher_lm.cuda()
+
+    # Load dataset
+    # NOTE: utterances are filtered in the same way as in training
+    args = compute_susampling_factor(args)
+    train_set = Dataset(corpus=args.corpus,
+                        tsv_path=args.train_set,
+                        dict_path=args.dict,
+                        nlsyms=args.nlsyms,
+                        unit=args.unit,
+                        wp_model=args.wp_model,
+                        batch_size=args.batch_size,
+                        min_n_frames=args.min_n_frames,
+                        max_n_frames=args.max_n_frames,
+                        sort_by='input',
+                        ctc=args.ctc_weight > 0,
+                        subsample_factor=args.subsample_factor,
+                        discourse_aware=args.discourse_aware)
+
+    writer = TeacherLogitWriter(args.teacher_logit_cache, args.teacher_logit_topk)
+    pbar = tqdm(total=len(train_set))
+    with torch.no_grad():
+        while True:
+            batch, is_new_epoch = train_set.next()
+            if teacher is not None:
+                logits = teacher.generate_logits(batch)
+            else:
+                logits = Speech2Text.generate_lm_logits(batch['ys'], teacher_lm)
+            # NOTE: teacher logits include <eos>
+            writer.add(batch['utt_ids'], logits, [len(y) + 1 for y in batch['ys']])
+            pbar.update(len(batch['utt_ids']))
+            if is_new_epoch:
+                break
+    pbar.close()
+    writer.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -15,6 +15,7 @@ import time
 
 from neural_sp.bin.args_asr import parse_args_eval
 from neural_sp.bin.eval_utils import average_checkpoints
+from neural_sp.bin.eval_utils import load_ema
 from neural_sp.bin.train_utils import load_checkpoint
 from neural_sp.bin.train_utils import load_config
 from neural_sp.bin.train_utils import set_logger
@@ -27,6 +28,7 @@ from neural_sp.evaluators.word import eval_word
 from neural_sp.evaluators.wordpiece import eval_wordpiece
 from neural_sp.evaluators.wordpiece_bleu import eval_wordpiece_bleu
 from neural_sp.models.lm.build import build_lm
+from neural_sp.models.lm.ngram import NgramLM
 from neural_sp.models.seq2seq.speech2text import Speech2Text
 
 logger = logging.getLogger(__name__)
@@ -78,6 +80,8 @@ def main():
                                             n_average=args.recog_n_average)
             else:
                 load_checkpoint(args.recog_model[0], model)
+                if args.recog_use_ema:
+                    load_ema(model, args.recog_model[0])
 
             # Ensemble (different models)
             ensemble_models = [model]
@@ -98,19 +102,24 @@ def main():
             if not args.lm_fusion:
                 # first path
                 if args.recog_lm is not None and args.recog_lm_weight > 0:
-                    conf_lm = load_config(os.path.join(os.path.dirname(args.recog_lm), 'conf.yml'))
-                    args_lm = argparse.Namespace()
-                    for k, v in conf_lm.items():
-                        setattr(args_lm, k, v)
-                    args_lm.recog_mem_len = args.recog_mem_len
-                    lm = build_lm(args_lm, wordlm=args.recog_wordlm,
-                                  lm_dict_path=os.path.join(os.path.dirname(args.recog_lm), 'dict.txt'),
-                                  asr_dict_path=os.path.join(dir_name, 'dict.txt'))
-                    load_checkpoint(args.recog_lm, lm)
-                    if args_lm.backward:
-                        model.lm_bwd = lm
+                    if args.recog_lm.endswith(('.arpa', '.arpa.gz')):
+                        # n-gram LM
+                        model.lm_fwd = NgramLM(args.recog_lm, os.path.join(dir_name, 'dict.txt'))
                     else:
-                        model.lm_fwd = lm
+                        conf_lm = load_config(os.path.join(os.path.dirname(args.recog_lm), 'conf.yml'))
+                        args_lm = argparse.Namespace()
+                        for k, v in conf_lm.items():
+                            setattr(args_lm, k, v)
+                        args_lm.recog_mem_len = args.recog_mem_len
+                        lm = build_lm(args_lm, wordlm=args.recog_wordlm,
+                                      lm_dict_path=os.path.join(os.path.dirname(args.recog_lm), 'dict.txt'),
+                                      asr_dict_path=os.path.join(dir_name, 'dict.txt'),
+                                      wp_model=os.path.join(dir_name, 'wp.model') if args.unit == 'wp' else None)
+                        load_checkpoint(args.recog_lm, lm)
+                        if args_lm.backward:
+                            model.lm_bwd = lm
+                        else:
+                            model.lm_fwd = lm
 
                 # second path (forward)
                 if args.recog_lm_second is not None and args.recog_lm_second_weight > 0:
@@ -24,18 +24,25 @@ from neural_sp.bin.train_utils import (
     compute_susampling_factor,
     load_checkpoint,
     load_config,
+    read_checkpoint,
     save_config,
+    set_autocast,
     set_logger,
     set_save_path
 )
 from neural_sp.datasets.asr import Dataset
+from neural_sp.datasets.teacher_cache import TeacherLogitStore
 from neural_sp.models.data_parallel import CustomDataParallel
 from neural_sp.models.data_parallel import CPUWrapperASR
 from neural_sp.models.lm.build import build_lm
 from neural_sp.models.seq2seq.speech2text import Speech2Text
+from neural_sp.trainers.checkpoint import CheckpointWriter
+from neural_sp.trainers.ema import ExponentialMovingAverage
 from neural_sp.trainers.lr_scheduler import LRScheduler
 from neural_sp.trainers.optimizer import set_optimizer
 from neural_sp.trainers.reporter import Reporter
+from neural_sp.trainers.step_timer import ProfilerWindow
+from neural_sp.trainers.step_timer import StepTimer
 from neural_sp.utils import mkdir_join
 
 torch.manual_seed(1)
@@ -157,6 +164,7 @@ def main():
 
     # Model setting
     model = Speech2Text(args, save_path, train_set.idx2token[0])
+    model.keep_attention_weights()  # for plot_attention
 
     if not args.resume:
         # Save the conf file as a yaml file
@@ -227,9 +235,12 @@ def main():
                             noam=args.optimizer == 'noam',
                             save_checkpoints_topk=10 if is_transformer else 1)
 
+    checkpoint = None
     if args.resume:
         # Restore the last saved model
-        load_checkpoint(args.resume, model, optimizer)
+        # NOTE: the checkpoint is read only once and shared by amp, scaler and EMA below
+        checkpoint = read_checkpoint(args.resume)
+        load_checkpoint(args.resume, model, optimizer, checkpoint=checkpoint)
 
         # Resume between convert_to_sgd_epoch -1 and convert_to_sgd_epoch
         if resume_epoch == args.convert_to_sgd_epoch:
@@ -278,7 +289,7 @@ def main():
             # NOTE: see https://github.com/espnet/espnet/pull/1779
             amp.init()
             if args.resume:
-                load_checkpoint(args.resume, amp=amp)
+                load_checkpoint(args.resume, amp=amp, checkpoint=checkpoint)
         model = CustomDataParallel(model, device_ids=list(range(0, args.n_gpus)))
 
         if teacher is not None:
@@ -288,6 +299,25 @@ def main():
     else:
         model = CPUWrapperASR(model)
 
+    # Load the teacher logits precomputed offline
+    if args.teacher_logit_cache:
+        assert not (args.teacher or args.teacher_lm)
+        args.lsm_prob = 0
+        teacher = TeacherLogitStore(args.teacher_logit_cache)
+
+    # Native mixed precision training setting
+    autocast, scaler = set_autocast(args.train_dtype, use_cuda=args.n_gpus >= 1)
+    if args.resume and scaler is not None:
+        load_checkpoint(args.resume, scaler=scaler, checkpoint=checkpoint)
+
+    # Exponential moving average of parameters
+    ema = None
+    if args.ema_decay > 0:
+        ema = ExponentialMovingAverage(model.module, args.ema_decay)
+        if args.resume:
+            load_checkpoint(args.resume, ema=ema, checkpoint=checkpoint)
+    del checkpoint
+
     # Set process name
     logger.info('PID: %s' % os.getpid())
     logger.info('USERNAME: %s' % os.uname()[1])
@@ -297,6 +327,18 @@ def main():
     # Set reporter
     reporter = Reporter(save_path)
 
+    # Set step timer and profiler
+    timer = StepTimer(use_cuda=args.n_gpus >= 1)
+    if args.n_gpus <= 1:
+        # NOTE: forward hooks are not thread-safe in data parallel
+        timer.attach(model.module)
+    profiler = ProfilerWindow(save_path, args.profile_start_step, args.profile_n_steps,
+                              use_cuda=args.n_gpus >= 1)
+
+    # Set checkpoint writer
+    checkpoint_writer = CheckpointWriter(save_path, asynchronous=args.async_checkpoint)
+    optimizer.set_checkpoint_writer(checkpoint_writer)
+
     if args.mtl_per_batch:
         # NOTE: from easier to harder tasks
         tasks = []
@@ -327,7 +369,8 @@ def main():
     session_prev = None
     while True:
         # Compute loss in the training set
-        batch_train, is_new_epoch = train_set.next()
+        with timer.section('data', host=True):
+            batch_train, is_new_epoch = train_set.next()
         if args.discourse_aware and batch_train['sessions'][0] != session_prev:
             model.module.reset_session()
         session_prev = batch_train['sessions'][0]
@@ -337,23 +380,33 @@ def main():
         if accum_n_steps == 1:
             loss_train = 0  # moving average over gradient accumulation
         for task in tasks:
-            loss, observation = model(batch_train, task,
-                                      teacher=teacher, teacher_lm=teacher_lm)
+            with timer.section('forward'), autocast():
+                loss, observation = model(batch_train, task,
+                                          teacher=teacher, teacher_lm=teacher_lm)
             reporter.add(observation)
-            if use_apex:
-                with amp.scale_loss(loss, optimizer.optimizer) as scaled_loss:
-                    scaled_loss.backward()
-            else:
-                loss.backward()
+            with timer.section('backward'):
+                if use_apex:
+                    with amp.scale_loss(loss, optimizer.optimizer) as scaled_loss:
+                        scaled_loss.backward()
+                elif scaler is not None:
+                    scaler.scale(loss).backward()
+                else:
+                    loss.backward()
             loss.detach()  # Trancate the graph
             loss_train = (loss_train * (accum_n_steps - 1) + loss.item()) / accum_n_steps
             if accum_n_steps >= args.accum_grad_n_steps or is_new_epoch:
                 if args.clip_grad_norm > 0:
-                    total_norm = torch.nn.utils.clip_grad_norm_(
-                        model.module.parameters(), args.clip_grad_norm)
+                    with timer.section('clip'):
+                        if scaler is not None:
+                            scaler.unscale_(optimizer.optimizer)
+                        total_norm = torch.nn.utils.clip_grad_norm_(
+                            model.module.parameters(), args.clip_grad_norm)
                     reporter.add_tensorboard_scalar('total_norm', total_norm)
-                optimizer.step()
-                optimizer.zero_grad()
+                with timer.section('optimizer'):
+                    optimizer.step(scaler)
+                    optimizer.zero_grad()
+                if ema is not None:
+                    ema.update(model.module)
                 accum_n_steps = 0
                 # NOTE: parameters are forcibly updated at the end of every epoch
             del loss
@@ -364,8 +417,24 @@ def main():
         reporter.step()
         n_steps += 1
         # NOTE: n_steps is different from the step counter in Noam Optimizer
+        if args.input_type == 'speech':
+            timer.step(n_frames=sum(len(x) for x in batch_train['xs']),
+                       n_tokens=sum(len(y) + 1 for y in batch_train['ys']))
+        else:
+            timer.step(n_tokens=sum(len(y) + 1 for y in batch_train['ys']))
+        profiler.step(n_steps)
 
         if n_steps % args.print_step == 0:
+            # Report step-time breakdown and throughput
+            times, throughput = timer.summary()
+            for k, v in times.items():
+                reporter.add_tensorboard_scalar('time/' + k, v)
+            for k, v in throughput.items():
+                reporter.add_tensorboard_scalar('throughput/' + k, v)
+            logger.info('time (ms/step): %s / frames/sec:%.1f tokens/sec:%.1f' %
+                        (' '.join('%s:%.1f' % (k, v) for k, v in times.items()),
+                         throughput['frames_per_sec'], throughput['tokens_per_sec']))
+
             # Compute loss in the dev set
             batch_dev = dev_set.next(batch_size=1 if 'transducer' in args.dec_type else None)[0]
             # Change mini-batch depending on task
@@ -389,6 +458,7 @@ def main():
                          optimizer.lr, len(batch_train['utt_ids']),
                          xlen, ylen, duration_step / 60))
             start_time_step = time.time()
+            timer.reset()  # exclude evaluation in the dev set
 
         # Save fugures of loss and accuracy
         if n_steps % (args.print_step * 10) == 0:
@@ -405,7 +475,7 @@ def main():
                 # Save the model
                 optimizer.save_checkpoint(
                     model, save_path, remove_old=False, amp=amp,
-                    epoch_detail=train_set.epoch_detail)
+                    epoch_detail=train_set.epoch_detail, scaler=scaler, ema=ema)
             epoch_detail_prev = train_set.epoch_detail
 
         # Save checkpoint and evaluate model per epoch
@@ -420,7 +490,7 @@ def main():
 
                 # Save the model
                 optimizer.save_checkpoint(
-                    model, save_path, remove_old=not is_transformer, amp=amp)
+                    model, save_path, remove_old=not is_transformer, amp=amp, scaler=scaler, ema=ema)
             else:
                 start_time_eval = time.time()
                 # dev
@@ -432,7 +502,7 @@ def main():
                 if optimizer.is_topk or is_transformer:
                     # Save the model
                     optimizer.save_checkpoint(
-                        model, save_path, remove_old=not is_transformer, amp=amp)
+                        model, save_path, remove_old=not is_transformer, amp=amp, scaler=scaler, ema=ema)
 
                     # test
                     if optimizer.is_topk:
@@ -462,10 +532,14 @@ def main():
 
             start_time_step = time.time()
             start_time_epoch = time.time()
+            timer.reset()
 
     duration_train = time.time() - start_time_train
     logger.info('Total time: %.2f hour' % (duration_train / 3600))
 
+    checkpoint_writer.close()
+    profiler.close()
+    timer.detach()
     reporter.tf_writer.close()
     pbar_epoch.close()
 
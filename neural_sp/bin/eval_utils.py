@@ -13,12 +13,47 @@ import torch
 logger = logging.getLogger(__name__)
 
 
+def load_state_dict(checkpoint_path, key='model_state_dict'):
+    """Load a single state dict from a checkpoint.
+
+    The checkpoint is memory-mapped when possible, so that the other states
+    (e.g., optimizer) are not read into memory.
+
+    Args:
+        checkpoint_path (str): path to the saved model (model.epoch-*)
+        key (str): name of the state dict to load
+    Returns:
+        state_dict (dict):
+
+    """
+    try:
+        checkpoint = torch.load(checkpoint_path, map_location='cpu', mmap=True)
+    except RuntimeError:
+        # NOTE: legacy (non-zip) checkpoints cannot be memory-mapped
+        checkpoint = torch.load(checkpoint_path, map_location='cpu')
+    return checkpoint[key]
+
+
 def average_checkpoints(model, best_model_path, n_average, topk_list=[]):
+    """Average model parameters over checkpoints.
+
+    Checkpoints are loaded one by one and accumulated in float64, so that
+    memory usage does not depend on the number of averaged models.
+
+    Args:
+        model (torch.nn.Module):
+        best_model_path (str): path to the best checkpoint (model.epoch-*)
+        n_average (int): number of checkpoints to average
+        topk_list (list): list of (epoch, metric)
+    Returns:
+        model (torch.nn.Module): model with averaged parameters
+
+    """
     if n_average == 1:
         return model
 
     n_models = 0
-    checkpoint_avg = {'model_state_dict': None}
+    state_dict_avg = None
     if len(topk_list) == 0:
         epoch = int(best_model_path.split('model.epoch-')[1])
         topk_list = [(i, 0) for i in range(epoch, epoch - n_average - 1, -1)]
@@ -28,26 +63,48 @@ def average_checkpoints(model, best_model_path, n_average, topk_list=[]):
         checkpoint_path = best_model_path.split('model.epoch-')[0] + 'model.epoch-' + str(ep)
         if os.path.isfile(checkpoint_path):
             logger.info("=> Loading checkpoint (epoch:%d): %s" % (ep, checkpoint_path))
-            checkpoint = torch.load(checkpoint_path, map_location=lambda storage, loc: storage)
-            if checkpoint_avg['model_state_dict'] is None:
+            state_dict = load_state_dict(checkpoint_path)
+            if state_dict_avg is None:
                 # first checkpoint
-                checkpoint_avg['model_state_dict'] = checkpoint['model_state_dict']
-                n_models += 1
-                continue
-            for k, v in checkpoint['model_state_dict'].items():
-                checkpoint_avg['model_state_dict'][k] += v
+                dtypes = {k: v.dtype for k, v in state_dict.items()}
+                state_dict_avg = {k: v.double() if v.is_floating_point() else v.clone()
+                                  for k, v in state_dict.items()}
+            else:
+                for k, v in state_dict.items():
+                    if v.is_floating_point():
+                        state_dict_avg[k] += v.double()
+                    # NOTE: integer buffers are taken from the first checkpoint
+            del state_dict
             n_models += 1
 
     # take an average
     logger.info('Take average for %d models' % n_models)
-    for k, v in checkpoint_avg['model_state_dict'].items():
-        checkpoint_avg['model_state_dict'][k] /= n_models
-    model.load_state_dict(checkpoint_avg['model_state_dict'])
+    for k, v in state_dict_avg.items():
+        if v.is_floating_point():
+            state_dict_avg[k] = (v / n_models).to(dtypes[k])
+    model.load_state_dict(state_dict_avg)
 
     # save as a new checkpoint
     checkpoint_avg_path = best_model_path.split('model.epoch-')[0] + 'model-avg' + str(n_average)
     if os.path.isfile(checkpoint_avg_path):
         os.remove(checkpoint_avg_path)
-    torch.save(checkpoint_avg, checkpoint_avg_path)
+    torch.save({'model_state_dict': state_dict_avg}, checkpoint_avg_path)
+
+    return model
+
+
+def load_ema(model, checkpoint_path):
+    """Overwrite model parameters with their exponential moving average.
+
+    Args:
+        model (torch.nn.Module):
+        checkpoint_path (str): path to the saved model (model.epoch-*)
+    Returns:
+        model (torch.nn.Module):
 
+    """
+    ema_state_dict = load_state_dict(checkpoint_path, key='ema_state_dict')
+    logger.info("=> Loading EMA parameters (%d updates): %s" %
+                (ema_state_dict['n_updates'], checkpoint_path))
+    model.load_state_dict(ema_state_dict['shadow'], strict=False)
     return model
@@ -12,6 +12,7 @@ import sys
 import time
 
 from neural_sp.bin.args_lm import parse_args_eval
+from neural_sp.bin.eval_utils import load_ema
 from neural_sp.bin.train_utils import (
     load_checkpoint,
     set_logger
@@ -51,6 +52,8 @@ def main():
             # Load the LM
             model = build_lm(args)
             load_checkpoint(args.recog_model[0], model)
+            if args.recog_use_ema:
+                load_ema(model, args.recog_model[0])
             epoch = int(args.recog_model[0].split('-')[-1])
             # NOTE: model averaging is not helpful for LM
 
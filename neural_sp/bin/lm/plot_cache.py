@@ -95,8 +95,9 @@ def main():
 
                 if len(model.cache_attn) > 0:
                     if toknen_count == n_tokens:
-                        tokens_keys = dataset.idx2token[0](model.cache_ids[:args.recog_n_caches], return_list=True)
-                        tokens_query = dataset.idx2token[0](model.cache_ids[-n_tokens:], return_list=True)
+                        cache_ids = model.cache_ids[0].tolist()  # `[n_caches]`
+                        tokens_keys = dataset.idx2token[0](cache_ids[:args.recog_n_caches], return_list=True)
+                        tokens_query = dataset.idx2token[0](cache_ids[-n_tokens:], return_list=True)
 
                         # Slide attention matrix
                         n_keys = len(tokens_keys)
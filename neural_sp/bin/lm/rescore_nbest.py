@@ -0,0 +1,127 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Rescore saved N-best lists with forward/backward LMs.
+
+The N-best list is a tsv file with (at least) the following columns:
+    utt_id: utterance ID
+    score: first-pass score
+    token_id: token indices separated by space (without <sos>/<eos>)
+Hypotheses of the same utterance share the utterance ID. LM scores are added
+as new columns, and hypotheses are re-ranked in each utterance.
+"""
+
+import argparse
+from distutils.util import strtobool
+import logging
+import os
+import pandas as pd
+import sys
+import time
+
+from neural_sp.bin.train_utils import load_checkpoint
+from neural_sp.bin.train_utils import load_config
+from neural_sp.bin.train_utils import set_logger
+from neural_sp.models.lm.build import build_lm
+from neural_sp.models.lm.rescoring import score_sequences
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args(input_args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nbest', type=str, required=True,
+                        help='tsv file path for the N-best list')
+    parser.add_argument('--out', type=str, required=True,
+                        help='tsv file path for the rescored N-best list')
+    parser.add_argument('--lm', type=str, default=None,
+                        help='path to the forward LM')
+    parser.add_argument('--lm_weight', type=float, default=0.3,
+                        help='weight of the forward LM score')
+    parser.add_argument('--lm_bwd', type=str, default=None,
+                        help='path to the backward LM')
+    parser.add_argument('--lm_bwd_weight', type=float, default=0.3,
+                        help='weight of the backward LM score')
+    parser.add_argument('--length_norm', type=strtobool, default=True,
+                        help='normalize LM scores by the number of tokens')
+    parser.add_argument('--batch_size', type=int, default=256,
+                        help='number of hypotheses scored at once (0: all hypotheses)')
+    parser.add_argument('--n_gpus', type=int, default=0,
+                        help='number of GPUs (0 indicates CPU)')
+    parser.add_argument('--log', type=str, default=None,
+                        help='log file path')
+    return parser.parse_args(input_args)
+
+
+def load_lm(lm_path, n_gpus):
+    """Load a LM from the checkpoint and its config."""
+    conf_lm = load_config(os.path.join(os.path.dirname(lm_path), 'conf.yml'))
+    args_lm = argparse.Namespace()
+    for k, v in conf_lm.items():
+        setattr(args_lm, k, v)
+    args_lm.recog_mem_len = 0
+    lm = build_lm(args_lm)
+    load_checkpoint(lm_path, lm)
+    if n_gpus > 0:
+        lm.cuda()
+    lm.eval()
+    return lm
+
+
+def rescore(df, eos, lm=None, lm_weight=0., lm_bwd=None, lm_bwd_weight=0.,
+            length_norm=True, batch_size=0):
+    """Rescore N-best hypotheses of all utterances in mini-batches.
+
+    Args:
+        df (pd.DataFrame): N-best list with columns of utt_id/score/token_id
+        eos (int): index of <sos>/<eos>
+        lm (LMBase): forward LM
+        lm_weight (float): weight of the forward LM score
+        lm_bwd (LMBase): backward LM
+        lm_bwd_weight (float): weight of the backward LM score
+        length_norm (bool): normalize LM scores by the number of tokens
+        batch_size (int): number of hypotheses scored at once
+    Returns:
+        df (pd.DataFrame): rescored N-best list sorted by score in each utterance
+
+    """
+    df = df.copy()
+    ys = [[eos] + list(map(int, str(y).split())) + [eos] if str(y) not in ['', 'nan'] else [eos, eos]
+          for y in df['token_id']]
+    if lm is not None:
+        df['score_lm'] = score_sequences(lm, ys, normalize_length=length_norm, batch_size=batch_size)
+        df['score'] += df['score_lm'] * lm_weight
+    if lm_bwd is not None:
+        df['score_lm_bwd'] = score_sequences(lm_bwd, ys, reverse=True,
+                                             normalize_length=length_norm, batch_size=batch_size)
+        df['score'] += df['score_lm_bwd'] * lm_bwd_weight
+    df['rank'] = df.groupby('utt_id', sort=False)['score'].rank(ascending=False, method='first').astype(int)
+    return df.sort_values(by=['utt_id', 'rank'], kind='mergesort')
+
+
+def main():
+
+    args = parse_args(sys.argv[1:])
+    set_logger(args.log, stdout=args.log is None)
+    assert args.lm is not None or args.lm_bwd is not None
+
+    lm = load_lm(args.lm, args.n_gpus) if args.lm is not None else None
+    lm_bwd = load_lm(args.lm_bwd, args.n_gpus) if args.lm_bwd is not None else None
+
+    df = pd.read_csv(args.nbest, encoding='utf-8', delimiter='\t', dtype={'token_id': str})
+    logger.info('Utterances: %d, hypotheses: %d' % (df['utt_id'].nunique(), len(df)))
+
+    start_time = time.time()
+    eos = (lm if lm is not None else lm_bwd).eos
+    df = rescore(df, eos, lm, args.lm_weight, lm_bwd, args.lm_bwd_weight,
+                 length_norm=args.length_norm, batch_size=args.batch_size)
+    logger.info('Elasped time: %.2f [sec]' % (time.time() - start_time))
+
+    df.to_csv(args.out, sep='\t', index=False)
+
+
+if __name__ == '__main__':
+    main()
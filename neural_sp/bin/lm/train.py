@@ -21,7 +21,9 @@ from neural_sp.bin.model_name import set_lm_name
 from neural_sp.bin.train_utils import (
     load_checkpoint,
     load_config,
+    read_checkpoint,
     save_config,
+    set_autocast,
     set_logger,
     set_save_path
 )
@@ -30,6 +32,8 @@ from neural_sp.evaluators.ppl import eval_ppl
 from neural_sp.models.data_parallel import CustomDataParallel
 from neural_sp.models.data_parallel import CPUWrapperLM
 from neural_sp.models.lm.build import build_lm
+from neural_sp.trainers.checkpoint import CheckpointWriter
+from neural_sp.trainers.ema import ExponentialMovingAverage
 from neural_sp.trainers.lr_scheduler import LRScheduler
 from neural_sp.trainers.optimizer import set_optimizer
 from neural_sp.trainers.reporter import Reporter
@@ -66,7 +70,9 @@ def main():
                         bptt=args.bptt,
                         shuffle=args.shuffle,
                         backward=args.backward,
-                        serialize=args.serialize)
+                        serialize=args.serialize,
+                        sentence_batching=args.sentence_batching,
+                        max_n_tokens=args.max_n_tokens)
     dev_set = Dataset(corpus=args.corpus,
                       tsv_path=args.dev_set,
                       dict_path=args.dict,
@@ -76,7 +82,9 @@ def main():
                       batch_size=batch_size,
                       bptt=args.bptt,
                       backward=args.backward,
-                      serialize=args.serialize)
+                      serialize=args.serialize,
+                      sentence_batching=args.sentence_batching,
+                      max_n_tokens=args.max_n_tokens)
     eval_sets = [Dataset(corpus=args.corpus,
                          tsv_path=s,
                          dict_path=args.dict,
@@ -86,7 +94,9 @@ def main():
                          batch_size=1,
                          bptt=args.bptt,
                          backward=args.backward,
-                         serialize=args.serialize) for s in args.eval_sets]
+                         serialize=args.serialize,
+                         sentence_batching=args.sentence_batching,
+                         max_n_tokens=args.max_n_tokens) for s in args.eval_sets]
 
     args.vocab = train_set.vocab
 
@@ -105,6 +115,7 @@ def main():
 
     # Model setting
     model = build_lm(args, save_path)
+    model.keep_attention_weights()  # for plot_attention
 
     if not args.resume:
         # Save the conf file as a yaml file
@@ -151,9 +162,12 @@ def main():
                             noam=args.optimizer == 'noam',
                             save_checkpoints_topk=10 if is_transformer else 1)
 
+    checkpoint = None
     if args.resume:
         # Restore the last saved model
-        load_checkpoint(args.resume, model, optimizer)
+        # NOTE: the checkpoint is read only once and shared by amp, scaler and EMA below
+        checkpoint = read_checkpoint(args.resume)
+        load_checkpoint(args.resume, model, optimizer, checkpoint=checkpoint)
 
         # Resume between convert_to_sgd_epoch -1 and convert_to_sgd_epoch
         if resume_epoch == args.convert_to_sgd_epoch:
@@ -175,11 +189,24 @@ def main():
                                                         opt_level=args.train_dtype)
             amp.init()
             if args.resume:
-                load_checkpoint(args.resume, amp=amp)
+                load_checkpoint(args.resume, amp=amp, checkpoint=checkpoint)
         model = CustomDataParallel(model, device_ids=list(range(0, args.n_gpus)))
     else:
         model = CPUWrapperLM(model)
 
+    # Native mixed precision training setting
+    autocast, scaler = set_autocast(args.train_dtype, use_cuda=args.n_gpus >= 1)
+    if args.resume and scaler is not None:
+        load_checkpoint(args.resume, scaler=scaler, checkpoint=checkpoint)
+
+    # Exponential moving average of parameters
+    ema = None
+    if args.ema_decay > 0:
+        ema = ExponentialMovingAverage(model.module, args.ema_decay)
+        if args.resume:
+            load_checkpoint(args.resume, ema=ema, checkpoint=checkpoint)
+    del checkpoint
+
     # Set process name
     logger.info('PID: %s' % os.getpid())
     logger.info('USERNAME: %s' % os.uname()[1])
@@ -189,7 +216,12 @@ def main():
     # Set reporter
     reporter = Reporter(save_path)
 
+    # Set checkpoint writer
+    checkpoint_writer = CheckpointWriter(save_path, asynchronous=args.async_checkpoint)
+    optimizer.set_checkpoint_writer(checkpoint_writer)
+
     hidden = None
+    eval_batch_size = batch_size if args.sentence_batching else 1
     start_time_train = time.time()
     start_time_epoch = time.time()
     start_time_step = time.time()
@@ -203,28 +235,37 @@ def main():
 
         if accum_n_steps == 1:
             loss_train = 0  # moving average over gradient accumulation
-        loss, hidden, observation = model(ys_train, hidden)
+        if args.sentence_batching:
+            hidden = None  # NOTE: sentences are independent of each other
+        with autocast():
+            loss, hidden, observation = model(ys_train, hidden)
         reporter.add(observation)
         if use_apex:
             with amp.scale_loss(loss, optimizer.optimizer) as scaled_loss:
                 scaled_loss.backward()
+        elif scaler is not None:
+            scaler.scale(loss).backward()
         else:
             loss.backward()
         loss.detach()  # Trancate the graph
         loss_train = (loss_train * (accum_n_steps - 1) + loss.item()) / accum_n_steps
         if accum_n_steps >= args.accum_grad_n_steps or is_new_epoch:
             if args.clip_grad_norm > 0:
+                if scaler is not None:
+                    scaler.unscale_(optimizer.optimizer)
                 total_norm = torch.nn.utils.clip_grad_norm_(
                     model.module.parameters(), args.clip_grad_norm)
                 reporter.add_tensorboard_scalar('total_norm', total_norm)
-            optimizer.step()
+            optimizer.step(scaler)
             optimizer.zero_grad()
+            if ema is not None:
+                ema.update(model.module)
             accum_n_steps = 0
             # NOTE: parameters are forcibly updated at the end of every epoch
         del loss
         hidden = model.module.repackage_state(hidden)
 
-        pbar_epoch.update(ys_train.shape[0] * (ys_train.shape[1] - 1))
+        pbar_epoch.update(sum([len(y) - 1 for y in ys_train]))
         reporter.add_tensorboard_scalar('learning_rate', optimizer.lr)
         # NOTE: loss/acc/ppl are already added in the model
         reporter.step()
@@ -244,7 +285,7 @@ def main():
             logger.info("step:%d(ep:%.2f) loss:%.3f(%.3f)/lr:%.5f/bs:%d (%.2f min)" %
                         (n_steps, optimizer.n_epochs + train_set.epoch_detail,
                          loss_train, loss_dev,
-                         optimizer.lr, ys_train.shape[0], duration_step / 60))
+                         optimizer.lr, len(ys_train), duration_step / 60))
             start_time_step = time.time()
 
         # Save fugures of loss and accuracy
@@ -264,13 +305,13 @@ def main():
 
                 # Save the model
                 optimizer.save_checkpoint(
-                    model, save_path, remove_old=not is_transformer, amp=amp)
+                    model, save_path, remove_old=not is_transformer, amp=amp, scaler=scaler, ema=ema)
             else:
                 start_time_eval = time.time()
                 # dev
                 model.module.reset_length(args.bptt)
                 ppl_dev, _ = eval_ppl([model.module], dev_set,
-                                      batch_size=1, bptt=args.bptt)
+                                      batch_size=eval_batch_size, bptt=args.bptt)
                 model.module.reset_length(args.bptt)
                 optimizer.epoch(ppl_dev)  # lr decay
                 reporter.epoch(ppl_dev, name='perplexity')  # plot
@@ -280,14 +321,14 @@ def main():
                 if optimizer.is_topk or is_transformer:
                     # Save the model
                     optimizer.save_checkpoint(
-                        model, save_path, remove_old=not is_transformer, amp=amp)
+                        model, save_path, remove_old=not is_transformer, amp=amp, scaler=scaler, ema=ema)
 
                     # test
                     ppl_test_avg = 0.
                     for eval_set in eval_sets:
                         model.module.reset_length(args.bptt)
                         ppl_test, _ = eval_ppl([model.module], eval_set,
-                                               batch_size=1, bptt=args.bptt)
+                                               batch_size=eval_batch_size, bptt=args.bptt)
                         model.module.reset_length(args.bptt)
                         logger.info('PPL (%s, ep:%d): %.2f' %
                                     (eval_set.set, optimizer.n_epochs, ppl_test))
@@ -319,6 +360,7 @@ def main():
     duration_train = time.time() - start_time_train
     logger.info('Total time: %.2f hour' % (duration_train / 3600))
 
+    checkpoint_writer.close()
     reporter.tf_writer.close()
     pbar_epoch.close()
 
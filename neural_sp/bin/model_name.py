@@ -86,7 +86,7 @@ def set_asr_model_name(args):
     else:
         dir_name += '_lr' + str(args.lr)
     dir_name += '_bs' + str(args.batch_size)
-    if args.train_dtype in ["O0", "O1", "O2", "O3"]:
+    if args.train_dtype in ["O0", "O1", "O2", "O3", "autocast_float16", "autocast_bfloat16"]:
         dir_name += '_' + args.train_dtype
     # if args.shuffle_bucket:
     #     dir_name += '_bucket'
@@ -172,6 +172,8 @@ def set_asr_model_name(args):
         dir_name += '_KD' + str(args.soft_label_weight)
     if args.teacher_lm:
         dir_name += '_lmKD' + str(args.soft_label_weight)
+    if args.teacher_logit_cache:
+        dir_name += '_KDcache' + str(args.distillation_weight)
 
     # MBR training
     if args.mbr_training:
@@ -194,10 +196,15 @@ def set_lm_name(args):
     else:
         dir_name += '_lr' + str(args.lr)
     dir_name += '_bs' + str(args.batch_size)
-    if args.train_dtype in ["O0", "O1", "O2", "O3"]:
+    if args.train_dtype in ["O0", "O1", "O2", "O3", "autocast_float16", "autocast_bfloat16"]:
         dir_name += '_' + args.train_dtype
 
-    dir_name += '_bptt' + str(args.bptt)
+    if getattr(args, 'sentence_batching', False):
+        dir_name += '_sent'
+        if args.max_n_tokens > 0:
+            dir_name += str(args.max_n_tokens)
+    else:
+        dir_name += '_bptt' + str(args.bptt)
 
     # regularization
     dir_name += '_dropI' + str(args.dropout_in) + 'H' + str(args.dropout_hidden)
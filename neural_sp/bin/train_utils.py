@@ -126,7 +126,48 @@ def set_save_path(save_path):
     return save_path_new
 
 
-def load_checkpoint(checkpoint_path, model=None, optimizer=None, amp=None):
+def set_autocast(train_dtype, use_cuda):
+    """Set native mixed precision training with autocast.
+
+    Args:
+        train_dtype (str): autocast_float16/autocast_bfloat16/others
+        use_cuda (bool): train on GPUs
+    Returns:
+        autocast (function): returns a context manager for the forward pass
+        scaler (GradScaler): gradient scaler (float16 only)
+
+    """
+    device_type = 'cuda' if use_cuda else 'cpu'
+    enabled = train_dtype in ['autocast_float16', 'autocast_bfloat16']
+    dtype = torch.float16 if train_dtype == 'autocast_float16' else torch.bfloat16
+    if train_dtype == 'autocast_float16':
+        assert use_cuda, 'float16 autocast is supported only on GPUs. Use autocast_bfloat16 instead.'
+
+    def autocast():
+        return torch.autocast(device_type, dtype=dtype, enabled=enabled)
+
+    scaler = None
+    if enabled and dtype == torch.float16:
+        scaler = torch.amp.GradScaler('cuda')
+    return autocast, scaler
+
+
+def read_checkpoint(checkpoint_path):
+    """Read checkpoint on CPU.
+
+    Args:
+        checkpoint_path (str): path to the saved model (model..epoch-*)
+    Returns:
+        checkpoint (dict): saved states
+
+    """
+    if not os.path.isfile(checkpoint_path):
+        raise ValueError("No checkpoint found at %s" % checkpoint_path)
+    return torch.load(checkpoint_path, map_location=lambda storage, loc: storage)
+
+
+def load_checkpoint(checkpoint_path, model=None, optimizer=None, amp=None, scaler=None,
+                    ema=None, checkpoint=None):
     """Load checkpoint.
 
     Args:
@@ -134,17 +175,16 @@ def load_checkpoint(checkpoint_path, model=None, optimizer=None, amp=None):
         model (torch.nn.Module):
         optimizer (LRScheduler): optimizer wrapped by LRScheduler class
         amp ():
+        scaler (GradScaler): gradient scaler for native mixed precision training
+        ema (ExponentialMovingAverage): moving average of model parameters
+        checkpoint (dict): states already read from checkpoint_path.
+            This avoids deserializing the same file again when restoring components one by one.
     Returns:
         topk_list (list): list of (epoch, metric)
 
     """
-    if not os.path.isfile(checkpoint_path):
-        raise ValueError('There is no checkpoint')
-
-    if os.path.isfile(checkpoint_path):
-        checkpoint = torch.load(checkpoint_path, map_location=lambda storage, loc: storage)
-    else:
-        raise ValueError("No checkpoint found at %s" % checkpoint_path)
+    if checkpoint is None:
+        checkpoint = read_checkpoint(checkpoint_path)
 
     # Restore parameters
     if 'avg' not in checkpoint_path:
@@ -171,6 +211,14 @@ def load_checkpoint(checkpoint_path, model=None, optimizer=None, amp=None):
     else:
         logger.warning('amp is not loaded.')
 
+    # Restore gradient scaler
+    if scaler is not None and 'scaler_state_dict' in checkpoint.keys():
+        scaler.load_state_dict(checkpoint['scaler_state_dict'])
+
+    # Restore moving average of parameters
+    if ema is not None and 'ema_state_dict' in checkpoint.keys():
+        ema.load_state_dict(checkpoint['ema_state_dict'])
+
     if 'optimizer_state_dict' in checkpoint.keys() and 'topk_list' in checkpoint['optimizer_state_dict'].keys():
         topk_list = checkpoint['optimizer_state_dict']['topk_list']
     else:
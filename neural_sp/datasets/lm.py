@@ -37,6 +37,7 @@ class Dataset(object):
                  unit, batch_size, nlsyms=False, n_epochs=1e10,
                  is_test=False, min_n_tokens=1,
                  bptt=2, shuffle=False, backward=False, serialize=False,
+                 sentence_batching=False, max_n_tokens=0,
                  wp_model=None, corpus=''):
         """A class for loading dataset.
 
@@ -53,6 +54,10 @@ class Dataset(object):
             shuffle (bool): shuffle utterances per epoch.
             backward (bool): flip all text in the corpus
             serialize (bool): serialize text according to contexts in dialogue
+            sentence_batching (bool): make mini-batches of sentences of similar lengths
+                instead of BPTT windows over the concatenated corpus
+            max_n_tokens (int): maximum number of tokens including padding in a mini-batch
+                for sentence_batching (0: no limit)
             wp_model (): path to the word-piece model for sentencepiece
             corpus (str): name of corpus
 
@@ -73,6 +78,8 @@ class Dataset(object):
         self.max_epoch = n_epochs
         self.shuffle = shuffle
         self.backward = backward
+        self.sentence_batching = sentence_batching
+        self.max_n_tokens = max_n_tokens
         self.vocab = count_vocab_size(dict_path)
         assert bptt >= 2
 
@@ -113,6 +120,8 @@ class Dataset(object):
             print('Removed %d utterances (threshold)' % (n_utts - len(self.df)))
 
         # Sort tsv records
+        if sentence_batching:
+            assert not serialize
         if shuffle:
             assert not serialize
             self.df = self.df.reindex(np.random.permutation(self.df.index))
@@ -125,8 +134,13 @@ class Dataset(object):
         else:
             self.df = self.df.sort_values(by='utt_id', ascending=True)
 
-        # Concatenate into a single sentence
-        self.concat_ids = self.concat_utterances(self.df)
+        if sentence_batching:
+            # Keep sentences separated
+            self.sentences = self.split_utterances(self.df)
+            self.buckets = self.bucketing(batch_size)
+        else:
+            # Concatenate into a single sentence
+            self.concat_ids = self.concat_utterances(self.df)
 
     def concat_utterances(self, df):
         indices = list(df.index)
@@ -147,17 +161,78 @@ class Dataset(object):
 
         return concat_ids
 
+    def split_utterances(self, df):
+        sentences = []
+        for i in df.index:
+            assert df['token_id'][i] != ''
+            token_ids = list(map(int, df['token_id'][i].split()))
+            if self.backward:
+                token_ids = token_ids[::-1]
+            sentences.append(np.array([self.eos] + token_ids + [self.eos]))
+            # NOTE: <sos> and <eos> have the same index
+        return sentences
+
+    def bucketing(self, batch_size):
+        """Group sentences of similar lengths into mini-batches.
+
+        Args:
+            batch_size (int): maximum number of sentences in a mini-batch
+        Returns:
+            buckets (list): list of indices of sentences in each mini-batch
+
+        """
+        ylens = np.array([len(y) for y in self.sentences])
+        if self.shuffle:
+            # NOTE: shuffle sentences of the same length
+            indices = np.random.permutation(len(ylens))
+            indices = indices[np.argsort(ylens[indices], kind='stable')]
+        else:
+            indices = np.argsort(ylens, kind='stable')
+
+        buckets = []
+        bucket = []
+        for i in indices:
+            # NOTE: sentences are sorted, so the new one is the longest in the bucket
+            is_full = len(bucket) >= batch_size
+            if self.max_n_tokens > 0:
+                is_full |= (len(bucket) + 1) * ylens[i] > self.max_n_tokens
+            if len(bucket) > 0 and is_full:
+                buckets.append(bucket)
+                bucket = []
+            bucket.append(i)
+        if len(bucket) > 0:
+            buckets.append(bucket)
+
+        if self.shuffle:
+            buckets = [buckets[i] for i in np.random.permutation(len(buckets))]
+        return buckets
+
     def __len__(self):
+        if self.sentence_batching:
+            return sum([len(y) - 1 for y in self.sentences])
         return len(self.concat_ids.reshape((-1,)))
 
     @property
     def epoch_detail(self):
         """Percentage of the current epoch."""
+        if self.sentence_batching:
+            return float(self.offset) / len(self.buckets)
         return float(self.offset * self.batch_size) / len(self)
 
-    def reset(self):
-        """Reset data counter and offset."""
-        if self.shuffle:
+    def reset(self, batch_size=None):
+        """Reset data counter and offset.
+
+            Args:
+                batch_size (int): size of mini-batch
+
+        """
+        if batch_size is None:
+            batch_size = self.batch_size
+        if self.sentence_batching:
+            if self.shuffle or batch_size != self.batch_size:
+                self.buckets = self.bucketing(batch_size)
+                self.batch_size = batch_size
+        elif self.shuffle:
             self.df = self.df.reindex(np.random.permutation(self.df.index))
             self.concat_ids = self.concat_utterances(self.df)
         self.offset = 0
@@ -169,10 +244,14 @@ class Dataset(object):
             batch_size (int): size of mini-batch
             bptt (int): BPTT length
         Returns:
-            ys (np.ndarray): target labels in the main task of size `[B, bptt]`
+            ys (np.ndarray or list): target labels in the main task of size `[B, bptt]`,
+                or a list of length `B`, each of which contains arrays of size `[L]` for sentence_batching
             is_new_epoch (bool): flag for the end of the current epoch
 
         """
+        if self.sentence_batching:
+            return self._next_sentences(batch_size)
+
         if batch_size is None:
             batch_size = self.batch_size
         elif self.concat_ids.shape[0] != batch_size:
@@ -200,3 +279,24 @@ class Dataset(object):
             self.epoch += 1
 
         return ys, is_new_epoch
+
+    def _next_sentences(self, batch_size=None):
+        if batch_size is not None and batch_size != self.batch_size:
+            self.reset(batch_size)
+            # NOTE: only for the first iteration during evaluation
+
+        if self.epoch >= self.max_epoch:
+            raise StopIteration
+
+        ys = [self.sentences[i] for i in self.buckets[self.offset]]
+        self.offset += 1
+
+        is_new_epoch = False
+
+        # Last mini-batch
+        if self.offset >= len(self.buckets):
+            is_new_epoch = True
+            self.reset()
+            self.epoch += 1
+
+        return ys, is_new_epoch
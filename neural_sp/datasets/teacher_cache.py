@@ -0,0 +1,142 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Precomputed teacher logits for knowledge distillation."""
+
+import json
+import logging
+import numpy as np
+import os
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+class TeacherLogitWriter(object):
+    """Store top-k teacher log-probabilities per output position.
+
+    Token indices and log-probabilities are appended to flat binary files of
+    size `[n_positions, topk]`, and the position range of each utterance is
+    saved to a metadata file when closed.
+
+    Args:
+        cache_path (str): path to the directory to save the cache
+        topk (int): number of (token, log-probability) pairs per position
+
+    """
+
+    meta_name = 'meta.json'
+
+    def __init__(self, cache_path, topk):
+
+        assert topk >= 1
+        os.makedirs(cache_path, exist_ok=True)
+        self.cache_path = cache_path
+        self.topk = topk
+        self.vocab = None
+        self.n_positions = 0
+        self.index = {}
+        self.f_ids = open(os.path.join(cache_path, 'ids.bin'), 'wb')
+        self.f_logprobs = open(os.path.join(cache_path, 'logprobs.bin'), 'wb')
+
+    @torch.no_grad()
+    def add(self, utt_ids, logits, ylens):
+        """Append teacher outputs in a mini-batch.
+
+        Args:
+            utt_ids (list): length `B`
+            logits (FloatTensor): `[B, L, vocab]`
+            ylens (list): length `B`, number of output positions (including <eos>)
+
+        """
+        if self.vocab is None:
+            self.vocab = logits.size(-1)
+        assert logits.size(-1) == self.vocab
+        log_probs = torch.log_softmax(logits.float(), dim=-1)
+        topk_logprobs, topk_ids = torch.topk(log_probs, k=self.topk, dim=-1)  # `[B, L, topk]`
+        topk_ids = topk_ids.int().cpu().numpy()
+        topk_logprobs = topk_logprobs.half().cpu().numpy()
+        for b, utt_id in enumerate(utt_ids):
+            if utt_id in self.index:
+                continue
+            self.f_ids.write(topk_ids[b, :ylens[b]].tobytes())
+            self.f_logprobs.write(topk_logprobs[b, :ylens[b]].tobytes())
+            self.index[utt_id] = [self.n_positions, int(ylens[b])]
+            self.n_positions += int(ylens[b])
+
+    def close(self):
+        self.f_ids.close()
+        self.f_logprobs.close()
+        meta = {'topk': self.topk,
+                'vocab': self.vocab,
+                'n_positions': self.n_positions,
+                'index': self.index}
+        with open(os.path.join(self.cache_path, self.meta_name), 'w') as f:
+            json.dump(meta, f)
+        logger.info('Saved teacher logits of %d utterances (%d positions): %s' %
+                    (len(self.index), self.n_positions, self.cache_path))
+
+
+class TeacherLogitStore(object):
+    """Read top-k teacher log-probabilities saved by `TeacherLogitWriter`.
+
+    The binary files are memory-mapped, so that only positions in the current
+    mini-batch are read from disk.
+
+    Args:
+        cache_path (str): path to the directory of the cache
+
+    """
+
+    def __init__(self, cache_path):
+
+        with open(os.path.join(cache_path, TeacherLogitWriter.meta_name), 'r') as f:
+            meta = json.load(f)
+        self.topk = meta['topk']
+        self.vocab = meta['vocab']
+        self.index = meta['index']
+        shape = (meta['n_positions'], self.topk)
+        self.ids = np.memmap(os.path.join(cache_path, 'ids.bin'),
+                             dtype=np.int32, mode='r', shape=shape)
+        self.logprobs = np.memmap(os.path.join(cache_path, 'logprobs.bin'),
+                                  dtype=np.float16, mode='r', shape=shape)
+        logger.info('Loaded teacher logits of %d utterances (top-%d): %s' %
+                    (len(self.index), self.topk, cache_path))
+
+    def __len__(self):
+        return len(self.index)
+
+    def generate_logits(self, utt_ids, device):
+        """Restore teacher logits in a mini-batch.
+
+        Log-probabilities out of the top-k candidates are filled with the
+        minimum value, so that they vanish after softmax.
+
+        Args:
+            utt_ids (list): length `B`
+            device (torch.device):
+        Returns:
+            logits (FloatTensor): `[B, L, vocab]`
+
+        """
+        missing = [utt_id for utt_id in utt_ids if utt_id not in self.index]
+        if len(missing) > 0:
+            raise ValueError('Teacher logits of %d utterances (e.g., %s) are not found in the cache. '
+                             'Re-run cache_teacher_logits.py with the same training set and filtering.'
+                             % (len(missing), missing[0]))
+        ranges = [self.index[utt_id] for utt_id in utt_ids]
+        ymax = max(ylen for _, ylen in ranges)
+        ids = np.zeros((len(utt_ids), ymax, self.topk), dtype=np.int64)
+        logprobs = np.zeros((len(utt_ids), ymax, self.topk), dtype=np.float32)
+        for b, (offset, ylen) in enumerate(ranges):
+            ids[b, :ylen] = self.ids[offset:offset + ylen]
+            logprobs[b, :ylen] = self.logprobs[offset:offset + ylen]
+        ids = torch.from_numpy(ids).to(device)
+        logprobs = torch.from_numpy(logprobs).to(device)
+        logits = logprobs.new_full((len(utt_ids), ymax, self.vocab), torch.finfo(torch.float32).min)
+        # NOTE: padded positions point to index 0, which are ignored in the loss
+        logits.scatter_(2, ids, logprobs)
+        return logits
@@ -6,6 +6,7 @@
 
 """Functions for computing edit distance."""
 
+import editdistance
 import numpy as np
 
 
@@ -56,6 +57,21 @@ def compute_cer(ref, hyp, normalize=False):
     return cer * 100
 
 
+def compute_wer_nbest(ref, hyps):
+    """Compute the number of word errors of N-best hypotheses.
+
+    This is much faster than `compute_wer` since the alignment is not traced back.
+
+    Args:
+        ref (list): words in the reference transcript
+        hyps (list): length `N_best`, each of which contains words in the predicted transcript
+    Returns:
+        n_errors (list): length `N_best`, the number of word errors
+
+    """
+    return [editdistance.eval(ref, hyp) for hyp in hyps]
+
+
 def compute_wer(ref, hyp, normalize=False):
     """Compute Word Error Rate.
 
@@ -83,6 +83,18 @@ class ModelBase(nn.Module):
                 p.data[start:end].fill_(1.)
                 logger.info('Initialize %s with 1 (bias in forget gate)' % (n))
 
+    def keep_attention_weights(self, keep=True):
+        """Keep self-attention weights of Transformer layers for plotting.
+            They are not materialized by default so that fused attention kernels are used.
+
+        Args:
+            keep (bool):
+
+        """
+        for module in self.modules():
+            if hasattr(module, 'need_weights'):
+                module.need_weights = keep
+
     def add_weight_noise(self, std):
         """Add variational Gaussian noise to model parameters.
 
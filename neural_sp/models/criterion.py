@@ -19,35 +19,35 @@ import torch.nn.functional as F
 class MBR(torch.autograd.Function):
     """Minimum Bayes Risk (MBR) training.
 
-    Args:
-        vocab (int): number of nodes in softmax layer
+    N-best hypotheses of all utterances in a mini-batch are processed at once.
+    The gradient of the expected risk w.r.t. each hypothesis is attached to
+    log-probabilities of its tokens in the backward pass.
 
     """
     @staticmethod
-    def forward(ctx, log_probs, hyps, exp_risk, grad):
+    def forward(ctx, log_probs, hyps, exp_risk, grad, pad):
         """Forward pass.
 
         Args:
-            log_probs (FloatTensor): `[N_best, L, vocab]`
-            hyps (LongTensor): `[N_best, L]`
-            exp_risk (FloatTensor): `[1]` (for forward)
-            grad (FloatTensor): `[1]` (for backward)
+            log_probs (FloatTensor): `[B * N_best, L, vocab]`
+            hyps (LongTensor): `[B * N_best, L]`
+            exp_risk (FloatTensor): `[B]` (for forward)
+            grad (FloatTensor): `[B * N_best]` (for backward)
+            pad (int): index for padding
         Returns:
             loss (FloatTensor): `[1]`
 
         """
-        device_id = torch.cuda.device_of(log_probs).idx
-        onehot = torch.eye(log_probs.size(-1)).cuda(device_id)[hyps]
-        grads = grad * onehot  # mask out other classes
-        log_probs = log_probs.requires_grad_()
-        ctx.save_for_backward(log_probs, grads)
-        return exp_risk
+        mask = (hyps != pad).unsqueeze(2)  # `[B * N_best, L, 1]`
+        onehot = F.one_hot(hyps.masked_fill(~mask.squeeze(2), 0), log_probs.size(-1))
+        grads = grad.view(-1, 1, 1) * onehot.to(log_probs.dtype) * mask  # mask out other classes
+        ctx.save_for_backward(grads)
+        return exp_risk.sum()
 
     @staticmethod
     def backward(ctx, grad_output):
-        input, grads, = ctx.saved_tensors
-        input.grad = grads
-        return input, None, None, None
+        grads, = ctx.saved_tensors
+        return grads * grad_output, None, None, None, None
 
 
 def cross_entropy_lsm(logits, ys, lsm_prob, ignore_index, training, normalize_length=False):
@@ -110,7 +110,7 @@ def distillation(logits_student, logits_teacher, ylens, temperature=5.0):
     log_probs_student = torch.log_softmax(logits_student, dim=-1)
     probs_teacher = torch.softmax(logits_teacher / temperature, dim=-1).data
     loss = -torch.mul(probs_teacher, log_probs_student)
-    loss_mean = np.sum([loss[b, :ylens[b], :].sum() for b in range(bs)]) / ylens.sum()
+    loss_mean = torch.stack([loss[b, :ylens[b], :].sum() for b in range(bs)]).sum() / ylens.sum()
     return loss_mean
 
 
@@ -130,7 +130,7 @@ def kldiv_lsm_ctc(logits, ylens):
     probs = torch.softmax(logits, dim=-1)
     log_probs = torch.log_softmax(logits, dim=-1)
     loss = torch.mul(probs, log_probs - log_uniform)
-    loss_mean = np.sum([loss[b, :ylens[b], :].sum() for b in range(bs)]) / ylens.sum()
+    loss_mean = torch.stack([loss[b, :ylens[b], :].sum() for b in range(bs)]).sum() / ylens.sum()
     # assert loss_mean >= 0
     return loss_mean
 
@@ -153,5 +153,5 @@ def focal_loss(logits, ys, ylens, alpha, gamma):
     log_probs = torch.log_softmax(logits, dim=-1)
     probs_inv = -torch.softmax(logits, dim=-1) + 1
     loss = -alpha * torch.mul(torch.pow(probs_inv, gamma), log_probs)
-    loss_mean = np.sum([loss[b, :ylens[b], :].sum() for b in range(bs)]) / ylens.sum()
+    loss_mean = torch.stack([loss[b, :ylens[b], :].sum() for b in range(bs)]).sum() / ylens.sum()
     return loss_mean
@@ -7,15 +7,17 @@
 """Select a language model"""
 
 
-def build_lm(args, save_path=None, wordlm=False, lm_dict_path=None, asr_dict_path=None):
+def build_lm(args, save_path=None, wordlm=False, lm_dict_path=None, asr_dict_path=None,
+             wp_model=None):
     """Select LM class.
 
     Args:
         args ():
         save_path (str):
-        wordlm (bool):
-        lm_dict_path (dict):
-        asr_dict_path (dict):
+        wordlm (bool): fuse a word-level LM with character/word-piece decoders
+        lm_dict_path (str): path to the dictionary of the word-level LM
+        asr_dict_path (str): path to the dictionary of the ASR model
+        wp_model (str): path to the sentencepiece model of the ASR model
     Returns:
         lm ():
 
@@ -33,4 +35,13 @@ def build_lm(args, save_path=None, wordlm=False, lm_dict_path=None, asr_dict_pat
         from neural_sp.models.lm.rnnlm import RNNLM
         lm = RNNLM(args, save_path)
 
+    if wordlm:
+        from neural_sp.models.lm.lookahead_wordlm import load_lexicon
+        from neural_sp.models.lm.lookahead_wordlm import LookAheadWordLM
+        from neural_sp.models.lm.rnnlm import RNNLM
+        if not isinstance(lm, RNNLM):
+            raise ValueError('Look-ahead word LM fusion supports RNNLM only.')
+        lexicon, vocab, space, word_start_ids = load_lexicon(lm_dict_path, asr_dict_path, wp_model)
+        lm = LookAheadWordLM(lm, lexicon, vocab, space, word_start_ids)
+
     return lm
@@ -72,61 +72,131 @@ class LMBase(ModelBase):
             logits = logits[:, -1].unsqueeze(1)
 
         # Compute XE sequence loss
-        if n_caches > 0 and len(self.cache_ids) > 0:
-            assert ys_out.size(1) == 1
-            assert ys_out.size(0) == 1
-            if self.adaptive_softmax is None:
-                probs = torch.softmax(logits, dim=-1)
-            else:
-                probs = self.adaptive_softmax.log_prob(logits).exp()
-            cache_probs = probs.new_zeros(probs.size())
-
-            # Truncate cache
-            self.cache_ids = self.cache_ids[-n_caches:]  # list of `[B, 1]`
-            self.cache_keys = self.cache_keys[-n_caches:]  # list of `[B, 1, n_units]`
-
-            # Compute inner-product over caches
-            cache_attn = torch.softmax(self.cache_theta * torch.matmul(
-                torch.cat(self.cache_keys, dim=1), out.transpose(2, 1)).squeeze(2), dim=1)
-
-            # For visualization
-            if len(self.cache_ids) == n_caches:
-                self.cache_attn += [cache_attn.cpu().numpy()]
-                self.cache_attn = self.cache_attn[-n_caches:]
-
-            # Sum all probabilities
-            for offset, idx in enumerate(self.cache_ids):
-                cache_probs[:, :, idx] += cache_attn[:, offset]
-            probs = (1 - self.cache_lambda) * probs + self.cache_lambda * cache_probs
-            loss = -torch.log(probs[:, :, ys_out[:, -1]])
+        if n_caches > 0:
+            if predict_last:
+                out = out[:, -1:]
+            loss, ppl = self._forward_neural_cache(logits, out, ys_out, n_caches)
         else:
             if self.adaptive_softmax is None:
                 loss, ppl = cross_entropy_lsm(logits, ys_out.contiguous(),
                                               self.lsm_prob, self.pad, self.training,
                                               normalize_length=True)
             else:
-                loss = self.adaptive_softmax(logits.view((-1, logits.size(2))),
-                                             ys_out.contiguous().view(-1)).loss
+                # NOTE: exclude padded positions of shorter sentences from the loss
+                mask = ys_out != self.pad
+                loss = self.adaptive_softmax(logits[mask], ys_out[mask]).loss
                 ppl = np.exp(loss.item())
 
-        if n_caches > 0:
-            # Register to cache
-            self.cache_ids += [ys_out[0, -1].item()]
-            self.cache_keys += [out]
-
         # Compute token-level accuracy in teacher-forcing
         if self.adaptive_softmax is None:
             acc = compute_accuracy(logits, ys_out, pad=self.pad)
         else:
             acc = compute_accuracy(self.adaptive_softmax.log_prob(
-                logits.view((-1, logits.size(2)))), ys_out, pad=self.pad)
+                logits.reshape(-1, logits.size(2))), ys_out, pad=self.pad)
 
         observation = {'loss.lm': loss.item(), 'acc.lm': acc, 'ppl.lm': ppl}
         return loss, new_state, observation
 
+    def reset_neural_cache(self):
+        """Clear the continuous cache of all streams."""
+        self.cache_ids = None  # `[B, <= n_caches]`
+        self.cache_keys = None  # `[B, <= n_caches, n_units]`
+        self.cache_attn = []  # for visualization
+
+    def _forward_neural_cache(self, logits, out, ys_out, n_caches):
+        """Compute loss with the continuous cache model (Grave et al., 2017)
+            for all tokens in a mini-batch at once.
+
+        Each query attends to hidden states of the previous `n_caches` tokens
+        in the same stream, including those in the previous mini-batches, and
+        the attention weights are added to the probabilities of the tokens that
+        followed them.
+
+        Args:
+            logits (FloatTensor): `[B, L, vocab]`
+            out (FloatTensor): `[B, L, n_units]`
+            ys_out (LongTensor): `[B, L]`
+            n_caches (int): number of cached states
+        Returns:
+            loss (FloatTensor): `[1]`
+            ppl (float): perplexity
+
+        """
+        bs, ylen = ys_out.size()
+        if self.adaptive_softmax is None:
+            probs = torch.softmax(logits, dim=-1)
+        else:
+            probs = self.adaptive_softmax.log_prob(logits.reshape(-1, logits.size(2))).exp().view(bs, ylen, -1)
+
+        if self.cache_keys is None or self.cache_keys.size(0) != bs:
+            self.reset_neural_cache()
+        keys, ids = out, ys_out
+        if self.cache_keys is not None:
+            keys = torch.cat([self.cache_keys, out], dim=1)  # `[B, mlen + L, n_units]`
+            ids = torch.cat([self.cache_ids, ys_out], dim=1)  # `[B, mlen + L]`
+        mlen = keys.size(1) - ylen
+
+        # causal mask over the cache
+        pos_k = torch.arange(keys.size(1), device=out.device) - mlen
+        pos_q = torch.arange(ylen, device=out.device).unsqueeze(1)
+        cache_mask = (pos_k < pos_q) & (pos_k >= pos_q - n_caches)  # `[L, mlen + L]`
+        cache_mask = cache_mask.unsqueeze(0) & (ids != self.pad).unsqueeze(1)  # `[B, L, mlen + L]`
+
+        # Compute inner-product over caches
+        e = self.cache_theta * torch.matmul(out, keys.transpose(2, 1))  # `[B, L, mlen + L]`
+        e = e.masked_fill_(cache_mask == 0, float(torch.finfo(e.dtype).min))
+        cache_attn = torch.softmax(e, dim=-1)
+
+        # For visualization (attention over full caches)
+        idx = (torch.arange(ylen, device=out.device) + mlen - n_caches).unsqueeze(1)
+        idx = idx + torch.arange(n_caches, device=out.device)  # `[L, n_caches]`
+        is_full = idx[:, 0] >= 0
+        if is_full.any():
+            aws = cache_attn[:, is_full].gather(2, idx[is_full].unsqueeze(0).expand(bs, -1, -1))
+            self.cache_attn += list(aws.transpose(1, 0).cpu().numpy())  # each `[B, n_caches]`
+            self.cache_attn = self.cache_attn[-n_caches:]
+
+        # Sum all probabilities
+        cache_probs = probs.new_zeros(probs.size()).scatter_add_(
+            2, ids.unsqueeze(1).expand(-1, ylen, -1), cache_attn)
+        has_cache = cache_mask.any(dim=-1, keepdim=True)  # `[B, L, 1]`
+        probs = torch.where(has_cache, (1 - self.cache_lambda) * probs + self.cache_lambda * cache_probs, probs)
+        nll = -torch.log(probs.gather(2, ys_out.unsqueeze(2)).squeeze(2))  # `[B, L]`
+        loss = nll[ys_out != self.pad].mean()
+        ppl = np.exp(loss.item())
+
+        # Register to cache
+        self.cache_keys = keys[:, -n_caches:]
+        self.cache_ids = ids[:, -n_caches:]
+
+        return loss, ppl
+
     def repackage_state(self, state):
         return state
 
+    def set_shortlist(self, shortlist=None):
+        """Restrict the output layer to the candidate tokens of the utterance during decoding.
+
+        Args:
+            shortlist (Shortlist): None to compute the full vocabulary
+
+        """
+        self.shortlist = shortlist
+
+    def output_logits(self, out):
+        """Project outputs to logits of tokens in the vocabulary (or the shortlist).
+
+        Args:
+            out (FloatTensor): `[B, L, n_units]`
+        Returns:
+            logits (FloatTensor): `[B, L, vocab]`
+
+        """
+        shortlist = getattr(self, 'shortlist', None)
+        if shortlist is None or shortlist.ids is None:
+            return self.output(out)
+        return shortlist.project(self.output, out, shortlist.ids)
+
     def reset_length(self, mem_len):
         # for TransformerXL
         self.mem_len = mem_len
@@ -144,7 +214,7 @@ class LMBase(ModelBase):
                     hxs (FloatTensor): `[n_layers, B, n_units]`
                     cxs (FloatTensor): `[n_layers, B, n_units]`
                 - TransformerLM (LongTensor): `[B, L]`
-                - TransformerXL (list): length `n_layers + 1`, each of which contains a tensor`[B, L, d_model]`
+                - TransformerXL (list): length `n_layers`, each of which contains a dict of projected keys/values
             mems (list):
             cache (list):
         Returns:
@@ -154,13 +224,16 @@ class LMBase(ModelBase):
                     hxs (FloatTensor): `[n_layers, B, n_units]`
                     cxs (FloatTensor): `[n_layers, B, n_units]`
                 - TransformerLM (LongTensor): `[B, L]`
-                - TransformerXL (list): length `n_layers + 1`, each of which contains a tensor`[B, L, d_model]`
+                - TransformerXL (list): length `n_layers`, each of which contains a dict of projected keys/values
             log_probs (FloatTensor): `[B, L, vocab]`
 
         """
         logits, lmout, new_state = self.decode(ys, state, mems=mems, cache=cache,
                                                incremental=True)
         log_probs = torch.log_softmax(logits, dim=-1)
+        shortlist = getattr(self, 'shortlist', None)
+        if shortlist is not None and shortlist.ids is not None:
+            log_probs = shortlist.add_backoff(log_probs, shortlist.ids)
         return lmout, new_state, log_probs
 
     def plot_attention(self):
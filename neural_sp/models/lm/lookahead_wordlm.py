@@ -0,0 +1,375 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Look-ahead word-level LM for character/word-piece decoders.
+
+See details in
+    https://arxiv.org/abs/1808.02608
+
+"""
+
+import codecs
+import logging
+import numpy as np
+import torch
+import torch.nn as nn
+
+from neural_sp.models.torch_utils import np2tensor
+from neural_sp.models.torch_utils import tensor2np
+
+logger = logging.getLogger(__name__)
+
+TINY = 1e-30
+
+
+def load_lexicon(lm_dict_path, asr_dict_path, wp_model=None):
+    """Spell words in the LM vocabulary with ASR tokens.
+
+    Args:
+        lm_dict_path (str): path to the dictionary of the word LM
+        asr_dict_path (str): path to the dictionary of the ASR model
+        wp_model (str): path to the sentencepiece model (for word-piece ASR)
+    Returns:
+        lexicon (list): list of (word index, list of ASR token indices)
+        vocab (int): ASR vocabulary size
+        space (int): index for <space> (-1 for word-piece ASR)
+        word_start_ids (list): ASR token indices starting a new word (for word-piece ASR)
+
+    """
+    token2idx = {}
+    with codecs.open(asr_dict_path, 'r', 'utf-8') as f:
+        for line in f:
+            token, idx = line.strip().split(' ')
+            token2idx[token] = int(idx)
+    vocab = max(token2idx.values()) + 1  # 0 is reserved for <blank>
+
+    sp = None
+    if wp_model is not None:
+        import sentencepiece as spm
+        sp = spm.SentencePieceProcessor()
+        sp.Load(wp_model)
+
+    lexicon = []
+    n_words = 0
+    with codecs.open(lm_dict_path, 'r', 'utf-8') as f:
+        for line in f:
+            word, idx = line.strip().split(' ')
+            if word[0] == '<' and word[-1] == '>':
+                continue  # special symbols
+            n_words += 1
+            tokens = sp.EncodeAsPieces(word) if sp is not None else list(word)
+            if len(tokens) == 0 or any(t not in token2idx for t in tokens):
+                continue
+            lexicon.append((int(idx), [token2idx[t] for t in tokens]))
+    logger.info('Lexicon: %d/%d words are spelled with ASR tokens' % (len(lexicon), n_words))
+
+    if sp is not None:
+        space = -1
+        word_start_ids = [idx for token, idx in token2idx.items() if token[0] == '▁']
+    else:
+        space = token2idx.get('<space>', -1)
+        word_start_ids = []
+    return lexicon, vocab, space, word_start_ids
+
+
+class LexiconPrefixTree(object):
+    """Prefix tree of ASR token sequences of words.
+
+    Words are indexed in the depth-first order, so that all words sharing
+    a prefix (node) occupy a contiguous range `[lo, hi)`. The look-ahead
+    probability of a node, i.e., the sum of LM probabilities of the words
+    under the node, is then a difference of two cumulative sums.
+
+    Args:
+        lexicon (list): list of (word index, list of token indices)
+
+    """
+
+    def __init__(self, lexicon):
+
+        children = [{}]
+        word_ids = [-1]
+        for w, tokens in lexicon:
+            node = 0
+            for t in tokens:
+                if t not in children[node]:
+                    children[node][t] = len(children)
+                    children.append({})
+                    word_ids.append(-1)
+                node = children[node][t]
+            # NOTE: words spelled with the same tokens share the first (most frequent) one
+            if node > 0 and word_ids[node] < 0:
+                word_ids[node] = w
+
+        n_nodes = len(children)
+        self.children = children
+        self.word_ids = np.array(word_ids, dtype=np.int64)
+        self.child_tokens = [np.array(list(c.keys()), dtype=np.int64) for c in children]
+        self.child_nodes = [np.array(list(c.values()), dtype=np.int64) for c in children]
+
+        # Depth-first ordering of words
+        self.lo = np.zeros(n_nodes, dtype=np.int64)
+        self.hi = np.zeros(n_nodes, dtype=np.int64)
+        dfs_word_ids = []
+        stack = [(0, False)]
+        while len(stack) > 0:
+            node, visited = stack.pop()
+            if visited:
+                self.hi[node] = len(dfs_word_ids)
+                continue
+            self.lo[node] = len(dfs_word_ids)
+            if self.word_ids[node] >= 0:
+                dfs_word_ids.append(self.word_ids[node])
+            stack.append((node, True))
+            stack += [(child, False) for child in reversed(self.child_nodes[node])]
+        self.dfs_word_ids = np.array(dfs_word_ids, dtype=np.int64)
+
+    @property
+    def n_nodes(self):
+        return len(self.children)
+
+    @property
+    def n_words(self):
+        return len(self.dfs_word_ids)
+
+    def lookahead(self, log_probs_dfs, cumprobs, nodes):
+        """Compute look-ahead log-probabilities of nodes.
+
+        Args:
+            log_probs_dfs (np.ndarray): `[..., n_words]`, word log-probabilities in the depth-first order
+            cumprobs (np.ndarray): `[..., n_words + 1]`, cumulative sums of word probabilities
+            nodes (np.ndarray): `[N]`
+        Returns:
+            np.ndarray: `[..., N]`
+
+        """
+        lo, hi = self.lo[nodes], self.hi[nodes]
+        probs = cumprobs[..., hi] - cumprobs[..., lo]
+        scores = np.log(np.maximum(probs, TINY))
+        # NOTE: use exact log-probabilities for nodes covering a single word
+        single = (hi - lo) == 1
+        if single.any():
+            scores[..., single] = log_probs_dfs[..., lo[single]]
+        return scores
+
+
+class LookAheadWordLM(nn.Module):
+    """Word-level LM fused with character/word-piece decoders via look-ahead.
+
+    A hypothesis tracks its position (node) in the lexicon prefix tree. Each
+    token is scored by the ratio of look-ahead probabilities of the child and
+    parent nodes, so that the scores of tokens in a word sum up to the word LM
+    probability. The word LM is queried only when a node ending a word is
+    reached, and queries of all hypotheses are batched. Tokens leading out
+    of the lexicon are scored with the probability of <unk>.
+
+    Args:
+        lm (RNNLM): word-level LM
+        lexicon (list): list of (word index, list of ASR token indices)
+        vocab (int): ASR vocabulary size
+        space (int): index for <space> (character ASR)
+        word_start_ids (list): ASR token indices starting a new word (word-piece ASR)
+
+    """
+
+    def __init__(self, lm, lexicon, vocab, space=-1, word_start_ids=None):
+
+        super(LookAheadWordLM, self).__init__()
+
+        self.lm = lm
+        self.tree = LexiconPrefixTree(lexicon)
+        self.vocab = vocab
+        self.eos = lm.eos  # NOTE: shared with the ASR dictionary
+        self.unk = 1
+        self.space = space
+        self.word_start = np.zeros(vocab, dtype=np.bool_)
+        if word_start_ids is not None:
+            self.word_start[word_start_ids] = True
+
+        self.root_child_tokens = self.tree.child_tokens[0]
+        self.root_child_nodes = self.tree.child_nodes[0]
+
+    @property
+    def device(self):
+        return self.lm.device
+
+    def load_state_dict(self, state_dict, strict=True):
+        # NOTE: checkpoints of the word LM are loaded as they are
+        return self.lm.load_state_dict(state_dict, strict)
+
+    def _make_contexts(self, lmstate, log_probs):
+        """Precompute look-ahead statistics for word histories.
+
+        Args:
+            lmstate (dict): RNNLM state of `B` word histories
+            log_probs (FloatTensor): `[B, lm_vocab]`
+        Returns:
+            contexts (list): length `B`
+
+        """
+        log_probs_dfs = log_probs[:, self.tree.dfs_word_ids]
+        cumprobs = torch.cumsum(log_probs_dfs.double().exp(), dim=-1)
+        cumprobs = torch.cat([cumprobs.new_zeros(cumprobs.size(0), 1), cumprobs], dim=-1)
+        log_probs = tensor2np(log_probs)
+        log_probs_dfs = tensor2np(log_probs_dfs)
+        cumprobs = tensor2np(cumprobs)
+
+        # Scores of the first token of a word
+        root_scores = np.repeat(log_probs[:, self.unk:self.unk + 1], self.vocab, axis=1)
+        root_scores[:, self.root_child_tokens] = self.tree.lookahead(
+            log_probs_dfs, cumprobs, self.root_child_nodes)
+        root_scores[:, self.eos] = log_probs[:, self.eos]
+
+        contexts = []
+        for j in range(log_probs.shape[0]):
+            contexts.append({'lmstate': {k: v[:, j:j + 1] if v is not None else None
+                                         for k, v in lmstate.items()},
+                             'log_probs': log_probs[j],
+                             'log_probs_dfs': log_probs_dfs[j],
+                             'cumprobs': cumprobs[j],
+                             'root_scores': root_scores[j]})
+        return contexts
+
+    def _advance(self, queries):
+        """Feed words to the word LM in a batch.
+
+        Args:
+            queries (list): list of (context, word index), context is None for the initial state
+        Returns:
+            contexts (list): contexts after the words
+
+        """
+        if len(queries) == 0:
+            return []
+        states = [ctx['lmstate'] if ctx is not None else self.lm.zero_state(1) for ctx, _ in queries]
+        lmstate = {k: torch.cat([state[k] for state in states], dim=1) if states[0][k] is not None else None
+                   for k in ['hxs', 'cxs']}
+        y = torch.tensor([[w] for _, w in queries], dtype=torch.int64, device=self.device)
+        _, lmstate, log_probs = self.lm.predict(y, lmstate)
+        return self._make_contexts(lmstate, log_probs[:, -1])
+
+    def _advance_unique(self, queries):
+        keys = list(dict.fromkeys((id(ctx), w) for ctx, w in queries))
+        ctx_dict = {id(ctx): ctx for ctx, _ in queries}
+        contexts = self._advance([(ctx_dict[i], w) for i, w in keys])
+        results = dict(zip(keys, contexts))
+        return [results[(id(ctx), w)] for ctx, w in queries]
+
+    def _next_token_scores(self, state):
+        """Compute look-ahead log-probabilities of the next tokens.
+
+        Args:
+            state (dict): state of a hypothesis
+        Returns:
+            scores (np.ndarray): `[vocab]`
+
+        """
+        ctx, node = state['ctx'], state['node']
+        if node == 0:
+            return ctx['root_scores']
+
+        if node > 0:
+            lp_unk = ctx['log_probs'][self.unk] - state['acc']
+            scores = np.full(self.vocab, lp_unk, dtype=np.float64)
+            child_tokens = self.tree.child_tokens[node]
+            if len(child_tokens) > 0:
+                scores[child_tokens] = self.tree.lookahead(
+                    ctx['log_probs_dfs'], ctx['cumprobs'], self.tree.child_nodes[node]) - state['acc']
+            w = self.tree.word_ids[node]
+            if w >= 0:
+                score_word = ctx['log_probs'][w] - state['acc']
+                ctx_next = state['next']
+            else:
+                # NOTE: the rest of <unk> is approximated with the current word history
+                score_word = lp_unk
+                ctx_next = ctx
+        else:
+            # out-of-lexicon word, <unk> has already been scored
+            scores = np.zeros(self.vocab, dtype=np.float64)
+            score_word = 0.
+            ctx_next = ctx
+
+        # Word boundaries
+        if self.space >= 0:
+            scores[self.space] = score_word
+        scores[self.word_start] = score_word + ctx_next['root_scores'][self.word_start]
+        scores[self.eos] = score_word + ctx_next['log_probs'][self.eos]
+        return scores
+
+    def predict(self, ys, state=None, mems=None, cache=None):
+        """Update states with the last tokens and score the next tokens.
+
+        Args:
+            ys (LongTensor): `[B, L]`, only the last tokens are used
+            state (list): length `B`, each of which is a dict or None (before the first token)
+                ctx (dict): word history
+                node (int): node in the prefix tree (0: root, -1: out of lexicon)
+                acc (float): look-ahead log-probability of the node
+                next (dict): word history including the word ending at the node
+            mems: dummy interfance for TransformerXL
+            cache: dummy interfance for TransformerLM/TransformerXL
+        Returns:
+            lmout: dummy interfance for cold fusion
+            state (list): length `B`
+            log_probs (FloatTensor): `[B, 1, vocab]`
+
+        """
+        bs = ys.size(0)
+        if state is None:
+            state = [None] * bs
+        ys = tensor2np(ys[:, -1])
+        new_state = [None] * bs
+
+        # Step 1. Feed the completed word (or <sos>) to the word LM
+        contexts, nodes = [None] * bs, [0] * bs
+        queries, q_ids = [], []
+        for b in range(bs):
+            if state[b] is None:
+                queries.append((None, self.eos))
+                q_ids.append(b)
+                continue
+            if ys[b] == self.eos:
+                new_state[b] = state[b]
+                continue
+            node = state[b]['node']
+            contexts[b] = state[b]['ctx']
+            nodes[b] = node
+            if node != 0 and (ys[b] == self.space or self.word_start[ys[b]]):
+                nodes[b] = 0
+                if node > 0 and self.tree.word_ids[node] >= 0:
+                    contexts[b] = state[b]['next']
+                else:
+                    queries.append((state[b]['ctx'], self.unk))
+                    q_ids.append(b)
+        for b, ctx in zip(q_ids, self._advance_unique(queries)):
+            contexts[b] = ctx
+            if state[b] is None:
+                new_state[b] = {'ctx': ctx, 'node': 0, 'acc': 0., 'next': None}
+
+        # Step 2. Move in the prefix tree
+        queries, q_ids = [], []
+        for b in range(bs):
+            if new_state[b] is not None:
+                continue
+            ctx, node = contexts[b], nodes[b]
+            if ys[b] == self.space:
+                new_state[b] = {'ctx': ctx, 'node': 0, 'acc': 0., 'next': None}
+                continue
+            child = self.tree.children[node].get(ys[b], -1) if node >= 0 else -1
+            acc = 0.
+            if child > 0:
+                acc = self.tree.lookahead(ctx['log_probs_dfs'], ctx['cumprobs'], np.array([child]))[0]
+                if self.tree.word_ids[child] >= 0:
+                    queries.append((ctx, self.tree.word_ids[child]))
+                    q_ids.append(b)
+            new_state[b] = {'ctx': ctx, 'node': child, 'acc': acc, 'next': None}
+        for b, ctx in zip(q_ids, self._advance_unique(queries)):
+            new_state[b]['next'] = ctx
+
+        # Step 3. Look-ahead scores of the next tokens
+        log_probs = np.stack([self._next_token_scores(s) for s in new_state], axis=0)
+        log_probs = np2tensor(log_probs.astype(np.float32), self.device).unsqueeze(1)
+        return None, new_state, log_probs
@@ -0,0 +1,285 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Back-off n-gram language model in the ARPA format."""
+
+import codecs
+import gzip
+import logging
+import numpy as np
+import os
+import torch
+import torch.nn as nn
+
+from neural_sp.models.torch_utils import np2tensor
+from neural_sp.models.torch_utils import tensor2np
+
+logger = logging.getLogger(__name__)
+
+LOG10 = np.log(10.)
+LOG_0 = -99. * LOG10
+
+
+def _open(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return codecs.open(path, 'r', 'utf-8')
+
+
+def read_arpa(arpa_path, token2idx, bos, eos, unk):
+    """Read n-grams from an ARPA file.
+
+    Args:
+        arpa_path (str): path to the ARPA file (gzipped if ending with .gz)
+        token2idx (dict): token -> index
+        bos (int): index for <s>
+        eos (int): index for </s>
+        unk (int): index for <unk>
+    Returns:
+        ngrams (list): length `N`, each of which is a list of (token indices, log-prob, back-off weight)
+            in the natural log scale
+
+    """
+    special = {'<s>': bos, '</s>': eos, '<unk>': unk}
+    ngrams = []
+    n_skipped = 0
+    order = 0
+    with _open(arpa_path) as f:
+        for line in f:
+            line = line.strip()
+            if len(line) == 0 or line == '\\end\\':
+                continue
+            if line == '\\data\\' or line.startswith('ngram '):
+                order = 0
+                continue
+            if line[0] == '\\' and line.endswith('-grams:'):
+                order = int(line[1:].split('-')[0])
+                ngrams.append([])
+                assert len(ngrams) == order
+                continue
+            if order == 0:
+                continue
+
+            fields = line.split()
+            ids = [special[w] if w in special else token2idx.get(w, -1) for w in fields[1:order + 1]]
+            if -1 in ids:
+                n_skipped += 1
+                continue
+            bow = float(fields[order + 1]) * LOG10 if len(fields) > order + 1 else 0.
+            ngrams[-1].append((tuple(ids), float(fields[0]) * LOG10, bow))
+    if n_skipped > 0:
+        logger.warning('%d n-grams including tokens out of the dictionary are skipped.' % n_skipped)
+    return ngrams
+
+
+class NgramLM(nn.Module):
+    """Back-off n-gram LM for shallow fusion.
+
+    N-grams of each order are stored in arrays sorted by (parent n-gram, token),
+    so that children of an n-gram occupy a contiguous range and a child is
+    found by binary search. A state is a vector of indices of the suffixes of
+    the context at each order (-1 if absent), which makes state transitions
+    and back-off over the whole vocabulary vectorized over a batch of states.
+    The parsed arrays are cached in a binary file next to the ARPA file.
+
+    Args:
+        arpa_path (str): path to the ARPA file
+        dict_path (str): path to the dictionary of the ASR model
+        cache_path (str): path to the binary cache (default: `arpa_path` + '.npz')
+
+    """
+
+    def __init__(self, arpa_path, dict_path, cache_path=None):
+
+        super(NgramLM, self).__init__()
+        logger.info(self.__class__.__name__)
+
+        self.lm_type = 'ngram'
+        self.unk = 1
+        self.eos = 2
+
+        token2idx = {}
+        with codecs.open(dict_path, 'r', 'utf-8') as f:
+            for line in f:
+                token, idx = line.strip().split(' ')
+                token2idx[token] = int(idx)
+        self.vocab = max(token2idx.values()) + 1  # 0 is reserved for <blank>
+        self.bos = self.vocab  # NOTE: <s> is distinguished from </s> internally
+
+        if cache_path is None:
+            cache_path = arpa_path + '.npz'
+        sources = np.array([os.path.getmtime(arpa_path), os.path.getsize(arpa_path),
+                            os.path.getmtime(dict_path), os.path.getsize(dict_path)], dtype=np.float64)
+        arrays = self._load_cache(cache_path, sources)
+        if arrays is None:
+            ngrams = read_arpa(arpa_path, token2idx, self.bos, self.eos, self.unk)
+            arrays = self._compile(ngrams)
+            try:
+                np.savez(cache_path, sources=sources, vocab=self.vocab, **arrays)
+                logger.info('Save the parsed n-grams to %s' % cache_path)
+            except OSError:
+                logger.warning('Failed to save the parsed n-grams to %s' % cache_path)
+        self._setup(arrays)
+
+        # to follow the device of the decoder
+        self.register_buffer('_device_tracker', torch.zeros(0))
+
+    @property
+    def device(self):
+        return self._device_tracker.device
+
+    def _load_cache(self, cache_path, sources):
+        if not os.path.isfile(cache_path):
+            return None
+        with np.load(cache_path) as cache:
+            if int(cache['vocab']) != self.vocab or not np.array_equal(cache['sources'], sources):
+                logger.info('Cache %s is outdated' % cache_path)
+                return None
+            logger.info('Load the parsed n-grams from %s' % cache_path)
+            return {k: cache[k] for k in cache.files if k not in ['sources', 'vocab']}
+
+    def _compile(self, ngrams):
+        """Convert n-grams into sorted arrays.
+
+        Args:
+            ngrams (list): output of read_arpa()
+        Returns:
+            arrays (dict): keys/logps/bows of each order
+
+        """
+        n_keys = self.vocab + 1
+        arrays = {}
+        index = {(): 0}
+        for n, entries in enumerate(ngrams, 1):
+            # NOTE: n-grams without their prefixes are ignored
+            entries = [e for e in entries if e[0][:-1] in index]
+            keys = np.array([index[ids[:-1]] * n_keys + ids[-1] for ids, _, _ in entries], dtype=np.int64)
+            perm = np.argsort(keys, kind='stable')
+            arrays['keys%d' % n] = keys[perm]
+            arrays['logps%d' % n] = np.array([entries[i][1] for i in perm], dtype=np.float32)
+            arrays['bows%d' % n] = np.array([entries[i][2] for i in perm], dtype=np.float32)
+            index = {entries[i][0]: j for j, i in enumerate(perm)}
+        return arrays
+
+    def _setup(self, arrays):
+        n_keys = self.vocab + 1
+        self.order = len([k for k in arrays.keys() if k.startswith('keys')])
+        self.keys = [None] + [arrays['keys%d' % n] for n in range(1, self.order + 1)]
+        self.logps = [None] + [arrays['logps%d' % n] for n in range(1, self.order + 1)]
+        self.bows = [None] + [arrays['bows%d' % n] for n in range(1, self.order + 1)]
+        self.words = [None] + [keys % n_keys for keys in self.keys[1:]]
+
+        # Range of children of each n-gram in the (n+1)-grams
+        self.child_lo, self.child_hi = [None], [None]
+        for n in range(1, self.order):
+            parents = self.keys[n + 1] // n_keys
+            entries = np.arange(len(self.keys[n]))
+            self.child_lo.append(np.searchsorted(parents, entries, side='left'))
+            self.child_hi.append(np.searchsorted(parents, entries, side='right'))
+
+        # Unigram distribution
+        self.logps_uni = np.full(n_keys, LOG_0, dtype=np.float32)
+        self.logps_uni[self.words[1]] = self.logps[1]
+        if self.logps_uni[self.unk] > LOG_0:
+            oov = np.ones(n_keys, dtype=np.bool_)
+            oov[self.words[1]] = False
+            self.logps_uni[oov] = self.logps_uni[self.unk]
+        logger.info('%d-gram LM: %s' % (self.order, ', '.join(
+            ['%d %d-grams' % (len(self.keys[n]), n) for n in range(1, self.order + 1)])))
+
+    def _find(self, n, parents, words):
+        """Find n-grams by their parents and last tokens.
+
+        Args:
+            n (int): order
+            parents (np.ndarray): `[B]`, indices of (n-1)-grams (-1 for absent)
+            words (np.ndarray): `[B]`
+        Returns:
+            np.ndarray: `[B]`, indices of n-grams (-1 for absent)
+
+        """
+        keys = self.keys[n]
+        if len(keys) == 0:
+            return np.full_like(parents, -1)
+        query = parents * (self.vocab + 1) + words
+        pos = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+        found = (parents >= 0) & (keys[pos] == query)
+        return np.where(found, pos, -1)
+
+    def transition(self, ctx, ys):
+        """Append tokens to contexts.
+
+        Args:
+            ctx (np.ndarray): `[B, N-1]`, indices of n-grams of the context suffixes at each order
+            ys (np.ndarray): `[B]`
+        Returns:
+            new_ctx (np.ndarray): `[B, N-1]`
+
+        """
+        bs = ctx.shape[0]
+        new_ctx = np.full_like(ctx, -1)
+        if self.order > 1:
+            new_ctx[:, 0] = self._find(1, np.zeros(bs, dtype=np.int64), ys)
+        for n in range(2, self.order):
+            new_ctx[:, n - 1] = self._find(n, ctx[:, n - 2], ys)
+        return new_ctx
+
+    def next_token_log_probs(self, ctx):
+        """Compute log-probabilities of the next tokens with back-off.
+
+        Args:
+            ctx (np.ndarray): `[B, N-1]`
+        Returns:
+            log_probs (np.ndarray): `[B, vocab + 1]`
+
+        """
+        bs = ctx.shape[0]
+        log_probs = np.tile(self.logps_uni, (bs, 1))
+        for n in range(1, self.order):
+            c = ctx[:, n - 1]
+            valid = c >= 0
+            c = np.maximum(c, 0)
+            # back off from the (n+1)-grams to the n-grams
+            log_probs += np.where(valid, self.bows[n][c], 0.)[:, None]
+            # overwrite with the observed (n+1)-grams
+            lo = np.where(valid, self.child_lo[n][c], 0)
+            lengths = np.where(valid, self.child_hi[n][c] - lo, 0)
+            if lengths.sum() == 0:
+                continue
+            rows = np.repeat(np.arange(bs), lengths)
+            offsets = np.repeat(lo - (np.cumsum(lengths) - lengths), lengths)
+            idx = np.arange(lengths.sum()) + offsets
+            log_probs[rows, self.words[n + 1][idx]] = self.logps[n + 1][idx]
+        return log_probs
+
+    def predict(self, ys, state=None, mems=None, cache=None):
+        """Update states with the last tokens and compute log-probabilities of the next tokens.
+
+        Args:
+            ys (LongTensor): `[B, L]`, only the last tokens are used
+            state (list): length `B`, each of which is `[N-1]` or None (before the first token)
+            mems: dummy interfance for TransformerXL
+            cache: dummy interfance for TransformerLM/TransformerXL
+        Returns:
+            lmout: dummy interfance for cold fusion
+            state (list): length `B`, each of which is `[N-1]`
+            log_probs (FloatTensor): `[B, 1, vocab]`
+
+        """
+        bs = ys.size(0)
+        if state is None:
+            state = [None] * bs
+        ys = tensor2np(ys[:, -1]).astype(np.int64)
+        is_first = np.array([s is None for s in state])
+        # NOTE: <sos> (shared with <eos>) is replaced with <s>
+        ys = np.where(is_first, self.bos, ys)
+        ctx = np.stack([s if s is not None else np.full(self.order - 1, -1, dtype=np.int64)
+                        for s in state], axis=0)
+
+        new_ctx = self.transition(ctx, ys)
+        log_probs = self.next_token_log_probs(new_ctx)[:, :self.vocab]
+        log_probs = np2tensor(log_probs.astype(np.float32), self.device).unsqueeze(1)
+        return None, [new_ctx[j] for j in range(bs)], log_probs
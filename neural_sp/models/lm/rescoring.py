@@ -0,0 +1,57 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Batched N-best rescoring with language models."""
+
+import logging
+import numpy as np
+import torch
+
+from neural_sp.models.torch_utils import np2tensor
+from neural_sp.models.torch_utils import pad_list
+from neural_sp.models.torch_utils import tensor2np
+
+logger = logging.getLogger(__name__)
+
+
+def score_sequences(lm, ys, reverse=False, normalize_length=False, batch_size=0):
+    """Compute log-probabilities of token sequences with a LM.
+        Sequences are sorted by length and padded into mini-batches,
+        so that the LM runs only once per mini-batch.
+
+    Args:
+        lm (LMBase): language model
+        ys (list): length `N`, each of which contains token indices starting with <sos>
+        reverse (bool): score reversed sequences with a backward LM
+        normalize_length (bool): divide scores by the number of scored tokens
+        batch_size (int): maximum number of sequences per LM call (0: all sequences at once)
+    Returns:
+        scores (np.ndarray): `[N]`
+
+    """
+    ys = [np.fromiter(y, dtype=np.int64)[::-1] if reverse else np.fromiter(y, dtype=np.int64) for y in ys]
+    scores = np.zeros(len(ys), dtype=np.float32)
+
+    # NOTE: sequences including <sos> only have no token to score
+    order = sorted([i for i in range(len(ys)) if len(ys[i]) > 1], key=lambda i: len(ys[i]))
+    if batch_size <= 0:
+        batch_size = max(1, len(order))
+
+    with torch.no_grad():
+        for offset in range(0, len(order), batch_size):
+            indices = order[offset:offset + batch_size]
+            ys_in = pad_list([np2tensor(ys[i][:-1].copy(), lm.device) for i in indices], lm.pad)  # `[B, L-1]`
+            ys_out = pad_list([np2tensor(ys[i][1:].copy(), lm.device) for i in indices], -1)  # `[B, L-1]`
+            mask = ys_out != -1
+
+            _, _, log_probs = lm.predict(ys_in, None)  # `[B, L-1, vocab]`
+            token_scores = log_probs.gather(2, ys_out.clamp(min=0).unsqueeze(2)).squeeze(2)  # `[B, L-1]`
+            scores_b = token_scores.masked_fill(~mask, 0).sum(1)
+            if normalize_length:
+                scores_b = scores_b / mask.sum(1)
+            scores[indices] = tensor2np(scores_b)
+
+    return scores
@@ -47,9 +47,7 @@ class RNNLM(LMBase):
         # for cache
         self.cache_theta = 0.2  # smoothing parameter
         self.cache_lambda = 0.2  # cache weight
-        self.cache_ids = []
-        self.cache_keys = []
-        self.cache_attn = []
+        self.reset_neural_cache()
 
         self.embed = nn.Embedding(self.vocab, args.emb_dim, padding_idx=self.pad)
         self.dropout_embed = nn.Dropout(p=args.dropout_in)
@@ -215,7 +213,7 @@ class RNNLM(LMBase):
         if self.adaptive_softmax is None:
             if self.output_proj is not None:
                 ys_emb = self.output_proj(ys_emb)
-            logits = self.output(ys_emb)
+            logits = self.output_logits(ys_emb)
         else:
             logits = ys_emb
 
@@ -63,9 +63,7 @@ class TransformerXL(LMBase):
         # for cache
         self.cache_theta = 0.2  # smoothing parameter
         self.cache_lambda = 0.2  # cache weight
-        self.cache_ids = []
-        self.cache_keys = []
-        self.cache_attn = []
+        self.reset_neural_cache()
 
         # positional embedding
         self.pos_emb = XLPositionalEmbedding(self.d_model, args.dropout_in)
@@ -199,17 +197,17 @@ class TransformerXL(LMBase):
             ys (LongTensor): `[B, L]`
             state (list): dummy interfance for RNNLM
             mems (list): length `n_layers`, each of which contains a FloatTensor `[B, mlen, d_model]`
-            cache (list): length `L`, each of which contains a FloatTensor `[B, L-1, d_model]`
+            cache (list): length `n_layers`, each of which contains a dict of
+                projected keys/values of the preceding tokens (see `decode_incremental`)
             incremental (bool): ASR decoding mode
         Returns:
             logits (FloatTensor): `[B, L, vocab]`
             out (FloatTensor): `[B, L, d_model]`
-            new_cache (list): length `n_layers`, each of which contains a FloatTensor `[B, L, d_model]`
+            new_mems (list): length `n_layers`, each of which contains a FloatTensor `[B, mlen, d_model]`
 
         """
-        # for ASR decoding
-        if cache is None:
-            cache = [None] * self.n_layers  # 1-th to L-th layer
+        if incremental:
+            return self.decode_incremental(ys, mems, cache)
 
         if mems is None:
             mems = self.init_memory()
@@ -218,8 +216,6 @@ class TransformerXL(LMBase):
             mlen = mems[0].size(1)
 
         bs, ylen = ys.size()[:2]
-        if incremental and cache[0] is not None:
-            ylen = cache[0].size(1) + 1
 
         # Create the self-attention mask
         causal_mask = ys.new_ones(ylen, ylen + mlen).byte()
@@ -229,34 +225,97 @@ class TransformerXL(LMBase):
         out = self.dropout_emb(self.embed(ys.long()) * self.scale)
         pos_embs = self.pos_emb(ys, mlen=mlen, zero_center_offset=self.zero_center_offset)
 
-        new_mems = [None] * self.n_layers
-        new_cache = [None] * self.n_layers
         hidden_states = [out]
         for lth, (mem, layer) in enumerate(zip(mems, self.layers)):
-            if incremental and mlen > 0 and mem.size(0) != bs:
-                mem = mem.repeat([bs, 1, 1])
-            out = layer(out, causal_mask, cache=cache[lth],
-                        pos_embs=pos_embs, memory=mem, u_bias=self.u_bias, v_bias=self.v_bias)
-            if incremental:
-                new_cache[lth] = out
-            elif lth < self.n_layers - 1:
+            out = layer(out, causal_mask, pos_embs=pos_embs, memory=mem,
+                        u_bias=self.u_bias, v_bias=self.v_bias)
+            if lth < self.n_layers - 1:
                 hidden_states.append(out)
                 # NOTE: outputs from the last layer is not used for memory
             if not self.training and layer.yy_aws is not None:
                 setattr(self, 'yy_aws_layer%d' % lth, tensor2np(layer.yy_aws))
         out = self.norm_out(out)
         if self.adaptive_softmax is None:
-            logits = self.output(out)
+            logits = self.output_logits(out)
         else:
             logits = out
 
-        if incremental:
-            # NOTE: do not update memory here during ASR decoding
-            return logits, out, new_cache
+        # Update memory
+        new_mems = self.update_memory(mems, hidden_states)
+        return logits, out, new_mems
+
+    def decode_incremental(self, ys, mems=None, cache=None):
+        """Decode new tokens incrementally for ASR decoding.
+            Keys and values of the preceding tokens are projected only once
+            per layer, and the memory is shared by all hypotheses.
+
+        Args:
+            ys (LongTensor): `[B, L]`, all tokens including those already in cache
+            mems (list): length `n_layers`, each of which contains a FloatTensor `[1 or B, mlen, d_model]`
+            cache (list): length `n_layers`, each of which contains a dict
+                mem_k (FloatTensor): `[1 or B, H, mlen, d_k]`
+                mem_v (FloatTensor): `[1 or B, H, mlen, d_k]`
+                k (FloatTensor): `[B, H, L-1, d_k]`
+                v (FloatTensor): `[B, H, L-1, d_k]`
+        Returns:
+            logits (FloatTensor): `[B, L - plen, vocab]`, for the tokens not in cache
+            out (FloatTensor): `[B, L - plen, d_model]`
+            new_cache (list): length `n_layers`, each of which contains a dict
+
+        """
+        if cache is None:
+            cache = [None] * self.n_layers
+        if mems is None:
+            mems = [None] * self.n_layers
+        mlen = mems[0].size(1) if mems[0] is not None and mems[0].dim() > 1 else 0
+        plen = cache[0]['k'].size(2) if cache[0] is not None else 0
+        assert ys.size(1) > plen
+
+        # Create the self-attention mask for new tokens
+        ys_new = ys[:, plen:]
+        qlen = ys_new.size(1)
+        causal_mask = torch.tril(ys.new_ones(qlen, mlen + plen + qlen, dtype=torch.uint8),
+                                 diagonal=mlen + plen).unsqueeze(0)  # `[1, qlen, mlen+plen+qlen]`
+
+        out = self.dropout_emb(self.embed(ys_new.long()) * self.scale)
+        pos_embs = self.pos_emb(ys, mlen=mlen, zero_center_offset=self.zero_center_offset)
+
+        new_cache = [None] * self.n_layers
+        for lth, (mem, layer) in enumerate(zip(mems, self.layers)):
+            out, new_cache[lth] = layer.forward_incremental(
+                out, causal_mask, pos_embs, cache[lth], mem, self.u_bias, self.v_bias)
+        out = self.norm_out(out)
+        if self.adaptive_softmax is None:
+            logits = self.output_logits(out)
         else:
-            # Update memory
-            new_mems = self.update_memory(mems, hidden_states)
-            return logits, out, new_mems
+            logits = out
+
+        # NOTE: do not update memory here during ASR decoding
+        return logits, out, new_cache
+
+    def reorder_state(self, cache, index):
+        """Select states of surviving hypotheses in beam search.
+            The memory shared by all hypotheses is not copied.
+
+        Args:
+            cache (list): length `n_layers`, each of which contains a dict
+            index (LongTensor or list): `[B']`, indices of hypotheses in the previous step
+        Returns:
+            new_cache (list): length `n_layers`, each of which contains a dict
+
+        """
+        if not torch.is_tensor(index):
+            index = torch.tensor(index, dtype=torch.long, device=self.device)
+        new_cache = []
+        for cache_l in cache:
+            new_cache_l = {}
+            for k, v in cache_l.items():
+                if k in ['mem_k', 'mem_v'] and (v is None or v.size(0) == 1):
+                    new_cache_l[k] = v
+                else:
+                    new_cache_l[k] = v.index_select(0, index)
+            new_cache.append(new_cache_l)
+        return new_cache
 
     def plot_attention(self, n_cols=4):
         """Plot attention for each head in all layers."""
@@ -6,10 +6,11 @@
 
 """Single-head attention layer."""
 
-import numpy as np
 import torch
 import torch.nn as nn
 
+from neural_sp.models.torch_utils import softmax_float32
+
 
 class AttentionMechanism(nn.Module):
     """Single-head attention layer.
@@ -115,7 +116,7 @@ class AttentionMechanism(nn.Module):
             p_choose_i: dummy interface for MoChA/MMA
 
         """
-        bs, klen = key.size()[:2]
+        bs, klen = query.size(0), key.size(1)
         qlen = query.size(1)
 
         if aw_prev is None:
@@ -125,50 +126,58 @@ class AttentionMechanism(nn.Module):
 
         # Pre-computation of encoder-side features for computing scores
         if self.key is None or not cache:
-            if self.atype in ['add', 'trigerred_attention',
+            # NOTE: encoder outputs broadcast across hypotheses are projected only once
+            if key.size(0) > 1 and key.stride(0) == 0:
+                key = key[0:1]
+            if self.atype in ['add', 'triggered_attention',
                               'location', 'dot', 'luong_general']:
                 self.key = self.w_key(key)
             else:
                 self.key = key
             self.mask = mask
             if mask is not None:
-                assert self.mask.size() == (bs, 1, klen), (self.mask.size(), (bs, 1, klen))
+                assert self.mask.size() == (key.size(0), 1, klen), (self.mask.size(), (key.size(0), 1, klen))
 
         # for batch beam search decoding
-        if self.key.size(0) != query.size(0):
-            self.key = self.key[0: 1, :, :].repeat([query.size(0), 1, 1])
+        # NOTE: the cached key of a single utterance is broadcast without copy
+        key = self.key
+        if key.size(0) != bs:
+            key = key[0:1].expand(bs, -1, -1)
+        if value.size(0) != bs:
+            value = value[0:1].expand(bs, -1, -1)
 
         if self.atype == 'no':
             raise NotImplementedError
 
         elif self.atype in ['add', 'triggered_attention']:
-            tmp = self.key.unsqueeze(1) + self.w_query(query).unsqueeze(2)
+            tmp = key.unsqueeze(1) + self.w_query(query).unsqueeze(2)
             e = self.v(torch.tanh(tmp)).squeeze(3)
 
         elif self.atype == 'location':
             conv_feat = self.conv(aw_prev.unsqueeze(1)).squeeze(2)  # `[B, ch, klen]`
             conv_feat = conv_feat.transpose(2, 1).contiguous().unsqueeze(1)  # `[B, 1, klen, ch]`
-            tmp = self.key.unsqueeze(1) + self.w_query(query).unsqueeze(2)
+            tmp = key.unsqueeze(1) + self.w_query(query).unsqueeze(2)
             e = self.v(torch.tanh(tmp + self.w_conv(conv_feat))).squeeze(3)
 
         elif self.atype == 'dot':
-            e = torch.bmm(self.w_query(query), self.key.transpose(2, 1))
+            e = torch.bmm(self.w_query(query), key.transpose(2, 1))
 
         elif self.atype in ['luong_dot', 'luong_general']:
-            e = torch.bmm(query, self.key.transpose(2, 1))
+            e = torch.bmm(query, key.transpose(2, 1))
 
         elif self.atype == 'luong_concat':
-            query = query.repeat([1, klen, 1])
-            e = self.v(torch.tanh(self.w(torch.cat([self.key, query], dim=-1)))).transpose(2, 1)
+            query = query.expand(-1, klen, -1)
+            e = self.v(torch.tanh(self.w(torch.cat([key, query], dim=-1)))).transpose(2, 1)
         assert e.size() == (bs, qlen, klen), (e.size(), (bs, qlen, klen))
 
-        NEG_INF = float(np.finfo(torch.tensor(0, dtype=e.dtype).numpy().dtype).min)
+        NEG_INF = float(torch.finfo(e.dtype).min)
 
         # Mask the right part from the trigger point
         if self.atype == 'triggered_attention':
             assert trigger_point is not None
-            for b in range(bs):
-                e[b, :, trigger_point[b] + self.lookahead + 1:] = NEG_INF
+            trigger_mask = torch.arange(klen, device=e.device).unsqueeze(0) > \
+                (trigger_point.to(e.device).unsqueeze(1) + self.lookahead)  # `[B, klen]`
+            e = e.masked_fill_(trigger_mask.unsqueeze(1), NEG_INF)
 
         # Compute attention weights, context vector
         if self.mask is not None:
@@ -176,7 +185,7 @@ class AttentionMechanism(nn.Module):
         if self.sigmoid_smoothing:
             aw = torch.sigmoid(e) / torch.sigmoid(e).sum(-1).unsqueeze(-1)
         else:
-            aw = torch.softmax(e * self.sharpening_factor, dim=-1)
+            aw = softmax_float32(e * self.sharpening_factor, dim=-1)
         aw = self.dropout(aw)
         cv = torch.bmm(aw, value)
 
@@ -7,7 +7,9 @@
 """Dilated causal convolution."""
 
 import logging
+import torch
 import torch.nn as nn
+import torch.nn.functional as F
 
 from neural_sp.models.modules.initialization import init_with_xavier_uniform
 
@@ -61,3 +63,28 @@ class CausalConv1d(nn.Module):
             xs = xs[:, :, :-self.padding]
         xs = xs.transpose(2, 1).contiguous()
         return xs
+
+    def forward_chunk(self, xs, cache=None):
+        """Forward pass for a chunk in streaming inference.
+
+        The last `padding` input frames are cached instead of re-feeding
+        overlapping context, so that each frame is convolved only once.
+
+        Args:
+            xs (FloatTensor): `[B, T, C_in]`
+            cache (FloatTensor): `[B, padding, C_in]`, inputs of previous chunks
+        Returns:
+            xs (FloatTensor): `[B, T, C_out]`
+            cache (FloatTensor): `[B, padding, C_in]`
+
+        """
+        if self.padding == 0:
+            return self.forward(xs), None
+        if cache is None:
+            cache = xs.new_zeros(xs.size(0), self.padding, xs.size(2))
+        cat = torch.cat([cache, xs], dim=1)
+        cache = cat[:, -self.padding:]
+        xs = F.conv1d(cat.transpose(2, 1), self.conv1d.weight, self.conv1d.bias,
+                      dilation=self.conv1d.dilation)
+        xs = xs.transpose(2, 1).contiguous()
+        return xs, cache
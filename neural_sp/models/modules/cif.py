@@ -50,15 +50,26 @@ class CIF(nn.Module):
         else:
             logger.info('Parameter initialization is skipped.')
 
+        self.reset()
+
     def reset_parameters(self):
         """Initialize parameters with Xavier uniform distribution."""
         logger.info('===== Initialize %s with Xavier uniform distribution =====' % self.__class__.__name__)
         for n, p in self.named_parameters():
             init_with_xavier_uniform(n, p)
 
+    def reset(self):
+        """Reset the state for incremental inference."""
+        self.state = None
+
     def forward(self, eouts, elens, ylens=None, mode='parallel'):
         """Forward pass.
 
+        Frames are integrated into tokens by the cumulative sum of alpha, where
+        the k-th token integrates the portion of alpha in [k * beta, (k + 1) * beta).
+        In the incremental mode, the next token of each utterance is fired
+        from the carried-over state, which is cleared by `reset`.
+
         Args:
             eouts (FloatTensor): `[B, T, enc_dim]`
             elens (IntTensor): `[B]`
@@ -71,89 +82,72 @@ class CIF(nn.Module):
 
         """
         bs, xmax, enc_dim = eouts.size()
+        device = eouts.device
 
         # 1d conv
         conv_feat = self.conv1d(eouts.transpose(2, 1)).transpose(2, 1)  # `[B, T, enc_dim]`
         conv_feat = torch.relu(self.norm(conv_feat))
         alpha = torch.sigmoid(self.proj(conv_feat)).squeeze(2)  # `[B, T]`
 
-        # normalization
+        # padding
+        mask = make_pad_mask(elens.to(device))
+        alpha_masked = alpha.masked_fill(mask == 0, 0)
+
         if mode == 'parallel':
-            # padding
             assert ylens is not None
-            device = eouts.device
             ylens = ylens.to(device)
-            mask = make_pad_mask(elens.to(device))
-            alpha = alpha.clone().masked_fill_(mask == 0, 0)
-
-            alpha_norm = alpha / alpha.sum(1, keepdim=True) * ylens.float().unsqueeze(1)
+            # normalization so that exactly ylens tokens are fired
+            alpha_norm = alpha_masked / alpha_masked.sum(1, keepdim=True) * (ylens.float() * self.beta).unsqueeze(1)
             ymax = int(ylens.max().item())
+
+            token_ids = torch.arange(ymax, device=device).unsqueeze(0).repeat([bs, 1])  # `[B, L]`
+            aws = self._integrate(alpha_norm, alpha_norm.new_zeros(bs), token_ids)
+            aws = aws.masked_fill((token_ids >= ylens.unsqueeze(1)).unsqueeze(2), 0)
+
         elif mode == 'incremental':
-            alpha_norm = alpha  # infernece time
-            ymax = 1
-            if bs > 1:
-                raise NotImplementedError('Batch mode is not supported.')
-                # TODO(hirofumi0810): support batch mode
+            if self.state is None:
+                self.state = {'n_tokens': torch.zeros(bs, dtype=torch.int64, device=device),
+                              'offset': torch.zeros(bs, dtype=torch.int64, device=device),
+                              'accum': eouts.new_zeros(bs)}
+            n_tokens = self.state['n_tokens']
+            pos = torch.arange(xmax, device=device).unsqueeze(0)  # `[1, T]`
+            # NOTE: frames before the offset have been integrated into previous tokens
+            alpha_norm = alpha_masked.masked_fill(pos < self.state['offset'].unsqueeze(1), 0)  # infernece time
+            aws = self._integrate(alpha_norm, self.state['accum'], n_tokens.unsqueeze(1))  # `[B, 1, T]`
+
+            c = self.state['accum'].unsqueeze(1) + torch.cumsum(alpha_norm, dim=1)  # `[B, T]`
+            boundary = (n_tokens + 1).float() * self.beta
+            fired = c[:, -1] >= boundary
+            # tail handling
+            fired |= c[:, -1] - n_tokens.float() * self.beta >= 0.5
+            aws = aws.masked_fill(~fired[:, None, None], 0)
+
+            # Carry over to the next token from the frame where the boundary is located
+            fire_pos = (c < boundary.unsqueeze(1)).sum(1)  # `[B]`
+            c_prev = self.state['accum'] + alpha_norm.masked_fill(pos >= fire_pos.unsqueeze(1), 0).sum(1)
+            self.state = {'n_tokens': torch.where(fired, n_tokens + 1, n_tokens),
+                          'offset': torch.where(fired, fire_pos, self.state['offset']),
+                          'accum': torch.where(fired, c_prev, self.state['accum'])}
         else:
             raise ValueError(mode)
 
-        cv = eouts.new_zeros(bs, ymax + 1, enc_dim)
-        aws = eouts.new_zeros(bs, ymax + 1, xmax)
-        n_tokens = torch.zeros(bs, dtype=torch.int64)
-        state = eouts.new_zeros(bs, self.enc_dim)
-        alpha_accum = eouts.new_zeros(bs)
-        for j in range(xmax):
-            alpha_accum_prev = alpha_accum
-            alpha_accum += alpha_norm[:, j]
-
-            if mode == 'parallel' and (alpha_accum >= self.beta).sum() == 0:
-                # No boundary is located in all utterances in mini-batch
-                # Carry over to the next frame
-                state += alpha_norm[:, j, None] * eouts[:, j]
-                aws[:, n_tokens, j] += alpha_norm[:, j]
-            else:
-                for b in range(bs):
-                    # skip the padding region
-                    if j > elens[b] - 1:
-                        continue
-
-                    # skip all-fired utterance
-                    if mode == 'parallel' and n_tokens[b].item() >= ylens[b]:
-                        continue
-
-                    if alpha_accum[b] < self.beta:
-                        # No boundary is located
-                        # Carry over to the next frame
-                        state[b] += alpha_norm[b, j, None] * eouts[b, j]
-                        aws[b, n_tokens[b], j] += alpha_norm[b, j]
-
-                        # tail handling
-                        if mode == 'incremental' and j == elens[b] - 1:
-                            if alpha_accum[b] >= 0.5:
-                                n_tokens[b] += 1
-                                cv[b, n_tokens[b]] = state[b]
-                            break
-                    else:
-                        # A boundary is located
-                        ak1 = 1 - alpha_accum_prev[b]
-                        ak2 = alpha_norm[b, j] - ak1
-                        cv[b, n_tokens[b]] = state[b] + ak1 * eouts[b, j]
-                        aws[b, n_tokens[b], j] += ak1
-                        n_tokens[b] += 1
-                        # Carry over to the next frame
-                        state[b] = ak2 * eouts[b, j]
-                        alpha_accum[b] = ak2
-                        aws[b, n_tokens[b], j] += ak2
-
-                        if mode == 'incremental':
-                            break
-
-                if mode == 'incremental' and n_tokens[0] >= 1:
-                    break
-                    # TODO(hirofumi0810): support batch mode
-
-        # truncate
-        cv = cv[:, :ymax]
-        aws = aws[:, :ymax]
-
+        cv = torch.bmm(aws, eouts)  # `[B, L, enc_dim]`
         return cv, alpha, aws
+
+    def _integrate(self, alpha, accum, token_ids):
+        """Compute weights of frames for each token.
+
+        Args:
+            alpha (FloatTensor): `[B, T]`
+            accum (FloatTensor): `[B]`, accumulated alpha before the first frame
+            token_ids (LongTensor): `[B, L]`
+        Returns:
+            aws (FloatTensor): `[B, L, T]`
+
+        """
+        c = accum.unsqueeze(1) + torch.cumsum(alpha, dim=1)  # `[B, T]`
+        c_prev = c - alpha
+        left = token_ids.float().unsqueeze(2) * self.beta  # `[B, L, 1]`
+        right = left + self.beta
+        aws = torch.min(c.unsqueeze(1), right) - torch.max(c_prev.unsqueeze(1), left)
+        return torch.clamp(aws, min=0)
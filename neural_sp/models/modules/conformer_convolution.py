@@ -7,6 +7,8 @@
 """Convolution block for Conformer encoder."""
 
 import logging
+import math
+import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
@@ -31,6 +33,7 @@ class ConformerConvBlock(nn.Module):
         super().__init__()
 
         assert (kernel_size - 1) % 2 == 0, 'kernel_size must be the odd number.'
+        self.context = (kernel_size - 1) // 2
 
         self.pointwise_conv1 = nn.Conv1d(in_channels=d_model,
                                          out_channels=d_model * 2,  # for GLU
@@ -63,11 +66,13 @@ class ConformerConvBlock(nn.Module):
             for n, p in layer.named_parameters():
                 init_with_xavier_uniform(n, p)
 
-    def forward(self, xs):
+    def forward(self, xs, chunk_size=0):
         """Forward pass.
 
         Args:
             xs (FloatTensor): `[B, T, d_model]`
+            chunk_size (int): restrict the right context of the depthwise convolution
+                to each chunk of this size for chunkwise streaming (0: disabled)
         Returns:
             xs (FloatTensor): `[B, T, d_model]`
 
@@ -79,7 +84,10 @@ class ConformerConvBlock(nn.Module):
         xs = xs.transpose(2, 1)  # `[B, T, 2 * C]`
         xs = F.glu(xs)  # `[B, T, C]`
         xs = xs.transpose(2, 1).contiguous()  # `[B, C, T]`
-        xs = self.depthwise_conv(xs)  # `[B, C, T]`
+        if chunk_size > 0:
+            xs = self._depthwise_conv_chunkwise(xs, chunk_size)  # `[B, C, T]`
+        else:
+            xs = self.depthwise_conv(xs)  # `[B, C, T]`
 
         xs = self.batch_norm(xs)
         xs = self.activation(xs)
@@ -87,3 +95,66 @@ class ConformerConvBlock(nn.Module):
 
         xs = xs.transpose(2, 1).contiguous()  # `[B, T, C]`
         return xs
+
+    def _depthwise_conv_chunkwise(self, xs, chunk_size):
+        """Depthwise convolution whose right context does not go beyond each chunk.
+            Frames in the following chunks are regarded as zero-padded frames
+            as in `forward_chunk`, while the left context is not truncated.
+
+        Args:
+            xs (FloatTensor): `[B, C, T]`
+            chunk_size (int): number of frames in each chunk
+        Returns:
+            xs (FloatTensor): `[B, C, T]`
+
+        """
+        bs, C, T = xs.size()
+        n_chunks = math.ceil(T / chunk_size)
+        xs = F.pad(xs, (self.context, n_chunks * chunk_size - T))  # `[B, C, context + n_chunks * chunk_size]`
+        xs = xs.unfold(2, self.context + chunk_size, chunk_size)  # `[B, C, n_chunks, context + chunk_size]`
+        xs = xs.transpose(2, 1).reshape(bs * n_chunks, C, self.context + chunk_size)
+        xs = self.depthwise_conv(xs)[:, :, self.context:]  # `[B * n_chunks, C, chunk_size]`
+        xs = xs.reshape(bs, n_chunks, C, chunk_size).transpose(2, 1).reshape(bs, C, n_chunks * chunk_size)
+        return xs[:, :, :T]
+
+    def forward_chunk(self, xs, cache=None, n_current=None):
+        """Forward pass for a chunk in streaming inference.
+
+        Inputs of the depthwise convolution for the last `(kernel_size - 1) // 2`
+        current frames are cached, so that the pointwise convolution is not
+        recomputed for the left context. The right context of the current frames
+        does not go beyond the chunk as in `forward` with chunk_size.
+
+        Args:
+            xs (FloatTensor): `[B, T, d_model]`
+            cache (FloatTensor): `[B, d_model, (kernel_size - 1) // 2]`
+            n_current (int): number of current frames (the rest is lookahead)
+        Returns:
+            xs (FloatTensor): `[B, T, d_model]`
+            cache (FloatTensor): `[B, d_model, (kernel_size - 1) // 2]`
+
+        """
+        if n_current is None:
+            n_current = xs.size(1)
+
+        xs = xs.transpose(2, 1).contiguous()  # `[B, C, T]`
+        xs = self.pointwise_conv1(xs)  # `[B, 2 * C, T]`
+        xs = F.glu(xs, dim=1)  # `[B, C, T]`
+        if cache is not None:
+            xs = torch.cat([cache, xs], dim=2)  # `[B, C, mlen + T]`
+        mlen = 0 if cache is None else cache.size(2)
+        cache = xs[:, :, max(0, mlen + n_current - self.context):mlen + n_current]
+        xs_out = self.depthwise_conv(xs[:, :, :mlen + n_current])[:, :, mlen:]  # `[B, C, n_current]`
+        if xs.size(2) > mlen + n_current:
+            # NOTE: right context beyond the lookahead frames is zero-padded
+            start = max(0, mlen + n_current - self.context)
+            xs_la = self.depthwise_conv(xs[:, :, start:])[:, :, mlen + n_current - start:]
+            xs_out = torch.cat([xs_out, xs_la], dim=2)  # `[B, C, T]`
+        xs = xs_out
+
+        xs = self.batch_norm(xs)
+        xs = self.activation(xs)
+        xs = self.pointwise_conv2(xs)  # `[B, C, T]`
+
+        xs = xs.transpose(2, 1).contiguous()  # `[B, T, C]`
+        return xs, cache
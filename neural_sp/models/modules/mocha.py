@@ -11,7 +11,6 @@
 
 import logging
 import math
-import numpy as np
 import random
 import torch
 import torch.nn as nn
@@ -149,7 +148,7 @@ class MonotonicEnergy(nn.Module):
         if self.r is not None:
             e = e + self.r
         if m is not None:
-            NEG_INF = float(np.finfo(torch.tensor(0, dtype=e.dtype).numpy().dtype).min)
+            NEG_INF = float(torch.finfo(e.dtype).min)
             e = e.masked_fill_(m == 0, NEG_INF)
         assert e.size() == (bs, self.n_heads, qlen, klen), \
             (e.size(), (bs, self.n_heads, qlen, klen))
@@ -256,7 +255,7 @@ class ChunkEnergy(nn.Module):
             r = torch.matmul(query, k) / self.scale
 
         if m is not None:
-            NEG_INF = float(np.finfo(torch.tensor(0, dtype=r.dtype).numpy().dtype).min)
+            NEG_INF = float(torch.finfo(r.dtype).min)
             r = r.masked_fill_(m == 0, NEG_INF)
         assert r.size() == (bs, self.n_heads, qlen, klen), \
             (r.size(), (bs, self.n_heads, qlen, klen))
@@ -396,13 +395,10 @@ class MoChA(nn.Module):
             shifted_1mp_choose = torch.cat([e_ma.new_ones(bs, self.n_heads_ma, 1, 1),
                                             1 - p_choose[:, :, i:i + 1, :-1]], dim=-1)
             # Compute attention distribution recursively as
-            # q_j = (1 - p_choose_j) * q_(j-1) + aw_prev_j
+            # q_j = (1 - p_choose_(j-1)) * q_(j-1) + aw_prev_j
             # alpha_j = p_choose_j * q_j
-            q = e_ma.new_zeros(bs, self.n_heads_ma, 1, klen + 1)
-            for j in range(klen):
-                q[:, :, i:i + 1, j + 1] = shifted_1mp_choose[:, :, i:i + 1, j].clone() * q[:, :, i:i + 1, j].clone() + \
-                    aw_prev[:, :, :, j].clone()
-            aw_prev = p_choose[:, :, i:i + 1] * q[:, :, i:i + 1, 1:]  # `[B, H_ma, 1, klen]`
+            q = linear_recurrence(shifted_1mp_choose, aw_prev[:, :, :, :klen])  # `[B, H_ma, 1, klen]`
+            aw_prev = p_choose[:, :, i:i + 1] * q  # `[B, H_ma, 1, klen]`
             alpha.append(aw_prev)
         alpha = torch.cat(alpha, dim=2) if qlen > 1 else alpha[-1]  # `[B, H_ma, qlen, klen]`
         return alpha, p_choose
@@ -414,16 +410,20 @@ class MoChA(nn.Module):
 
         # safe_cumprod computes cumprod in logspace with numeric checks
         cumprod_1mp_choose = safe_cumprod(1 - p_choose, eps=self.eps)  # `[B, H_ma, qlen, klen]`
+        denom = 1 if self.no_denom else torch.clamp(cumprod_1mp_choose, min=self.eps, max=1.0)
+        # Mask the right part from the trigger point
+        decot_mask = None
+        if self.decot and trigger_point is not None:
+            decot_mask = torch.arange(klen, device=e_ma.device).unsqueeze(0) > (
+                trigger_point.to(e_ma.device).unsqueeze(1) + self.lookahead)  # `[B, klen]`
+            decot_mask = decot_mask[:, None, None]  # `[B, 1, 1, klen]`
         # Compute recurrence relation solution
         for i in range(qlen):
-            denom = 1 if self.no_denom else torch.clamp(
-                cumprod_1mp_choose[:, :, i:i + 1], min=self.eps, max=1.0)
+            denom_i = denom if self.no_denom else denom[:, :, i:i + 1]
             aw_prev = p_choose[:, :, i:i + 1] * cumprod_1mp_choose[:, :, i:i + 1] * torch.cumsum(
-                aw_prev / denom, dim=-1)  # `[B, H_ma, 1, klen]`
-            # Mask the right part from the trigger point
-            if self.decot and trigger_point is not None:
-                for b in range(bs):
-                    aw_prev[b, :, :, trigger_point[b] + self.lookahead + 1:] = 0
+                aw_prev / denom_i, dim=-1)  # `[B, H_ma, 1, klen]`
+            if decot_mask is not None:
+                aw_prev = aw_prev.masked_fill(decot_mask, 0)
             alpha.append(aw_prev)
 
         alpha = torch.cat(alpha, dim=2) if qlen > 1 else alpha[-1]  # `[B, H_ma, qlen, klen]`
@@ -461,23 +461,7 @@ class MoChA(nn.Module):
             alpha = p_choose_i * exclusive_cumprod(1 - p_choose_i)  # `[B, H_ma, 1 (qlen), klen]`
 
         if eps_wait > 0:
-            for b in range(bs):
-                # no boundary until the last frame for all heads
-                if alpha[b].sum() == 0:
-                    continue
-
-                leftmost = alpha[b, :, 0].nonzero()[:, -1].min().item()
-                rightmost = alpha[b, :, 0].nonzero()[:, -1].max().item()
-                for h in range(self.n_heads_ma):
-                    # no bondary at the h-th head
-                    if alpha[b, h, 0].sum().item() == 0:
-                        alpha[b, h, 0, min(rightmost, leftmost + eps_wait)] = 1
-                        continue
-
-                    # surpass acceptable latency
-                    if alpha[b, h, 0].nonzero()[:, -1].min().item() >= leftmost + eps_wait:
-                        alpha[b, h, 0, :] = 0  # reset
-                        alpha[b, h, 0, leftmost + eps_wait] = 1
+            alpha = head_synchronous_boundary(alpha, eps_wait)
 
         return alpha, None
 
@@ -621,6 +605,63 @@ class MoChA(nn.Module):
         return cv, alpha, beta, p_choose
 
 
+def linear_recurrence(a, b):
+    """Solve q_j = a_j * q_(j-1) + b_j (q_(-1) = 0) along the last dimension.
+
+    The recurrence is computed by a parallel prefix scan over affine maps in
+    log2(klen) steps without division by cumulative products.
+
+    Args:
+        a (FloatTensor): `[B, H, qlen, klen]`
+        b (FloatTensor): `[B, H, qlen, klen]`
+    Returns:
+        q (FloatTensor): `[B, H, qlen, klen]`
+
+    """
+    klen = a.size(-1)
+    d = 1
+    while d < klen:
+        b = torch.cat([b[..., :d], b[..., d:] + a[..., d:] * b[..., :-d]], dim=-1)
+        a = torch.cat([a[..., :d], a[..., d:] * a[..., :-d]], dim=-1)
+        d *= 2
+    return b
+
+
+def head_synchronous_boundary(alpha, eps_wait):
+    """Synchronize boundaries of monotonic attention heads for head-synchronous decoding.
+
+    Heads without a boundary are forced to attend at `eps_wait` frames after
+    the leftmost boundary among heads (but not beyond the rightmost one), and
+    heads whose boundary exceeds it are moved back there. Utterances without
+    any boundary are left untouched.
+
+    Args:
+        alpha (FloatTensor): `[B, H_ma, 1, klen]`
+        eps_wait (int): wait time delay
+    Returns:
+        alpha (FloatTensor): `[B, H_ma, 1, klen]`
+
+    """
+    klen = alpha.size(3)
+    is_bd = alpha[:, :, 0] != 0  # `[B, H_ma, klen]`
+    pos = torch.arange(klen, device=alpha.device)
+    has_bd = is_bd.any(dim=-1)  # `[B, H_ma]`
+    first = torch.where(is_bd, pos, pos.new_full((1,), klen)).min(dim=-1)[0]  # `[B, H_ma]`
+    last = torch.where(is_bd, pos, pos.new_full((1,), -1)).max(dim=-1)[0]  # `[B, H_ma]`
+    leftmost = first.min(dim=-1, keepdim=True)[0]  # `[B, 1]`
+    rightmost = last.max(dim=-1, keepdim=True)[0]  # `[B, 1]`
+    deadline = leftmost + eps_wait
+
+    no_bd = ~has_bd  # no bondary at the head
+    too_late = has_bd & (first >= deadline)  # surpass acceptable latency
+    target = torch.where(no_bd, torch.min(rightmost, deadline), deadline)  # `[B, H_ma]`
+    update = (no_bd | too_late) & has_bd.any(dim=-1, keepdim=True)
+    if not update.any():
+        return alpha
+    new_alpha = (pos == target.clamp(max=klen - 1).unsqueeze(-1)).to(alpha.dtype)  # `[B, H_ma, klen]`
+    return torch.where(update[:, :, None, None], new_alpha.unsqueeze(2), alpha)
+
+
 def headdrop(alpha, n_heads_mono, dropout):
     """HeadDrop regularization.
 
@@ -790,17 +831,17 @@ def hard_chunkwise_attention(alpha, u, mask, chunk_size, n_heads_chunk,
             u = u.view(bs, n_heads_mono, n_heads_chunk, qlen, klen)
 
     mask = alpha.clone().byte()  # `[B, H_ma, H_ca, qlen, klen]`
-    for b in range(bs):
-        for h in range(n_heads_mono):
-            if alpha[b, h, 0, 0].sum() > 0:
-                boundary = alpha[b, h, 0, 0].nonzero()[:, -1].min().item()
-                if chunk_size == -1:
-                    # infinite lookback attention
-                    mask[b, h, :, 0, 0:boundary + 1] = 1
-                else:
-                    mask[b, h, :, 0, max(0, boundary - chunk_size + 1):boundary + 1] = 1
-
-    NEG_INF = float(np.finfo(torch.tensor(0, dtype=u.dtype).numpy().dtype).min)
+    # attend to a window ending at the boundary (the first non-zero position)
+    pos = torch.arange(klen, device=alpha.device)
+    is_bd = alpha != 0
+    boundary = torch.where(is_bd, pos, pos.new_full((1,), klen)).min(dim=-1, keepdim=True)[0]
+    window = (pos <= boundary) & is_bd.any(dim=-1, keepdim=True)
+    if chunk_size != -1:
+        window &= pos > boundary - chunk_size
+    # else: infinite lookback attention
+    mask = mask.masked_fill(window, 1)
+
+    NEG_INF = float(torch.finfo(u.dtype).min)
     u = u.masked_fill(mask == 0, NEG_INF)
     beta = torch.softmax(u, dim=-1)
     return beta.view(bs, -1, qlen, klen)
@@ -8,11 +8,12 @@
 
 import logging
 import math
-import numpy as np
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 
 from neural_sp.models.modules.mocha import headdrop
+from neural_sp.models.torch_utils import softmax_float32
 
 logger = logging.getLogger(__name__)
 
@@ -91,22 +92,25 @@ class MultiheadAttentionMechanism(nn.Module):
         self.mask = None
 
     def forward(self, key, value, query, mask, aw_prev=None,
-                cache=False, mode='', trigger_point=None, eps_wait=-1):
+                cache=False, mode='', trigger_point=None, eps_wait=-1,
+                need_weights=True):
         """Forward pass.
 
         Args:
             key (FloatTensor): `[B, klen, kdim]`
             value (FloatTensor): `[B, klen, vdim]`
             query (FloatTensor): `[B, qlen, qdim]`
-            mask (ByteTensor): `[B, qlen, klen]`
+            mask (ByteTensor): `[B, qlen, klen]` or `[B, 1, klen]`
             aw_prev: dummy interface
             cache (bool): cache key, value, and mask
             mode: dummy interface for MoChA/MMA
             trigger_point: dummy interface for MoChA/MMA
             eps_wait: dummy interface for MMA
+            need_weights (bool): return attention weights.
+                If False, attention weights are not materialized when possible.
         Returns:
             cv (FloatTensor): `[B, qlen, vdim]`
-            aw (FloatTensor): `[B, H, qlen, klen]`
+            aw (FloatTensor): `[B, H, qlen, klen]` (None if not need_weights)
             beta: dummy interface for MoChA/MMA
             p_choose: dummy interface for MoChA/MMA
 
@@ -115,41 +119,97 @@ class MultiheadAttentionMechanism(nn.Module):
         qlen = query.size(1)
 
         if self.key is None or not cache:
-            self.key = self.w_key(key).view(bs, -1, self.n_heads, self.d_k)  # `[B, klen, H, d_k]`
-            self.value = self.w_value(value).view(bs, -1, self.n_heads, self.d_k)  # `[B, klen, H, d_k]`
+            self.key = self.w_key(key).view(bs, -1, self.n_heads, self.d_k).transpose(2, 1)  # `[B, H, klen, d_k]`
+            self.value = self.w_value(value).view(bs, -1, self.n_heads, self.d_k).transpose(2, 1)  # `[B, H, klen, d_k]`
             self.mask = mask
             if self.mask is not None:
-                self.mask = self.mask.unsqueeze(3).repeat([1, 1, 1, self.n_heads])
-                assert self.mask.size() == (bs, qlen, klen, self.n_heads), \
-                    (self.mask.size(), (bs, qlen, klen, self.n_heads))
-
-        query = self.w_query(query).view(bs, -1, self.n_heads, self.d_k)  # `[B, qlen, H, d_k]`
-
-        if self.atype == 'scaled_dot':
-            e = torch.einsum("bihd,bjhd->bijh", (query, self.key)) / self.scale  # `[B, qlen, klen, H]`
-        elif self.atype == 'add':
-            key = self.key.unsqueeze(1)  # `[B, 1, klen, H, d_k]`
-            query = query.unsqueeze(2)  # `[B, qlen, 1, H, d_k]`
-            tmp = torch.tanh(key + query).view(bs, qlen, klen, -1)  # `[B, qlen, klen, H, d_k]`
-            e = self.v(tmp)  # `[B, qlen, klen, H]`
-
-        # Compute attention weights
-        if self.mask is not None:
-            NEG_INF = float(np.finfo(torch.tensor(0, dtype=e.dtype).numpy().dtype).min)
-            e = e.masked_fill_(self.mask == 0, NEG_INF)  # `[B, qlen, klen, H]`
-        aw = torch.softmax(e, dim=2)
-        aw = self.dropout_attn(aw)
-        aw_masked = aw.clone()
-
-        # mask out each head independently (HeadDrop)
-        if self.dropout_head > 0 and self.training:
-            aw_masked = aw_masked.permute(0, 3, 1, 2)
-            aw_masked = headdrop(aw_masked, self.n_heads, self.dropout_head)  # `[B, H, qlen, klen]`
-            aw_masked = aw_masked.permute(0, 2, 3, 1)
-
-        cv = torch.einsum("bijh,bjhd->bihd", (aw_masked, self.value))  # `[B, qlen, H, d_k]`
-        cv = cv.contiguous().view(bs, -1, self.n_heads * self.d_k)  # `[B, qlen, H * d_k]`
+                # NOTE: broadcast over heads instead of repeating the mask
+                self.mask = (self.mask != 0).unsqueeze(1)  # `[B, 1, qlen (or 1), klen]`
+                assert self.mask.size(-1) == klen and self.mask.size(0) == bs, \
+                    (self.mask.size(), (bs, qlen, klen))
+
+        query = self.w_query(query).view(bs, -1, self.n_heads, self.d_k).transpose(2, 1)  # `[B, H, qlen, d_k]`
+        headdrop_on = self.dropout_head > 0 and self.training
+
+        if self.atype == 'scaled_dot' and not need_weights and not headdrop_on:
+            # fused kernel without materializing attention weights
+            attn_mask = None
+            if self.mask is not None:
+                NEG_INF = float(torch.finfo(query.dtype).min)
+                # NOTE: an additive mask keeps fully-masked queries uniform as in the unfused path
+                attn_mask = torch.zeros(self.mask.size(), dtype=query.dtype,
+                                        device=query.device).masked_fill_(~self.mask, NEG_INF)
+            cv = F.scaled_dot_product_attention(
+                query, self.key, self.value, attn_mask=attn_mask,
+                dropout_p=self.dropout_attn.p if self.training else 0.)  # `[B, H, qlen, d_k]`
+            aw = None
+        else:
+            if self.atype == 'scaled_dot':
+                e = torch.matmul(query, self.key.transpose(3, 2)) / self.scale  # `[B, H, qlen, klen]`
+            elif self.atype == 'add':
+                key = self.key.unsqueeze(2)  # `[B, H, 1, klen, d_k]`
+                query = query.unsqueeze(3)  # `[B, H, qlen, 1, d_k]`
+                tmp = torch.tanh(key + query).permute(0, 2, 3, 1, 4).contiguous().view(
+                    bs, qlen, klen, -1)  # `[B, qlen, klen, H * d_k]`
+                e = self.v(tmp).permute(0, 3, 1, 2)  # `[B, H, qlen, klen]`
+
+            # Compute attention weights
+            if self.mask is not None:
+                NEG_INF = float(torch.finfo(e.dtype).min)
+                e = e.masked_fill(~self.mask, NEG_INF)  # `[B, H, qlen, klen]`
+            aw = softmax_float32(e, dim=-1)
+            aw = self.dropout_attn(aw)
+
+            # mask out each head independently (HeadDrop)
+            aw_masked = aw
+            if headdrop_on:
+                aw_masked = headdrop(aw.clone(), self.n_heads, self.dropout_head)  # `[B, H, qlen, klen]`
+
+            cv = torch.matmul(aw_masked, self.value)  # `[B, H, qlen, d_k]`
+            if not need_weights:
+                aw = None
+
+        cv = cv.transpose(2, 1).contiguous().view(bs, -1, self.n_heads * self.d_k)  # `[B, qlen, H * d_k]`
         cv = self.w_out(cv)
-        aw = aw.permute(0, 3, 1, 2)  # `[B, H, qlen, klen]`
 
         return cv, aw, None, None
+
+    def forward_incremental(self, query, cache=None, need_weights=True):
+        """Incremental forward pass of self-attention for streaming encoding.
+            Keys and values of the preceding frames are projected only once
+            and cached.
+
+        Args:
+            query (FloatTensor): `[B, qlen, qdim]`, new frames
+            cache (dict): projected keys/values of the preceding frames
+                k (FloatTensor): `[B, H, plen, d_k]`
+                v (FloatTensor): `[B, H, plen, d_k]`
+            need_weights (bool): return attention weights
+        Returns:
+            cv (FloatTensor): `[B, qlen, vdim]`
+            aw (FloatTensor): `[B, H, qlen, plen+qlen]` (None if not need_weights)
+            new_cache (dict): projected keys/values including the new frames
+
+        """
+        assert self.atype == 'scaled_dot'
+        bs = query.size(0)
+
+        k = self.w_key(query).view(bs, -1, self.n_heads, self.d_k).transpose(2, 1)  # `[B, H, qlen, d_k]`
+        v = self.w_value(query).view(bs, -1, self.n_heads, self.d_k).transpose(2, 1)  # `[B, H, qlen, d_k]`
+        q = self.w_query(query).view(bs, -1, self.n_heads, self.d_k).transpose(2, 1)  # `[B, H, qlen, d_k]`
+        if cache is not None:
+            k = torch.cat([cache['k'], k], dim=2)  # `[B, H, plen+qlen, d_k]`
+            v = torch.cat([cache['v'], v], dim=2)  # `[B, H, plen+qlen, d_k]`
+
+        if need_weights:
+            e = torch.matmul(q, k.transpose(3, 2)) / self.scale  # `[B, H, qlen, plen+qlen]`
+            aw = softmax_float32(e, dim=-1)
+            cv = torch.matmul(self.dropout_attn(aw), v)  # `[B, H, qlen, d_k]`
+        else:
+            cv = F.scaled_dot_product_attention(
+                q, k, v, dropout_p=self.dropout_attn.p if self.training else 0.)  # `[B, H, qlen, d_k]`
+            aw = None
+        cv = cv.transpose(2, 1).contiguous().view(bs, -1, self.n_heads * self.d_k)  # `[B, qlen, H * d_k]`
+        cv = self.w_out(cv)
+
+        return cv, aw, {'k': k, 'v': v}
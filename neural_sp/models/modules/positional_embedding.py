@@ -69,11 +69,13 @@ class PositionalEncoding(nn.Module):
 
         logger.info('Positional encoding: %s' % pe_type)
 
-    def forward(self, xs, scale=True):
+    def forward(self, xs, scale=True, offset=0):
         """Forward pass.
 
         Args:
             xs (FloatTensor): `[B, T, d_model]`
+            scale (bool): multiply inputs by sqrt(d_model)
+            offset (int): position of the first frame (for streaming encoding)
         Returns:
             xs (FloatTensor): `[B, T, d_model]`
 
@@ -86,7 +88,7 @@ class PositionalEncoding(nn.Module):
             xs = self.dropout(xs)
             return xs
         elif self.pe_type == 'add':
-            xs = xs + self.pe[:, :xs.size(1)]
+            xs = xs + self.pe[:, offset:offset + xs.size(1)]
             xs = self.dropout(xs)
         elif '1dconv' in self.pe_type:
             xs = self.pe(xs)
@@ -96,7 +98,13 @@ class PositionalEncoding(nn.Module):
 
 
 class XLPositionalEmbedding(nn.Module):
-    """Positional embedding for TransformerXL."""
+    """Positional embedding for TransformerXL.
+
+    Sinusoidal embeddings are computed once for relative positions in
+    [-max_pos, max_pos] and sliced in each forward pass. The table is extended
+    when longer inputs are given.
+
+    """
 
     def __init__(self, d_model, dropout):
 
@@ -108,7 +116,26 @@ class XLPositionalEmbedding(nn.Module):
 
         self.dropout = nn.Dropout(p=dropout)
 
-    def forward(self, xs, mlen=0, clamp_len=-1, zero_center_offset=False):
+        self.max_pos = -1
+        self.table = None  # `[2 * max_pos + 1, d_model]`, positions in descending order
+
+    def _extend_table(self, max_pos):
+        """Compute the sinusoid table for positions from max_pos to -max_pos.
+
+        Args:
+            max_pos (int): maximum absolute position
+
+        """
+        if max_pos <= self.max_pos and self.table.device == self.inv_freq.device:
+            return
+        max_pos = max(max_pos, self.max_pos)
+        pos_idxs = torch.arange(max_pos, -max_pos - 1, -1.0, dtype=torch.float, device=self.inv_freq.device)
+        # outer product
+        sinusoid_inp = torch.einsum("i,j->ij", pos_idxs, self.inv_freq)
+        self.table = torch.cat([sinusoid_inp.sin(), sinusoid_inp.cos()], dim=-1)
+        self.max_pos = max_pos
+
+    def forward(self, xs, mlen=0, clamp_len=-1, zero_center_offset=False, bidirectional=False):
         """Forward pass.
 
         Args:
@@ -116,21 +143,30 @@ class XLPositionalEmbedding(nn.Module):
             mlen (int); length of memory
             clamp_len (int):
             zero_center_offset (bool):
+            bidirectional (bool): also embed negative positions for future keys.
+                Positions are from mlen+L-1 to -(L-1), so that they do not depend on L.
         Returns:
-            pos_emb (LongTensor): `[L, 1, d_model]`
+            pos_emb (LongTensor): `[L, 1, d_model]` (`[mlen+2L-1, 1, d_model]` if bidirectional)
 
         """
-        if zero_center_offset:
-            pos_idxs = torch.arange(mlen - 1, -xs.size(1) - 1, -1.0, dtype=torch.float, device=xs.device)
+        qlen = xs.size(1)
+        klen = mlen + qlen
+        n_pos = klen
+        # first (largest) position
+        start = mlen - 1 if zero_center_offset else klen - 1
+        if bidirectional:
+            start = klen - 1
+            n_pos = klen + qlen - 1
+        max_pos = max(start, n_pos - start - 1)
+        self._extend_table(max_pos)
+
+        if 0 < clamp_len < max_pos:
+            # truncate by maximum length
+            pos_idxs = torch.arange(start, start - n_pos, -1, device=self.table.device).clamp_(max=clamp_len)
+            if bidirectional:
+                pos_idxs.clamp_(min=-clamp_len)
+            pos_emb = self.table.index_select(0, self.max_pos - pos_idxs)
         else:
-            pos_idxs = torch.arange(mlen + xs.size(1) - 1, -1, -1.0, dtype=torch.float, device=xs.device)
-
-        # truncate by maximum length
-        if clamp_len > 0:
-            pos_idxs.clamp_(max=clamp_len)
-
-        # outer product
-        sinusoid_inp = torch.einsum("i,j->ij", pos_idxs, self.inv_freq)
-        pos_emb = torch.cat([sinusoid_inp.sin(), sinusoid_inp.cos()], dim=-1)
+            pos_emb = self.table[self.max_pos - start:self.max_pos - start + n_pos]
         pos_emb = self.dropout(pos_emb)
         return pos_emb.unsqueeze(1)
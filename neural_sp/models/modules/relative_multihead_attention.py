@@ -8,11 +8,11 @@
 
 import logging
 import math
-import numpy as np
 import torch
 import torch.nn as nn
 
 from neural_sp.models.modules.mocha import headdrop
+from neural_sp.models.torch_utils import softmax_float32
 
 
 logger = logging.getLogger(__name__)
@@ -65,6 +65,8 @@ class RelativeMultiheadAttentionMechanism(nn.Module):
         else:
             logger.info('Parameter initialization is skipped.')
 
+        self.reset_cache()
+
     def reset_parameters(self, bias):
         """Initialize parameters with Xavier uniform distribution."""
         logger.info('===== Initialize %s with Xavier uniform distribution =====' % self.__class__.__name__)
@@ -86,24 +88,60 @@ class RelativeMultiheadAttentionMechanism(nn.Module):
             if bias:
                 nn.init.constant_(self.w_pos.bias, 0.)
 
-    def _rel_shift(self, xs):
-        """Calculate relative positional attention efficiently.
+    def reset_cache(self):
+        self.pos_cache_key = None
+        self.pos_cache_src = None
+        self.pos_cache = None
+
+    def _project_pos_embs(self, pos_embs):
+        """Project positional embeddings. The projection is cached during inference
+            so that it is not recomputed for inputs of the same length.
 
         Args:
-            xs (FloatTensor): `[B, qlen, klen, H]`
+            pos_embs (FloatTensor): `[klen, 1, d_model]`
         Returns:
-            xs_shifted (FloatTensor): `[B, qlen, klen, H]`
+            pos_embs (FloatTensor): `[H, d_k, klen + 1]`, with zero vectors at the first position
 
         """
-        bs, qlen, klen, n_heads = xs.size()
-        # `[qlen, klen, B, H]` -> `[B, qlen, klen, H]`
-        xs = xs.permute(1, 2, 0, 3).contiguous().view(qlen, klen, bs * n_heads)
+        w_pos = self.w_pos if self.xl_like else self.w_value
+        if self.training:
+            self.reset_cache()
+        else:
+            key = (pos_embs.data_ptr(), pos_embs.size(), pos_embs.stride(), pos_embs.dtype, pos_embs.device,
+                   torch.is_autocast_enabled(pos_embs.device.type),
+                   tuple(p._version for p in w_pos.parameters()))
+            if key == self.pos_cache_key:
+                return self.pos_cache
+
+        _pos_embs = w_pos(pos_embs).view(-1, self.n_heads, self.d_k)  # `[klen, H, d_k]`
+        # NOTE: zero-pad here instead of the position-based scores for _rel_shift
+        _pos_embs = torch.cat([_pos_embs.new_zeros(1, self.n_heads, self.d_k), _pos_embs], dim=0)
+        _pos_embs = _pos_embs.permute(1, 2, 0)  # `[H, d_k, klen + 1]`
+
+        if not self.training:
+            # NOTE: keep a reference to pos_embs so that its storage is not reused
+            self.pos_cache_key = key
+            self.pos_cache_src = pos_embs
+            self.pos_cache = _pos_embs
+        return _pos_embs
+
+    def _rel_shift(self, xs, klen):
+        """Calculate relative positional attention efficiently.
+            This is equivalent to padding a zero column and reshaping, but
+            returns a view without copying scores.
+
+        Args:
+            xs (FloatTensor): `[B, H, qlen, n_pos + 1]`, whose first column is zero.
+                n_pos is klen, or klen + qlen - 1 when positions of future keys are included.
+            klen (int): number of keys
+        Returns:
+            xs_shifted (FloatTensor): `[B, H, qlen, klen]`
 
-        zero_pad = xs.new_zeros((qlen, 1, bs * n_heads))
-        xs_shifted = (torch.cat([zero_pad, xs], dim=1)
-                      .view(klen + 1, qlen, bs * n_heads)[1:]
-                      .view_as(xs))
-        return xs_shifted.view(qlen, klen, bs, n_heads).permute(2, 0, 1, 3)
+        """
+        bs, n_heads, qlen, n_pos = xs.size()
+        n_pos -= 1
+        xs = xs.contiguous().view(bs, n_heads, -1)
+        return xs[:, :, qlen:qlen + qlen * n_pos].view(bs, n_heads, qlen, n_pos)[..., :klen]
 
     def forward(self, key, query, pos_embs, mask, u_bias=None, v_bias=None):
         """Forward pass.
@@ -111,7 +149,8 @@ class RelativeMultiheadAttentionMechanism(nn.Module):
         Args:
             cat (FloatTensor): `[B, mlen+qlen, kdim]`
             mask (ByteTensor): `[B, qlen, mlen+qlen]`
-            pos_embs (LongTensor): `[qlen, 1, d_model]`
+            pos_embs (LongTensor): `[mlen+qlen, 1, d_model]`
+                (`[mlen+2qlen-1, 1, d_model]` with positions of future keys)
             u_bias (nn.Parameter): `[H, d_k]`
             v_bias (nn.Parameter): `[H, d_k]`
         Returns:
@@ -124,57 +163,123 @@ class RelativeMultiheadAttentionMechanism(nn.Module):
         # NOTE: cat already includes memory, i.e., klen=mlen+qlen
 
         if mask is not None:
-            mask = mask.unsqueeze(3).repeat([1, 1, 1, self.n_heads])
-            assert mask.size() == (bs, qlen, mlen + qlen, self.n_heads), \
-                (mask.size(), (bs, qlen, mlen + qlen, self.n_heads))
+            # NOTE: broadcast over heads instead of repeating the mask
+            mask = (mask != 0).unsqueeze(1)  # `[B, 1, qlen, mlen+qlen]`
+            assert mask.size() == (bs, 1, qlen, mlen + qlen), \
+                (mask.size(), (bs, 1, qlen, mlen + qlen))
 
-        k = self.w_key(key).view(bs, -1, self.n_heads, self.d_k)  # `[B, mlen+qlen, H, d_k]`
-        v = self.w_value(key).view(bs, -1, self.n_heads, self.d_k)  # `[B, mlen+qlen, H, d_k]`
-        q = self.w_query(key[:, -qlen:]).view(bs, -1, self.n_heads, self.d_k)  # `[B, qlen, H, d_k]`
+        k = self.w_key(key).view(bs, -1, self.n_heads, self.d_k).transpose(2, 1)  # `[B, H, mlen+qlen, d_k]`
+        v = self.w_value(key).view(bs, -1, self.n_heads, self.d_k).transpose(2, 1)  # `[B, H, mlen+qlen, d_k]`
+        q = self.w_query(key[:, -qlen:]).view(bs, -1, self.n_heads, self.d_k).transpose(2, 1)  # `[B, H, qlen, d_k]`
 
-        if self.xl_like:
-            _pos_embs = self.w_pos(pos_embs)
-        else:
-            _pos_embs = self.w_value(pos_embs)
-        _pos_embs = _pos_embs.view(-1, self.n_heads, self.d_k)  # `[mlen+qlen, H, d_k]`
+        _pos_embs = self._project_pos_embs(pos_embs)  # `[H, d_k, mlen+qlen+1]`
 
         # content-based attention term: (a) + (c)
         if u_bias is not None:
             assert self.xl_like
-            AC = torch.einsum("bihd,bjhd->bijh", ((q + u_bias[None, None]), k))  # `[B, qlen, mlen+qlen, H]`
+            AC = torch.matmul(q + u_bias[None, :, None], k.transpose(3, 2))  # `[B, H, qlen, mlen+qlen]`
         else:
-            AC = torch.einsum("bihd,bjhd->bijh", (q, k))  # `[B, qlen, mlen+qlen, H]`
+            AC = torch.matmul(q, k.transpose(3, 2))  # `[B, H, qlen, mlen+qlen]`
 
         # position-based attention term: (b) + (d)
         if v_bias is not None:
             assert self.xl_like
-            BD = torch.einsum("bihd,jhd->bijh", ((q + v_bias[None, None]), _pos_embs))  # `[B, qlen, mlen+qlen, H]`
+            BD = torch.matmul(q + v_bias[None, :, None], _pos_embs)  # `[B, H, qlen, mlen+qlen+1]`
         else:
-            BD = torch.einsum("bihd,jhd->bijh", (q, _pos_embs))  # `[B, qlen, mlen+qlen, H]`
+            BD = torch.matmul(q, _pos_embs)  # `[B, H, qlen, mlen+qlen+1]`
 
         # Compute positional attention efficiently
-        BD = self._rel_shift(BD)
+        BD = self._rel_shift(BD, mlen + qlen)  # `[B, H, qlen, mlen+qlen]`
 
         # the attention is the sum of content-based and position-based attention
-        e = (AC + BD) / self.scale  # `[B, qlen, mlen+qlen, H]`
+        e = (AC + BD) / self.scale  # `[B, H, qlen, mlen+qlen]`
 
         # Compute attention weights
         if mask is not None:
-            NEG_INF = float(np.finfo(torch.tensor(0, dtype=e.dtype).numpy().dtype).min)
-            e = e.masked_fill_(mask == 0, NEG_INF)  # `[B, qlen, mlen+qlen, H]`
-        aw = torch.softmax(e, dim=2)
-        aw = self.dropout_attn(aw)  # `[B, qlen, mlen+qlen, H]`
-        aw_masked = aw.clone()
+            NEG_INF = float(torch.finfo(e.dtype).min)
+            e = e.masked_fill_(~mask, NEG_INF)  # `[B, H, qlen, mlen+qlen]`
+        aw = softmax_float32(e, dim=-1)
+        aw = self.dropout_attn(aw)  # `[B, H, qlen, mlen+qlen]`
 
         # mask out each head independently (HeadDrop)
+        aw_masked = aw
         if self.dropout_head > 0 and self.training:
-            aw_masked = aw_masked.permute(0, 3, 1, 2)
-            aw_masked = headdrop(aw_masked, self.n_heads, self.dropout_head)  # `[B, H, qlen, klen]`
-            aw_masked = aw_masked.permute(0, 2, 3, 1)
+            aw_masked = headdrop(aw.clone(), self.n_heads, self.dropout_head)  # `[B, H, qlen, mlen+qlen]`
 
-        cv = torch.einsum("bijh,bjhd->bihd", (aw, v))  # `[B, qlen, H, d_k]`
-        cv = cv.contiguous().view(bs, -1, self.n_heads * self.d_k)  # `[B, qlen, H * d_k]`
+        cv = torch.matmul(aw_masked, v)  # `[B, H, qlen, d_k]`
+        cv = cv.transpose(2, 1).contiguous().view(bs, -1, self.n_heads * self.d_k)  # `[B, qlen, H * d_k]`
         cv = self.w_out(cv)
-        aw = aw.permute(0, 3, 1, 2)  # `[B, H, qlen, mlen+qlen]`
 
         return cv, aw
+
+    def forward_incremental(self, query, pos_embs, mask, cache=None, memory=None,
+                            u_bias=None, v_bias=None):
+        """Incremental forward pass for autoregressive decoding.
+            Keys and values of the preceding positions are projected only once
+            and cached. Those of the memory are shared by all hypotheses.
+
+        Args:
+            query (FloatTensor): `[B, qlen, kdim]`, new positions
+            pos_embs (LongTensor): `[mlen+plen+qlen, 1, d_model]`
+                (`[mlen+plen+2qlen-1, 1, d_model]` with positions of future keys)
+            mask (ByteTensor): `[1 or B, qlen, mlen+plen+qlen]`
+            cache (dict): projected keys/values of the preceding positions
+                mem_k (FloatTensor): `[1 or B, H, mlen, d_k]`
+                mem_v (FloatTensor): `[1 or B, H, mlen, d_k]`
+                k (FloatTensor): `[B, H, plen, d_k]`
+                v (FloatTensor): `[B, H, plen, d_k]`
+            memory (FloatTensor): `[1 or B, mlen, kdim]`, used only when cache is None
+            u_bias (nn.Parameter): `[H, d_k]`
+            v_bias (nn.Parameter): `[H, d_k]`
+        Returns:
+            cv (FloatTensor): `[B, qlen, vdim]`
+            aw (FloatTensor): `[B, H, qlen, mlen+plen+qlen]`
+            new_cache (dict): projected keys/values including the new positions
+
+        """
+        bs, qlen = query.size()[:2]
+
+        if cache is None:
+            cache = {'mem_k': None, 'mem_v': None, 'k': None, 'v': None}
+            if memory is not None and memory.dim() > 1 and memory.size(1) > 0:
+                mbs = memory.size(0)
+                cache['mem_k'] = self.w_key(memory).view(mbs, -1, self.n_heads, self.d_k).transpose(2, 1)
+                cache['mem_v'] = self.w_value(memory).view(mbs, -1, self.n_heads, self.d_k).transpose(2, 1)
+
+        k = self.w_key(query).view(bs, -1, self.n_heads, self.d_k).transpose(2, 1)  # `[B, H, qlen, d_k]`
+        v = self.w_value(query).view(bs, -1, self.n_heads, self.d_k).transpose(2, 1)  # `[B, H, qlen, d_k]`
+        q = self.w_query(query).view(bs, -1, self.n_heads, self.d_k).transpose(2, 1)  # `[B, H, qlen, d_k]`
+        if cache['k'] is not None:
+            k = torch.cat([cache['k'], k], dim=2)  # `[B, H, plen+qlen, d_k]`
+            v = torch.cat([cache['v'], v], dim=2)  # `[B, H, plen+qlen, d_k]`
+        mem_k, mem_v = cache['mem_k'], cache['mem_v']
+        mlen = mem_k.size(2) if mem_k is not None else 0
+
+        _pos_embs = self._project_pos_embs(pos_embs)  # `[H, d_k, mlen+plen+qlen+1]`
+
+        # content-based attention term: (a) + (c)
+        q_u = q + u_bias[None, :, None] if u_bias is not None else q
+        AC = torch.matmul(q_u, k.transpose(3, 2))  # `[B, H, qlen, plen+qlen]`
+        if mem_k is not None:
+            # NOTE: broadcast the memory over hypotheses instead of repeating it
+            AC = torch.cat([torch.matmul(q_u, mem_k.transpose(3, 2)), AC], dim=-1)  # `[B, H, qlen, mlen+plen+qlen]`
+
+        # position-based attention term: (b) + (d)
+        q_v = q + v_bias[None, :, None] if v_bias is not None else q
+        BD = self._rel_shift(torch.matmul(q_v, _pos_embs), mlen + k.size(2))  # `[B, H, qlen, mlen+plen+qlen]`
+
+        e = (AC + BD) / self.scale  # `[B, H, qlen, mlen+plen+qlen]`
+        if mask is not None:
+            NEG_INF = float(torch.finfo(e.dtype).min)
+            e = e.masked_fill_((mask == 0).unsqueeze(1), NEG_INF)
+        aw = softmax_float32(e, dim=-1)
+        aw = self.dropout_attn(aw)  # `[B, H, qlen, mlen+plen+qlen]`
+
+        cv = torch.matmul(aw[..., mlen:], v)  # `[B, H, qlen, d_k]`
+        if mem_v is not None:
+            cv = cv + torch.matmul(aw[..., :mlen], mem_v)
+        cv = cv.transpose(2, 1).contiguous().view(bs, -1, self.n_heads * self.d_k)  # `[B, qlen, H * d_k]`
+        cv = self.w_out(cv)
+
+        new_cache = {'mem_k': mem_k, 'mem_v': mem_v, 'k': k, 'v': v}
+        return cv, aw, new_cache
@@ -68,6 +68,8 @@ class TransformerDecoderBlock(nn.Module):
         self.n_heads = n_heads
         self.src_tgt_attention = src_tgt_attention
         self.memory_transformer = memory_transformer
+        # NOTE: self-attention weights are kept only for plotting
+        self.need_weights = False
 
         # self-attention
         self.norm1 = nn.LayerNorm(d_model, eps=layer_norm_eps)
@@ -221,7 +223,8 @@ class TransformerDecoderBlock(nn.Module):
         if self.memory_transformer:
             out, self._yy_aws = self.self_attn(cat, ys_q, pos_embs, yy_mask, u_bias, v_bias)
         else:
-            out, self._yy_aws = self.self_attn(ys, ys, ys_q, mask=yy_mask)[:2]  # k/v/q
+            out, self._yy_aws = self.self_attn(ys, ys, ys_q, mask=yy_mask,
+                                               need_weights=self.need_weights and not self.training)[:2]  # k/v/q
         out = self.dropout(out) + residual
 
         # attention over encoder stacks
@@ -259,6 +262,43 @@ class TransformerDecoderBlock(nn.Module):
 
         return out
 
+    def forward_incremental(self, ys, yy_mask, pos_embs, cache=None, memory=None,
+                            u_bias=None, v_bias=None):
+        """Incremental forward pass of the TransformerXL decoder block.
+
+        Args:
+            ys (FloatTensor): `[B, qlen, d_model]`, new positions
+            yy_mask (ByteTensor): `[1 or B, qlen, mlen+plen+qlen]`
+            pos_embs (LongTensor): `[mlen+plen+qlen, 1, d_model]`
+            cache (dict): projected keys/values of the preceding positions
+            memory (FloatTensor): `[1 or B, mlen, d_model]`, used only when cache is None
+            u_bias (FloatTensor): global parameter for TransformerXL
+            v_bias (FloatTensor): global parameter for TransformerXL
+        Returns:
+            out (FloatTensor): `[B, qlen, d_model]`
+            new_cache (dict): projected keys/values including the new positions
+
+        """
+        assert self.memory_transformer
+        self.reset_visualization()
+
+        if cache is None and memory is not None and memory.dim() > 1:
+            memory = self.norm1(memory)
+
+        # self-attention
+        residual = ys
+        out, _, new_cache = self.self_attn.forward_incremental(
+            self.norm1(ys), pos_embs, yy_mask, cache, memory, u_bias, v_bias)
+        out = self.dropout(out) + residual
+
+        # position-wise feed-forward
+        residual = out
+        out = self.norm3(out)
+        out = self.feed_forward(out)
+        out = self.dropout(out) + residual
+
+        return out, new_cache
+
 
 class SyncBidirTransformerDecoderBlock(nn.Module):
     """A single layer of the synchronous bidirectional Transformer decoder.
@@ -6,17 +6,23 @@
 
 """Utility funcitons for beam search decoding."""
 
-# import logging
+from collections import OrderedDict
+import logging
 # import math
-# import numpy as np
+import numpy as np
 # import os
 # import random
 # import shutil
 import torch
 # import torch.nn as nn
+import torch.nn.functional as F
 
+from neural_sp.models.lm.lookahead_wordlm import LookAheadWordLM
+from neural_sp.models.lm.ngram import NgramLM
 from neural_sp.models.torch_utils import tensor2np
 
+logger = logging.getLogger(__name__)
+
 
 class BeamSearch(object):
     def __init__(self, beam_width, eos, ctc_weight, device, beam_width_bwd=0):
@@ -67,12 +73,262 @@ class BeamSearch(object):
     def add_lm_score(self, after_topk=True):
         raise NotImplementedError
 
-    def update_rnnlm_state_batch(self, lm, hyps, y):
+    def update_rnnlm_state_batch(self, lm, hyps, y, lm_scorer=None):
         lmout, lmstate, scores_lm = None, None, None
-        if lm is not None:
-            if hyps[0]['lmstate'] is not None:
-                lm_hxs = torch.cat([beam['lmstate']['hxs'] for beam in hyps], dim=1)
-                lm_cxs = torch.cat([beam['lmstate']['cxs'] for beam in hyps], dim=1)
-                lmstate = {'hxs': lm_hxs, 'cxs': lm_cxs}
+        if lm_scorer is not None:
+            prefixes = [beam['hyp'][:-1] + [y[j, -1].item()] for j, beam in enumerate(hyps)]
+            lmout, lmstate, scores_lm = lm_scorer.predict(prefixes)
+        elif isinstance(lm, (LookAheadWordLM, NgramLM)):
+            lmout, lmstate, scores_lm = lm.predict(y, [beam['lmstate'] for beam in hyps])
+        elif lm is not None:
+            if any(beam['lmstate'] is not None for beam in hyps):
+                # NOTE: hypotheses before the first token may be mixed (CTC)
+                states = [beam['lmstate'] if beam['lmstate'] is not None else lm.zero_state(1)
+                          for beam in hyps]
+                lmstate = {k: torch.cat([state[k] for state in states], dim=1) if states[0][k] is not None else None
+                           for k in ['hxs', 'cxs']}
             lmout, lmstate, scores_lm = lm.predict(y, lmstate)
         return lmout, lmstate, scores_lm
+
+    @staticmethod
+    def select_rnnlm_state(lm, lmstate, j):
+        """Select the LM state of the j-th hypothesis from the batched state."""
+        if lmstate is None:
+            return None
+        if isinstance(lm, (LookAheadWordLM, NgramLM)):
+            return lmstate[j]
+        return {k: v[:, j:j + 1] if v is not None else None for k, v in lmstate.items()}
+
+
+class CachedLMScorer(object):
+    """Score next tokens with an external RNNLM while sharing LM states
+       of token prefixes across hypotheses, beam steps, and utterances.
+
+    LM states, outputs, and next-token log-probabilities are stored for each
+    token prefix in a bounded LRU cache. A prefix and its parent (the prefix
+    without the last token) form a trie, so only the last token is fed to the
+    LM for a new prefix whose parent is cached. All cache misses are scored
+    in a single batch.
+
+    Args:
+        lm (RNNLM): external LM
+        max_size (int): maximum number of cached prefixes
+
+    """
+
+    def __init__(self, lm, max_size=500):
+
+        super(CachedLMScorer, self).__init__()
+
+        self.lm = lm
+        self.max_size = max_size
+        self.cache = OrderedDict()
+        self.init_state = None
+
+        self.n_queries = 0
+        self.n_hits = 0
+
+    @property
+    def hit_rate(self):
+        return self.n_hits / self.n_queries if self.n_queries > 0 else 0.
+
+    def reset(self, init_state=None):
+        """Clear the cache.
+
+        Args:
+            init_state (dict): LM state before the first token (zero state if None)
+
+        """
+        self.cache.clear()
+        self.init_state = init_state
+
+    def set_initial_state(self, init_state):
+        """Set the LM state before the first token. The cache is cleared only
+            when the state is changed, e.g., by LM state carry over.
+
+        Args:
+            init_state (dict): LM state before the first token (zero state if None)
+
+        """
+        if init_state is not self.init_state:
+            self.reset(init_state)
+
+    def report(self):
+        logger.info('LM state cache: %d queries, hit rate: %.2f %%, %d entries' %
+                    (self.n_queries, self.hit_rate * 100, len(self.cache)))
+
+    def _initial_state(self):
+        if self.init_state is None:
+            return self.lm.zero_state(1)
+        return self.init_state
+
+    def _register(self, prefix, lmout, lmstate, scores_lm):
+        self.cache[prefix] = (lmout, lmstate, scores_lm)
+        if len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+
+    def predict(self, prefixes):
+        """Compute LM states and next-token log-probabilities for token prefixes.
+
+        Args:
+            prefixes (list): length `B`, each of which contains a list of token indices
+        Returns:
+            lmout (FloatTensor): `[B, 1, n_units]`
+            lmstate (dict):
+                hxs (FloatTensor): `[n_layers, B, n_units]`
+                cxs (FloatTensor): `[n_layers, B, n_units]`
+            scores_lm (FloatTensor): `[B, 1, vocab]`
+
+        """
+        prefixes = [tuple(p) for p in prefixes]
+        self.n_queries += len(prefixes)
+
+        # Collect unique cache misses
+        entries = {}
+        for p in prefixes:
+            if p in self.cache:
+                self.cache.move_to_end(p)
+                entries[p] = self.cache[p]
+        misses = list(OrderedDict.fromkeys(p for p in prefixes if p not in entries))
+        self.n_hits += len(prefixes) - len(misses)
+
+        # Feed only the last token when the parent is cached
+        incremental = [p for p in misses if len(p) == 1 or p[:-1] in self.cache]
+        from_scratch = [p for p in misses if not (len(p) == 1 or p[:-1] in self.cache)]
+
+        if len(incremental) > 0:
+            states = [self._initial_state() if len(p) == 1 else self.cache[p[:-1]][1]
+                      for p in incremental]
+            lmstate = {k: torch.cat([state[k] for state in states], dim=1) if states[0][k] is not None else None
+                       for k in ['hxs', 'cxs']}
+            y = torch.tensor([[p[-1]] for p in incremental], dtype=torch.int64, device=self.lm.device)
+            lmout, lmstate, scores_lm = self.lm.predict(y, lmstate)
+            for j, p in enumerate(incremental):
+                entries[p] = (lmout[j:j + 1],
+                              {k: v[:, j:j + 1] if v is not None else None for k, v in lmstate.items()},
+                              scores_lm[j:j + 1])
+
+        # Re-encode the whole prefix when the parent was evicted
+        for p in from_scratch:
+            y = torch.tensor([p], dtype=torch.int64, device=self.lm.device)
+            lmout, lmstate, scores_lm = self.lm.predict(y, self._initial_state())
+            entries[p] = (lmout[:, -1:], lmstate, scores_lm[:, -1:])
+
+        for p in misses:
+            self._register(p, *entries[p])
+
+        entries = [entries[p] for p in prefixes]
+        lmout = torch.cat([e[0] for e in entries], dim=0)
+        lmstate = {k: torch.cat([e[1][k] for e in entries], dim=1) if entries[0][1][k] is not None else None
+                   for k in ['hxs', 'cxs']}
+        scores_lm = torch.cat([e[2] for e in entries], dim=0)
+        return lmout, lmstate, scores_lm
+
+
+class Shortlist(object):
+    """Restrict output layers to candidate tokens during inference.
+
+    The candidate set of each utterance is the union of the most frequent
+    tokens, i.e., the head of the dictionary sorted by frequency, and the
+    top-k non-blank tokens of CTC at each frame. At each decoding step, the
+    top-k tokens of the external LM can be added. Only logits of candidates
+    are computed, and the other tokens get a constant backoff score.
+
+    Args:
+        vocab (int): number of nodes in the output layer
+        device (torch.device): device
+        n_freq (int): number of frequent tokens
+        ctc_topk (int): number of CTC candidates per frame
+        lm_topk (int): number of LM candidates per hypothesis at each step
+        backoff (float): log-probability of tokens out of the shortlist
+        max_ratio (float): compute the full vocabulary when the shortlist covers more than this ratio
+        reserved (list): tokens always included such as <blank> and <eos>
+
+    """
+
+    def __init__(self, vocab, device, n_freq=0, ctc_topk=0, lm_topk=0,
+                 backoff=-1e10, max_ratio=0.5, reserved=None):
+
+        self.vocab = vocab
+        self.device = device
+        self.n_freq = n_freq
+        self.ctc_topk = ctc_topk
+        self.lm_topk = lm_topk
+        self.backoff = backoff
+        self.max_ratio = max_ratio
+        self.reserved = reserved if reserved is not None else []
+
+        self.mask = None
+        self.ids = None
+        self.restrict_lm = False
+
+    def _to_ids(self, mask):
+        if mask.sum().item() > self.vocab * self.max_ratio:
+            return None  # fallback to the full vocabulary
+        return mask.nonzero(as_tuple=False).squeeze(1)
+
+    def reset(self, ctc_log_probs=None, blank=0):
+        """Make the candidate set of an utterance.
+
+        Args:
+            ctc_log_probs (np.ndarray): `[T, vocab]`
+            blank (int): index for <blank>
+
+        """
+        mask = np.zeros(self.vocab, dtype=np.bool_)
+        mask[:self.n_freq] = True
+        mask[self.reserved] = True
+        if ctc_log_probs is not None and self.ctc_topk > 0:
+            ctc_log_probs = np.array(ctc_log_probs)
+            ctc_log_probs[:, blank] = -np.inf
+            k = min(self.ctc_topk, self.vocab - 1)
+            mask[np.argpartition(-ctc_log_probs, k - 1, axis=1)[:, :k]] = True
+        self.mask = torch.from_numpy(mask).to(self.device)
+        self.ids = self._to_ids(self.mask)
+
+    def select(self, scores_lm=None):
+        """Make the candidate set at the current step.
+
+        Args:
+            scores_lm (FloatTensor): `[B, L, vocab]`, next-token log-probabilities of the LM
+        Returns:
+            ids (LongTensor): `[V']`, indices of candidates (None for the full vocabulary)
+
+        """
+        if scores_lm is None or self.lm_topk <= 0:
+            return self.ids
+        mask = self.mask.clone()
+        mask[torch.topk(scores_lm[:, -1], k=min(self.lm_topk, self.vocab), dim=-1)[1].reshape(-1)] = True
+        return self._to_ids(mask)
+
+    @staticmethod
+    def project(output, x, ids):
+        """Compute logits of candidates only.
+
+        Args:
+            output (nn.Linear): output layer
+            x (FloatTensor): `[..., in_features]`
+            ids (LongTensor): `[V']`
+        Returns:
+            logits (FloatTensor): `[..., vocab]`, filled with the minimum value except for candidates
+
+        """
+        bias = output.bias[ids] if output.bias is not None else None
+        logits_c = F.linear(x, output.weight[ids], bias)
+        logits = logits_c.new_full(x.size()[:-1] + (output.out_features,), float(torch.finfo(logits_c.dtype).min))
+        logits[..., ids] = logits_c
+        return logits
+
+    def add_backoff(self, scores, ids):
+        """Replace log-probabilities of tokens out of the shortlist with the backoff score.
+
+        Args:
+            scores (FloatTensor): `[..., vocab]`
+            ids (LongTensor): `[V']`
+        Returns:
+            scores (FloatTensor): `[..., vocab]`
+
+        """
+        mask = scores.new_ones(self.vocab, dtype=torch.bool)
+        mask[ids] = False
+        return scores.masked_fill(mask, self.backoff)
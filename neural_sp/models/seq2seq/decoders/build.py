@@ -55,7 +55,8 @@ def build_decoder(args, special_symbols, enc_n_units, vocab,
             mocha_first_layer=args.mocha_first_layer,
             share_chunkwise_attention=getattr(args, 'share_chunkwise_attention', False),
             external_lm=external_lm,
-            lm_fusion=args.lm_fusion)
+            lm_fusion=args.lm_fusion,
+            checkpoint_every_n_layers=getattr(args, 'activation_checkpointing', 0))
 
     elif args.dec_type in ['lstm_transducer', 'gru_transducer']:
         from neural_sp.models.seq2seq.decoders.rnn_transducer import RNNTransducer
@@ -15,7 +15,10 @@ import torch
 import torch.nn as nn
 
 from neural_sp.models.criterion import kldiv_lsm_ctc
+from neural_sp.models.lm.rescoring import score_sequences
+from neural_sp.models.seq2seq.decoders.beam_search import BeamSearch
 from neural_sp.models.seq2seq.decoders.decoder_base import DecoderBase
+from neural_sp.models.torch_utils import float32_region
 from neural_sp.models.torch_utils import make_pad_mask
 from neural_sp.models.torch_utils import np2tensor
 from neural_sp.models.torch_utils import pad_list
@@ -126,6 +129,7 @@ class CTC(DecoderBase):
 
         return loss, trigger_points
 
+    @float32_region
     def loss_fn(self, logits, ys_ctc, elens, ylens):
         loss = self.warpctc_loss(logits.transpose(1, 0),  # time-major
                                  ys_ctc, elens.cpu(), ylens).to(self.device)
@@ -219,7 +223,7 @@ class CTC(DecoderBase):
                 recog_lm_second_weight (float): weight of second path LM score
                 recog_lm_bwd_weight (float): weight of second path backward LM score
             idx2token (): converter from index to token
-            lm: firsh path LM
+            lm (RNNLM, LookAheadWordLM or NgramLM): firsh path LM
             lm_second: second path LM
             lm_second_rev: secoding path backward LM
             nbest (int):
@@ -244,6 +248,8 @@ class CTC(DecoderBase):
             assert lm_weight_second > 0
             lm_second.eval()
 
+        helper = BeamSearch(beam_width, self.eos, 1., self.device)
+
         best_hyps = []
         log_probs = torch.log_softmax(self.output(eouts), dim=-1)
         for b in range(bs):
@@ -263,6 +269,13 @@ class CTC(DecoderBase):
                 log_probs_topk, topk_ids = torch.topk(
                     log_probs[b:b + 1, t], k=min(beam_width, self.vocab), dim=-1, largest=True, sorted=True)
 
+                # Update LM states of all hypotheses in a batch for shallow fusion
+                if lm is not None:
+                    y_lm = eouts.new_zeros(len(beam), 1, dtype=torch.int64)
+                    for i_beam in range(len(beam)):
+                        y_lm[i_beam, 0] = beam[i_beam]['hyp'][-1]
+                    _, lmstates, lm_log_probs = helper.update_rnnlm_state_batch(lm, beam, y_lm)
+
                 for i_beam in range(len(beam)):
                     hyp = beam[i_beam]['hyp'][:]
                     p_b = beam[i_beam]['p_b']
@@ -287,12 +300,7 @@ class CTC(DecoderBase):
                                      'score_lp': score_lp,
                                      'lmstate': beam[i_beam]['lmstate']})
 
-                    # Update LM states for shallow fusion
-                    if lm is not None:
-                        _, lmstate, lm_log_probs = lm.predict(
-                            eouts.new_zeros(1, 1).fill_(hyp[-1]), beam[i_beam]['lmstate'])
-                    else:
-                        lmstate = None
+                    lmstate = helper.select_rnnlm_state(lm, lmstates, i_beam) if lm is not None else None
 
                     # case 2. hyp is extended
                     new_p_b = LOG_0
@@ -305,25 +313,21 @@ class CTC(DecoderBase):
                         c_prev = hyp[-1] if len(hyp) > 1 else None
                         if c == c_prev:
                             new_p_nb = p_b + p_t
-                            # TODO(hirofumi): apply character LM here
                         else:
                             new_p_nb = np.logaddexp(p_b + p_t, p_nb + p_t)
-                            # TODO(hirofumi): apply character LM here
-                            if c == self.space:
-                                pass
-                                # TODO(hirofumi): apply word LM here
 
                         score_ctc = np.logaddexp(new_p_b, new_p_nb)
                         score_lp = (len(hyp[1:]) + 1) * lp_weight
+                        score_lm_c = score_lm
                         if lm_weight > 0 and lm is not None:
-                            local_score_lm = lm_log_probs[0, 0, c].item() * lm_weight
-                            score_lm += local_score_lm
+                            # NOTE: word LMs are scored with look-ahead at every token
+                            score_lm_c = score_lm + lm_log_probs[i_beam, 0, c].item() * lm_weight
                         new_beam.append({'hyp': hyp + [c],
-                                         'score': score_ctc + score_lm + score_lp,
+                                         'score': score_ctc + score_lm_c + score_lp,
                                          'p_b': new_p_b,
                                          'p_nb': new_p_nb,
                                          'score_ctc': score_ctc,
-                                         'score_lm': score_lm,
+                                         'score_lm': score_lm_c,
                                          'score_lp': score_lp,
                                          'lmstate': lmstate})
 
@@ -332,13 +336,11 @@ class CTC(DecoderBase):
 
             # Rescoing alignments
             if lm_second is not None:
+                scores_lm = score_sequences(lm_second, [hyp['hyp'] for hyp in beam])
                 new_beam = []
                 for i_beam in range(len(beam)):
-                    ys = [np2tensor(np.fromiter(beam[i_beam]['hyp'], dtype=np.int64), self.device)]
-                    ys_pad = pad_list(ys, lm_second.pad)
-                    _, _, lm_log_probs = lm_second.predict(ys_pad, None)
                     score_ctc = np.logaddexp(beam[i_beam]['p_b'], beam[i_beam]['p_nb'])
-                    score_lm = lm_log_probs.sum() * lm_weight_second
+                    score_lm = scores_lm[i_beam] * lm_weight_second
                     score_lp = len(beam[i_beam]['hyp'][1:]) * lp_weight
                     new_beam.append({'hyp': beam[i_beam]['hyp'],
                                      'score': score_ctc + score_lm + score_lp,
@@ -13,8 +13,11 @@ import torch
 import shutil
 
 from neural_sp.models.base import ModelBase
-from neural_sp.models.torch_utils import np2tensor
-from neural_sp.models.torch_utils import pad_list
+from neural_sp.models.lm.lm_base import LMBase
+from neural_sp.models.lm.rescoring import score_sequences
+from neural_sp.models.lm.rnnlm import RNNLM
+from neural_sp.models.seq2seq.decoders.beam_search import CachedLMScorer
+from neural_sp.models.seq2seq.decoders.beam_search import Shortlist
 
 import matplotlib
 matplotlib.use('Agg')
@@ -40,6 +43,54 @@ class DecoderBase(ModelBase):
     def beam_search(self, eouts, elens, params, idx2token):
         raise NotImplementedError
 
+    def get_lm_scorer(self, lm, cache_size):
+        """Get the LM state cache for shallow fusion, which is kept over utterances.
+
+        Args:
+            lm (RNNLM): external LM
+            cache_size (int): maximum number of cached prefixes
+        Returns:
+            lm_scorer (CachedLMScorer): None if disabled
+
+        """
+        if not isinstance(lm, RNNLM) or cache_size <= 0:
+            return None
+        lm_scorer = getattr(self, 'lm_scorer', None)
+        if lm_scorer is None or lm_scorer.lm is not lm or lm_scorer.max_size != cache_size:
+            lm_scorer = CachedLMScorer(lm, cache_size)
+            self.lm_scorer = lm_scorer
+        return lm_scorer
+
+    def get_shortlist(self, params, lm=None):
+        """Get the vocabulary shortlist for decoding.
+
+        The output layer of the external LM is also restricted to the shortlist
+        unless its top-k tokens are used as candidates.
+
+        Args:
+            params (dict): hyperparameters for decoding
+            lm (LMBase): external LM
+        Returns:
+            shortlist (Shortlist): None if disabled
+
+        """
+        n_freq = params['recog_shortlist_freq']
+        ctc_topk = params['recog_shortlist_ctc_topk']
+        if n_freq <= 0 and ctc_topk <= 0:
+            return None
+        if ctc_topk > 0 and params['recog_ctc_weight'] == 0:
+            # NOTE: CTC posteriors are computed only for CTC score fusion
+            raise ValueError('Set recog_ctc_weight > 0 to use CTC candidates in the vocabulary shortlist.')
+        lm_topk = params['recog_shortlist_lm_topk'] if lm is not None else 0
+        shortlist = Shortlist(self.vocab, self.device, n_freq, ctc_topk, lm_topk,
+                              backoff=params['recog_shortlist_backoff'],
+                              max_ratio=params['recog_shortlist_max_ratio'],
+                              reserved=[self.blank, self.eos])
+        if lm_topk == 0 and isinstance(lm, LMBase) and lm.adaptive_softmax is None:
+            lm.set_shortlist(shortlist)
+            shortlist.restrict_lm = True
+        return shortlist
+
     def _plot_attention(self, save_path=None, n_cols=2):
         """Plot attention for each head in all decoder layers."""
         if getattr(self, 'att_weight', 0) == 0 and getattr(self, 'rnnt_weight', 0) == 0:
@@ -195,18 +246,9 @@ class DecoderBase(ModelBase):
         return probs, topk_ids
 
     def lm_rescoring(self, hyps, lm, lm_weight, reverse=False, tag=''):
-        for i in range(len(hyps)):
-            ys = hyps[i]['hyp']  # include <sos>
-            if reverse:
-                ys = ys[::-1]
-
-            ys = [np2tensor(np.fromiter(ys, dtype=np.int64), self.device)]
-            ys_in = pad_list([y[:-1] for y in ys], -1)  # `[1, L-1]`
-            ys_out = pad_list([y[1:] for y in ys], -1)  # `[1, L-1]`
-
-            lmout, lmstate, scores_lm = lm.predict(ys_in, None)
-            score_lm = sum([scores_lm[0, t, ys_out[0, t]] for t in range(ys_out.size(1))])
-            score_lm /= ys_out.size(1)
-
+        # NOTE: all hypotheses are scored in a single batch
+        scores_lm = score_sequences(lm, [hyp['hyp'] for hyp in hyps],  # include <sos>
+                                    reverse=reverse, normalize_length=True)
+        for i, score_lm in enumerate(scores_lm):
             hyps[i]['score'] += score_lm * lm_weight
             hyps[i]['score_lm_' + tag] = score_lm
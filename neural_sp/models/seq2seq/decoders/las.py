@@ -14,11 +14,13 @@ import random
 import torch
 import torch.nn as nn
 
-from neural_sp.evaluators.edit_distance import compute_wer
+from neural_sp.evaluators.edit_distance import compute_wer_nbest
 from neural_sp.models.criterion import cross_entropy_lsm
 from neural_sp.models.criterion import distillation
 from neural_sp.models.criterion import MBR
 # from neural_sp.models.criterion import minimum_bayes_risk
+from neural_sp.models.lm.lookahead_wordlm import LookAheadWordLM
+from neural_sp.models.lm.ngram import NgramLM
 from neural_sp.models.lm.rnnlm import RNNLM
 from neural_sp.models.lm.transformerlm import TransformerLM
 from neural_sp.models.lm.transformer_xl import TransformerXL
@@ -467,63 +469,41 @@ class RNNDecoder(DecoderBase):
             N_best = recog_params['recog_beam_width']
             alpha = 1.0
             assert N_best >= 2
-            loss_mbr = 0.
-            loss_ce = 0.
             bs = eouts.size(0)
-            for b in range(bs):
-                # 1. beam search
-                self.eval()
-                with torch.no_grad():
-                    nbest_hyps_id, _, log_scores = self.beam_search(
-                        eouts[b:b + 1], elens[b:b + 1], params=recog_params,
-                        nbest=N_best, exclude_eos=True)
-                nbest_hyps_id_b = [np.fromiter(y, dtype=np.int64) for y in nbest_hyps_id[0]]
-                log_scores_b = np2tensor(np.array(log_scores[0], dtype=np.float32), self.device)
-                scores_b_norm = torch.softmax(alpha * log_scores_b, dim=-1)  # `[N_best]`
-                # print((scores_b_norm * 100).int())
-
-                # 2. calculate expected WER
-                wers_b = np2tensor(np.array([
-                    compute_wer(ref=idx2token(ys[b]).split(' '),
-                                hyp=idx2token(nbest_hyps_id_b[n]).split(' '))[0] / 100
-                    for n in range(N_best)], dtype=np.float32), self.device)
-                exp_wer_b = (scores_b_norm * wers_b).sum()
-                grad_b = (scores_b_norm * (wers_b - exp_wer_b)).sum()
-                # print(wers_b)
-                # print(exp_wer_b)
-                # print(scores_b_norm * (wers_b - exp_wer_b))
-                # print(grad_b)
-
-                # 3. forward pass (teacher-forcing with hypotheses)
-                self.train()
-                logits_b = self.forward_mbr(eouts[b:b + 1].repeat([N_best, 1, 1]),
-                                            elens[b:b + 1].repeat([N_best]),
-                                            nbest_hyps_id_b)
-                log_probs_b = torch.log_softmax(logits_b, dim=-1)  # `[nbest, L, vocab]`
-
-                # 4. backward pass (attach gradient)
-                _eos = eouts.new_zeros((1,), dtype=torch.int64).fill_(self.eos)
-                nbest_hyps_id_b_pad = pad_list([torch.cat([np2tensor(y, self.device), _eos], dim=0)
-                                                for y in nbest_hyps_id_b], self.pad)
-                loss_mbr += self.mbr(log_probs_b, nbest_hyps_id_b_pad, exp_wer_b, grad_b)
-
-                # 4. calculate MBR loss
-                # loss_mbr_b, scores_b = minimum_bayes_risk(log_probs_b, nbest_hyps_id_b, wers_b,
-                #                                           self.eos, self.pad)
-                # loss_mbr += loss_mbr_b
-
-                # 5. CE loss regularization
-                loss_ce += self.forward_att(eouts[b:b + 1], elens[b:b + 1], ys[b:b + 1])[0]
-
-                # ys_out_b = append_sos_eos([ys[b]], self.eos, self.eos, self.pad, self.device)[1]
-                # ys_out_b = ys_out_b.repeat([N_best, 1])
-                # # NOTE: truncate to match the lengths
-                # ymax = min(logits_b.size(1), ys_out_b.size(1))
-                # logits_b = logits_b[:, :ymax].contiguous()
-                # ys_out_b = ys_out_b[:, :ymax].contiguous()
-                # for k in range(N_best):
-                #     loss_ce_k = cross_entropy_lsm(logits_b, ys_out_b, 0, self.pad, self.training)[0]
-                #     loss_ce += loss_ce_k * scores_b_norm[k]
+
+            # 1. batched beam search over the whole mini-batch
+            self.eval()
+            with torch.no_grad():
+                nbest_hyps_id, log_scores = self.beam_search_batch(
+                    eouts, elens, params=recog_params, nbest=N_best, exclude_eos=True)
+            nbest_hyps_id = [y for nbest_hyps_id_b in nbest_hyps_id for y in nbest_hyps_id_b]  # `[B * N_best]`
+            log_scores = np2tensor(np.array(log_scores, dtype=np.float32), self.device)  # `[B, N_best]`
+            scores_norm = torch.softmax(alpha * log_scores, dim=-1)  # `[B, N_best]`
+
+            # 2. calculate expected WER
+            wers = np2tensor(np.array([
+                compute_wer_nbest(ref=idx2token(ys[b]).split(' '),
+                                  hyps=[idx2token(y).split(' ') for y in nbest_hyps_id[b * N_best:(b + 1) * N_best]])
+                for b in range(bs)], dtype=np.float32) / 100, self.device)  # `[B, N_best]`
+            exp_wer = (scores_norm * wers).sum(1)  # `[B]`
+            grad = alpha * scores_norm * (wers - exp_wer.unsqueeze(1))  # `[B, N_best]`
+
+            # 3. forward pass (teacher-forcing with hypotheses)
+            self.train()
+            logits = self.forward_mbr(eouts.repeat_interleave(N_best, dim=0),
+                                      elens.repeat_interleave(N_best, dim=0),
+                                      nbest_hyps_id)
+            log_probs = torch.log_softmax(logits, dim=-1)  # `[B * N_best, L, vocab]`
+
+            # 4. backward pass (attach gradient)
+            _eos = eouts.new_zeros((1,), dtype=torch.int64).fill_(self.eos)
+            nbest_hyps_id_pad = pad_list([torch.cat([np2tensor(y, self.device), _eos], dim=0)
+                                          for y in nbest_hyps_id], self.pad)
+            loss_mbr = self.mbr(log_probs, nbest_hyps_id_pad, exp_wer, grad.view(-1), self.pad)
+
+            # 5. CE loss regularization
+            # NOTE: XE loss is averaged over utterances in forward_att
+            loss_ce = self.forward_att(eouts, elens, ys)[0] * bs
 
             # NOTE: MBR loss is accumlated over N-best and mini-batch
             loss = loss_mbr + loss_ce * self.mbr_ce_weight
@@ -1044,6 +1024,7 @@ class RNNDecoder(DecoderBase):
         if lm is not None:
             assert lm_weight > 0
             lm.eval()
+        lm_scorer = self.get_lm_scorer(lm, params['recog_lm_state_cache_size'])
         if lm_second is not None:
             assert lm_weight_second > 0
             lm_second.eval()
@@ -1051,6 +1032,7 @@ class RNNDecoder(DecoderBase):
             assert lm_weight_second_bwd > 0
             lm_second_bwd.eval()
         trfm_lm = isinstance(lm, TransformerLM) or isinstance(lm, TransformerXL)
+        shortlist = self.get_shortlist(params, lm)
 
         if ctc_log_probs is not None:
             assert ctc_weight > 0
@@ -1073,6 +1055,10 @@ class RNNDecoder(DecoderBase):
                 else:
                     ctc_prefix_scorer = CTCPrefixScore(ctc_log_probs[b], self.blank, self.eos)
 
+            # Vocabulary shortlist
+            if shortlist is not None:
+                shortlist.reset(ctc_log_probs[b][:elens[b]] if ctc_log_probs is not None else None, self.blank)
+
             # Ensemble initialization
             ensmbl_dstate, ensmbl_cv = [], []
             if n_models > 1:
@@ -1104,6 +1090,12 @@ class RNNDecoder(DecoderBase):
                     self.lmmemory = None  # reset
                 self.prev_spk = speakers[b]
 
+            if lm_scorer is not None:
+                if shortlist is not None and shortlist.restrict_lm:
+                    lm_scorer.reset(lmstate)  # NOTE: cached LM scores depend on the shortlist
+                else:
+                    lm_scorer.set_initial_state(lmstate)
+
             helper = BeamSearch(beam_width, self.eos, ctc_weight, self.device)
 
             end_hyps = []
@@ -1149,19 +1141,25 @@ class RNNDecoder(DecoderBase):
                         y_lm = y
 
                     if i > 0 or (i == 0 and trfm_lm and lm_state_CO and self.lmstate_final is not None):
-                        if isinstance(lm, RNNLM):
+                        if isinstance(lm, RNNLM) and lm_scorer is None:
                             lmstate = {'hxs': torch.cat([beam['lmstate']['hxs'] for beam in hyps], dim=1),
                                        'cxs': torch.cat([beam['lmstate']['cxs'] for beam in hyps], dim=1)}
+                        elif isinstance(lm, (LookAheadWordLM, NgramLM)):
+                            lmstate = [beam['lmstate'] for beam in hyps]
                         elif trfm_lm:
                             if isinstance(lm, TransformerLM):
                                 lmstate = [torch.cat([beam['lmstate'][lth] for beam in hyps], dim=0)
                                            for lth in range(lm.n_layers)]
-                            elif i > 0:
-                                lmstate = [torch.cat([beam['lmstate'][lth] for beam in hyps], dim=0)
-                                           for lth in range(lm.n_layers)]
+                            elif i > 0 and cache_states:
+                                # NOTE: all hypotheses share the batched state in the previous step
+                                lmstate = lm.reorder_state(hyps[0]['lmstate'],
+                                                           [beam['lmstate_idx'] for beam in hyps])
 
                     if self.lm is not None:  # cold/deep fusion
                         lmout, lmstate, scores_lm = self.lm.predict(y_lm, lmstate)
+                    elif lm_scorer is not None:  # shallow fusion with cached LM states
+                        prefixes = [beam['hyp'][:-1] + [y_lm[j, -1].item()] for j, beam in enumerate(hyps)]
+                        lmout, lmstate, scores_lm = lm_scorer.predict(prefixes)
                     elif lm is not None:  # shallow fusion
                         lmout, lmstate, scores_lm = lm.predict(y_lm, lmstate,
                                                                mems=self.lmmemory,
@@ -1169,9 +1167,14 @@ class RNNDecoder(DecoderBase):
 
                 # for the main model
                 dstates, cv, aw, attn_v, _, _ = self.decode_step(
-                    eouts[b:b + 1, :elens[b]].repeat([cv.size(0), 1, 1]),
+                    eouts[b:b + 1, :elens[b]].expand(cv.size(0), -1, -1),
                     dstates, cv, self.dropout_emb(self.embed(y)), None, aw, lmout)
-                probs = torch.softmax(self.output(attn_v).squeeze(1) * softmax_smoothing, dim=1)
+                shortlist_ids = shortlist.select(scores_lm) if shortlist is not None else None
+                if shortlist_ids is None:
+                    logits = self.output(attn_v).squeeze(1)
+                else:
+                    logits = shortlist.project(self.output, attn_v.squeeze(1), shortlist_ids)
+                probs = torch.softmax(logits * softmax_smoothing, dim=1)
 
                 # for the ensemble
                 ensmbl_dstate, ensmbl_cv, ensmbl_aws = [], [], []
@@ -1184,7 +1187,7 @@ class RNNDecoder(DecoderBase):
                     dstates_e = {'dstate': (hxs_e, cxs_e)}
 
                     dstates_e, cv_e, aw_e, attn_v_e, _, _ = dec.decode_step(
-                        ensmbl_eouts[i_e][b:b + 1, :ensmbl_elens[i_e][b]].repeat([cv_e.size(0), 1, 1]),
+                        ensmbl_eouts[i_e][b:b + 1, :ensmbl_elens[i_e][b]].expand(cv_e.size(0), -1, -1),
                         dstates_e, cv_e, dec.dropout_emb(dec.embed(y)), None, aw_e, lmout)
 
                     ensmbl_dstate += [{'dstate': (dstates_e['dstate'][0][:, j:j + 1],
@@ -1196,6 +1199,8 @@ class RNNDecoder(DecoderBase):
 
                 # Ensemble
                 scores_att = torch.log(probs / n_models)
+                if shortlist_ids is not None:
+                    scores_att = shortlist.add_backoff(scores_att, shortlist_ids)
 
                 new_hyps = []
                 for j, beam in enumerate(hyps):
@@ -1265,6 +1270,10 @@ class RNNDecoder(DecoderBase):
                             if isinstance(lm, RNNLM) or isinstance(self.lm, RNNLM):
                                 new_lmstate = {'hxs': lmstate['hxs'][:, j:j + 1],
                                                'cxs': lmstate['cxs'][:, j:j + 1]}
+                            elif isinstance(lm, (LookAheadWordLM, NgramLM)):
+                                new_lmstate = lmstate[j]
+                            elif isinstance(lm, TransformerXL):
+                                new_lmstate = lmstate  # reordered in the next step
                             elif trfm_lm:
                                 new_lmstate = [lmstate_l[j:j + 1] for lmstate_l in lmstate]
                             else:
@@ -1285,6 +1294,7 @@ class RNNDecoder(DecoderBase):
                              'cv': cv[j:j + 1],
                              'aws': beam['aws'] + [aw[j:j + 1]],
                              'lmstate': new_lmstate,
+                             'lmstate_idx': j,
                              'ctc_state': new_ctc_states[k] if ctc_prefix_scorer is not None else None,
                              'ensmbl_dstate': ensmbl_dstate,
                              'ensmbl_cv': ensmbl_cv,
@@ -1369,24 +1379,174 @@ class RNNDecoder(DecoderBase):
                                    else nbest_hyps_idx[b][n] for n in range(nbest)] for b in range(bs)]
                 aws = [[aws[b][n][:, :-1] if eos_flags[b][n] else aws[b][n] for n in range(nbest)] for b in range(bs)]
 
+        if lm_scorer is not None:
+            lm_scorer.report()
+        if shortlist is not None and shortlist.restrict_lm:
+            lm.set_shortlist(None)
+
         # Store ASR/LM state
         self.dstates_final = end_hyps[0]['dstates']
         if isinstance(lm, RNNLM):
             self.lmstate_final = end_hyps[0]['lmstate']
         elif trfm_lm:
+            ys = end_hyps[0]['ys']
+            # Exclude the last state corresponding to <eos>
+            if ys[0, -1].item() == self.eos:
+                ys = ys[:, :-1]
             if isinstance(lm, TransformerXL):
-                self.lmmemory = lm.update_memory(self.lmmemory, end_hyps[0]['lmstate'])
+                # NOTE: re-encode the best hypothesis once to update memory
+                _, _, self.lmmemory = lm.decode(ys, mems=self.lmmemory)
                 logging.info('Memory: %d' % self.lmmemory[0].size(1))
             else:
-                ys = end_hyps[0]['ys']
-                # Exclude the last state corresponding to <eos>
-                if ys[0, -1].item() == self.eos:
-                    ys = ys[:, :-1]
                 ys = ys[:, -lm.mem_len:]  # Truncate by BPTT length
             self.lmstate_final = ys
 
         return nbest_hyps_idx, aws, scores
 
+    def beam_search_batch(self, eouts, elens, params, nbest=1, exclude_eos=False):
+        """Batched beam search decoding (for MBR training).
+
+        Hypotheses of all utterances in the mini-batch are decoded at once as a
+        `[B * beam_width]` batch. Only attention scores are used, i.e., CTC scores,
+        LM scores, and coverage penalty are not supported.
+
+        Args:
+            eouts (FloatTensor): `[B, T, enc_n_units]`
+            elens (IntTensor): `[B]`
+            params (dict): hyperparameters for decoding
+            nbest (int): number of N-best list
+            exclude_eos (bool): exclude <eos> from hypothesis
+        Returns:
+            nbest_hyps_idx (list): length `B`, each of which contains list of N hypotheses
+            scores (list): length `B`, each of which contains list of N attention scores
+
+        """
+        bs = eouts.size(0)
+
+        beam_width = params['recog_beam_width']
+        assert 1 <= nbest <= beam_width
+        max_len_ratio = params['recog_max_len_ratio']
+        min_len_ratio = params['recog_min_len_ratio']
+        lp_weight = params['recog_length_penalty']
+        length_norm = params['recog_length_norm']
+        gnmt_decoding = params['recog_gnmt_decoding']
+        eos_threshold = params['recog_eos_threshold']
+        softmax_smoothing = params['recog_softmax_smoothing']
+
+        # Expand inputs for all hypotheses
+        eouts = eouts.repeat_interleave(beam_width, dim=0)  # `[B * beam, T, enc_n_units]`
+        elens_beam = elens.to(self.device).repeat_interleave(beam_width, dim=0)  # `[B * beam]`
+        src_mask = make_pad_mask(elens_beam).unsqueeze(1)  # `[B * beam, 1, T]`
+        min_lens = elens_beam.float() * min_len_ratio
+        ymaxs = [math.ceil(elen * max_len_ratio) for elen in elens.tolist()]
+        beam_offset = torch.arange(bs, device=self.device).unsqueeze(1) * beam_width  # `[B, 1]`
+
+        # Initialization
+        self.score.reset()
+        dstates = self.zero_state(bs * beam_width)
+        cv = eouts.new_zeros(bs * beam_width, 1, self.enc_n_units)
+        aw = None
+        y = eouts.new_zeros((bs * beam_width, 1), dtype=torch.int64).fill_(self.eos)
+        ys = y[:, :0]
+        # NOTE: only the first hypothesis is active at the first step
+        scores_att = eouts.new_zeros(bs, beam_width)
+        scores_att[:, 1:] = float('-inf')
+
+        end_hyps = [[] for _ in range(bs)]
+        is_finish = [False] * bs
+        for i in range(max(ymaxs)):
+            dstates, cv, aw, attn_v, _, _ = self.decode_step(
+                eouts, dstates, cv, self.dropout_emb(self.embed(y)), src_mask, aw, None)
+            scores_step = torch.log_softmax(self.output(attn_v).squeeze(1) * softmax_smoothing,
+                                            dim=-1)  # `[B * beam, vocab]`
+
+            # Exclude short hypotheses and apply EOS threshold
+            scores_eos = scores_step[:, self.eos]
+            max_score_no_eos = torch.cat([scores_step[:, :self.eos],
+                                          scores_step[:, self.eos + 1:]], dim=-1).max(-1)[0]
+            eos_mask = (i < min_lens) | (scores_eos <= eos_threshold * max_score_no_eos)
+            scores_step[:, self.eos] = scores_eos.masked_fill(eos_mask, float('-inf'))
+
+            # Global pruning over all hypotheses per utterance
+            total_scores_att = (scores_att.view(-1, 1) + scores_step).view(bs, -1)  # `[B, beam * vocab]`
+            total_scores_att, topk_ids = torch.topk(
+                total_scores_att, k=beam_width, dim=1, largest=True, sorted=True)  # `[B, beam]`
+            beam_ids = torch.div(topk_ids, self.vocab, rounding_mode='floor')
+            token_ids = topk_ids % self.vocab
+            index = (beam_offset + beam_ids).view(-1)  # `[B * beam]`
+
+            # Reorder states
+            ys = torch.cat([ys[index], token_ids.view(-1, 1)], dim=1)
+            hxs, cxs = dstates['dstate']
+            dstates = {'dstate': (hxs[:, index], cxs[:, index] if cxs is not None else None)}
+            cv = cv[index]
+            aw = aw[index]
+            y = token_ids.view(-1, 1)
+
+            # Add length penalty
+            total_scores = total_scores_att.clone()
+            if lp_weight > 0:
+                if gnmt_decoding:
+                    total_scores /= math.pow(6 + i, lp_weight) / math.pow(6, lp_weight)
+                else:
+                    total_scores += (i + 1) * lp_weight
+            if length_norm:
+                total_scores /= (i + 1)
+
+            # Remove complete hypotheses
+            is_eos = token_ids == self.eos
+            if is_eos.any() or (i + 1) in ymaxs:
+                ys_np = tensor2np(ys)
+                is_eos_np = tensor2np(is_eos)
+                total_scores_np = tensor2np(total_scores)
+                total_scores_att_np = tensor2np(total_scores_att)
+                for b in range(bs):
+                    if is_finish[b]:
+                        continue
+                    alive_hyps = []
+                    for k in range(beam_width):
+                        if total_scores_att_np[b, k] == float('-inf'):
+                            continue
+                        hyp = {'hyp': ys_np[b * beam_width + k],
+                               'score': total_scores_np[b, k],
+                               'score_att': total_scores_att_np[b, k]}
+                        if is_eos_np[b, k]:
+                            end_hyps[b].append(hyp)
+                        else:
+                            alive_hyps.append(hyp)
+                    if len(end_hyps[b]) >= beam_width:
+                        end_hyps[b] = end_hyps[b][:beam_width]
+                        is_finish[b] = True
+                    elif i + 1 == ymaxs[b]:
+                        if len(end_hyps[b]) < nbest:
+                            end_hyps[b].extend(alive_hyps[:nbest - len(end_hyps[b])])
+                        is_finish[b] = True
+            if all(is_finish):
+                break
+
+            # Deactivate complete hypotheses and utterances
+            total_scores_att = total_scores_att.masked_fill(is_eos, float('-inf'))
+            is_finish_t = torch.tensor(is_finish, device=self.device).unsqueeze(1)
+            scores_att = total_scores_att.masked_fill(is_finish_t, float('-inf'))
+
+        nbest_hyps_idx, scores = [], []
+        for b in range(bs):
+            end_hyps_b = sorted(end_hyps[b], key=lambda x: x['score'], reverse=True)[:nbest]
+            hyps_b = []
+            for hyp in end_hyps_b:
+                y_hyp = hyp['hyp']
+                # Exclude <eos> (<sos> in case of the backward decoder)
+                if exclude_eos and y_hyp[-1] == self.eos:
+                    y_hyp = y_hyp[:-1]
+                hyps_b.append(y_hyp[::-1] if self.bwd else y_hyp)
+            nbest_hyps_idx.append(hyps_b)
+            if length_norm:
+                scores.append([hyp['score_att'] / len(hyp['hyp']) for hyp in end_hyps_b])
+            else:
+                scores.append([hyp['score_att'] for hyp in end_hyps_b])
+
+        return nbest_hyps_idx, scores
+
     def beam_search_chunk_sync(self, eouts_c, params, idx2token,
                                lm=None, ctc_log_probs=None,
                                hyps=False, state_carry_over=False, ignore_eos=False):
@@ -1489,7 +1649,7 @@ class RNNDecoder(DecoderBase):
                 self.lm if self.lm is not None else lm, hyps, y)
 
             dstates, cv, aw, attn_v, _, _ = self.decode_step(
-                eouts_c[0:1].repeat([cv.size(0), 1, 1]),
+                eouts_c[0:1].expand(cv.size(0), -1, -1),
                 dstates, cv, self.dropout_emb(self.embed(y)), None, aw, lmout, cache=False)
             scores_att = torch.log_softmax(self.output(attn_v).squeeze(1), dim=1)
 
@@ -1553,8 +1713,7 @@ class RNNDecoder(DecoderBase):
                          'dstates': {'dstate': (dstates['dstate'][0][:, j:j + 1], dstates['dstate'][1][:, j:j + 1])},
                          'cv': cv[j:j + 1],
                          'aws': beam['aws'] + [aw[j:j + 1]],
-                         'lmstate': {'hxs': lmstate['hxs'][:, j:j + 1],
-                                     'cxs': lmstate['cxs'][:, j:j + 1]} if lmstate is not None else None,
+                         'lmstate': helper.select_rnnlm_state(self.lm if self.lm is not None else lm, lmstate, j),
                          'ctc_state': new_ctc_states[k] if self.ctc_prefix_scorer is not None else None,
                          'no_boundary': no_boundary})
 
@@ -15,9 +15,11 @@ import torch.nn as nn
 
 from neural_sp.models.lm.rnnlm import RNNLM
 from neural_sp.models.seq2seq.decoders.beam_search import BeamSearch
+from neural_sp.models.seq2seq.decoders.beam_search import Shortlist
 from neural_sp.models.seq2seq.decoders.ctc import CTC
 from neural_sp.models.seq2seq.decoders.ctc import CTCPrefixScore
 from neural_sp.models.seq2seq.decoders.decoder_base import DecoderBase
+from neural_sp.models.torch_utils import float32_region
 from neural_sp.models.torch_utils import np2tensor
 from neural_sp.models.torch_utils import pad_list
 from neural_sp.models.torch_utils import repeat
@@ -250,6 +252,11 @@ class RNNTransducer(DecoderBase):
         logits = self.joint(eouts, dout)
 
         # Compute Transducer loss
+        loss = self.loss_fn(logits, ys_out, elens, ylens)
+        return loss
+
+    @float32_region
+    def loss_fn(self, logits, ys_out, elens, ylens):
         log_probs = torch.log_softmax(logits, dim=-1)
         assert log_probs.size(2) == ys_out.size(1) + 1
         if self.device_id >= 0:
@@ -270,12 +277,13 @@ class RNNTransducer(DecoderBase):
 
         return loss
 
-    def joint(self, eouts, douts):
+    def joint(self, eouts, douts, shortlist_ids=None):
         """Combine encoder outputs and prediction network outputs.
 
         Args:
             eouts (FloatTensor): `[B, T, enc_n_units]`
             douts (FloatTensor): `[B, L, dec_n_units]`
+            shortlist_ids (LongTensor): `[V']`, compute logits of these tokens only
         Returns:
             out (FloatTensor): `[B, T, L, vocab]`
 
@@ -283,7 +291,10 @@ class RNNTransducer(DecoderBase):
         eouts = eouts.unsqueeze(2)  # `[B, T, 1, enc_n_units]`
         douts = douts.unsqueeze(1)  # `[B, 1, L, dec_n_units]`
         out = torch.tanh(self.w_enc(eouts) + self.w_dec(douts))
-        out = self.output(out)
+        if shortlist_ids is None:
+            out = self.output(out)
+        else:
+            out = Shortlist.project(self.output, out, shortlist_ids)
         return out
 
     def recurrency(self, ys_emb, dstate):
@@ -439,6 +450,8 @@ class RNNTransducer(DecoderBase):
         if lm is not None:
             assert lm_weight > 0
             lm.eval()
+        lm_scorer = self.get_lm_scorer(lm, params['recog_lm_state_cache_size'])
+        shortlist = self.get_shortlist(params, lm)
         if lm_second is not None:
             assert lm_weight_second > 0
             lm_second.eval()
@@ -464,12 +477,22 @@ class RNNTransducer(DecoderBase):
             if ctc_log_probs is not None:
                 ctc_prefix_scorer = CTCPrefixScore(ctc_log_probs[b], self.blank, self.eos)
 
+            # Vocabulary shortlist
+            if shortlist is not None:
+                shortlist.reset(ctc_log_probs[b][:elens[b]] if ctc_log_probs is not None else None, self.blank)
+
             if speakers is not None:
                 if speakers[b] == self.prev_spk:
                     if lm_state_carry_over and isinstance(lm, RNNLM):
                         lmstate = self.lmstate_final
                 self.prev_spk = speakers[b]
 
+            if lm_scorer is not None:
+                if shortlist is not None and shortlist.restrict_lm:
+                    lm_scorer.reset(lmstate)  # NOTE: cached LM scores depend on the shortlist
+                else:
+                    lm_scorer.set_initial_state(lmstate)
+
             helper = BeamSearch(beam_width, self.eos, ctc_weight, self.device)
 
             end_hyps = []
@@ -484,28 +507,26 @@ class RNNTransducer(DecoderBase):
                      'lmstate': lmstate,
                      'ctc_state': ctc_prefix_scorer.initial_state() if ctc_prefix_scorer is not None else None}]
             for t in range(elens[b]):
-                # preprocess for batch decoding
-                douts = torch.cat([beam['dout'] for beam in hyps], dim=0)
-                outs = self.joint(eouts[b:b + 1, t:t + 1].repeat([douts.size(0), 1, 1]), douts)
-                scores_rnnt = torch.log_softmax(outs.squeeze(2).squeeze(1), dim=-1)
-
                 # Update LM states for shallow fusion
                 y = eouts.new_zeros(len(hyps), 1).long()
                 for j, beam in enumerate(hyps):
                     y[j, 0] = beam['hyp'][-1]
-                lmstate, scores_lm = None, None
-                if lm is not None:
-                    if hyps[0]['lmstate'] is not None:
-                        lm_hxs = torch.cat([beam['lmstate']['hxs'] for beam in hyps], dim=1)
-                        lm_cxs = torch.cat([beam['lmstate']['cxs'] for beam in hyps], dim=1)
-                        lmstate = {'hxs': lm_hxs, 'cxs': lm_cxs}
-                    lmout, lmstate, scores_lm = lm.predict(y, lmstate)
+                # NOTE: hypotheses extended by blank query the same prefix again
+                _, lmstate, scores_lm = helper.update_rnnlm_state_batch(lm, hyps, y, lm_scorer)
+
+                # preprocess for batch decoding
+                douts = torch.cat([beam['dout'] for beam in hyps], dim=0)
+                shortlist_ids = shortlist.select(scores_lm) if shortlist is not None else None
+                outs = self.joint(eouts[b:b + 1, t:t + 1].repeat([douts.size(0), 1, 1]), douts,
+                                  shortlist_ids)
+                scores_rnnt = torch.log_softmax(outs.squeeze(2).squeeze(1), dim=-1)
+                if shortlist_ids is not None:
+                    scores_rnnt = shortlist.add_backoff(scores_rnnt, shortlist_ids)
 
                 new_hyps = []
                 for j, beam in enumerate(hyps):
                     dout = douts[j:j + 1]
                     dstate = beam['dstate']
-                    lmstate = beam['lmstate']
 
                     # Attention scores
                     total_scores_rnnt = beam['score_rnnt'] + scores_rnnt[j:j + 1]
@@ -555,8 +576,7 @@ class RNNTransducer(DecoderBase):
                         self.state_cache[hyp_str] = {
                             'dout': dout,
                             'dstate': new_dstate,
-                            'lmstate': {'hxs': lmstate['hxs'][:, j:j + 1],
-                                        'cxs': lmstate['cxs'][:, j:j + 1]} if lmstate is not None else None,
+                            'lmstate': helper.select_rnnlm_state(lm, lmstate, j),
                         }
 
                         new_hyps.append({'hyp': hyp_id,
@@ -566,8 +586,7 @@ class RNNTransducer(DecoderBase):
                                          'score_lm': total_scores_lm[k].item(),
                                          'dout': dout,
                                          'dstate': new_dstate,
-                                         'lmstate': {'hxs': lmstate['hxs'][:, j:j + 1],
-                                                     'cxs': lmstate['cxs'][:, j:j + 1]} if lmstate is not None else None,
+                                         'lmstate': helper.select_rnnlm_state(lm, lmstate, j),
                                          'ctc_state': new_ctc_states[k] if ctc_prefix_scorer is not None else None})
 
                 # Merge hypotheses having the same token sequences
@@ -638,4 +657,9 @@ class RNNTransducer(DecoderBase):
             # Check <eos>
             eos_flags.append([(end_hyps[n]['hyp'][-1] == self.eos) for n in range(nbest)])
 
+        if lm_scorer is not None:
+            lm_scorer.report()
+        if shortlist is not None and shortlist.restrict_lm:
+            lm.set_shortlist(None)
+
         return nbest_hyps_idx, None, None
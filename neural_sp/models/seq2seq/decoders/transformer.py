@@ -27,6 +27,8 @@ from neural_sp.models.seq2seq.decoders.ctc import CTCPrefixScore
 from neural_sp.models.seq2seq.decoders.decoder_base import DecoderBase
 from neural_sp.models.torch_utils import append_sos_eos
 from neural_sp.models.torch_utils import compute_accuracy
+from neural_sp.models.torch_utils import checkpoint_enabled
+from neural_sp.models.torch_utils import checkpoint_layer
 from neural_sp.models.torch_utils import make_pad_mask
 from neural_sp.models.torch_utils import tensor2np
 from neural_sp.models.torch_utils import tensor2scalar
@@ -88,6 +90,7 @@ class TransformerDecoder(DecoderBase):
         share_chunkwise_attention (bool): share chunkwise attention in the same layer of MMA
         external_lm (RNNLM): external RNNLM for LM fusion
         lm_fusion (str): type of LM fusion
+        checkpoint_every_n_layers (int): apply activation checkpointing every N layers (0: disabled)
 
     """
 
@@ -106,7 +109,7 @@ class TransformerDecoder(DecoderBase):
                  mocha_quantity_loss_weight, mocha_head_divergence_loss_weight,
                  latency_metric, latency_loss_weight,
                  mocha_first_layer, share_chunkwise_attention,
-                 external_lm, lm_fusion):
+                 external_lm, lm_fusion, checkpoint_every_n_layers):
 
         super(TransformerDecoder, self).__init__()
 
@@ -118,6 +121,7 @@ class TransformerDecoder(DecoderBase):
         self.enc_n_units = enc_n_units
         self.d_model = d_model
         self.n_layers = n_layers
+        self.checkpoint_every_n_layers = checkpoint_every_n_layers
         self.n_heads = n_heads
         self.pe_type = pe_type
         self.lsm_prob = lsm_prob
@@ -483,8 +487,9 @@ class TransformerDecoder(DecoderBase):
         hidden_states = [out]
         xy_aws_layers = []
         for lth, (mem, layer) in enumerate(zip(mems, self.layers)):
-            out = layer(out, tgt_mask, eouts, src_mask, mode='parallel', lmout=lmout,
-                        pos_embs=pos_embs, memory=mem, u_bias=self.u_bias, v_bias=self.v_bias)
+            out = checkpoint_layer(layer, checkpoint_enabled(self, lth, self.checkpoint_every_n_layers))(
+                out, tgt_mask, eouts, src_mask, mode='parallel', lmout=lmout,
+                pos_embs=pos_embs, memory=mem, u_bias=self.u_bias, v_bias=self.v_bias)
             if lth < self.n_layers - 1:
                 hidden_states.append(out)
                 # NOTE: outputs from the last layer is not used for momory
@@ -686,6 +691,8 @@ class TransformerDecoder(DecoderBase):
         if lm is not None:
             assert lm_weight > 0
             lm.eval()
+        lm_scorer = self.get_lm_scorer(lm, params['recog_lm_state_cache_size'])
+        shortlist = self.get_shortlist(params, lm)
         if lm_second is not None:
             assert lm_weight_second > 0
             lm_second.eval()
@@ -712,12 +719,22 @@ class TransformerDecoder(DecoderBase):
                 else:
                     ctc_prefix_scorer = CTCPrefixScore(ctc_log_probs[b], self.blank, self.eos)
 
+            # Vocabulary shortlist
+            if shortlist is not None:
+                shortlist.reset(ctc_log_probs[b][:elens[b]] if ctc_log_probs is not None else None, self.blank)
+
             if speakers is not None:
                 if speakers[b] == self.prev_spk:
                     if lm_state_carry_over and isinstance(lm, RNNLM):
                         lmstate = self.lmstate_final
                 self.prev_spk = speakers[b]
 
+            if lm_scorer is not None:
+                if shortlist is not None and shortlist.restrict_lm:
+                    lm_scorer.reset(lmstate)  # NOTE: cached LM scores depend on the shortlist
+                else:
+                    lm_scorer.set_initial_state(lmstate)
+
             helper = BeamSearch(beam_width, self.eos, ctc_weight, self.device)
 
             end_hyps = []
@@ -752,7 +769,7 @@ class TransformerDecoder(DecoderBase):
 
                 # Update LM states for shallow fusion
                 y_lm = ys[:, -1:].clone()  # NOTE: this is important
-                _, lmstate, scores_lm = helper.update_rnnlm_state_batch(lm, hyps, y_lm)
+                _, lmstate, scores_lm = helper.update_rnnlm_state_batch(lm, hyps, y_lm, lm_scorer)
 
                 # for the main model
                 causal_mask = eouts.new_ones(i + 1, i + 1).byte()
@@ -788,8 +805,12 @@ class TransformerDecoder(DecoderBase):
                     new_cache[lth] = out
                     if layer.xy_aws is not None:
                         xy_aws_layers.append(layer.xy_aws)
-                logits = self.output(self.norm_out(out))
-                probs = torch.softmax(logits[:, -1] * softmax_smoothing, dim=1)
+                shortlist_ids = shortlist.select(scores_lm) if shortlist is not None else None
+                if shortlist_ids is None:
+                    logits = self.output(self.norm_out(out[:, -1]))
+                else:
+                    logits = shortlist.project(self.output, self.norm_out(out[:, -1]), shortlist_ids)
+                probs = torch.softmax(logits * softmax_smoothing, dim=1)
                 xy_aws_layers = torch.stack(xy_aws_layers, dim=1)  # `[B, H, n_layers, L, T]`
 
                 # Ensemble initialization
@@ -814,6 +835,8 @@ class TransformerDecoder(DecoderBase):
 
                 # Ensemble
                 scores_att = torch.log(probs / n_models)
+                if shortlist_ids is not None:
+                    scores_att = shortlist.add_backoff(scores_att, shortlist_ids)
 
                 new_hyps = []
                 for j, beam in enumerate(hyps):
@@ -889,8 +912,7 @@ class TransformerDecoder(DecoderBase):
                              'score_ctc': total_scores_ctc[k].item(),
                              'score_lm': total_scores_lm[0, idx].item(),
                              'aws': new_aws,
-                             'lmstate': {'hxs': lmstate['hxs'][:, j:j + 1],
-                                         'cxs': lmstate['cxs'][:, j:j + 1]} if lmstate is not None else None,
+                             'lmstate': helper.select_rnnlm_state(lm, lmstate, j),
                              'ctc_state': new_ctc_states[k] if ctc_prefix_scorer is not None else None,
                              'ensmbl_cache': [[new_cache_e_l[j:j + 1] for new_cache_e_l in new_cache_e] for new_cache_e in ensmbl_new_cache] if cache_states else None,
                              'streamable': streamable_global,
@@ -994,6 +1016,11 @@ class TransformerDecoder(DecoderBase):
                                    else nbest_hyps_idx[b][n] for n in range(nbest)] for b in range(bs)]
                 aws = [[aws[b][n][:, :-1] if eos_flags[b][n] else aws[b][n] for n in range(nbest)] for b in range(bs)]
 
+        if lm_scorer is not None:
+            lm_scorer.report()
+        if shortlist is not None and shortlist.restrict_lm:
+            lm.set_shortlist(None)
+
         # Store ASR/LM state
         if isinstance(lm, RNNLM):
             self.lmstate_final = end_hyps[0]['lmstate']
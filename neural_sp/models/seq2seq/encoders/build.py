@@ -70,7 +70,8 @@ def build_encoder(args):
             chunk_size_left=args.lc_chunk_size_left,
             chunk_size_current=args.lc_chunk_size_current,
             chunk_size_right=args.lc_chunk_size_right,
-            latency_control_type=getattr(args, 'lc_type', 'reshape'))
+            latency_control_type=getattr(args, 'lc_type', 'reshape'),
+            checkpoint_every_n_layers=getattr(args, 'activation_checkpointing', 0))
 
     elif 'conformer' in args.enc_type:
         from neural_sp.models.seq2seq.encoders.conformer import ConformerEncoder
@@ -112,7 +113,8 @@ def build_encoder(args):
             chunk_size_left=args.lc_chunk_size_left,
             chunk_size_current=args.lc_chunk_size_current,
             chunk_size_right=args.lc_chunk_size_right,
-            latency_control_type=getattr(args, 'lc_type', 'reshape'))
+            latency_control_type=getattr(args, 'lc_type', 'reshape'),
+            checkpoint_every_n_layers=getattr(args, 'activation_checkpointing', 0))
 
     else:
         from neural_sp.models.seq2seq.encoders.rnn import RNNEncoder
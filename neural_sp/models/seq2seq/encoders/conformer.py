@@ -25,6 +25,10 @@ from neural_sp.models.seq2seq.encoders.subsampling import Conv1dSubsampler
 from neural_sp.models.seq2seq.encoders.subsampling import DropSubsampler
 from neural_sp.models.seq2seq.encoders.subsampling import MaxpoolSubsampler
 from neural_sp.models.seq2seq.encoders.utils import chunkwise
+from neural_sp.models.seq2seq.encoders.utils import make_chunkwise_mask
+from neural_sp.models.seq2seq.encoders.utils import merge_chunkwise_attention
+from neural_sp.models.torch_utils import checkpoint_enabled
+from neural_sp.models.torch_utils import checkpoint_layer
 from neural_sp.models.torch_utils import make_pad_mask
 from neural_sp.models.torch_utils import tensor2np
 
@@ -76,6 +80,7 @@ class ConformerEncoder(EncoderBase):
         chunk_size_current (int): current chunk size for latency-controlled Conformer encoder
         chunk_size_right (int): right chunk size for latency-controlled Conformer encoder
         latency_control_type (str): implementation methods of latency-controlled Conformer encoder
+        checkpoint_every_n_layers (int): apply activation checkpointing every N layers (0: disabled)
 
     """
 
@@ -88,7 +93,8 @@ class ConformerEncoder(EncoderBase):
                  conv_in_channel, conv_channels, conv_kernel_sizes, conv_strides, conv_poolings,
                  conv_batch_norm, conv_layer_norm, conv_bottleneck_dim, conv_param_init,
                  task_specific_layer, param_init, clamp_len,
-                 chunk_size_left, chunk_size_current, chunk_size_right, latency_control_type):
+                 chunk_size_left, chunk_size_current, chunk_size_right, latency_control_type,
+                 checkpoint_every_n_layers):
 
         super(ConformerEncoder, self).__init__()
 
@@ -111,6 +117,7 @@ class ConformerEncoder(EncoderBase):
         self.n_heads = n_heads
         self.pe_type = pe_type
         self.scale = math.sqrt(d_model)
+        self.checkpoint_every_n_layers = checkpoint_every_n_layers
 
         # for streaming encoder
         self.chunk_size_left = chunk_size_left
@@ -233,6 +240,7 @@ class ConformerEncoder(EncoderBase):
             self._odim = last_proj_dim
 
         self.reset_parameters(param_init)
+        self.reset_cache()
 
     @staticmethod
     def add_args(parser, args):
@@ -332,7 +340,7 @@ class ConformerEncoder(EncoderBase):
             xs (FloatTensor): `[B, T, input_dim]`
             xlens (InteTensor): `[B]` (on CPU)
             task (str): ys/ys_sub1/ys_sub2
-            streaming (bool): streaming encoding
+            streaming (bool): streaming encoding with the state cached in the encoder
             lookback (bool): truncate leftmost frames for lookback in CNN context
             lookahead (bool): truncate rightmost frames for lookahead in CNN context
         Returns:
@@ -345,11 +353,16 @@ class ConformerEncoder(EncoderBase):
                  'ys_sub1': {'xs': None, 'xlens': None},
                  'ys_sub2': {'xs': None, 'xlens': None}}
 
+        if streaming and self.latency_controlled and self.lc_type == 'mask':
+            xs, self.stream_state = self.forward_chunk(xs, self.stream_state)
+            eouts['ys']['xs'] = xs
+            eouts['ys']['xlens'] = torch.IntTensor([xs.size(1)] * xs.size(0))
+            return eouts
+
         N_l = self.chunk_size_left
         N_c = self.chunk_size_current
         N_r = self.chunk_size_right
         bs, xmax, idim = xs.size()
-        n_chunks = 0
         clamp_len = self.clamp_len
 
         if self.latency_controlled:
@@ -358,13 +371,18 @@ class ConformerEncoder(EncoderBase):
             elif self.lc_type == 'mask':
                 # xs = chunkwise(xs, N_l, N_c, N_r)  # `[B * n_chunks, N_l+N_c+N_r, idim]`
                 xs = chunkwise(xs, 0, N_c, 0)  # `[B * n_chunks, N_c, idim]`
-            n_chunks = xs.size(0) // bs
 
         if self.conv is None:
             xs = self.embed(xs)
         else:
             # Path through CNN blocks
-            xs, xlens = self.conv(xs, xlens)
+            if self.latency_controlled and self.lc_type == 'mask':
+                # NOTE: each chunk is subsampled independently as in forward_chunk
+                xs, _ = self.conv(xs, xlens)
+                factor = self.conv.subsampling_factor
+                xlens = (xlens + factor - 1) // factor
+            else:
+                xs, xlens = self.conv(xs, xlens)
             N_l = max(0, N_l // self.conv.subsampling_factor)
             N_c = N_c // self.conv.subsampling_factor
             N_r = N_r // self.conv.subsampling_factor
@@ -380,31 +398,23 @@ class ConformerEncoder(EncoderBase):
             emax = xlens.max().item()
 
             xs = xs * self.scale
-            pos_embs = self.pos_emb(xs, zero_center_offset=True)  # NOTE: no clamp_len for streaming
+            # NOTE: no clamp_len for streaming
+            pos_embs = self.pos_emb(xs, zero_center_offset=True, bidirectional=self.lc_type == 'mask')
 
             if self.lc_type == 'reshape':
                 xx_mask = None  # NOTE: no mask to avoid masking all frames in a chunk
             elif self.lc_type == 'mask':
-                xx_mask = make_pad_mask(xlens.to(self.device))
-                xx_mask = xx_mask.unsqueeze(1).repeat([1, xs.size(1), 1])  # `[B, emax (query), emax (key)]`
-                for chunk_idx in range(n_chunks):
-                    offset = chunk_idx * N_c
-                    xx_mask[:, offset:offset + N_c, :max(0, offset - N_l)] = 0
-                    xx_mask[:, offset:offset + N_c, offset + (N_c + N_r):] = 0
+                xx_mask = make_chunkwise_mask(xlens.to(self.device), xs.size(1),
+                                              N_l, N_c, N_r)  # `[B, emax (query), emax (key)]`
 
             for lth, layer in enumerate(self.layers):
-                xs = layer(xs, xx_mask, pos_embs=pos_embs, u_bias=self.u_bias, v_bias=self.v_bias)
+                xs = checkpoint_layer(layer, checkpoint_enabled(self, lth, self.checkpoint_every_n_layers))(
+                    xs, xx_mask, pos_embs=pos_embs, u_bias=self.u_bias, v_bias=self.v_bias,
+                    chunk_size=N_c if self.lc_type == 'mask' else 0)
                 if not self.training:
                     if self.lc_type == 'reshape':
-                        n_heads = layer.xx_aws.size(1)
                         xx_aws = layer.xx_aws[:, :, N_l:N_l + N_c, N_l:N_l + N_c]
-                        xx_aws = xx_aws.view(bs, n_chunks, n_heads, N_c, N_c)
-                        xx_aws_center = xx_aws.new_zeros(bs, n_heads, emax, emax)
-                        for chunk_idx in range(n_chunks):
-                            offset = chunk_idx * N_c
-                            emax_chunk = xx_aws_center[:, :, offset:offset + N_c].size(2)
-                            xx_aws_chunk = xx_aws[:, chunk_idx, :, :emax_chunk, :emax_chunk]
-                            xx_aws_center[:, :, offset:offset + N_c, offset:offset + N_c] = xx_aws_chunk
+                        xx_aws_center = merge_chunkwise_attention(xx_aws, bs, emax)
                         self.aws_dict['xx_aws_layer%d' % lth] = tensor2np(xx_aws_center)
                     elif self.lc_type == 'mask':
                         self.aws_dict['xx_aws_layer%d' % lth] = tensor2np(layer.xx_aws)
@@ -417,14 +427,10 @@ class ConformerEncoder(EncoderBase):
                     N_c = N_c // self.subsample[lth].subsampling_factor
                     N_r = N_r // self.subsample[lth].subsampling_factor
                     # Create sinusoidal positional embeddings for relative positional encoding
-                    pos_embs = self.pos_emb(xs, zero_center_offset=True)  # NOTE: no clamp_len for streaming
+                    pos_embs = self.pos_emb(xs, zero_center_offset=True, bidirectional=self.lc_type == 'mask')
                     if self.lc_type == 'mask':
-                        xx_mask = make_pad_mask(xlens.to(self.device))
-                        xx_mask = xx_mask.unsqueeze(1).repeat([1, xs.size(1), 1])  # `[B, emax (query), emax (key)]`
-                        for chunk_idx in range(n_chunks):
-                            offset = chunk_idx * N_c
-                            xx_mask[:, offset:offset + N_c, :max(0, offset - N_l)] = 0
-                            xx_mask[:, offset:offset + N_c, offset + (N_c + N_r):] = 0
+                        xx_mask = make_chunkwise_mask(xlens.to(self.device), xs.size(1),
+                                                      N_l, N_c, N_r)  # `[B, emax (query), emax (key)]`
 
             # Extract the center region
             if self.lc_type == 'reshape':
@@ -441,7 +447,8 @@ class ConformerEncoder(EncoderBase):
             xx_mask = make_pad_mask(xlens.to(self.device)).unsqueeze(1).repeat([1, xs.size(1), 1])
 
             for lth, layer in enumerate(self.layers):
-                xs = layer(xs, xx_mask, pos_embs=pos_embs, u_bias=self.u_bias, v_bias=self.v_bias)
+                xs = checkpoint_layer(layer, checkpoint_enabled(self, lth, self.checkpoint_every_n_layers))(
+                    xs, xx_mask, pos_embs=pos_embs, u_bias=self.u_bias, v_bias=self.v_bias)
                 if not self.training:
                     self.aws_dict['xx_aws_layer%d' % lth] = tensor2np(layer.xx_aws)
                     self.data_dict['elens%d' % lth] = tensor2np(xlens)
@@ -480,6 +487,83 @@ class ConformerEncoder(EncoderBase):
             eouts['ys_sub2']['xs'], eouts['ys_sub2']['xlens'] = xs_sub2, xlens
         return eouts
 
+    def reset_cache(self):
+        """Reset the state for streaming encoding."""
+        self.stream_state = self.init_state()
+
+    def init_state(self):
+        """Initialize the state for chunkwise streaming encoding.
+
+        Returns:
+            state (dict):
+                offset (int): number of frames encoded so far (after the frontend)
+                caches (list): left-context keys/values and convolution history of each layer
+
+        """
+        return {'offset': 0, 'caches': [None] * self.n_layers}
+
+    def forward_chunk(self, xs, state):
+        """Encode a chunk incrementally for streaming inference.
+
+        A chunk consists of N_c current frames followed by at most N_r lookahead
+        frames. Projected keys/values of the last N_l current frames and the left
+        context of the convolution module are cached in each layer, so that
+        previous chunks are not re-encoded. Outputs are the same as those of the
+        masked chunkwise encoding in `forward` (latency_control_type='mask') when
+        there is no lookahead frame.
+
+        Args:
+            xs (FloatTensor): `[B, T_chunk, input_dim]`
+            state (dict): state returned by `init_state` or the previous call
+        Returns:
+            xs (FloatTensor): `[B, T_chunk', d_model]`, outputs of the current frames
+            state (dict): updated state
+
+        """
+        assert self.lc_type == 'mask', 'Set latency_control_type to mask.'
+        N_l = self.chunk_size_left
+        N_c = self.chunk_size_current
+        if N_c <= 0:
+            raise ValueError('Set chunk_size_current > 0 for incremental encoding.')
+        bs, xmax, idim = xs.size()
+        n_current = min(xmax, N_c)
+
+        if self.conv is None:
+            xs = self.embed(xs)
+        else:
+            # NOTE: the CNN frontend is applied to each chunk independently as in training
+            xs = chunkwise(xs, 0, N_c, 0)  # `[B * n_chunks, N_c, idim]`
+            xs, _ = self.conv(xs, torch.IntTensor([N_c] * xs.size(0)))
+            factor = self.conv.subsampling_factor
+            xs = xs.contiguous().view(bs, -1, xs.size(2))[:, :math.ceil(xmax / factor)]
+            n_current = math.ceil(n_current / factor)
+            N_l = N_l // factor
+
+        n_current_in = n_current
+        xs = xs * self.scale
+
+        caches = []
+        for lth, layer in enumerate(self.layers):
+            cache = state['caches'][lth]
+            mlen = cache['attn']['k'].size(2) if cache is not None and cache['attn'] is not None else 0
+            pos_embs = self.pos_emb(xs, mlen=mlen, bidirectional=True)
+            xs, cache = layer.forward_chunk(xs, cache, n_current, N_l,
+                                            pos_embs=pos_embs, u_bias=self.u_bias, v_bias=self.v_bias)
+            caches.append(cache)
+
+            if self.subsample is not None:
+                factor = self.subsample[lth].subsampling_factor
+                xs, _ = self.subsample[lth](xs, torch.IntTensor([xs.size(1)] * bs))
+                n_current = math.ceil(n_current / factor)
+                N_l = N_l // factor
+
+        xs = self.norm_out(xs[:, :n_current])
+        if self.bridge is not None:
+            xs = self.bridge(xs)
+
+        state = {'offset': state['offset'] + n_current_in, 'caches': caches}
+        return xs, state
+
     def sub_module(self, xs, xx_mask, lth, pos_embs=None, module='sub1'):
         if self.task_specific_layer:
             xs_sub = getattr(self, 'layer_' + module)(xs, xx_mask, pos_embs=pos_embs)
@@ -558,7 +642,7 @@ class ConformerEncoderBlock(nn.Module):
     def reset_visualization(self):
         self._xx_aws = None
 
-    def forward(self, xs, xx_mask=None, pos_embs=None, u_bias=None, v_bias=None):
+    def forward(self, xs, xx_mask=None, pos_embs=None, u_bias=None, v_bias=None, chunk_size=0):
         """Conformer encoder layer definition.
 
         Args:
@@ -567,6 +651,8 @@ class ConformerEncoderBlock(nn.Module):
             pos_embs (LongTensor): `[L, 1, d_model]`
             u_bias (FloatTensor): global parameter for relative positional encoding
             v_bias (FloatTensor): global parameter for relative positional encoding
+            chunk_size (int): chunk size for the masked chunkwise encoding (0: disabled).
+                The right context of the convolution module does not go beyond each chunk.
         Returns:
             xs (FloatTensor): `[B, T, d_model]`
 
@@ -586,7 +672,7 @@ class ConformerEncoderBlock(nn.Module):
         # conv
         residual = xs
         xs = self.norm2(xs)
-        xs = self.conv(xs)
+        xs = self.conv(xs, chunk_size)
         xs = self.dropout(xs) + residual
 
         # self-attention w/ relative positional encoding
@@ -603,3 +689,60 @@ class ConformerEncoderBlock(nn.Module):
         # TODO(hirofumi0810): additional layer normalization here?
 
         return xs
+
+    def forward_chunk(self, xs, cache, n_current, N_l, pos_embs=None, u_bias=None, v_bias=None):
+        """Conformer encoder layer for a single chunk in streaming inference.
+
+        Args:
+            xs (FloatTensor): `[B, T_chunk, d_model]`
+            cache (dict):
+                conv (FloatTensor): `[B, d_model, (kernel_size - 1) // 2]`, history of the conv module
+                attn (dict): projected keys/values (`[B, H, mlen, d_k]`) of the self-attention
+            n_current (int): number of current frames (the rest is lookahead)
+            N_l (int): number of frames to cache for the self-attention in the next chunk
+            pos_embs (LongTensor): `[mlen + 2 * T_chunk - 1, 1, d_model]`
+            u_bias (FloatTensor): global parameter for relative positional encoding
+            v_bias (FloatTensor): global parameter for relative positional encoding
+        Returns:
+            xs (FloatTensor): `[B, T_chunk, d_model]`
+            cache (dict):
+
+        """
+        self.reset_visualization()
+        if cache is None:
+            cache = {'conv': None, 'attn': None}
+        new_cache = {}
+
+        # first half FFN
+        residual = xs
+        xs = self.norm1(xs)
+        xs = self.feed_forward1(xs)
+        xs = self.fc_factor * self.dropout(xs) + residual  # Macaron FFN
+
+        # conv w/ left context from previous chunks
+        residual = xs
+        xs = self.norm2(xs)
+        xs, new_cache['conv'] = self.conv.forward_chunk(xs, cache['conv'], n_current)
+        xs = self.dropout(xs) + residual
+
+        # self-attention w/ relative positional encoding over cached and current frames
+        residual = xs
+        xs = self.norm3(xs)
+        xs, self._xx_aws, attn_cache = self.self_attn.forward_incremental(
+            xs, pos_embs, None, cache=cache['attn'], u_bias=u_bias, v_bias=v_bias)
+        xs = self.dropout(xs) + residual
+        # NOTE: lookahead frames are re-encoded in the next chunk
+        mlen = attn_cache['k'].size(2) - residual.size(1)
+        new_cache['attn'] = None
+        if N_l > 0:
+            start = max(0, mlen + n_current - N_l)
+            new_cache['attn'] = dict(attn_cache, k=attn_cache['k'][:, :, start:mlen + n_current],
+                                     v=attn_cache['v'][:, :, start:mlen + n_current])
+
+        # second half FFN
+        residual = xs
+        xs = self.norm4(xs)
+        xs = self.feed_forward2(xs)
+        xs = self.fc_factor * self.dropout(xs) + residual  # Macaron FFN
+
+        return xs, new_cache
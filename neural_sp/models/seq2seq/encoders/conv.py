@@ -12,6 +12,7 @@ import math
 import numpy as np
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 
 from neural_sp.models.modules.initialization import init_with_lecun_normal
 from neural_sp.models.seq2seq.encoders.encoder_base import EncoderBase
@@ -186,6 +187,56 @@ class ConvEncoder(EncoderBase):
 
         return xs, xlens
 
+    def init_state(self):
+        """Initialize the state for streaming encoding.
+
+        Returns:
+            state (list): histories of each CNN block
+
+        """
+        return [None] * len(self.layers)
+
+    def forward_chunk(self, xs, state, is_last=False):
+        """Forward pass for a chunk in streaming inference.
+
+        Each CNN block carries exactly the input frames in its receptive field
+        over chunks instead of re-feeding overlapping context frames, so that
+        every frame is convolved only once. Outputs are the same as those of
+        `forward` for the whole utterance, but delayed by the right context of
+        the convolutions and the pooling windows. Remaining frames are flushed
+        when `is_last` is True.
+
+        Args:
+            xs (FloatTensor): `[B, T, F]`
+            state (list): state returned by `init_state` or the previous call
+            is_last (bool): the chunk is the last one in the utterance
+        Returns:
+            xs (FloatTensor): `[B, T', F']`
+            state (list): updated state
+
+        """
+        B, T, F = xs.size()
+        C_i = self.in_channel
+        if not self.is_1dconv:
+            xs = xs.view(B, T, C_i, F // C_i).contiguous().transpose(2, 1)  # `[B, C_i, T, F // C_i]`
+        else:
+            xs = xs.transpose(2, 1)  # `[B, F, T]`
+
+        state = list(state)
+        for lth, block in enumerate(self.layers):
+            xs, state[lth] = block.forward_chunk(xs, state[lth], is_last)
+        if not self.is_1dconv:
+            B, C_o, T, F = xs.size()
+            xs = xs.transpose(2, 1).contiguous().view(B, T, C_o * F)  # `[B, T', C_o * F']`
+        else:
+            xs = xs.transpose(2, 1)  # `[B, T', C_o]`
+
+        # Bridge layer
+        if self.bridge is not None:
+            xs = self.bridge(xs)
+
+        return xs, state
+
 
 class Conv1dBlock(EncoderBase):
     """1d-CNN block."""
@@ -275,6 +326,48 @@ class Conv1dBlock(EncoderBase):
 
         return xs, xlens
 
+    def forward_chunk(self, xs, state, is_last=False):
+        """Forward pass for a chunk in streaming inference.
+
+        Args:
+            xs (FloatTensor): `[B, F, T]`
+            state (dict): histories of inputs in the receptive field
+            is_last (bool): flush remaining frames
+        Returns:
+            xs (FloatTensor): `[B, F', T']`
+            state (dict): updated state
+
+        """
+        if state is None:
+            state = {'conv1': None, 'conv2': None, 'pool': None, 'residual': None}
+        state = dict(state)
+        if self.residual:
+            residual = xs if state['residual'] is None else torch.cat([state['residual'], xs], dim=2)
+
+        xs, state['conv1'] = _conv_chunk(self.conv1, xs, state['conv1'], is_last)
+        xs = xs.transpose(2, 1)
+        xs = self.batch_norm1(xs)
+        xs = self.layer_norm1(xs)
+        xs = torch.relu(xs)
+        xs = self.dropout(xs)
+
+        xs, state['conv2'] = _conv_chunk(self.conv2, xs.transpose(2, 1), state['conv2'], is_last)
+        xs = xs.transpose(2, 1)
+        xs = self.batch_norm2(xs)
+        xs = self.layer_norm2(xs)
+        if self.residual and xs.size(2) == residual.size(1):
+            # NOTE: outputs are delayed from inputs by the right context
+            xs = xs + residual[:, :, :xs.size(1)].transpose(2, 1)
+            state['residual'] = residual[:, :, xs.size(1):]
+        xs = torch.relu(xs)
+        xs = self.dropout(xs)
+        xs = xs.transpose(2, 1)
+
+        if self.pool is not None:
+            xs, state['pool'] = _pool_chunk(self.pool, xs, state['pool'], is_last)
+
+        return xs, state
+
 
 class Conv2dBlock(EncoderBase):
     """2d-CNN block."""
@@ -382,6 +475,45 @@ class Conv2dBlock(EncoderBase):
 
         return xs, xlens
 
+    def forward_chunk(self, xs, state, is_last=False):
+        """Forward pass for a chunk in streaming inference.
+
+        Args:
+            xs (FloatTensor): `[B, C_i, T, F]`
+            state (dict): histories of inputs in the receptive field
+            is_last (bool): flush remaining frames
+        Returns:
+            xs (FloatTensor): `[B, C_o, T', F']`
+            state (dict): updated state
+
+        """
+        if state is None:
+            state = {'conv1': None, 'conv2': None, 'pool': None, 'residual': None}
+        state = dict(state)
+        if self.residual:
+            residual = xs if state['residual'] is None else torch.cat([state['residual'], xs], dim=2)
+
+        xs, state['conv1'] = _conv_chunk(self.conv1, xs, state['conv1'], is_last)
+        xs = self.batch_norm1(xs)
+        xs = self.layer_norm1(xs)
+        xs = torch.relu(xs)
+        xs = self.dropout(xs)
+
+        xs, state['conv2'] = _conv_chunk(self.conv2, xs, state['conv2'], is_last)
+        xs = self.batch_norm2(xs)
+        xs = self.layer_norm2(xs)
+        if self.residual and (xs.size(1), xs.size(3)) == (residual.size(1), residual.size(3)):
+            # NOTE: outputs are delayed from inputs by the right context
+            xs = xs + residual[:, :, :xs.size(2)]
+            state['residual'] = residual[:, :, xs.size(2):]
+        xs = torch.relu(xs)
+        xs = self.dropout(xs)
+
+        if self.pool is not None:
+            xs, state['pool'] = _pool_chunk(self.pool, xs, state['pool'], is_last)
+
+        return xs, state
+
 
 class LayerNorm2D(nn.Module):
     """Layer normalization for CNN outputs."""
@@ -407,6 +539,66 @@ class LayerNorm2D(nn.Module):
         return xs
 
 
+def _conv_chunk(conv, xs, cache, is_last):
+    """Apply a convolution to a chunk with the history of inputs along the time axis.
+
+    Args:
+        conv (nn.Conv1d or nn.Conv2d): convolution with stride 1 along the time axis
+        xs (FloatTensor): `[B, C_i, T]` or `[B, C_i, T, F]`
+        cache (FloatTensor): `[B, C_i, kernel_size - 1, (F)]`, inputs of previous chunks
+        is_last (bool): pad the right context with zeros
+    Returns:
+        xs (FloatTensor): `[B, C_o, T', (F')]`
+        cache (FloatTensor): `[B, C_i, kernel_size - 1, (F)]`
+
+    """
+    assert conv.stride[0] == 1 and conv.dilation[0] == 1
+
+    def _conv(xs):
+        if isinstance(conv, nn.Conv2d):
+            return F.conv2d(xs, conv.weight, conv.bias, stride=conv.stride, padding=(0, conv.padding[1]))
+        return F.conv1d(xs, conv.weight, conv.bias, stride=conv.stride, padding=0)
+
+    pad = conv.padding[0]
+    width = conv.kernel_size[0] - 1
+    if cache is None:
+        # left padding at the beginning of the utterance
+        cache = xs.new_zeros(xs.size()[:2] + (pad,) + xs.size()[3:])
+    xs = torch.cat([cache, xs], dim=2)
+    if is_last:
+        xs = torch.cat([xs, xs.new_zeros(xs.size()[:2] + (pad,) + xs.size()[3:])], dim=2)
+    cache = xs[:, :, max(0, xs.size(2) - width):]
+    if xs.size(2) <= width:
+        # NOTE: no output until the receptive field is filled
+        return _conv(xs.new_zeros(xs.size()[:2] + (width + 1,) + xs.size()[3:]))[:, :, :0], cache
+    return _conv(xs), cache
+
+
+def _pool_chunk(pool, xs, cache, is_last):
+    """Apply max-pooling to a chunk with the remainder of previous chunks along the time axis.
+
+    Args:
+        pool (nn.MaxPool1d or nn.MaxPool2d): pooling whose stride is equal to the kernel size
+        xs (FloatTensor): `[B, C, T]` or `[B, C, T, F]`
+        cache (FloatTensor): `[B, C, T_rem, (F)]`, frames not pooled yet
+        is_last (bool): pool the remaining frames
+    Returns:
+        xs (FloatTensor): `[B, C, T', (F')]`
+        cache (FloatTensor): `[B, C, T_rem, (F)]`
+
+    """
+    window = pool.kernel_size if isinstance(pool, nn.MaxPool1d) else pool.kernel_size[0]
+    if cache is not None:
+        xs = torch.cat([cache, xs], dim=2)
+    n_frames = (xs.size(2) // window) * window
+    if is_last and pool.ceil_mode:
+        n_frames = xs.size(2)
+    xs, cache = xs[:, :, :n_frames], xs[:, :, n_frames:]
+    if n_frames == 0:
+        return pool(cache.new_zeros(cache.size()[:2] + (window,) + cache.size()[3:]))[:, :, :0], cache
+    return pool(xs), cache
+
+
 def update_lens_1d(seq_lens, layer):
     """Update lenghts (frequency or time).
 
@@ -430,7 +622,7 @@ def update_lens_1d(seq_lens, layer):
 def _update_1d(seq_len, layer):
     if type(layer) == nn.MaxPool1d and layer.ceil_mode:
         return math.ceil(
-            (seq_len + 1 + 2 * layer.padding - (layer.kernel_size - 1) - 1) / layer.stride + 1)
+            (seq_len + 2 * layer.padding - (layer.kernel_size - 1) - 1) / layer.stride) + 1
     else:
         return math.floor(
             (seq_len + 2 * layer.padding[0] - (layer.kernel_size[0] - 1) - 1) / layer.stride[0] + 1)
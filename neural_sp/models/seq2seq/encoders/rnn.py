@@ -23,6 +23,7 @@ from neural_sp.models.seq2seq.encoders.subsampling import ConcatSubsampler
 from neural_sp.models.seq2seq.encoders.subsampling import Conv1dSubsampler
 from neural_sp.models.seq2seq.encoders.subsampling import DropSubsampler
 from neural_sp.models.seq2seq.encoders.subsampling import MaxpoolSubsampler
+from neural_sp.models.seq2seq.encoders.utils import chunkwise
 
 
 logger = logging.getLogger(__name__)
@@ -409,71 +410,232 @@ class RNNEncoder(EncoderBase):
             N_l = N_l // self.conv.subsampling_factor
             N_r = N_r // self.conv.subsampling_factor
 
+        if not streaming:
+            return self._forward_chunkwise_parallel(xs, xlens, N_l, N_r, task)
+
+        # NOTE: encode the current chunk only in streaming inference
         bs, xmax, _ = xs.size()
-        n_chunks = math.ceil(xmax / N_l)
-        if streaming:
-            xlens = torch.IntTensor(bs).fill_(xs.size(1) if xmax < N_l else N_l)
+        xlens = torch.IntTensor(bs).fill_(xs.size(1) if xmax < N_l else N_l)
+        xs = xs[:, :N_l + N_r]
+
+        for lth in range(self.n_layers):
+            self.rnn[lth].flatten_parameters()  # for multi-GPUs
+            self.rnn_bwd[lth].flatten_parameters()  # for multi-GPUs
+            # bwd
+            xs_bwd = torch.flip(xs, dims=[1])
+            xs_bwd, _ = self.rnn_bwd[lth](xs_bwd, hx=None)
+            xs_bwd = torch.flip(xs_bwd, dims=[1])  # `[B, N_l+N_r, n_units]`
+            # fwd
+            if xs.size(1) <= N_l:
+                xs_fwd, self.hx_fwd[lth] = self.rnn[lth](xs, hx=self.hx_fwd[lth])
+            else:
+                xs_fwd1, self.hx_fwd[lth] = self.rnn[lth](xs[:, :N_l], hx=self.hx_fwd[lth])
+                xs_fwd2, _ = self.rnn[lth](xs[:, N_l:], hx=self.hx_fwd[lth])
+                xs_fwd = torch.cat([xs_fwd1, xs_fwd2], dim=1)  # `[B, N_l+N_r, n_units]`
+                # NOTE: xs_fwd2 is for xs_bwd in the next layer
+            if self.bidir_sum:
+                xs = xs_fwd + xs_bwd
+            else:
+                xs = torch.cat([xs_fwd, xs_bwd], dim=-1)
+            xs = self.dropout(xs)
+
+            # Pick up outputs in the sub task before the projection layer
+            if lth == self.n_layers_sub1 - 1:
+                xs_sub1 = xs.clone()
+                if self.bridge_sub1 is not None:
+                    xs_sub1 = self.bridge_sub1(xs_sub1)
+                if task == 'ys_sub1':
+                    return None, xlens, xs_sub1
+
+            # Projection layer
+            if self.proj is not None and lth != self.n_layers - 1:
+                xs = torch.tanh(self.proj[lth](xs))
+            # Subsampling layer
+            if self.subsample is not None:
+                xs, xlens = self.subsample[lth](xs, xlens)
+                N_l = N_l // self.subsample[lth].subsampling_factor
+
+        xs = xs[:, :N_l]
+        if self.n_layers_sub1 > 0:
+            xs_sub1 = xs_sub1[:, :N_l]
 
-        xs_chunks = []
-        xs_chunks_sub1 = []
-        for chunk_idx, t in enumerate(range(0, N_l * n_chunks, N_l)):
-            xs_chunk = xs[:, t:t + (N_l + N_r)]
-            _N_l = N_l
+        return xs, xlens, xs_sub1
 
-            for lth in range(self.n_layers):
-                self.rnn[lth].flatten_parameters()  # for multi-GPUs
-                self.rnn_bwd[lth].flatten_parameters()  # for multi-GPUs
-                # bwd
+    def _forward_chunkwise_parallel(self, xs, xlens, N_l, N_r, task='all'):
+        """Encode all chunks of the latency-controlled bidirectional encoder in parallel.
+            The outputs are the same as those of encoding chunk by chunk.
+
+        Chunks whose windows (current and right context frames) fit in the input
+        are regarded as a single batch of `[B * n_chunks]` utterances for the
+        backward RNN and the forward RNN over the right context. The forward RNN
+        over current frames is run chunk by chunk carrying over its state, and
+        the state at the end of every chunk is kept as the initial state for the
+        right context. The remaining chunks near the end have shorter windows
+        and are processed one by one.
+
+        Args:
+            xs (FloatTensor): `[B, T, n_units]`
+            xlens (IntTensor): `[B]`
+            N_l (int): number of frames for current context
+            N_r (int): number of frames for right context
+            task (str): all or ys_sub1
+        Returns:
+            xs (FloatTensor): `[B, T', n_units]`
+            xlens (IntTensor): `[B]`
+            xs_sub1 (FloatTensor): `[B, T', n_units]`
+
+        """
+        bs, xmax, idim = xs.size()
+        n_chunks = math.ceil(xmax / N_l)
+        n_full = max(0, (xmax - N_l - N_r) // N_l + 1)
+
+        # `[B, n_full, N_l + N_r, idim]`
+        xs_full = None
+        if n_full > 0:
+            xs_full = chunkwise(xs, 0, N_l, N_r).view(bs, n_chunks, N_l + N_r, idim)[:, :n_full]
+        xs_tails = [xs[:, t:t + (N_l + N_r)] for t in range(n_full * N_l, n_chunks * N_l, N_l)]
+
+        _N_l = N_l
+        xs_full_sub1, xs_tails_sub1 = None, []
+        for lth in range(self.n_layers):
+            self.rnn[lth].flatten_parameters()  # for multi-GPUs
+            self.rnn_bwd[lth].flatten_parameters()  # for multi-GPUs
+
+            # fwd over current frames of all chunks
+            xs_cur = [xs_chunk[:, :_N_l] for xs_chunk in xs_tails]
+            if xs_full is not None:
+                xs_cur = [xs_full[:, :, :_N_l].reshape(bs, -1, xs_full.size(-1))] + xs_cur
+            xs_cur_fwd, hx_chunks = self._forward_rnn_chunk_states(
+                self.rnn[lth], torch.cat(xs_cur, dim=1), _N_l, self.hx_fwd[lth])
+            self.hx_fwd[lth] = hx_chunks[-1]
+
+            # fwd over right context frames from the last state of each chunk
+            # bwd in each chunk
+            if xs_full is not None:
+                _, _, W, odim = xs_full.size()
+                xs_full_fwd = xs_cur_fwd[:, :n_full * _N_l].view(bs, n_full, _N_l, -1)
+                if W > _N_l:
+                    xs_full_fwd_r, _ = self.rnn[lth](
+                        xs_full[:, :, _N_l:].reshape(bs * n_full, W - _N_l, odim),
+                        hx=self._batchify_chunk_states(hx_chunks[:n_full]))
+                    xs_full_fwd = torch.cat([xs_full_fwd, xs_full_fwd_r.view(bs, n_full, W - _N_l, -1)], dim=2)
+                xs_full_bwd = torch.flip(xs_full.reshape(bs * n_full, W, odim), dims=[1])
+                xs_full_bwd, _ = self.rnn_bwd[lth](xs_full_bwd, hx=None)
+                xs_full_bwd = torch.flip(xs_full_bwd, dims=[1]).view(bs, n_full, W, -1)
+                if self.bidir_sum:
+                    xs_full = xs_full_fwd + xs_full_bwd
+                else:
+                    xs_full = torch.cat([xs_full_fwd, xs_full_bwd], dim=-1)
+            for i, xs_chunk in enumerate(xs_tails):
+                t = (n_full + i) * _N_l
+                xs_chunk_fwd = xs_cur_fwd[:, t:t + xs_chunk[:, :_N_l].size(1)]
+                if xs_chunk.size(1) > _N_l:
+                    xs_chunk_fwd_r, _ = self.rnn[lth](xs_chunk[:, _N_l:], hx=hx_chunks[n_full + i])
+                    xs_chunk_fwd = torch.cat([xs_chunk_fwd, xs_chunk_fwd_r], dim=1)
                 xs_chunk_bwd = torch.flip(xs_chunk, dims=[1])
                 xs_chunk_bwd, _ = self.rnn_bwd[lth](xs_chunk_bwd, hx=None)
-                xs_chunk_bwd = torch.flip(xs_chunk_bwd, dims=[1])  # `[B, _N_l+_N_r, n_units]`
-                # fwd
-                if xs_chunk.size(1) <= _N_l:
-                    xs_chunk_fwd, self.hx_fwd[lth] = self.rnn[lth](xs_chunk,
-                                                                   hx=self.hx_fwd[lth])
-                else:
-                    xs_chunk_fwd1, self.hx_fwd[lth] = self.rnn[lth](xs_chunk[:, :_N_l],
-                                                                    hx=self.hx_fwd[lth])
-                    xs_chunk_fwd2, _ = self.rnn[lth](xs_chunk[:, _N_l:],
-                                                     hx=self.hx_fwd[lth])
-                    xs_chunk_fwd = torch.cat([xs_chunk_fwd1, xs_chunk_fwd2], dim=1)  # `[B, _N_l+_N_r, n_units]`
-                    # NOTE: xs_chunk_fwd2 is for xs_chunk_bwd in the next layer
+                xs_chunk_bwd = torch.flip(xs_chunk_bwd, dims=[1])
                 if self.bidir_sum:
-                    xs_chunk = xs_chunk_fwd + xs_chunk_bwd
+                    xs_tails[i] = xs_chunk_fwd + xs_chunk_bwd
                 else:
-                    xs_chunk = torch.cat([xs_chunk_fwd, xs_chunk_bwd], dim=-1)
-                xs_chunk = self.dropout(xs_chunk)
+                    xs_tails[i] = torch.cat([xs_chunk_fwd, xs_chunk_bwd], dim=-1)
+
+            xs_chunks = xs_tails if xs_full is None else [xs_full] + xs_tails
+            xs_chunks = [self.dropout(xs_chunk) for xs_chunk in xs_chunks]
+
+            # Pick up outputs in the sub task before the projection layer
+            if lth == self.n_layers_sub1 - 1:
+                xs_chunks_sub1 = [xs_chunk.clone() for xs_chunk in xs_chunks]
+                if self.bridge_sub1 is not None:
+                    xs_chunks_sub1 = [self.bridge_sub1(xs_chunk) for xs_chunk in xs_chunks_sub1]
+                if xs_full is not None:
+                    xs_full_sub1 = xs_chunks_sub1.pop(0)
+                xs_tails_sub1 = xs_chunks_sub1
+                if task == 'ys_sub1':
+                    return None, xlens, self._merge_chunks(xs_full_sub1, xs_tails_sub1, _N_l)
+
+            # Projection layer
+            if self.proj is not None and lth != self.n_layers - 1:
+                xs_chunks = [torch.tanh(self.proj[lth](xs_chunk)) for xs_chunk in xs_chunks]
+            # Subsampling layer
+            if self.subsample is not None:
+                xlens_sub = xlens
+                for i, xs_chunk in enumerate(xs_chunks):
+                    if xs_full is not None and i == 0:
+                        xs_chunk = xs_chunk.reshape(bs * n_full, xs_chunk.size(2), -1)
+                    xs_chunk, xlens_tmp = self.subsample[lth](xs_chunk, xlens)
+                    if i == 0:
+                        xlens_sub = xlens_tmp
+                    if xs_full is not None and i == 0:
+                        xs_chunk = xs_chunk.view(bs, n_full, xs_chunk.size(1), -1)
+                    xs_chunks[i] = xs_chunk
+                xlens = xlens_sub
+                _N_l = _N_l // self.subsample[lth].subsampling_factor
+
+            if xs_full is not None:
+                xs_full = xs_chunks.pop(0)
+            xs_tails = xs_chunks
+
+        xs = self._merge_chunks(xs_full, xs_tails, _N_l)
+        xs_sub1 = None
+        if self.n_layers_sub1 > 0:
+            xs_sub1 = self._merge_chunks(xs_full_sub1, xs_tails_sub1, _N_l)
 
-                # Pick up outputs in the sub task before the projection layer
-                if lth == self.n_layers_sub1 - 1:
-                    xs_chunk_sub1 = xs_chunk.clone()
-                    if self.bridge_sub1 is not None:
-                        xs_chunk_sub1 = self.bridge_sub1(xs_chunk_sub1)
-                    if task == 'ys_sub1':
-                        return None, xlens, xs_chunk_sub1
+        return xs, xlens, xs_sub1
 
-                # Projection layer
-                if self.proj is not None and lth != self.n_layers - 1:
-                    xs_chunk = torch.tanh(self.proj[lth](xs_chunk))
-                # Subsampling layer
-                if self.subsample is not None:
-                    xs_chunk, xlens_tmp = self.subsample[lth](xs_chunk, xlens)
-                    if chunk_idx == 0:
-                        xlens = xlens_tmp
-                    _N_l = _N_l // self.subsample[lth].subsampling_factor
+    @staticmethod
+    def _merge_chunks(xs_full, xs_tails, N_l):
+        """Concatenate current frames of all chunks.
 
-            xs_chunks.append(xs_chunk[:, :_N_l])
-            if self.n_layers_sub1 > 0:
-                xs_chunks_sub1.append(xs_chunk_sub1[:, :_N_l])
+        Args:
+            xs_full (FloatTensor): `[B, n_full, N_l + N_r, n_units]`
+            xs_tails (list): each of which is `[B, <= N_l + N_r, n_units]`
+            N_l (int): number of frames for current context
+        Returns:
+            xs (FloatTensor): `[B, T, n_units]`
 
-            if streaming:
-                break
+        """
+        xs = [xs_chunk[:, :N_l] for xs_chunk in xs_tails]
+        if xs_full is not None:
+            xs = [xs_full[:, :, :N_l].reshape(xs_full.size(0), -1, xs_full.size(-1))] + xs
+        return torch.cat(xs, dim=1)
 
-        xs = torch.cat(xs_chunks, dim=1)
-        if self.n_layers_sub1 > 0:
-            xs_sub1 = torch.cat(xs_chunks_sub1, dim=1)
+    @staticmethod
+    def _forward_rnn_chunk_states(rnn, xs, N_l, hx=None):
+        """Run the forward RNN and keep states at the end of every chunk.
 
-        return xs, xlens, xs_sub1
+        Args:
+            rnn (nn.Module): unidirectional LSTM or GRU
+            xs (FloatTensor): `[B, T, idim]`
+            N_l (int): number of frames per chunk
+            hx (FloatTensor or tuple): initial state
+        Returns:
+            xs (FloatTensor): `[B, T, n_units]`
+            hx_chunks (list): states at the end of each chunk
+
+        """
+        # NOTE: split the sequence at chunk boundaries since cell states of LSTM
+        # are not returned at intermediate steps
+        xs_chunks, hx_chunks = [], []
+        for t in range(0, xs.size(1), N_l):
+            xs_chunk, hx = rnn(xs[:, t:t + N_l], hx=hx)
+            xs_chunks.append(xs_chunk)
+            hx_chunks.append(hx)
+        return torch.cat(xs_chunks, dim=1), hx_chunks
+
+    @staticmethod
+    def _batchify_chunk_states(hx_chunks):
+        """Stack states of chunks in the order of `[B * n_chunks]`.
+
+        Args:
+            hx_chunks (list): each of which is `[1, B, n_units]` or a tuple of them
+        Returns:
+            hx (FloatTensor or tuple): `[1, B * n_chunks, n_units]`
+
+        """
+        if isinstance(hx_chunks[0], tuple):
+            return tuple(torch.stack(h, dim=2).view(1, -1, h[0].size(-1)) for h in zip(*hx_chunks))
+        return torch.stack(hx_chunks, dim=2).view(1, -1, hx_chunks[0].size(-1))
 
     def sub_module(self, xs, xlens, perm_ids_unsort, module='sub1'):
         if self.task_specific_layer:
@@ -6,7 +6,6 @@
 
 """Subsampling layers."""
 
-import math
 import torch
 import torch.nn as nn
 
@@ -37,15 +36,14 @@ class ConcatSubsampler(nn.Module):
         if self.subsampling_factor == 1:
             return xs, xlens
 
-        xs = xs.transpose(1, 0).contiguous()
-        xs = [torch.cat([xs[t - r:t - r + 1] for r in range(self.subsampling_factor - 1, -1, -1)], dim=-1)
-              for t in range(xs.size(0)) if (t + 1) % self.subsampling_factor == 0]
-        xs = torch.cat(xs, dim=0).transpose(1, 0)
+        bs, xmax, idim = xs.size()
         # NOTE: Exclude the last frames if the length is not divisible
+        xmax_sub = xmax // self.subsampling_factor
+        xs = xs[:, :xmax_sub * self.subsampling_factor]
+        xs = xs.reshape(bs, xmax_sub, idim * self.subsampling_factor)
         xs = torch.relu(self.proj(xs))
 
-        xlens = [max(1, i.item() // self.subsampling_factor) for i in xlens]
-        xlens = torch.IntTensor(xlens)
+        xlens = torch.clamp(xlens // self.subsampling_factor, min=1)
         return xs, xlens
 
 
@@ -113,8 +111,8 @@ class DropSubsampler(nn.Module):
 
         xs = xs[:, ::self.subsampling_factor, :]
 
-        xlens = [max(1, math.ceil(i.item() / self.subsampling_factor)) for i in xlens]
-        xlens = torch.IntTensor(xlens)
+        # NOTE: ceil(xlen / factor)
+        xlens = torch.clamp((xlens + self.subsampling_factor - 1) // self.subsampling_factor, min=1)
         return xs, xlens
 
 
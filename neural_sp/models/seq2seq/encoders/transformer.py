@@ -26,6 +26,10 @@ from neural_sp.models.seq2seq.encoders.subsampling import Conv1dSubsampler
 from neural_sp.models.seq2seq.encoders.subsampling import DropSubsampler
 from neural_sp.models.seq2seq.encoders.subsampling import MaxpoolSubsampler
 from neural_sp.models.seq2seq.encoders.utils import chunkwise
+from neural_sp.models.seq2seq.encoders.utils import make_chunkwise_mask
+from neural_sp.models.seq2seq.encoders.utils import merge_chunkwise_attention
+from neural_sp.models.torch_utils import checkpoint_enabled
+from neural_sp.models.torch_utils import checkpoint_layer
 from neural_sp.models.torch_utils import make_pad_mask
 from neural_sp.models.torch_utils import tensor2np
 
@@ -76,6 +80,7 @@ class TransformerEncoder(EncoderBase):
         chunk_size_current (int): current chunk size for latency-controlled Transformer encoder
         chunk_size_right (int): right chunk size for latency-controlled Transformer encoder
         latency_control_type (str): implementation methods of latency-controlled Conformer encoder
+        checkpoint_every_n_layers (int): apply activation checkpointing every N layers (0: disabled)
 
     """
 
@@ -88,7 +93,8 @@ class TransformerEncoder(EncoderBase):
                  conv_in_channel, conv_channels, conv_kernel_sizes, conv_strides, conv_poolings,
                  conv_batch_norm, conv_layer_norm, conv_bottleneck_dim, conv_param_init,
                  task_specific_layer, param_init, clamp_len,
-                 chunk_size_left, chunk_size_current, chunk_size_right, latency_control_type):
+                 chunk_size_left, chunk_size_current, chunk_size_right, latency_control_type,
+                 checkpoint_every_n_layers):
 
         super(TransformerEncoder, self).__init__()
 
@@ -111,6 +117,7 @@ class TransformerEncoder(EncoderBase):
         self.n_heads = n_heads
         self.pe_type = pe_type
         self.scale = math.sqrt(d_model)
+        self.checkpoint_every_n_layers = checkpoint_every_n_layers
 
         # for streaming encoder
         self.chunk_size_left = chunk_size_left
@@ -235,6 +242,7 @@ class TransformerEncoder(EncoderBase):
             self._odim = last_proj_dim
 
         self.reset_parameters(param_init)
+        self.reset_cache()
 
     @staticmethod
     def add_args(parser, args):
@@ -332,7 +340,7 @@ class TransformerEncoder(EncoderBase):
             xs (FloatTensor): `[B, T, input_dim]`
             xlens (InteTensor): `[B]` (on CPU)
             task (str): ys/ys_sub1/ys_sub2
-            streaming (bool): streaming encoding
+            streaming (bool): streaming encoding with the state cached in the encoder
             lookback (bool): truncate leftmost frames for lookback in CNN context
             lookahead (bool): truncate rightmost frames for lookahead in CNN context
         Returns:
@@ -345,11 +353,16 @@ class TransformerEncoder(EncoderBase):
                  'ys_sub1': {'xs': None, 'xlens': None},
                  'ys_sub2': {'xs': None, 'xlens': None}}
 
+        if streaming and self.latency_controlled and self.lc_type == 'mask':
+            xs, self.stream_state = self.forward_chunk(xs, self.stream_state)
+            eouts['ys']['xs'] = xs
+            eouts['ys']['xlens'] = torch.IntTensor([xs.size(1)] * xs.size(0))
+            return eouts
+
         N_l = self.chunk_size_left
         N_c = self.chunk_size_current
         N_r = self.chunk_size_right
         bs, xmax, idim = xs.size()
-        n_chunks = 0
         clamp_len = self.clamp_len
 
         if self.latency_controlled:
@@ -358,13 +371,18 @@ class TransformerEncoder(EncoderBase):
             elif self.lc_type == 'mask':
                 # xs = chunkwise(xs, N_l, N_c, N_r)  # `[B * n_chunks, N_l+N_c+N_r, idim]`
                 xs = chunkwise(xs, 0, N_c, 0)  # `[B * n_chunks, N_c, idim]`
-            n_chunks = xs.size(0) // bs
 
         if self.conv is None:
             xs = self.embed(xs)
         else:
             # Path through CNN blocks
-            xs, xlens = self.conv(xs, xlens)
+            if self.latency_controlled and self.lc_type == 'mask':
+                # NOTE: each chunk is subsampled independently as in forward_chunk
+                xs, _ = self.conv(xs, xlens)
+                factor = self.conv.subsampling_factor
+                xlens = (xlens + factor - 1) // factor
+            else:
+                xs, xlens = self.conv(xs, xlens)
             N_l = max(0, N_l // self.conv.subsampling_factor)
             N_c = N_c // self.conv.subsampling_factor
             N_r = N_r // self.conv.subsampling_factor
@@ -382,33 +400,24 @@ class TransformerEncoder(EncoderBase):
             pos_embs = None
             if self.pe_type in ['relative', 'relative_xl']:
                 xs = xs * self.scale
-                pos_embs = self.pos_emb(xs, zero_center_offset=True)  # NOTE: no clamp_len for streaming
+                # NOTE: no clamp_len for streaming
+                pos_embs = self.pos_emb(xs, zero_center_offset=True, bidirectional=self.lc_type == 'mask')
             else:
                 xs = self.pos_enc(xs, scale=True)
 
             if self.lc_type == 'reshape':
                 xx_mask = None  # NOTE: no mask to avoid masking all frames in a chunk
             elif self.lc_type == 'mask':
-                xx_mask = make_pad_mask(xlens.to(self.device))
-                xx_mask = xx_mask.unsqueeze(1).repeat([1, xs.size(1), 1])  # `[B, emax (query), emax (key)]`
-                for chunk_idx in range(n_chunks):
-                    offset = chunk_idx * N_c
-                    xx_mask[:, offset:offset + N_c, :max(0, offset - N_l)] = 0
-                    xx_mask[:, offset:offset + N_c, offset + (N_c + N_r):] = 0
+                xx_mask = make_chunkwise_mask(xlens.to(self.device), xs.size(1),
+                                              N_l, N_c, N_r)  # `[B, emax (query), emax (key)]`
 
             for lth, layer in enumerate(self.layers):
-                xs = layer(xs, xx_mask, pos_embs=pos_embs, u_bias=self.u_bias, v_bias=self.v_bias)
-                if not self.training:
+                xs = checkpoint_layer(layer, checkpoint_enabled(self, lth, self.checkpoint_every_n_layers))(
+                    xs, xx_mask, pos_embs=pos_embs, u_bias=self.u_bias, v_bias=self.v_bias)
+                if not self.training and layer.xx_aws is not None:
                     if self.lc_type == 'reshape':
-                        n_heads = layer.xx_aws.size(1)
                         xx_aws = layer.xx_aws[:, :, N_l:N_l + N_c, N_l:N_l + N_c]
-                        xx_aws = xx_aws.view(bs, n_chunks, n_heads, N_c, N_c)
-                        xx_aws_center = xx_aws.new_zeros(bs, n_heads, emax, emax)
-                        for chunk_idx in range(n_chunks):
-                            offset = chunk_idx * N_c
-                            emax_chunk = xx_aws_center[:, :, offset:offset + N_c].size(2)
-                            xx_aws_chunk = xx_aws[:, chunk_idx, :, :emax_chunk, :emax_chunk]
-                            xx_aws_center[:, :, offset:offset + N_c, offset:offset + N_c] = xx_aws_chunk
+                        xx_aws_center = merge_chunkwise_attention(xx_aws, bs, emax)
                         self.aws_dict['xx_aws_layer%d' % lth] = tensor2np(xx_aws_center)
                     elif self.lc_type == 'mask':
                         self.aws_dict['xx_aws_layer%d' % lth] = tensor2np(layer.xx_aws)
@@ -422,14 +431,10 @@ class TransformerEncoder(EncoderBase):
                     N_r = N_r // self.subsample[lth].subsampling_factor
                     if self.pe_type in ['relative', 'relative_xl']:
                         # Create sinusoidal positional embeddings for relative positional encoding
-                        pos_embs = self.pos_emb(xs, zero_center_offset=True)  # NOTE: no clamp_len for streaming
+                        pos_embs = self.pos_emb(xs, zero_center_offset=True, bidirectional=self.lc_type == 'mask')
                     if self.lc_type == 'mask':
-                        xx_mask = make_pad_mask(xlens.to(self.device))
-                        xx_mask = xx_mask.unsqueeze(1).repeat([1, xs.size(1), 1])  # `[B, emax (query), emax (key)]`
-                        for chunk_idx in range(n_chunks):
-                            offset = chunk_idx * N_c
-                            xx_mask[:, offset:offset + N_c, :max(0, offset - N_l)] = 0
-                            xx_mask[:, offset:offset + N_c, offset + (N_c + N_r):] = 0
+                        xx_mask = make_chunkwise_mask(xlens.to(self.device), xs.size(1),
+                                                      N_l, N_c, N_r)  # `[B, emax (query), emax (key)]`
 
             # Extract the center region
             if self.lc_type == 'reshape':
@@ -450,8 +455,9 @@ class TransformerEncoder(EncoderBase):
             xx_mask = make_pad_mask(xlens.to(self.device)).unsqueeze(1).repeat([1, xs.size(1), 1])
 
             for lth, layer in enumerate(self.layers):
-                xs = layer(xs, xx_mask, pos_embs=pos_embs, u_bias=self.u_bias, v_bias=self.v_bias)
-                if not self.training:
+                xs = checkpoint_layer(layer, checkpoint_enabled(self, lth, self.checkpoint_every_n_layers))(
+                    xs, xx_mask, pos_embs=pos_embs, u_bias=self.u_bias, v_bias=self.v_bias)
+                if not self.training and layer.xx_aws is not None:
                     self.aws_dict['xx_aws_layer%d' % lth] = tensor2np(layer.xx_aws)
                     self.data_dict['elens%d' % lth] = tensor2np(xlens)
 
@@ -490,6 +496,87 @@ class TransformerEncoder(EncoderBase):
             eouts['ys_sub2']['xs'], eouts['ys_sub2']['xlens'] = xs_sub2, xlens
         return eouts
 
+    def reset_cache(self):
+        """Reset the state for streaming encoding."""
+        self.stream_state = self.init_state()
+
+    def init_state(self):
+        """Initialize the state for chunkwise streaming encoding.
+
+        Returns:
+            state (dict):
+                offset (int): number of frames encoded so far (after the frontend)
+                caches (list): left-context keys/values of each layer
+
+        """
+        return {'offset': 0, 'caches': [None] * self.n_layers}
+
+    def forward_chunk(self, xs, state):
+        """Encode a chunk incrementally for streaming inference.
+
+        A chunk consists of N_c current frames followed by at most N_r lookahead
+        frames. Projected keys/values of the last N_l current frames are cached
+        in each layer, so that previous chunks are not re-encoded. Outputs are
+        the same as those of the masked chunkwise encoding in `forward`
+        (latency_control_type='mask') when there is no lookahead frame.
+
+        Args:
+            xs (FloatTensor): `[B, T_chunk, input_dim]`
+            state (dict): state returned by `init_state` or the previous call
+        Returns:
+            xs (FloatTensor): `[B, T_chunk', d_model]`, outputs of the current frames
+            state (dict): updated state
+
+        """
+        assert self.lc_type == 'mask', 'Set latency_control_type to mask.'
+        N_l = self.chunk_size_left
+        N_c = self.chunk_size_current
+        if N_c <= 0:
+            raise ValueError('Set chunk_size_current > 0 for incremental encoding.')
+        bs, xmax, idim = xs.size()
+        n_current = min(xmax, N_c)
+
+        if self.conv is None:
+            xs = self.embed(xs)
+        else:
+            # NOTE: the CNN frontend is applied to each chunk independently as in training
+            xs = chunkwise(xs, 0, N_c, 0)  # `[B * n_chunks, N_c, idim]`
+            xs, _ = self.conv(xs, torch.IntTensor([N_c] * xs.size(0)))
+            factor = self.conv.subsampling_factor
+            xs = xs.contiguous().view(bs, -1, xs.size(2))[:, :math.ceil(xmax / factor)]
+            n_current = math.ceil(n_current / factor)
+            N_l = N_l // factor
+
+        n_current_in = n_current
+        if self.pe_type in ['relative', 'relative_xl']:
+            xs = xs * self.scale
+        else:
+            xs = self.pos_enc(xs, scale=True, offset=state['offset'])
+
+        caches = []
+        for lth, layer in enumerate(self.layers):
+            cache = state['caches'][lth]
+            pos_embs = None
+            if self.pe_type in ['relative', 'relative_xl']:
+                mlen = cache['k'].size(2) if cache is not None else 0
+                pos_embs = self.pos_emb(xs, mlen=mlen, bidirectional=True)
+            xs, cache = layer.forward_chunk(xs, cache, n_current, N_l,
+                                            pos_embs=pos_embs, u_bias=self.u_bias, v_bias=self.v_bias)
+            caches.append(cache)
+
+            if self.subsample is not None:
+                factor = self.subsample[lth].subsampling_factor
+                xs, _ = self.subsample[lth](xs, torch.IntTensor([xs.size(1)] * bs))
+                n_current = math.ceil(n_current / factor)
+                N_l = N_l // factor
+
+        xs = self.norm_out(xs[:, :n_current])
+        if self.bridge is not None:
+            xs = self.bridge(xs)
+
+        state = {'offset': state['offset'] + n_current_in, 'caches': caches}
+        return xs, state
+
     def sub_module(self, xs, xx_mask, lth, pos_embs=None, module='sub1'):
         if self.task_specific_layer:
             xs_sub = getattr(self, 'layer_' + module)(xs, xx_mask, pos_embs=pos_embs)
@@ -498,7 +585,7 @@ class TransformerEncoder(EncoderBase):
         xs_sub = getattr(self, 'norm_out_' + module)(xs_sub)
         if getattr(self, 'bridge_' + module) is not None:
             xs_sub = getattr(self, 'bridge_' + module)(xs_sub)
-        if not self.training:
+        if not self.training and getattr(self, 'layer_' + module).xx_aws is not None:
             self.aws_dict['xx_aws_%s_layer%d' % (module, lth)] = tensor2np(getattr(self, 'layer_' + module).xx_aws)
         return xs_sub
 
@@ -529,6 +616,8 @@ class TransformerEncoderBlock(nn.Module):
 
         self.n_heads = n_heads
         self.relative_attention = pe_type in ['relaive', 'relative_xl']
+        # NOTE: self-attention weights are kept only for plotting
+        self.need_weights = False
 
         # self-attention
         self.norm1 = nn.LayerNorm(d_model, eps=layer_norm_eps)
@@ -584,7 +673,8 @@ class TransformerEncoderBlock(nn.Module):
         if self.relative_attention:
             xs, self._xx_aws = self.self_attn(xs, xs, pos_embs, xx_mask, u_bias, v_bias)  # k/q/m
         else:
-            xs, self._xx_aws = self.self_attn(xs, xs, xs, mask=xx_mask)[:2]  # k/v/q
+            xs, self._xx_aws = self.self_attn(xs, xs, xs, mask=xx_mask,
+                                              need_weights=self.need_weights and not self.training)[:2]  # k/v/q
         xs = self.dropout(xs) + residual
 
         # position-wise feed-forward
@@ -594,3 +684,51 @@ class TransformerEncoderBlock(nn.Module):
         xs = self.dropout(xs) + residual
 
         return xs
+
+    def forward_chunk(self, xs, cache, n_current, N_l, pos_embs=None, u_bias=None, v_bias=None):
+        """Transformer encoder layer for a single chunk in streaming inference.
+
+        Args:
+            xs (FloatTensor): `[B, T_chunk, d_model]`
+            cache (dict): projected keys/values of previous frames
+                k (FloatTensor): `[B, H, mlen, d_k]`
+                v (FloatTensor): `[B, H, mlen, d_k]`
+            n_current (int): number of current frames (the rest is lookahead)
+            N_l (int): number of frames to cache for the next chunk
+            pos_embs (LongTensor): `[mlen + 2 * T_chunk - 1, 1, d_model]`
+            u_bias (FloatTensor): global parameter for relative positional encoding
+            v_bias (FloatTensor): global parameter for relative positional encoding
+        Returns:
+            xs (FloatTensor): `[B, T_chunk, d_model]`
+            cache (dict): projected keys/values of the last N_l current frames
+
+        """
+        self.reset_visualization()
+
+        # self-attention over cached and current frames
+        residual = xs
+        xs = self.norm1(xs)
+        if self.relative_attention:
+            xs, self._xx_aws, cache = self.self_attn.forward_incremental(
+                xs, pos_embs, None, cache=cache, u_bias=u_bias, v_bias=v_bias)
+        else:
+            xs, self._xx_aws, cache = self.self_attn.forward_incremental(
+                xs, cache=cache, need_weights=self.need_weights)
+        xs = self.dropout(xs) + residual
+
+        # NOTE: lookahead frames are re-encoded in the next chunk
+        mlen = cache['k'].size(2) - residual.size(1)
+        if N_l > 0:
+            start = max(0, mlen + n_current - N_l)
+            cache = dict(cache, k=cache['k'][:, :, start:mlen + n_current],
+                         v=cache['v'][:, :, start:mlen + n_current])
+        else:
+            cache = None
+
+        # position-wise feed-forward
+        residual = xs
+        xs = self.norm2(xs)
+        xs = self.feed_forward(xs)
+        xs = self.dropout(xs) + residual
+
+        return xs, cache
@@ -9,6 +9,9 @@
 import logging
 import math
 import torch
+import torch.nn.functional as F
+
+from neural_sp.models.torch_utils import make_pad_mask
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +21,9 @@ def chunkwise(xs, N_l, N_c, N_r):
         right contexts) as a single utterance for efficient training of
         latency-controlled bidirectional encoder.
 
+    Chunks are extracted with a strided window (`Tensor.unfold`), and a view of
+    the input is returned when there is no context and T is divisible by N_c.
+
     Args:
         xs (FloatTensor): `[B, T, input_dim]`
         N_l (int): number of frames for left context
@@ -31,13 +37,61 @@ def chunkwise(xs, N_l, N_c, N_r):
     bs, xmax, idim = xs.size()
 
     n_chunks = math.ceil(xmax / N_c)
-    xs_tmp = xs.new_zeros(bs, n_chunks, N_l + N_c + N_r, idim)
-    xs_pad = torch.cat([xs.new_zeros(bs, N_l, idim),
-                        xs,
-                        xs.new_zeros(bs, N_r, idim)], dim=1)
-    for chunk_idx, t in enumerate(range(N_l, N_l + xmax, N_c)):
-        xs_chunk = xs_pad[:, t - N_l:t + (N_c + N_r)]
-        xs_tmp[:, chunk_idx, :xs_chunk.size(1), :] = xs_chunk
-    xs = xs_tmp.view(bs * n_chunks, N_l + N_c + N_r, idim)
+    pad_right = n_chunks * N_c - xmax + N_r
+    if N_l > 0 or pad_right > 0:
+        xs = F.pad(xs, (0, 0, N_l, pad_right))  # `[B, N_l + n_chunks * N_c + N_r, input_dim]`
+    if N_l == 0 and N_r == 0:
+        return xs.view(bs * n_chunks, N_c, idim)
+    xs = xs.unfold(1, N_l + N_c + N_r, N_c)  # `[B, n_chunks, input_dim, N_l + N_c + N_r]`
+    xs = xs.transpose(3, 2).reshape(bs * n_chunks, N_l + N_c + N_r, idim)
 
     return xs
+
+
+def make_chunkwise_mask(xlens, xmax, N_l, N_c, N_r):
+    """Make a block-diagonal self-attention mask with left and right contexts
+        for latency-controlled encoders.
+
+    Each query in the c-th chunk can attend to keys from c * N_c - N_l to
+    (c + 1) * N_c + N_r (exclusive) except for padded frames.
+
+    Args:
+        xlens (IntTensor): `[B]`
+        xmax (int): number of frames
+        N_l (int): number of frames for left context
+        N_c (int): number of frames for current context
+        N_r (int): number of frames for right context
+    Returns:
+        xx_mask (BoolTensor): `[B, xmax (query), xmax (key)]`
+
+    """
+    xx_mask = make_pad_mask(xlens).unsqueeze(1)  # `[B, 1, xmax]`
+    if N_c <= 0:
+        return xx_mask.repeat([1, xmax, 1])
+    idx = torch.arange(xmax, device=xlens.device)
+    offset = (idx // N_c * N_c).unsqueeze(1)  # `[xmax, 1]`
+    chunk_mask = (idx.unsqueeze(0) >= offset - N_l) & (idx.unsqueeze(0) < offset + N_c + N_r)
+    return xx_mask & chunk_mask.unsqueeze(0)
+
+
+def merge_chunkwise_attention(aws, bs, emax):
+    """Place attention weights of each chunk on the diagonal of the whole
+        attention map.
+
+    Args:
+        aws (FloatTensor): `[B * n_chunks, H, N_c, N_c]`
+        bs (int): batch size
+        emax (int): number of frames
+    Returns:
+        aws (FloatTensor): `[B, H, emax, emax]`
+
+    """
+    n_chunks = aws.size(0) // bs
+    _, n_heads, N_c, _ = aws.size()
+    aws = aws.reshape(bs, n_chunks, n_heads, N_c, N_c)
+    aws_full = aws.new_zeros(bs, n_heads, n_chunks, N_c, n_chunks, N_c)
+    idx = torch.arange(n_chunks, device=aws.device)
+    # NOTE: separated advanced indices are moved to the first dimension
+    aws_full[:, :, idx, :, idx, :] = aws.transpose(1, 0)
+    aws_full = aws_full.view(bs, n_heads, n_chunks * N_c, n_chunks * N_c)
+    return aws_full[:, :, :emax, :emax]
@@ -35,6 +35,11 @@ class Streaming(object):
         if self.N_l == 0 and self.N_r == 0:
             self.N_l = 40  # for unidirectional encoder
             # TODO(hirofumi0810): make this hyper-parameters
+        # NOTE: Transformer/Conformer encoders trained with the chunkwise mask cache
+        # the left context (incl. CNN) internally, so only N_c current frames are fed per chunk
+        self.stateful = getattr(encoder, 'lc_type', None) == 'mask' and encoder.latency_controlled
+        if self.stateful:
+            self.N_l = encoder.chunk_size_current
 
         # threshold for CTC-VAD
         self.blank = 0
@@ -52,8 +57,11 @@ class Streaming(object):
         self.bd_offset = -1  # boudnary offset in each chunk (AFTER subsampling)
 
         # for CNN
-        self.conv_lookback_n_frames = encoder.conv.n_frames_context if encoder.conv is not None else 0
-        self.conv_lookahead_n_frames = encoder.conv.n_frames_context if encoder.conv is not None else 0
+        self.conv_lookback_n_frames = 0
+        self.conv_lookahead_n_frames = 0
+        if encoder.conv is not None and not self.stateful:
+            self.conv_lookback_n_frames = encoder.conv.n_frames_context
+            self.conv_lookahead_n_frames = encoder.conv.n_frames_context
 
         # for test
         self.eout_chunks = []
@@ -77,8 +85,8 @@ class Streaming(object):
         r = self.N_r
 
         # Encode input features chunk by chunk
-        if getattr(self.encoder, 'conv', None) is not None:
-            context = self.encoder.conv.n_frames_context
+        if self.conv_lookback_n_frames > 0:
+            context = self.conv_lookback_n_frames
             x_chunk = self.x_whole[max(0, j - context):j + (l + r) + context]
         else:
             x_chunk = self.x_whole[j:j + (l + r)]
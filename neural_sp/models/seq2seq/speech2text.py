@@ -14,6 +14,7 @@ import torch
 import torch.nn as nn
 
 from neural_sp.bin.train_utils import load_checkpoint
+from neural_sp.datasets.teacher_cache import TeacherLogitStore
 from neural_sp.models.base import ModelBase
 from neural_sp.models.lm.rnnlm import RNNLM
 from neural_sp.models.seq2seq.decoders.build import build_decoder
@@ -232,7 +233,7 @@ class Speech2Text(ModelBase):
             task (str): all/ys*/ys_sub*
             is_eval (bool): evaluation mode
                 This should be used in inference model for memory efficiency.
-            teacher (Speech2Text): used for knowledge distillation from ASR
+            teacher (Speech2Text or TeacherLogitStore): used for knowledge distillation from ASR
             teacher_lm (RNNLM): used for knowledge distillation from LM
         Returns:
             loss (FloatTensor): `[1]`
@@ -265,7 +266,10 @@ class Speech2Text(ModelBase):
         # for the forward decoder in the main task
         if (self.fwd_weight > 0 or (self.bwd_weight == 0 and self.ctc_weight > 0) or self.mbr_training) and task in ['all', 'ys', 'ys.ctc', 'ys.mbr']:
             teacher_logits = None
-            if teacher is not None:
+            if isinstance(teacher, TeacherLogitStore):
+                # precomputed by neural_sp/bin/asr/cache_teacher_logits.py
+                teacher_logits = teacher.generate_logits(batch['utt_ids'], self.device)
+            elif teacher is not None:
                 teacher.eval()
                 teacher_logits = teacher.generate_logits(batch)
                 # TODO(hirofumi): label smoothing, scheduled sampling, dropout?
@@ -338,13 +342,14 @@ class Speech2Text(ModelBase):
             return_logits=True)
         return logits
 
-    def generate_lm_logits(self, ys, lm, temperature=5.0):
+    @staticmethod
+    def generate_lm_logits(ys, lm, temperature=5.0):
         # Append <sos> and <eos>
-        eos = next(lm.parameters()).new_zeros(1).fill_(self.eos).long()
-        ys = [np2tensor(np.fromiter(y, dtype=np.int64), self.device)for y in ys]
-        ys_in = pad_list([torch.cat([eos, y], dim=0) for y in ys], self.pad)
-        lmout, _ = lm.decode(ys_in, None)
-        logits = lm.output(lmout)
+        device = next(lm.parameters()).device
+        eos = torch.zeros(1, dtype=torch.int64, device=device).fill_(lm.eos)
+        ys = [np2tensor(np.fromiter(y, dtype=np.int64), device) for y in ys]
+        ys_in = pad_list([torch.cat([eos, y], dim=0) for y in ys], lm.pad)
+        logits, _, _ = lm.decode(ys_in, None)
         return logits
 
     def encode(self, xs, task='all', streaming=False, lookback=False, lookahead=False):
@@ -7,8 +7,11 @@
 """Utility functions."""
 
 import copy
+import functools
 import numpy as np
+import random
 import torch
+import torch.utils.checkpoint
 
 
 def repeat(module, n_layers):
@@ -144,3 +147,102 @@ def compute_accuracy(logits, ys_ref, pad):
     denominator = torch.sum(mask)
     acc = float(numerator) * 100 / float(denominator)
     return acc
+
+
+def float32_region(func):
+    """Decorator to run a function in float32 inside native autocast regions.
+
+    Floating-point tensor arguments are casted to float32 and autocast is
+    disabled while the function runs. Outside autocast, this is a no-op.
+
+    Args:
+        func (function): numerically sensitive function such as a loss
+    Returns:
+        function
+
+    """
+    def _to_float32(x):
+        if torch.is_tensor(x) and x.dtype in [torch.float16, torch.bfloat16]:
+            return x.float()
+        return x
+
+    @functools.wraps(func)
+    def _float32_region(*args, **kwargs):
+        device_types = [d for d in ['cuda', 'cpu'] if torch.is_autocast_enabled(d)]
+        if len(device_types) == 0:
+            return func(*args, **kwargs)
+        args = [_to_float32(a) for a in args]
+        kwargs = {k: _to_float32(v) for k, v in kwargs.items()}
+        with torch.autocast(device_types[0], enabled=False):
+            return func(*args, **kwargs)
+    return _float32_region
+
+
+def softmax_float32(e, dim):
+    """Softmax function computed in float32 for half-precision inputs.
+
+    Args:
+        e (FloatTensor): attention energies of any sizes
+        dim (int): dimension to normalize
+    Returns:
+        aw (FloatTensor): attention weights of the same dtype as the input
+
+    """
+    if e.dtype in [torch.float16, torch.bfloat16]:
+        return torch.softmax(e, dim=dim, dtype=torch.float32).to(e.dtype)
+    return torch.softmax(e, dim=dim)
+
+
+def checkpoint_enabled(module, lth, every_n_layers):
+    """Check if activation checkpointing is applied to the lth layer.
+
+    Args:
+        module (torch.nn.Module): encoder or decoder containing the layer
+        lth (int): layer index
+        every_n_layers (int): apply checkpointing every N layers (0: disabled)
+    Returns:
+        bool
+
+    """
+    if not (module.training and torch.is_grad_enabled()) or every_n_layers == 0:
+        return False
+    return lth % every_n_layers == 0
+
+
+def checkpoint_layer(layer, enabled=True):
+    """Wrap a layer with activation checkpointing.
+
+    Intermediate activations inside the layer are not kept in the forward pass,
+    and they are recomputed in the backward pass instead. The random states
+    are replayed in the recomputation so that dropout and LayerDrop make the
+    same decisions.
+
+    Args:
+        layer (torch.nn.Module):
+        enabled (bool): if False, the layer is returned as it is
+    Returns:
+        function: the same interface as the layer
+
+    """
+    if not enabled:
+        return layer
+
+    @functools.wraps(layer.forward)
+    def _checkpoint_layer(*args, **kwargs):
+        state = random.getstate()
+        is_recomputation = [False]
+
+        def run(*args, **kwargs):
+            if not is_recomputation[0]:
+                is_recomputation[0] = True
+                return layer(*args, **kwargs)
+            # NOTE: torch random states are restored by torch.utils.checkpoint
+            state_current = random.getstate()
+            random.setstate(state)
+            try:
+                return layer(*args, **kwargs)
+            finally:
+                random.setstate(state_current)
+
+        return torch.utils.checkpoint.checkpoint(run, *args, use_reentrant=False, **kwargs)
+    return _checkpoint_layer
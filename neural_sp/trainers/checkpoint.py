@@ -0,0 +1,162 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Asynchronous checkpoint writer with top-k retention."""
+
+from glob import glob
+import json
+import logging
+import os
+import queue
+import threading
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+def snapshot(obj):
+    """Copy all tensors in a (nested) state dict to CPU.
+
+    Args:
+        obj: tensor, or dict/list/tuple containing tensors
+    Returns:
+        obj: the same structure whose tensors are detached CPU copies
+
+    """
+    if torch.is_tensor(obj):
+        return obj.detach().to('cpu', copy=True)
+    elif isinstance(obj, dict):
+        return obj.__class__((k, snapshot(v)) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        return obj.__class__(snapshot(v) for v in obj)
+    return obj
+
+
+class CheckpointWriter(object):
+    """Checkpoint writer serializing model states in a background thread.
+
+    Tensors are copied to CPU on the training thread, and serialization is
+    done by a worker thread so that training is not blocked by disk I/O.
+    Each checkpoint is written to a temporary file and renamed atomically.
+    Saved checkpoints are tracked by a manifest file, so that old ones can
+    be pruned without globbing the save directory.
+
+    Args:
+        save_path (str): path to the directory to save checkpoints
+        asynchronous (bool): serialize checkpoints in a background thread
+        max_queue_size (int): number of pending checkpoints kept in memory.
+            `save` blocks when this is exceeded.
+
+    """
+
+    manifest_name = 'checkpoints.json'
+
+    def __init__(self, save_path, asynchronous=False, max_queue_size=1):
+
+        self.save_path = save_path
+        self.asynchronous = asynchronous
+        self.manifest_path = os.path.join(save_path, self.manifest_name)
+        self.manifest = self._load_manifest()
+
+        self._error = None
+        self._queue = None
+        self._thread = None
+        if asynchronous:
+            self._queue = queue.Queue(maxsize=max_queue_size)
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _load_manifest(self):
+        if os.path.isfile(self.manifest_path):
+            with open(self.manifest_path, 'r') as f:
+                return json.load(f)
+        # NOTE: bootstrap from existing checkpoints once (e.g., resumed training)
+        manifest = []
+        for path in sorted(glob(os.path.join(self.save_path, 'model.epoch-*'))):
+            if 'model.epoch-avg' in path or path.endswith('.tmp'):
+                continue
+            manifest.append({'path': os.path.basename(path),
+                             'epoch': path.split('-')[-1]})
+        return manifest
+
+    def _save_manifest(self):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def save(self, checkpoint, epoch, keep_epochs=None):
+        """Save a checkpoint.
+
+        Args:
+            checkpoint (dict): states to save
+            epoch (int or float): epoch of the checkpoint
+            keep_epochs (list): if not None, previous checkpoints whose epoch
+                is not included in this list are deleted
+        Returns:
+            model_path (str): path to the checkpoint
+
+        """
+        self._raise_error()
+        model_path = os.path.join(self.save_path, 'model.epoch-' + str(epoch))
+        job = (snapshot(checkpoint), model_path, str(epoch),
+               None if keep_epochs is None else [str(ep) for ep in keep_epochs])
+        if self.asynchronous:
+            self._queue.put(job)
+        else:
+            self._write(*job)
+        return model_path
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    break
+                self._write(*job)
+            except Exception as e:
+                logger.error('Failed to save a checkpoint: %s' % str(e))
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _write(self, checkpoint, model_path, epoch, keep_epochs):
+        # Remove old checkpoints
+        if keep_epochs is not None:
+            for item in self.manifest:
+                if item['epoch'] not in keep_epochs:
+                    path = os.path.join(self.save_path, item['path'])
+                    if os.path.isfile(path):
+                        os.remove(path)
+            self.manifest = [item for item in self.manifest if item['epoch'] in keep_epochs]
+
+        # Write to a temporary file first so that a crash never leaves a broken checkpoint
+        tmp_path = model_path + '.tmp'
+        torch.save(checkpoint, tmp_path)
+        os.replace(tmp_path, model_path)
+
+        self.manifest = [item for item in self.manifest if item['epoch'] != epoch]
+        self.manifest.append({'path': os.path.basename(model_path), 'epoch': epoch})
+        self._save_manifest()
+        logger.info("=> Saved checkpoint (epoch:%s): %s" % (epoch, model_path))
+
+    def _raise_error(self):
+        if self._error is not None:
+            e, self._error = self._error, None
+            raise e
+
+    def wait(self):
+        """Block until all pending checkpoints are written."""
+        if self.asynchronous:
+            self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        """Flush pending checkpoints and stop the worker thread."""
+        if self.asynchronous and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._raise_error()
@@ -0,0 +1,74 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Exponential moving average of model parameters."""
+
+import logging
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+class ExponentialMovingAverage(object):
+    """Exponential moving average (EMA) of model parameters.
+
+    This keeps a running average of floating-point parameters and buffers
+    during training, which can be used instead of post-hoc checkpoint averaging.
+
+    Args:
+        model (torch.nn.Module):
+        decay (float): decay rate of the moving average per update
+        warmup (bool): increase the decay rate gradually in early updates
+
+    """
+
+    def __init__(self, model, decay, warmup=True):
+
+        assert 0 < decay < 1
+        self.decay = decay
+        self.warmup = warmup
+        self.n_updates = 0
+        self.shadow = {k: v.detach().clone() for k, v in model.state_dict().items()
+                       if v.is_floating_point()}
+
+    @torch.no_grad()
+    def update(self, model):
+        """Update the moving average with the current parameters.
+
+        Args:
+            model (torch.nn.Module):
+
+        """
+        self.n_updates += 1
+        decay = self.decay
+        if self.warmup:
+            decay = min(decay, (1 + self.n_updates) / (10 + self.n_updates))
+        for k, v in model.state_dict().items():
+            if k in self.shadow:
+                self.shadow[k].mul_(decay).add_(v.detach().to(self.shadow[k].dtype), alpha=1 - decay)
+
+    def copy_to(self, model):
+        """Overwrite model parameters with the moving average.
+
+        Args:
+            model (torch.nn.Module):
+
+        """
+        model.load_state_dict(self.shadow, strict=False)
+
+    def state_dict(self):
+        return {'decay': self.decay,
+                'warmup': self.warmup,
+                'n_updates': self.n_updates,
+                'shadow': self.shadow}
+
+    def load_state_dict(self, state_dict):
+        self.decay = state_dict['decay']
+        self.warmup = state_dict['warmup']
+        self.n_updates = state_dict['n_updates']
+        for k, v in state_dict['shadow'].items():
+            if k in self.shadow:
+                self.shadow[k].copy_(v)
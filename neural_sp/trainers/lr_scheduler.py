@@ -6,11 +6,10 @@
 
 """Learning rate scheduler."""
 
-from glob import glob
 import logging
-import os
 import torch
 
+from neural_sp.trainers.checkpoint import CheckpointWriter
 from neural_sp.trainers.optimizer import set_optimizer
 
 logger = logging.getLogger(__name__)
@@ -83,6 +82,9 @@ class LRScheduler(object):
         assert save_checkpoints_topk >= 1
         self.topk_list = []
 
+        # for checkpoint saving
+        self._writer = None
+
     @property
     def n_steps(self):
         return self._step
@@ -99,14 +101,33 @@ class LRScheduler(object):
     def is_early_stop(self):
         return self.not_improved_n_epochs >= self.early_stop_patient_n_epochs
 
-    def step(self):
+    def step(self, scaler=None):
+        """Update parameters and learning rate.
+
+        Args:
+            scaler (GradScaler): gradient scaler for native mixed precision training
+
+        """
         self._step += 1
-        self.optimizer.step()
+        if scaler is not None:
+            scaler.step(self.optimizer)
+            scaler.update()
+        else:
+            self.optimizer.step()
         if self.noam:
             self._noam_lr()
         else:
             self._warmup_lr()
 
+    def set_checkpoint_writer(self, writer):
+        """Set a checkpoint writer.
+
+        Args:
+            writer (CheckpointWriter): (asynchronous) checkpoint writer
+
+        """
+        self._writer = writer
+
     def zero_grad(self):
         self.optimizer.zero_grad()
 
@@ -179,7 +200,7 @@ class LRScheduler(object):
                 param_group['lr'] = self.lr
 
     def save_checkpoint(self, model, save_path, remove_old=True, amp=None,
-                        epoch_detail=None):
+                        epoch_detail=None, scaler=None, ema=None):
         """Save checkpoint.
 
         Args:
@@ -190,20 +211,14 @@ class LRScheduler(object):
                 worse than the top-k ones are deleted
             amp ():
             epoch_detail (float): fine-grained epoch (used for MBR training)
+            scaler (GradScaler): gradient scaler for native mixed precision training
+            ema (ExponentialMovingAverage): moving average of model parameters
 
         """
         if epoch_detail is None:
             epoch_detail = self.n_epochs
-        model_path = os.path.join(save_path, 'model.epoch-' + str(epoch_detail))
-
-        # Remove old checkpoints
-        if remove_old:
-            for path in glob(os.path.join(save_path, 'model.epoch-*')):
-                if 'model.epoch-avg' in path:
-                    continue
-                epoch = int(path.split('-')[-1])
-                if epoch not in [ep for (ep, v) in self.topk_list]:
-                    os.remove(path)
+        if self._writer is None:
+            self._writer = CheckpointWriter(save_path, asynchronous=False)
 
         # Save parameters, optimizer, step index etc.
         checkpoint = {
@@ -212,18 +227,27 @@ class LRScheduler(object):
         }
         if amp is not None:
             checkpoint['amp_state_dict'] = amp.state_dict()
-        torch.save(checkpoint, model_path)
+        if scaler is not None:
+            checkpoint['scaler_state_dict'] = scaler.state_dict()
+        if ema is not None:
+            checkpoint['ema_state_dict'] = ema.state_dict()
 
-        logger.info("=> Saved checkpoint (epoch:%s): %s" % (str(epoch_detail), model_path))
+        # NOTE: tensors are copied to CPU here, and serialized in the background
+        # if the writer is asynchronous
+        keep_epochs = [ep for (ep, v) in self.topk_list] if remove_old else None
+        self._writer.save(checkpoint, epoch_detail, keep_epochs)
 
     def state_dict(self):
         """Returns the state of the scheduler as a :class:`dict`.
 
         It contains an entry for every variable in self.__dict__ which
-        is not the optimizer.
+        is not the optimizer or the checkpoint writer.
 
         """
-        dict = {key: value for key, value in self.__dict__.items()}
+        dict = {key: value for key, value in self.__dict__.items()
+                if key not in ['optimizer', '_writer']}
+        # NOTE: the optimizer object itself is not saved so that the states can be
+        # copied to CPU and serialized safely while training continues
         dict['optimizer_state_dict'] = self.optimizer.state_dict()
         return dict
 
@@ -235,7 +259,7 @@ class LRScheduler(object):
                 from a call to :meth:`state_dict`.
 
         """
-        self.__dict__.update({k: v for k, v in state_dict.items() if k != 'optimizer_state_dict'})
+        self.__dict__.update({k: v for k, v in state_dict.items() if k not in ['optimizer', 'optimizer_state_dict', '_writer']})
         self.optimizer.load_state_dict(state_dict['optimizer_state_dict'])
 
     def convert_to_sgd(self, model, lr, weight_decay, decay_type, decay_rate):
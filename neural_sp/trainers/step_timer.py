@@ -0,0 +1,218 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Step-time breakdown and profiling during training."""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+import logging
+import os
+import time
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+class StepTimer(object):
+    """Accumulate elapsed time of each section in training steps.
+
+    On GPU, device-side sections are measured with CUDA events, which are
+    resolved only when `summary` is called, so that the training loop is not
+    synchronized at every section. Host-side sections (e.g., data loading)
+    are measured with the wall clock.
+
+    Args:
+        use_cuda (bool): measure device-side sections with CUDA events
+
+    """
+
+    def __init__(self, use_cuda=False):
+
+        self.use_cuda = use_cuda
+        self._records = OrderedDict()  # name -> list of (start, end)
+        self._running = {}  # name -> start
+        self._hooks = []
+        self.reset()
+
+    def reset(self):
+        """Clear all records and restart the clock for throughput."""
+        self._records.clear()
+        self._running.clear()
+        self.n_steps = 0
+        self.n_frames = 0
+        self.n_tokens = 0
+        self._start_time = time.time()
+
+    def start(self, name, host=False):
+        """Start measuring a section.
+
+        Args:
+            name (str): name of the section
+            host (bool): measure with the wall clock even on GPU
+
+        """
+        if self.use_cuda and not host:
+            event = torch.cuda.Event(enable_timing=True)
+            event.record()
+        else:
+            event = time.perf_counter()
+        self._running[name] = event
+
+    def stop(self, name):
+        """Stop measuring a section. This is ignored if it is not running."""
+        if name not in self._running:
+            return
+        start = self._running.pop(name)
+        if isinstance(start, float):
+            end = time.perf_counter()
+        else:
+            end = torch.cuda.Event(enable_timing=True)
+            end.record()
+        self._records.setdefault(name, []).append((start, end))
+
+    @contextmanager
+    def section(self, name, host=False):
+        self.start(name, host)
+        try:
+            yield
+        finally:
+            self.stop(name)
+
+    def attach(self, model, enc_name='enc', dec_prefix='dec_'):
+        """Measure encoder and decoder forward with forward hooks.
+
+        The time from the beginning of the model forward to the encoder forward
+        is reported as `h2d`, which includes the host-to-device copy of inputs
+        and feature-level preprocessing (e.g., SpecAugment).
+        Forward passes in the evaluation mode are not measured.
+
+        Args:
+            model (torch.nn.Module): model containing the encoder and decoders
+            enc_name (str): name of the encoder module
+            dec_prefix (str): prefix of names of decoder modules
+
+        """
+        def pre_hook(name, stop=None):
+            def hook(module, inputs):
+                if module.training:
+                    if stop is not None:
+                        self.stop(stop)
+                    self.start(name)
+            return hook
+
+        def post_hook(name):
+            def hook(module, inputs, outputs):
+                self.stop(name)
+            return hook
+
+        self._hooks.append(model.register_forward_pre_hook(pre_hook('h2d')))
+        self._hooks.append(model.register_forward_hook(post_hook('h2d')))
+        for name, module in model.named_children():
+            if name == enc_name:
+                self._hooks.append(module.register_forward_pre_hook(pre_hook('enc', stop='h2d')))
+                self._hooks.append(module.register_forward_hook(post_hook('enc')))
+            elif name.startswith(dec_prefix):
+                self._hooks.append(module.register_forward_pre_hook(pre_hook(name)))
+                self._hooks.append(module.register_forward_hook(post_hook(name)))
+
+    def detach(self):
+        """Remove all forward hooks."""
+        for h in self._hooks:
+            h.remove()
+        self._hooks = []
+
+    def step(self, n_frames=0, n_tokens=0):
+        """Count a training step.
+
+        Args:
+            n_frames (int): number of input frames in the mini-batch
+            n_tokens (int): number of output tokens in the mini-batch
+
+        """
+        self.n_steps += 1
+        self.n_frames += n_frames
+        self.n_tokens += n_tokens
+
+    def summary(self):
+        """Summarize records since the last call and reset them.
+
+        Returns:
+            times (OrderedDict): average time [ms] per step of each section
+            throughput (dict): frames/sec and tokens/sec
+
+        """
+        if self.use_cuda:
+            torch.cuda.synchronize()
+        duration = time.time() - self._start_time
+        n_steps = max(self.n_steps, 1)
+        times = OrderedDict()
+        for name, records in self._records.items():
+            total = 0.
+            for start, end in records:
+                if isinstance(start, float):
+                    total += (end - start) * 1000
+                else:
+                    total += start.elapsed_time(end)
+            times[name] = total / n_steps
+        throughput = {'frames_per_sec': self.n_frames / duration,
+                      'tokens_per_sec': self.n_tokens / duration}
+        self.reset()
+        return times, throughput
+
+
+class ProfilerWindow(object):
+    """Run the PyTorch profiler over a range of training steps.
+
+    A chrome trace is saved to `save_path` and a table of the most expensive
+    operators is logged when the window is closed.
+
+    Args:
+        save_path (str): path to the directory to save the trace
+        start_step (int): first step to profile (0: disabled)
+        n_steps (int): number of steps to profile
+        use_cuda (bool): profile CUDA kernels
+
+    """
+
+    def __init__(self, save_path, start_step, n_steps, use_cuda=False):
+
+        self.save_path = save_path
+        self.start_step = start_step
+        self.end_step = start_step + n_steps
+        self.use_cuda = use_cuda
+        self.prof = None
+
+    def step(self, n_steps):
+        """Start or stop the profiler depending on the step.
+
+        Args:
+            n_steps (int): number of training steps finished so far
+
+        """
+        if self.start_step <= 0:
+            return
+        if n_steps == self.start_step and self.prof is None:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if self.use_cuda:
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self.prof = torch.profiler.profile(activities=activities,
+                                               record_shapes=True, profile_memory=True)
+            self.prof.__enter__()
+            logger.info('Start profiling (step:%d-%d)' % (self.start_step, self.end_step))
+        elif n_steps == self.end_step and self.prof is not None:
+            self.close()
+
+    def close(self):
+        if self.prof is None:
+            return
+        self.prof.__exit__(None, None, None)
+        trace_path = os.path.join(self.save_path, 'trace.step%d-%d.json' %
+                                  (self.start_step, self.end_step))
+        self.prof.export_chrome_trace(trace_path)
+        sort_by = 'cuda_time_total' if self.use_cuda else 'cpu_time_total'
+        logger.info(self.prof.key_averages().table(sort_by=sort_by, row_limit=20))
+        logger.info('Saved profiler trace: %s' % trace_path)
+        self.prof = None
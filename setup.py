@@ -24,7 +24,7 @@ requirements = {
         'setproctitle>=1.1.10',
         'tensorboardX>=2.0',
         'tqdm>=4.42.0',
-        'torch==1.0.0',
+        'torch>=2.4.0',
     ],
     'setup': [
 
@@ -61,8 +61,8 @@ setup(name='neural_sp',
       extras_require=extras_require,
       classifiers=[
           'Programming Language :: Python',
-          'Programming Language :: Python :: 3.6',
-          'Programming Language :: Python :: 3.7',
+          'Programming Language :: Python :: 3.8',
+          'Programming Language :: Python :: 3.9',
           'Development Status :: 5 - Production/Stable',
           'Intended Audience :: Science/Research',
           'Operating System :: POSIX :: Linux',
@@ -0,0 +1,120 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for sentence-level mini-batches of the LM dataset."""
+
+import argparse
+import importlib
+import numpy as np
+import pytest
+import torch
+
+
+VOCAB = 50
+EOS = 2
+
+
+def make_dataset(tmp_path, ylens):
+    dict_path = tmp_path / 'dict.txt'
+    with open(dict_path, 'w') as f:
+        f.write('<unk> 1\n<eos> 2\n<pad> 3\n')
+        for i in range(4, VOCAB):
+            f.write('w%d %d\n' % (i, i))
+    tsv_path = tmp_path / 'train.tsv'
+    with open(tsv_path, 'w') as f:
+        f.write('\t'.join(['utt_id', 'speaker', 'feat_path', 'xlen', 'xdim',
+                           'text', 'token_id', 'ylen', 'ydim']) + '\n')
+        for i, ylen in enumerate(ylens):
+            token_id = ' '.join(map(str, np.random.randint(4, VOCAB, ylen)))
+            f.write('\t'.join(['utt%03d' % i, 'spk', '', '0', '0', 'text', token_id,
+                               str(ylen), str(VOCAB)]) + '\n')
+    return str(tsv_path), str(dict_path)
+
+
+def make_args_rnnlm(**kwargs):
+    args = dict(
+        lm_type='lstm',
+        n_units=16,
+        n_projs=0,
+        n_layers=2,
+        residual=False,
+        use_glu=False,
+        n_units_null_context=0,
+        bottleneck_dim=8,
+        emb_dim=8,
+        vocab=VOCAB,
+        dropout_in=0.1,
+        dropout_hidden=0.1,
+        lsm_prob=0.0,
+        param_init=0.1,
+        adaptive_softmax=False,
+        tie_embedding=False,
+    )
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+
+@pytest.mark.parametrize(
+    "batch_size, max_n_tokens, shuffle, backward",
+    [
+        (4, 0, False, False),
+        (4, 20, False, False),
+        (100, 30, True, False),
+        (3, 0, True, True),
+        (1, 0, False, False),
+    ]
+)
+def test_sentence_batching(tmp_path, batch_size, max_n_tokens, shuffle, backward):
+    ylens = np.random.randint(1, 12, 37).tolist()
+    tsv_path, dict_path = make_dataset(tmp_path, ylens)
+
+    module = importlib.import_module('neural_sp.datasets.lm')
+    dataset = module.Dataset(tsv_path, dict_path, unit='word', batch_size=batch_size,
+                             shuffle=shuffle, backward=backward,
+                             sentence_batching=True, max_n_tokens=max_n_tokens)
+    sentences_ref = []
+    for token_id in dataset.df['token_id']:
+        token_ids = list(map(int, token_id.split()))
+        if backward:
+            token_ids = token_ids[::-1]
+        sentences_ref.append([EOS] + token_ids + [EOS])
+    assert len(dataset) == sum(ylens) + len(ylens)
+
+    for epoch in range(2):
+        sentences = []
+        while True:
+            ys, is_new_epoch = dataset.next()
+            assert isinstance(ys, list)
+            assert 1 <= len(ys) <= batch_size
+            max_len = max([len(y) for y in ys])
+            if max_n_tokens > 0 and len(ys) > 1:
+                assert len(ys) * max_len <= max_n_tokens
+            if not shuffle:
+                # similar lengths
+                assert all(len(y) <= len(y_next) for y, y_next in zip(ys[:-1], ys[1:]))
+            sentences += [y.tolist() for y in ys]
+            if is_new_epoch:
+                break
+        assert dataset.epoch == epoch + 1
+        assert dataset.offset == 0
+        assert sorted(sentences) == sorted(sentences_ref)
+
+
+@pytest.mark.parametrize("adaptive_softmax", [False, True])
+def test_forward_padded_sentences(tmp_path, adaptive_softmax):
+    ylens = [3, 7, 1, 5]
+    tsv_path, dict_path = make_dataset(tmp_path, ylens)
+
+    module = importlib.import_module('neural_sp.datasets.lm')
+    dataset = module.Dataset(tsv_path, dict_path, unit='word', batch_size=len(ylens),
+                             sentence_batching=True)
+    ys, is_new_epoch = dataset.next()
+    assert is_new_epoch
+
+    module_rnnlm = importlib.import_module('neural_sp.models.lm.rnnlm')
+    lm = module_rnnlm.RNNLM(make_args_rnnlm(adaptive_softmax=adaptive_softmax))
+    with torch.no_grad():
+        loss = lm(ys, None, is_eval=True)[0]
+        # padding does not affect the loss
+        total_loss = sum([lm([y], None, is_eval=True)[0].item() * (len(y) - 1) for y in ys])
+    assert abs(loss.item() - total_loss / sum([len(y) - 1 for y in ys])) < 1e-5
@@ -0,0 +1,59 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for precomputed teacher logits."""
+
+import pytest
+import torch
+
+from neural_sp.models.criterion import distillation
+from neural_sp.datasets.teacher_cache import TeacherLogitStore
+from neural_sp.datasets.teacher_cache import TeacherLogitWriter
+
+VOCAB = 20
+
+
+@pytest.mark.parametrize("topk", [1, 4, VOCAB])
+def test_teacher_cache(tmpdir, topk):
+    cache_path = str(tmpdir.join('teacher'))
+    ylens = [[4, 2, 3], [5, 1]]
+    utt_ids = [['utt1', 'utt2', 'utt3'], ['utt4', 'utt5']]
+    logits = [torch.randn(len(ylens_b), max(ylens_b), VOCAB) for ylens_b in ylens]
+
+    writer = TeacherLogitWriter(cache_path, topk)
+    for utt_ids_b, logits_b, ylens_b in zip(utt_ids, logits, ylens):
+        writer.add(utt_ids_b, logits_b, ylens_b)
+    writer.close()
+
+    store = TeacherLogitStore(cache_path)
+    assert len(store) == 5
+
+    # mini-batch composed differently from the one in writing
+    logits_restored = store.generate_logits(['utt5', 'utt1'], torch.device('cpu'))
+    assert logits_restored.size() == (2, 4, VOCAB)
+    refs = [logits[1][1, :1], logits[0][0, :4]]
+    for b, ref in enumerate(refs):
+        ylen = ref.size(0)
+        assert torch.equal(logits_restored[b, :ylen].argmax(-1), ref.argmax(-1))
+        if topk == VOCAB:
+            probs_restored = torch.softmax(logits_restored[b, :ylen], dim=-1)
+            assert torch.allclose(probs_restored, torch.softmax(ref, dim=-1), atol=1e-3)
+
+    # distillation loss should be finite
+    ylens_restored = torch.IntTensor([1, 4])
+    logits_student = torch.randn(2, 4, VOCAB, requires_grad=True)
+    loss = distillation(logits_student, logits_restored, ylens_restored)
+    loss.backward()
+    assert torch.isfinite(loss)
+    assert torch.isfinite(logits_student.grad).all()
+
+
+def test_teacher_cache_missing_utterance(tmpdir):
+    cache_path = str(tmpdir.join('teacher'))
+    writer = TeacherLogitWriter(cache_path, topk=4)
+    writer.add(['utt1'], torch.randn(1, 3, VOCAB), [3])
+    writer.close()
+
+    store = TeacherLogitStore(cache_path)
+    with pytest.raises(ValueError, match='utt2'):
+        store.generate_logits(['utt1', 'utt2'], torch.device('cpu'))
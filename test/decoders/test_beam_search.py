@@ -0,0 +1,165 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for utilities of beam search."""
+
+import argparse
+import importlib
+import numpy as np
+import pytest
+import torch
+
+
+VOCAB = 10
+
+
+def make_args_rnnlm(**kwargs):
+    args = dict(
+        lm_type='lstm',
+        n_units=32,
+        n_projs=0,
+        n_layers=2,
+        residual=False,
+        use_glu=False,
+        n_units_null_context=0,
+        bottleneck_dim=16,
+        emb_dim=16,
+        vocab=VOCAB,
+        dropout_in=0.1,
+        dropout_hidden=0.1,
+        lsm_prob=0.0,
+        param_init=0.1,
+        adaptive_softmax=False,
+        tie_embedding=False,
+    )
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+
+@pytest.mark.parametrize(
+    "lm_type, max_size, init_state",
+    [
+        ('lstm', 1000, False),
+        ('gru', 1000, False),
+        ('lstm', 1000, True),
+        ('lstm', 3, False),  # parents are evicted
+    ]
+)
+def test_cached_lm_scorer(lm_type, max_size, init_state):
+    module_rnnlm = importlib.import_module('neural_sp.models.lm.rnnlm')
+    lm = module_rnnlm.RNNLM(make_args_rnnlm(lm_type=lm_type))
+    lm.eval()
+
+    module = importlib.import_module('neural_sp.models.seq2seq.decoders.beam_search')
+    lm_scorer = module.CachedLMScorer(lm, max_size=max_size)
+    lmstate_init = None
+    if init_state:
+        _, lmstate_init, _ = lm.predict(torch.randint(4, VOCAB, (1, 5)), None)
+        lm_scorer.set_initial_state(lmstate_init)
+
+    eos = 2
+    steps = [
+        [[eos]],
+        [[eos, 5], [eos, 6], [eos, 7]],
+        [[eos, 5, 8], [eos, 5, 9], [eos, 6, 8], [eos, 5, 8]],  # duplicated prefix
+        [[eos, 5], [eos, 5, 8], [eos, 6, 8, 4]],  # already scored prefixes
+    ]
+    with torch.no_grad():
+        for prefixes in steps:
+            lmout, lmstate, scores_lm = lm_scorer.predict(prefixes)
+            assert scores_lm.size() == (len(prefixes), 1, VOCAB)
+            assert lmstate['hxs'].size(1) == len(prefixes)
+            for j, prefix in enumerate(prefixes):
+                y = torch.tensor([prefix], dtype=torch.int64)
+                lmout_ref, lmstate_ref, scores_lm_ref = lm.predict(y, lmstate_init)
+                assert torch.allclose(lmout[j], lmout_ref[0, -1:], atol=1e-6)
+                assert torch.allclose(scores_lm[j], scores_lm_ref[0, -1:], atol=1e-6)
+                assert torch.allclose(lmstate['hxs'][:, j], lmstate_ref['hxs'][:, 0], atol=1e-6)
+                if lm_type == 'lstm':
+                    assert torch.allclose(lmstate['cxs'][:, j], lmstate_ref['cxs'][:, 0], atol=1e-6)
+                else:
+                    assert lmstate['cxs'] is None
+
+    assert len(lm_scorer.cache) <= max_size
+    assert lm_scorer.n_queries == sum(len(prefixes) for prefixes in steps)
+    if max_size > 10:
+        # duplicated and already scored prefixes
+        assert lm_scorer.n_hits == 3
+    assert 0 <= lm_scorer.hit_rate <= 1
+
+    # the cache is kept as long as the initial state is not changed
+    n_cached = len(lm_scorer.cache)
+    lm_scorer.set_initial_state(lmstate_init)
+    assert len(lm_scorer.cache) == n_cached
+    lm_scorer.set_initial_state(lm.zero_state(1))
+    assert len(lm_scorer.cache) == 0
+
+
+@pytest.mark.parametrize(
+    "n_freq, ctc_topk, lm_topk, max_ratio",
+    [
+        (5, 0, 0, 0.8),
+        (0, 2, 0, 0.8),
+        (5, 1, 0, 0.8),
+        (5, 0, 2, 1.0),
+        (5, 2, 2, 0.1),  # fallback to the full vocabulary
+    ]
+)
+def test_shortlist(n_freq, ctc_topk, lm_topk, max_ratio):
+    module = importlib.import_module('neural_sp.models.seq2seq.decoders.beam_search')
+    blank, eos = 0, 2
+    shortlist = module.Shortlist(VOCAB, torch.device('cpu'), n_freq, ctc_topk, lm_topk,
+                                 backoff=-100., max_ratio=max_ratio, reserved=[blank, eos])
+
+    ctc_log_probs = np.log(np.random.dirichlet(np.ones(VOCAB), size=6)).astype(np.float32)
+    shortlist.reset(ctc_log_probs, blank)
+    candidates = set(range(n_freq)) | {blank, eos}
+    for t in range(len(ctc_log_probs)):
+        ctc_log_probs[t, blank] = -np.inf
+        candidates |= set(np.argsort(-ctc_log_probs[t])[:ctc_topk].tolist())
+    scores_lm = torch.log_softmax(torch.randn(3, 1, VOCAB), dim=-1)
+    for j in range(scores_lm.size(0)):
+        candidates |= set(torch.topk(scores_lm[j, -1], k=lm_topk)[1].tolist())
+
+    ids = shortlist.select(scores_lm)
+    if len(candidates) > VOCAB * max_ratio:
+        assert ids is None
+        return
+    assert ids.tolist() == sorted(candidates)
+
+    # logits are computed for candidates only
+    output = torch.nn.Linear(8, VOCAB)
+    x = torch.randn(3, 4, 8)
+    logits = shortlist.project(output, x, ids)
+    assert logits.size() == (3, 4, VOCAB)
+    assert torch.allclose(logits[..., ids], output(x)[..., ids], atol=1e-6)
+    probs = torch.softmax(logits, dim=-1)
+    assert torch.allclose(probs[..., ids].sum(-1), torch.ones(3, 4))
+
+    scores = shortlist.add_backoff(torch.log(probs), ids)
+    out_ids = [i for i in range(VOCAB) if i not in candidates]
+    assert torch.all(scores[..., out_ids] == -100.)
+    assert torch.allclose(scores[..., ids], torch.log(probs[..., ids]))
+
+
+def test_shortlist_lm():
+    module_rnnlm = importlib.import_module('neural_sp.models.lm.rnnlm')
+    lm = module_rnnlm.RNNLM(make_args_rnnlm())
+    lm.eval()
+
+    module = importlib.import_module('neural_sp.models.seq2seq.decoders.beam_search')
+    shortlist = module.Shortlist(VOCAB, torch.device('cpu'), n_freq=6, backoff=-100., max_ratio=1.0)
+    shortlist.reset()
+    ids = shortlist.ids
+    assert ids.tolist() == list(range(6))
+
+    ys = torch.randint(4, VOCAB, (2, 3))
+    with torch.no_grad():
+        _, _, scores_lm_ref = lm.predict(ys)
+        lm.set_shortlist(shortlist)
+        _, _, scores_lm = lm.predict(ys)
+        lm.set_shortlist(None)
+        # renormalized over the shortlist
+        assert torch.allclose(scores_lm[..., ids], torch.log_softmax(scores_lm_ref[..., ids], dim=-1), atol=1e-5)
+        assert torch.all(scores_lm[..., 6:] == -100.)
+        assert torch.allclose(lm.predict(ys)[2], scores_lm_ref)
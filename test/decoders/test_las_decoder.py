@@ -182,6 +182,12 @@ def make_decode_params(**kwargs):
         recog_eos_threshold=1.5,
         recog_asr_state_carry_over=False,
         recog_lm_state_carry_over=False,
+        recog_lm_state_cache_size=500,
+        recog_shortlist_freq=0,
+        recog_shortlist_ctc_topk=0,
+        recog_shortlist_lm_topk=0,
+        recog_shortlist_backoff=-1e10,
+        recog_shortlist_max_ratio=0.5,
         recog_softmax_smoothing=1.0,
         nbest=1,
         exclude_eos=False,
@@ -213,6 +219,33 @@ def make_args_rnnlm(**kwargs):
     return argparse.Namespace(**args)
 
 
+def make_args_transformer_xl(**kwargs):
+    args = dict(
+        lm_type='transformer_xl',
+        transformer_n_heads=4,
+        n_layers=2,
+        transformer_d_model=16,
+        transformer_d_ff=64,
+        transformer_layer_norm_eps=1e-12,
+        transformer_ffn_activation='relu',
+        vocab=VOCAB,
+        dropout_in=0.1,
+        dropout_hidden=0.1,
+        dropout_att=0.1,
+        dropout_layer=0.0,
+        lsm_prob=0.0,
+        transformer_param_init='xavier_uniform',
+        bptt=200,
+        mem_len=10,
+        recog_mem_len=0,
+        zero_center_offset=False,
+        adaptive_softmax=False,
+        tie_embedding=False,
+    )
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+
 @pytest.mark.parametrize(
     "backward, lm_fusion, params",
     [
@@ -238,12 +271,20 @@ def make_args_rnnlm(**kwargs):
         (False, '', {'recog_coverage_penalty': 0.1, 'recog_gnmt_decoding': True}),
         # shallow fusion
         (False, '', {'recog_beam_width': 4, 'recog_lm_weight': 0.1}),
+        (False, '', {'recog_beam_width': 4, 'recog_lm_weight': 0.1, 'recog_lm_state_cache_size': 0}),
         # cold fusion
         (False, 'cold', {'recog_beam_width': 4}),
         (False, 'cold', {'recog_beam_width': 4, 'recog_lm_weight': 0.1}),
         # rescoring
         (False, '', {'recog_beam_width': 4, 'recog_lm_second_weight': 0.1}),
         (False, '', {'recog_beam_width': 4, 'recog_lm_bwd_weight': 0.1}),
+        # vocabulary shortlist
+        (False, '', {'recog_beam_width': 4, 'recog_shortlist_freq': 5}),
+        (False, '', {'recog_beam_width': 4, 'recog_shortlist_freq': 5, 'recog_shortlist_max_ratio': 0.1}),
+        (False, '', {'recog_beam_width': 4, 'recog_ctc_weight': 0.1, 'recog_shortlist_ctc_topk': 2}),
+        (False, '', {'recog_beam_width': 4, 'recog_lm_weight': 0.1, 'recog_shortlist_freq': 5}),
+        (False, '', {'recog_beam_width': 4, 'recog_lm_weight': 0.1, 'recog_shortlist_freq': 5,
+                     'recog_shortlist_lm_topk': 2, 'recog_shortlist_max_ratio': 1.0}),
         # !!! backward
         # greedy decoding
         (True, '', {'recog_beam_width': 1}),
@@ -372,3 +413,231 @@ def test_decoding(backward, lm_fusion, params):
             assert isinstance(scores, list)
             assert len(scores) == batch_size
             assert len(scores[0]) == params['nbest']
+
+
+@pytest.mark.parametrize(
+    "backward, params",
+    [
+        (False, {'recog_beam_width': 4}),
+        (False, {'recog_beam_width': 4, 'nbest': 4}),
+        (False, {'recog_beam_width': 4, 'nbest': 4, 'exclude_eos': True}),
+        (False, {'recog_beam_width': 4, 'nbest': 2, 'recog_length_penalty': 0.1}),
+        (False, {'recog_beam_width': 4, 'nbest': 2, 'recog_length_penalty': 0.1, 'recog_gnmt_decoding': True}),
+        (False, {'recog_beam_width': 4, 'nbest': 2, 'recog_length_norm': True}),
+        (True, {'recog_beam_width': 4, 'nbest': 4}),
+        (True, {'recog_beam_width': 4, 'nbest': 4, 'exclude_eos': True}),
+    ]
+)
+def test_beam_search_batch(backward, params):
+    args = make_args()
+    args['backward'] = backward
+    params = make_decode_params(**params)
+
+    batch_size = 4
+    emax = 40
+    device = "cpu"
+
+    eouts = np.random.randn(batch_size, emax, ENC_N_UNITS).astype(np.float32)
+    elens = torch.IntTensor([emax, emax - 5, emax - 10, emax - 20])
+    eouts = pad_list([np2tensor(x[:elens[b]], device).float() for b, x in enumerate(eouts)], 0.)
+
+    module = importlib.import_module('neural_sp.models.seq2seq.decoders.las')
+    dec = module.RNNDecoder(**args)
+    dec = dec.to(device)
+
+    dec.eval()
+    with torch.no_grad():
+        nbest_hyps, scores = dec.beam_search_batch(eouts, elens, params, nbest=params['nbest'],
+                                                   exclude_eos=params['exclude_eos'])
+    assert len(nbest_hyps) == batch_size
+    assert len(scores) == batch_size
+    for b in range(batch_size):
+        assert len(nbest_hyps[b]) == params['nbest']
+        assert len(scores[b]) == params['nbest']
+        for y in nbest_hyps[b]:
+            assert len(y) <= elens[b]
+            if params['exclude_eos']:
+                assert dec.eos not in y.tolist()
+
+
+def test_forward_mbr():
+    args = make_args(mbr_training=True, dropout=0.0, dropout_emb=0.0, dropout_att=0.0)
+    params = make_decode_params(recog_beam_width=4)
+
+    batch_size = 4
+    emax = 40
+    device = "cpu"
+
+    eouts = np.random.randn(batch_size, emax, ENC_N_UNITS).astype(np.float32)
+    elens = torch.IntTensor([len(x) for x in eouts])
+    eouts = pad_list([np2tensor(x, device).float() for x in eouts], 0.)
+    ylens = [4, 5, 3, 7]
+    ys = [np.random.randint(0, VOCAB, ylen).astype(np.int32) for ylen in ylens]
+
+    def idx2token(token_ids):
+        return ' '.join([str(i) for i in token_ids])
+
+    module = importlib.import_module('neural_sp.models.seq2seq.decoders.las')
+    dec = module.RNNDecoder(**args)
+    dec = dec.to(device)
+
+    loss, observation = dec(eouts, elens, ys, task='all', recog_params=params, idx2token=idx2token)
+    assert loss.numel() == 1
+    assert observation['loss_mbr'] >= 0
+    loss.backward()
+    assert dec.output.weight.grad is not None
+    assert torch.isfinite(dec.output.weight.grad).all()
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        ({'recog_beam_width': 4, 'recog_lm_weight': 0.5}),
+        ({'recog_beam_width': 4, 'recog_lm_weight': 0.5, 'nbest': 4}),
+    ]
+)
+def test_decoding_transformer_xl_lm(params):
+    args = make_args()
+    params = make_decode_params(**params)
+
+    batch_size = params['recog_batch_size']
+    emax = 40
+    device = "cpu"
+
+    eouts = np.random.randn(batch_size, emax, ENC_N_UNITS).astype(np.float32)
+    elens = torch.IntTensor([len(x) for x in eouts])
+    eouts = pad_list([np2tensor(x, device).float() for x in eouts], 0.)
+
+    module_xl = importlib.import_module('neural_sp.models.lm.transformer_xl')
+    lm = module_xl.TransformerXL(make_args_transformer_xl()).to(device)
+    lm.eval()
+
+    module = importlib.import_module('neural_sp.models.seq2seq.decoders.las')
+    dec = module.RNNDecoder(**args)
+    dec = dec.to(device)
+
+    dec.eval()
+    with torch.no_grad():
+        results = []
+        for cache_states in [True, False]:
+            dec.lmmemory = None
+            # NOTE: the second utterance attends to memory of the first one
+            for _ in range(2):
+                nbest_hyps, _, scores = dec.beam_search(
+                    eouts, elens, params, idx2token=None, lm=lm,
+                    nbest=params['nbest'], exclude_eos=params['exclude_eos'],
+                    refs_id=None, utt_ids=None, speakers=None,
+                    cache_states=cache_states)
+                results.append((nbest_hyps, scores))
+            assert dec.lmmemory[0].size(0) == 1
+
+        # incremental decoding with cached states must not change results
+        for (hyps, scores), (hyps_ref, scores_ref) in zip(results[:2], results[2:]):
+            for hyp, hyp_ref in zip(hyps[0], hyps_ref[0]):
+                assert np.array_equal(hyp, hyp_ref)
+            assert np.allclose(scores[0], scores_ref[0], atol=1e-4)
+
+
+def make_wordlm():
+    # character dictionary: <space>: 4, a-e: 5-9
+    words = ['a', 'ab', 'abc', 'b', 'ba', 'cab', 'cc', 'dab', 'e']
+    module_rnnlm = importlib.import_module('neural_sp.models.lm.rnnlm')
+    lm = module_rnnlm.RNNLM(make_args_rnnlm(vocab=4 + len(words), n_units_null_context=0))
+    lexicon = [(4 + i, [ord(c) - ord('a') + 5 for c in w]) for i, w in enumerate(words)]
+    module = importlib.import_module('neural_sp.models.lm.lookahead_wordlm')
+    return module.LookAheadWordLM(lm, lexicon, VOCAB, space=4)
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        ({'recog_beam_width': 4, 'recog_lm_weight': 0.5}),
+        ({'recog_beam_width': 4, 'recog_lm_weight': 0.5, 'recog_ctc_weight': 0.1}),
+        ({'recog_beam_width': 4, 'recog_lm_weight': 0.5, 'recog_ctc_weight': 1.0}),
+    ]
+)
+def test_decoding_lookahead_wordlm(params):
+    args = make_args()
+    if params.get('recog_ctc_weight', 0) > 0:
+        args['ctc_weight'] = 0.5
+    params = make_decode_params(**params)
+
+    batch_size = params['recog_batch_size']
+    emax = 40
+    device = "cpu"
+
+    eouts = np.random.randn(batch_size, emax, ENC_N_UNITS).astype(np.float32)
+    elens = torch.IntTensor([len(x) for x in eouts])
+    eouts = pad_list([np2tensor(x, device).float() for x in eouts], 0.)
+
+    lm = make_wordlm().to(device)
+    lm.eval()
+
+    module = importlib.import_module('neural_sp.models.seq2seq.decoders.las')
+    dec = module.RNNDecoder(**args)
+    dec = dec.to(device)
+
+    dec.eval()
+    with torch.no_grad():
+        if params['recog_ctc_weight'] == 1:
+            hyps = dec.decode_ctc(eouts, elens, params, idx2token=None, lm=lm)
+            assert len(hyps) == batch_size
+        else:
+            ctc_log_probs = None
+            if params['recog_ctc_weight'] > 0:
+                ctc_log_probs = dec.ctc_log_probs(eouts)
+            nbest_hyps, _, scores = dec.beam_search(
+                eouts, elens, params, idx2token=None, lm=lm,
+                ctc_log_probs=ctc_log_probs,
+                nbest=params['nbest'], exclude_eos=params['exclude_eos'],
+                refs_id=None, utt_ids=None, speakers=None)
+            assert len(nbest_hyps) == batch_size
+            assert len(scores[0]) == params['nbest']
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        ({'recog_beam_width': 4, 'recog_lm_weight': 0.5}),
+        ({'recog_beam_width': 4, 'recog_lm_weight': 0.5, 'nbest': 4}),
+    ]
+)
+def test_decoding_ngram_lm(tmp_path, params):
+    args = make_args()
+    params = make_decode_params(**params)
+
+    batch_size = params['recog_batch_size']
+    emax = 40
+    device = "cpu"
+
+    eouts = np.random.randn(batch_size, emax, ENC_N_UNITS).astype(np.float32)
+    elens = torch.IntTensor([len(x) for x in eouts])
+    eouts = pad_list([np2tensor(x, device).float() for x in eouts], 0.)
+
+    arpa_path = str(tmp_path / 'lm.arpa')
+    dict_path = str(tmp_path / 'dict.txt')
+    with open(dict_path, 'w') as f:
+        f.write('<unk> 1\n<eos> 2\n<pad> 3\n')
+        for idx in range(4, VOCAB):
+            f.write('%d %d\n' % (idx, idx))
+    with open(arpa_path, 'w') as f:
+        f.write('\\data\\\nngram 1=%d\nngram 2=2\n\n\\1-grams:\n' % (VOCAB - 2))
+        f.write('-99\t<s>\t-0.3\n-1.0\t</s>\n-2.0\t<unk>\n')
+        for idx in range(4, VOCAB):
+            f.write('-1.0\t%d\t-0.2\n' % idx)
+        f.write('\n\\2-grams:\n-0.1\t<s> 4\n-0.2\t4 5\n\n\\end\\\n')
+    module_ngram = importlib.import_module('neural_sp.models.lm.ngram')
+    lm = module_ngram.NgramLM(arpa_path, dict_path)
+
+    module = importlib.import_module('neural_sp.models.seq2seq.decoders.las')
+    dec = module.RNNDecoder(**args)
+    dec = dec.to(device)
+
+    dec.eval()
+    with torch.no_grad():
+        nbest_hyps, _, scores = dec.beam_search(
+            eouts, elens, params, idx2token=None, lm=lm,
+            nbest=params['nbest'], exclude_eos=params['exclude_eos'],
+            refs_id=None, utt_ids=None, speakers=None)
+        assert len(nbest_hyps) == batch_size
+        assert len(scores[0]) == params['nbest']
@@ -93,6 +93,12 @@ def make_decode_params(**kwargs):
         recog_lm_bwd_weight=0.0,
         recog_max_len_ratio=1.0,
         recog_lm_state_carry_over=False,
+        recog_lm_state_cache_size=500,
+        recog_shortlist_freq=0,
+        recog_shortlist_ctc_topk=0,
+        recog_shortlist_lm_topk=0,
+        recog_shortlist_backoff=-1e10,
+        recog_shortlist_max_ratio=0.5,
         nbest=1,
     )
     args.update(kwargs)
@@ -135,9 +141,16 @@ def make_args_rnnlm(**kwargs):
         ({'recog_beam_width': 4, 'recog_ctc_weight': 0.1}),
         # shallow fusion
         ({'recog_beam_width': 4, 'recog_lm_weight': 0.1}),
+        ({'recog_beam_width': 4, 'recog_lm_weight': 0.1, 'recog_lm_state_cache_size': 0}),
         # rescoring
         ({'recog_beam_width': 4, 'recog_lm_second_weight': 0.1}),
         ({'recog_beam_width': 4, 'recog_lm_bwd_weight': 0.1}),
+        # vocabulary shortlist
+        ({'recog_beam_width': 4, 'recog_shortlist_freq': 5}),
+        ({'recog_beam_width': 4, 'recog_ctc_weight': 0.1, 'recog_shortlist_ctc_topk': 2}),
+        ({'recog_beam_width': 4, 'recog_lm_weight': 0.1, 'recog_shortlist_freq': 5}),
+        ({'recog_beam_width': 4, 'recog_lm_weight': 0.1, 'recog_shortlist_freq': 5,
+          'recog_shortlist_lm_topk': 2, 'recog_shortlist_max_ratio': 1.0}),
     ]
 )
 def test_decoding(params):
@@ -63,6 +63,7 @@ def make_args(**kwargs):
         share_chunkwise_attention=False,
         external_lm=None,
         lm_fusion='',
+        checkpoint_every_n_layers=0,
         # lm_init=False,
     )
     args.update(kwargs)
@@ -114,6 +115,11 @@ def make_args(**kwargs):
         ({'backward': True, 'ctc_weight': 1.0}),
         # bottleneck
         ({'ffn_bottleneck_dim': 32}),
+        # activation checkpointing
+        ({'checkpoint_every_n_layers': 1}),
+        ({'checkpoint_every_n_layers': 2, 'dropout_layer': 0.1}),
+        ({'checkpoint_every_n_layers': 1, 'attn_type': 'mocha', 'mocha_chunk_size': 4,
+          'mocha_n_heads_mono': 4, 'mocha_n_heads_chunk': 4}),
         # TransformerLM init
         # LM integration
     ]
@@ -158,6 +164,12 @@ def make_decode_params(**kwargs):
         recog_eos_threshold=1.5,
         recog_asr_state_carry_over=False,
         recog_lm_state_carry_over=False,
+        recog_lm_state_cache_size=500,
+        recog_shortlist_freq=0,
+        recog_shortlist_ctc_topk=0,
+        recog_shortlist_lm_topk=0,
+        recog_shortlist_backoff=-1e10,
+        recog_shortlist_max_ratio=0.5,
         recog_softmax_smoothing=1.0,
         recog_mma_delay_threshold=-1,
         nbest=1,
@@ -213,9 +225,16 @@ def make_args_rnnlm(**kwargs):
         (False, {'recog_length_norm': True}),
         # shallow fusion
         (False, {'recog_beam_width': 4, 'recog_lm_weight': 0.1}),
+        (False, {'recog_beam_width': 4, 'recog_lm_weight': 0.1, 'recog_lm_state_cache_size': 0}),
         # rescoring
         (False, {'recog_beam_width': 4, 'recog_lm_second_weight': 0.1}),
         (False, {'recog_beam_width': 4, 'recog_lm_bwd_weight': 0.1}),
+        # vocabulary shortlist
+        (False, {'recog_beam_width': 4, 'recog_shortlist_freq': 5}),
+        (False, {'recog_beam_width': 4, 'recog_ctc_weight': 0.1, 'recog_shortlist_ctc_topk': 2}),
+        (False, {'recog_beam_width': 4, 'recog_lm_weight': 0.1, 'recog_shortlist_freq': 5}),
+        (False, {'recog_beam_width': 4, 'recog_lm_weight': 0.1, 'recog_shortlist_freq': 5,
+                 'recog_shortlist_lm_topk': 2, 'recog_shortlist_max_ratio': 1.0}),
         # !!! backward
         # greedy decoding
         (True, {'recog_beam_width': 1}),
@@ -331,3 +350,13 @@ def test_decoding(backward, params):
             assert isinstance(scores, list)
             assert len(scores) == batch_size
             assert len(scores[0]) == params['nbest']
+
+
+def test_shortlist_without_ctc_fusion():
+    args = make_args()
+    params = make_decode_params(recog_beam_width=4, recog_shortlist_ctc_topk=2)
+
+    module = importlib.import_module('neural_sp.models.seq2seq.decoders.transformer')
+    dec = module.TransformerDecoder(**args)
+    with pytest.raises(ValueError):
+        dec.get_shortlist(params)
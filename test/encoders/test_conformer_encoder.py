@@ -52,6 +52,7 @@ def make_args(**kwargs):
         chunk_size_current=0,
         chunk_size_right=0,
         latency_control_type='mask',
+        checkpoint_every_n_layers=0,
     )
     args.update(kwargs)
     return args
@@ -87,6 +88,9 @@ def make_args(**kwargs):
           'last_proj_dim': 10}),
         # bottleneck
         ({'ffn_bottleneck_dim': 16}),
+        # activation checkpointing
+        ({'enc_type': 'conformer', 'checkpoint_every_n_layers': 1}),
+        ({'enc_type': 'conformer', 'checkpoint_every_n_layers': 2, 'pe_type': 'relative_xl'}),
         # subsampling
         ({'subsample': "1_2_1"}),
         ({'subsample': "1_2_1"}),
@@ -141,3 +145,128 @@ def test_forward(args):
             if args['n_layers_sub2'] > 0:
                 assert enc_out_dict['ys_sub2']['xs'].size(0) == batch_size
                 assert enc_out_dict['ys_sub2']['xs'].size(1) == enc_out_dict['ys_sub2']['xlens'][0]
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({'enc_type': 'conformer', 'chunk_size_left': 16, 'chunk_size_current': 16}),
+        ({'enc_type': 'conformer', 'chunk_size_left': 0, 'chunk_size_current': 16}),
+        ({'enc_type': 'conformer', 'chunk_size_left': 16, 'chunk_size_current': 16, 'chunk_size_right': 8}),
+        ({'enc_type': 'conformer', 'chunk_size_left': 16, 'chunk_size_current': 16,
+          'subsample': "1_2_1", 'subsample_type': 'drop'}),
+        ({'enc_type': 'conv_conformer', 'chunk_size_left': 16, 'chunk_size_current': 16}),
+    ]
+)
+def test_forward_chunk(args):
+    args = make_args(latency_control_type='mask', **args)
+    batch_size = 2
+    xmax = 72
+    device = "cpu"
+
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.conformer')
+    enc = module.ConformerEncoder(**args).to(device)
+    enc.eval()
+
+    xs = torch.randn(batch_size, xmax, args['input_dim'])
+    N_c = args['chunk_size_current']
+    N_r = args['chunk_size_right']
+    with torch.no_grad():
+        state = enc.init_state()
+        eouts_chunk = []
+        for t in range(0, xmax, N_c):
+            eout_chunk, state = enc.forward_chunk(xs[:, t:t + N_c + N_r], state)
+            assert eout_chunk.size(1) == -(-min(N_c, xmax - t) // enc.subsampling_factor)
+            for cache in state['caches']:
+                assert cache['conv'].size(2) <= (args['kernel_size'] - 1) // 2
+                if cache['attn'] is not None:
+                    assert cache['attn']['k'].size(2) <= args['chunk_size_left']
+            eouts_chunk.append(eout_chunk)
+        eouts_chunk = torch.cat(eouts_chunk, dim=1)
+
+        # streaming interface with the internal state
+        enc.reset_cache()
+        eouts_stream = torch.cat([enc(xs[:, t:t + N_c + N_r], None, task='all', streaming=True)['ys']['xs']
+                                  for t in range(0, xmax, N_c)], dim=1)
+
+    assert eouts_chunk.size(0) == batch_size
+    assert eouts_chunk.size(2) == enc.output_dim
+    assert torch.equal(eouts_stream, eouts_chunk)
+
+
+@pytest.mark.parametrize("pe_type", ['relative', 'relative_xl'])
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({'enc_type': 'conformer', 'chunk_size_left': 16, 'chunk_size_current': 16}),
+        ({'enc_type': 'conformer', 'chunk_size_left': 0, 'chunk_size_current': 16}),
+        ({'enc_type': 'conformer', 'chunk_size_left': 32, 'chunk_size_current': 16, 'kernel_size': 7}),
+        ({'enc_type': 'conformer', 'chunk_size_left': 16, 'chunk_size_current': 16,
+          'subsample': "1_2_1", 'subsample_type': 'drop'}),
+        ({'enc_type': 'conv_conformer', 'chunk_size_left': 16, 'chunk_size_current': 16}),
+    ]
+)
+def test_forward_chunk_pe_type(args, pe_type):
+    args = make_args(latency_control_type='mask', pe_type=pe_type, **args)
+    batch_size = 2
+    xmax = 72  # NOTE: multiple chunks and the last partial chunk
+    device = "cpu"
+
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.conformer')
+    enc = module.ConformerEncoder(**args).to(device)
+    enc.eval()
+
+    xs = torch.randn(batch_size, xmax, args['input_dim'])
+    xlens = torch.IntTensor([xmax] * batch_size)
+    N_c = args['chunk_size_current']
+    with torch.no_grad():
+        eouts = enc(xs, xlens, task='all')['ys']['xs']
+
+        state = enc.init_state()
+        eouts_chunk = []
+        for t in range(0, xmax, N_c):
+            eout_chunk, state = enc.forward_chunk(xs[:, t:t + N_c], state)
+            eouts_chunk.append(eout_chunk)
+        eouts_chunk = torch.cat(eouts_chunk, dim=1)
+
+    assert eouts_chunk.size() == eouts.size()
+    assert torch.allclose(eouts_chunk, eouts, atol=1e-5)
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({'latency_control_type': 'reshape', 'chunk_size_left': 16, 'chunk_size_current': 16, 'chunk_size_right': 8}),
+        ({'latency_control_type': 'mask'}),
+    ]
+)
+def test_forward_streaming_without_state(args):
+    args = make_args(enc_type='conformer', **args)
+    batch_size = 2
+    xmax = 40
+    device = "cpu"
+
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.conformer')
+    enc = module.ConformerEncoder(**args).to(device)
+    enc.eval()
+
+    # NOTE: only latency-controlled encoders with the chunkwise mask are encoded incrementally
+    xs = torch.randn(batch_size, xmax, args['input_dim'])
+    xlens = torch.IntTensor([xmax] * batch_size)
+    with torch.no_grad():
+        eouts = enc(xs, xlens, task='all')['ys']['xs']
+        eouts_stream = enc(xs, xlens, task='all', streaming=True)['ys']['xs']
+    assert torch.equal(eouts_stream, eouts)
+
+
+def test_forward_chunk_invalid_chunk_size():
+    args = make_args(enc_type='conformer', latency_control_type='mask',
+                     chunk_size_left=16, chunk_size_current=0)
+
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.conformer')
+    enc = module.ConformerEncoder(**args)
+    enc.eval()
+
+    xs = torch.randn(2, 16, args['input_dim'])
+    with pytest.raises(ValueError):
+        enc.forward_chunk(xs, enc.init_state())
@@ -161,3 +161,47 @@ def test_forward_1d(args):
         xs, xlens = enc(xs, xlens)
         assert xs.size(0) == batch_size
         assert xs.size(1) == xlens.max(), (xs.size(), xlens)
+
+
+@pytest.mark.parametrize(
+    "args, chunk_size",
+    [
+        (make_args_2d(channels="32_32", kernel_sizes="(3,3)_(3,3)", strides="(1,1)_(1,1)",
+                      poolings="(2,2)_(2,2)"), 8),
+        (make_args_2d(channels="32_32", kernel_sizes="(3,3)_(3,3)", strides="(1,1)_(1,1)",
+                      poolings="(2,2)_(2,2)"), 5),
+        (make_args_2d(channels="32_32", kernel_sizes="(3,3)_(3,3)", strides="(1,1)_(1,1)",
+                      poolings="(2,2)_(2,2)"), 1),
+        (make_args_2d(poolings="(2,2)_(1,1)_(2,1)", residual=True, layer_norm=True), 7),
+        (make_args_2d(batch_norm=True), 8),
+        (make_args_2d(bottleneck_dim=8), 8),
+        (make_args_1d(), 8),
+        (make_args_1d(kernel_sizes="5_3_3", poolings="2_1_2"), 3),
+    ]
+)
+def test_forward_chunk(args, chunk_size):
+    batch_size = 4
+    xmaxs = [40, 45]
+    device = "cpu"
+
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.conv')
+    enc = module.ConvEncoder(**args)
+    enc = enc.to(device)
+    enc.eval()
+
+    for xmax in xmaxs:
+        xs = torch.randn(batch_size, xmax, args['input_dim'], device=device)
+        xlens = torch.IntTensor([xmax] * batch_size)
+        with torch.no_grad():
+            eouts, _ = enc(xs, xlens)
+
+            state = enc.init_state()
+            eouts_chunk = []
+            for t in range(0, xmax, chunk_size):
+                eout_chunk, state = enc.forward_chunk(xs[:, t:t + chunk_size], state,
+                                                      is_last=t + chunk_size >= xmax)
+                eouts_chunk.append(eout_chunk)
+            eouts_chunk = torch.cat(eouts_chunk, dim=1)
+
+        assert eouts_chunk.size() == eouts.size()
+        assert torch.allclose(eouts_chunk, eouts, atol=1e-5)
@@ -179,3 +179,51 @@ def test_forward(args):
             enc_out_dict_sub12 = enc(xs, xlens, task='ys_sub2')
             assert enc_out_dict_sub12['ys_sub2']['xs'].size(0) == batch_size
             assert enc_out_dict_sub12['ys_sub2']['xs'].size(1) == enc_out_dict_sub12['ys_sub2']['xlens'].max()
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({'enc_type': 'blstm', 'chunk_size_left': 40, 'chunk_size_right': 40}),
+        ({'enc_type': 'bgru', 'chunk_size_left': 40, 'chunk_size_right': 40}),
+        ({'enc_type': 'blstm', 'chunk_size_left': 40, 'chunk_size_right': 0}),
+        ({'enc_type': 'blstm', 'chunk_size_left': 20, 'chunk_size_right': 60}),
+        ({'enc_type': 'blstm', 'bidir_sum_fwd_bwd': True, 'n_projs': 8,
+          'chunk_size_left': 40, 'chunk_size_right': 40}),
+        ({'enc_type': 'blstm', 'subsample': "1_2_1_1_1", 'subsample_type': 'max_pool',
+          'chunk_size_left': 40, 'chunk_size_right': 40}),
+        ({'enc_type': 'bgru', 'subsample': "1_2_2_1_1", 'subsample_type': '1dconv',
+          'chunk_size_left': 40, 'chunk_size_right': 20}),
+        ({'enc_type': 'blstm', 'n_layers_sub1': 3, 'chunk_size_left': 40, 'chunk_size_right': 40}),
+    ]
+)
+def test_forward_chunkwise_parallel(args):
+    args = make_args(**args)
+
+    batch_size = 4
+    N_l = args['chunk_size_left']
+    N_r = args['chunk_size_right']
+    device = "cpu"
+
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.rnn')
+    enc = module.RNNEncoder(**args)
+    enc = enc.to(device)
+    enc.eval()
+
+    for xmax in [30, 400, 455]:
+        xs = torch.randn(batch_size, xmax, args['input_dim'])
+        xlens = torch.IntTensor([xmax - i * enc.subsampling_factor for i in range(batch_size)])
+        enc_out_dict = enc(xs, xlens, task='all')
+
+        # encode chunk by chunk
+        xs_ref, xs_ref_sub1 = [], []
+        enc.reset_cache()
+        for t in range(0, xmax, N_l):
+            enc_out_dict_chunk = enc(xs[:, t:t + N_l + N_r], xlens, task='all', streaming=True)
+            xs_ref.append(enc_out_dict_chunk['ys']['xs'])
+            xs_ref_sub1.append(enc_out_dict_chunk['ys_sub1']['xs'])
+        xs_ref = torch.cat(xs_ref, dim=1)
+        assert enc_out_dict['ys']['xs'].size() == xs_ref.size()
+        assert torch.allclose(enc_out_dict['ys']['xs'], xs_ref, atol=1e-6)
+        if args['n_layers_sub1'] > 0:
+            assert torch.allclose(enc_out_dict['ys_sub1']['xs'], torch.cat(xs_ref_sub1, dim=1), atol=1e-6)
@@ -0,0 +1,71 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for subsampling layers."""
+
+import importlib
+import math
+import pytest
+import torch
+
+
+def concat_reference(xs, factor):
+    xs = xs.transpose(1, 0).contiguous()
+    xs = [torch.cat([xs[t - r:t - r + 1] for r in range(factor - 1, -1, -1)], dim=-1)
+          for t in range(xs.size(0)) if (t + 1) % factor == 0]
+    return torch.cat(xs, dim=0).transpose(1, 0)
+
+
+@pytest.mark.parametrize(
+    "factor, xmax",
+    [
+        (1, 40),
+        (2, 40),
+        (2, 41),
+        (3, 40),
+        (4, 43),
+    ]
+)
+def test_concat_subsampler(factor, xmax):
+    batch_size = 4
+    n_units = 8
+
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.subsampling')
+    subsampler = module.ConcatSubsampler(factor, n_units)
+
+    xs = torch.randn(batch_size, xmax, n_units)
+    xlens = torch.IntTensor([xmax - i for i in range(batch_size)] + [1])
+    xs = torch.cat([xs, torch.randn(1, xmax, n_units)], dim=0)
+    xs_sub, xlens_sub = subsampler(xs, xlens)
+
+    assert xlens_sub.dtype == torch.int32
+    if factor == 1:
+        assert torch.equal(xs_sub, xs)
+        return
+    xs_ref = torch.relu(subsampler.proj(concat_reference(xs, factor)))
+    assert torch.allclose(xs_sub, xs_ref)
+    assert xlens_sub.tolist() == [max(1, xlen // factor) for xlen in xlens.tolist()]
+
+
+@pytest.mark.parametrize(
+    "factor, xmax",
+    [
+        (1, 40),
+        (2, 40),
+        (3, 41),
+        (4, 43),
+    ]
+)
+def test_drop_subsampler(factor, xmax):
+    n_units = 8
+
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.subsampling')
+    subsampler = module.DropSubsampler(factor)
+
+    xs = torch.randn(5, xmax, n_units)
+    xlens = torch.IntTensor([xmax, xmax - 1, xmax - 2, 2, 1])
+    xs_sub, xlens_sub = subsampler(xs, xlens)
+
+    assert torch.equal(xs_sub, xs[:, ::factor])
+    assert xlens_sub.dtype == torch.int32
+    assert xlens_sub.tolist() == [max(1, math.ceil(xlen / factor)) for xlen in xlens.tolist()]
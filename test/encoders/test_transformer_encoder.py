@@ -6,6 +6,7 @@
 import importlib
 import numpy as np
 import pytest
+import random
 import torch
 
 from neural_sp.models.torch_utils import np2tensor
@@ -51,6 +52,7 @@ def make_args(**kwargs):
         chunk_size_current=0,
         chunk_size_right=0,
         latency_control_type='mask',
+        checkpoint_every_n_layers=0,
     )
     args.update(kwargs)
     return args
@@ -96,6 +98,11 @@ def make_args(**kwargs):
           'last_proj_dim': 10}),
         # bottleneck
         ({'ffn_bottleneck_dim': 16}),
+        # activation checkpointing
+        ({'enc_type': 'transformer', 'checkpoint_every_n_layers': 1}),
+        ({'enc_type': 'transformer', 'checkpoint_every_n_layers': 2, 'pe_type': 'relative_xl'}),
+        ({'enc_type': 'transformer', 'checkpoint_every_n_layers': 1, 'latency_control_type': 'mask',
+          'chunk_size_left': 64, 'chunk_size_current': 64, 'chunk_size_right': 32}),
         # subsampling
         ({'subsample': "1_2_1"}),
         ({'subsample': "1_2_1"}),
@@ -155,3 +162,151 @@ def test_forward(args):
             if args['n_layers_sub2'] > 0:
                 assert enc_out_dict['ys_sub2']['xs'].size(0) == batch_size, xs.size()
                 assert enc_out_dict['ys_sub2']['xs'].size(1) == enc_out_dict['ys_sub2']['xlens'][0], xs.size()
+
+
+@pytest.mark.parametrize("checkpoint_every_n_layers", [1, 2])
+def test_activation_checkpointing(checkpoint_every_n_layers):
+    args = make_args(enc_type='transformer', dropout_layer=0.5)
+    batch_size = 4
+    xmax = 40
+    device = "cpu"
+
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.transformer')
+    enc = module.TransformerEncoder(**args).to(device)
+    enc.train()
+
+    xs = np.random.randn(batch_size, xmax, args['input_dim']).astype(np.float32)
+    xlens = torch.IntTensor([len(x) - i for i, x in enumerate(xs)])
+    xs = pad_list([np2tensor(x, device).float() for x in xs], 0.)
+
+    grads = []
+    for n in [0, checkpoint_every_n_layers]:
+        enc.checkpoint_every_n_layers = n
+        enc.zero_grad()
+        # NOTE: dropout and LayerDrop must make the same decisions in recomputation
+        torch.manual_seed(1)
+        random.seed(1)
+        enc(xs, xlens, task='all')['ys']['xs'].sum().backward()
+        grads.append([p.grad.clone() if p.grad is not None else None for p in enc.parameters()])
+    for g1, g2 in zip(*grads):
+        if g1 is None:
+            assert g2 is None
+        else:
+            assert torch.allclose(g1, g2, atol=1e-6)
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({'chunk_size_left': 16, 'chunk_size_current': 16}),
+        ({'chunk_size_left': 32, 'chunk_size_current': 16}),
+        ({'chunk_size_left': 8, 'chunk_size_current': 16}),
+        ({'chunk_size_left': 0, 'chunk_size_current': 16}),
+        ({'chunk_size_left': 16, 'chunk_size_current': 16, 'pe_type': 'add'}),
+        ({'chunk_size_left': 16, 'chunk_size_current': 16, 'subsample': "1_2_1", 'subsample_type': 'drop'}),
+        ({'chunk_size_left': 16, 'chunk_size_current': 16, 'last_proj_dim': 10}),
+        ({'chunk_size_left': 16, 'chunk_size_current': 16, 'enc_type': 'conv_transformer'}),
+    ]
+)
+def test_forward_chunk(args):
+    args = make_args(**dict({'enc_type': 'transformer', 'latency_control_type': 'mask'}, **args))
+    batch_size = 2
+    xmax = 72
+    device = "cpu"
+
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.transformer')
+    enc = module.TransformerEncoder(**args).to(device)
+    enc.eval()
+
+    xs = torch.randn(batch_size, xmax, args['input_dim'])
+    xlens = torch.IntTensor([xmax] * batch_size)
+    N_c = args['chunk_size_current']
+    with torch.no_grad():
+        eouts = enc(xs, xlens, task='all')['ys']['xs']
+
+        state = enc.init_state()
+        eouts_chunk = []
+        for t in range(0, xmax, N_c):
+            eout_chunk, state = enc.forward_chunk(xs[:, t:t + N_c], state)
+            eouts_chunk.append(eout_chunk)
+        eouts_chunk = torch.cat(eouts_chunk, dim=1)
+
+        # streaming interface with the internal state
+        enc.reset_cache()
+        eouts_stream = torch.cat([enc(xs[:, t:t + N_c], None, task='all', streaming=True)['ys']['xs']
+                                  for t in range(0, xmax, N_c)], dim=1)
+
+    assert eouts_chunk.size() == eouts.size()
+    assert torch.allclose(eouts_chunk, eouts, atol=1e-5)
+    assert torch.equal(eouts_stream, eouts_chunk)
+    factor = enc.conv.subsampling_factor if enc.conv is not None else 1
+    assert state['offset'] == -(-xmax // factor)  # NOTE: counted after the CNN frontend
+
+
+@pytest.mark.parametrize("pe_type", ['none', 'add', 'relative', 'relative_xl'])
+@pytest.mark.parametrize("chunk_size_left", [0, 16])
+def test_forward_chunk_pe_type(pe_type, chunk_size_left):
+    args = make_args(enc_type='transformer', latency_control_type='mask', pe_type=pe_type,
+                     chunk_size_left=chunk_size_left, chunk_size_current=16)
+    batch_size = 2
+    xmax = 72
+    device = "cpu"
+
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.transformer')
+    enc = module.TransformerEncoder(**args).to(device)
+    enc.eval()
+
+    xs = torch.randn(batch_size, xmax, args['input_dim'])
+    xlens = torch.IntTensor([xmax] * batch_size)
+    N_c = args['chunk_size_current']
+    with torch.no_grad():
+        eouts = enc(xs, xlens, task='all')['ys']['xs']
+
+        state = enc.init_state()
+        eouts_chunk = []
+        for t in range(0, xmax, N_c):
+            eout_chunk, state = enc.forward_chunk(xs[:, t:t + N_c], state)
+            eouts_chunk.append(eout_chunk)
+        eouts_chunk = torch.cat(eouts_chunk, dim=1)
+
+    assert eouts_chunk.size() == eouts.size()
+    assert torch.allclose(eouts_chunk, eouts, atol=1e-5)
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({'latency_control_type': 'reshape', 'chunk_size_left': 16, 'chunk_size_current': 16, 'chunk_size_right': 8}),
+        ({'latency_control_type': 'mask'}),
+    ]
+)
+def test_forward_streaming_without_state(args):
+    args = make_args(enc_type='transformer', **args)
+    batch_size = 2
+    xmax = 40
+    device = "cpu"
+
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.transformer')
+    enc = module.TransformerEncoder(**args).to(device)
+    enc.eval()
+
+    # NOTE: only latency-controlled encoders with the chunkwise mask are encoded incrementally
+    xs = torch.randn(batch_size, xmax, args['input_dim'])
+    xlens = torch.IntTensor([xmax] * batch_size)
+    with torch.no_grad():
+        eouts = enc(xs, xlens, task='all')['ys']['xs']
+        eouts_stream = enc(xs, xlens, task='all', streaming=True)['ys']['xs']
+    assert torch.equal(eouts_stream, eouts)
+
+
+def test_forward_chunk_invalid_chunk_size():
+    args = make_args(enc_type='transformer', latency_control_type='mask',
+                     chunk_size_left=16, chunk_size_current=0)
+
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.transformer')
+    enc = module.TransformerEncoder(**args)
+    enc.eval()
+
+    xs = torch.randn(2, 16, args['input_dim'])
+    with pytest.raises(ValueError):
+        enc.forward_chunk(xs, enc.init_state())
@@ -4,10 +4,12 @@
 """Test for encoder utility functions."""
 
 import importlib
+import math
 import numpy as np
 import pytest
 import torch
 
+from neural_sp.models.torch_utils import make_pad_mask
 from neural_sp.models.torch_utils import np2tensor
 from neural_sp.models.torch_utils import pad_list
 
@@ -19,6 +21,8 @@ from neural_sp.models.torch_utils import pad_list
         (64, 64, 64),
         (40, 40, 40),
         (40, 40, 20),
+        (0, 40, 0),
+        (0, 40, 20),
     ]
 )
 def test_chunkwise(N_l, N_c, N_r):
@@ -42,3 +46,81 @@ def test_chunkwise(N_l, N_c, N_r):
 
         assert xs_chunk.size() == xs.size()
         assert torch.equal(xs_chunk, xs)
+
+
+def chunkwise_reference(xs, N_l, N_c, N_r):
+    bs, xmax, idim = xs.size()
+    n_chunks = math.ceil(xmax / N_c)
+    xs_tmp = xs.new_zeros(bs, n_chunks, N_l + N_c + N_r, idim)
+    xs_pad = torch.cat([xs.new_zeros(bs, N_l, idim),
+                        xs,
+                        xs.new_zeros(bs, N_r, idim)], dim=1)
+    for chunk_idx, t in enumerate(range(N_l, N_l + xmax, N_c)):
+        xs_chunk = xs_pad[:, t - N_l:t + (N_c + N_r)]
+        xs_tmp[:, chunk_idx, :xs_chunk.size(1), :] = xs_chunk
+    return xs_tmp.view(bs * n_chunks, N_l + N_c + N_r, idim)
+
+
+@pytest.mark.parametrize(
+    "N_l, N_c, N_r",
+    [
+        (96, 64, 32),
+        (40, 40, 20),
+        (0, 40, 0),
+        (0, 40, 20),
+        (20, 40, 0),
+    ]
+)
+def test_chunkwise_reference(N_l, N_c, N_r):
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.utils')
+    for xmax in [80, 85, 20]:
+        xs = torch.randn(4, xmax, 8)
+        assert torch.equal(module.chunkwise(xs, N_l, N_c, N_r), chunkwise_reference(xs, N_l, N_c, N_r))
+
+
+@pytest.mark.parametrize(
+    "N_l, N_c, N_r",
+    [
+        (16, 16, 8),
+        (16, 32, 16),
+        (0, 16, 0),
+        (0, 16, 16),
+    ]
+)
+def test_make_chunkwise_mask(N_l, N_c, N_r):
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.utils')
+    for xmax in [64, 70]:
+        xlens = torch.IntTensor([xmax, xmax - 10, 5])
+        n_chunks = math.ceil(xmax / N_c)
+
+        xx_mask_ref = make_pad_mask(xlens).unsqueeze(1).repeat([1, xmax, 1])
+        for chunk_idx in range(n_chunks):
+            offset = chunk_idx * N_c
+            xx_mask_ref[:, offset:offset + N_c, :max(0, offset - N_l)] = 0
+            xx_mask_ref[:, offset:offset + N_c, offset + (N_c + N_r):] = 0
+
+        xx_mask = module.make_chunkwise_mask(xlens, xmax, N_l, N_c, N_r)
+        assert torch.equal(xx_mask, xx_mask_ref)
+
+
+@pytest.mark.parametrize(
+    "N_c, emax",
+    [
+        (16, 64),
+        (16, 70),
+    ]
+)
+def test_merge_chunkwise_attention(N_c, emax):
+    module = importlib.import_module('neural_sp.models.seq2seq.encoders.utils')
+    bs, n_heads = 3, 4
+    n_chunks = math.ceil(emax / N_c)
+    aws = torch.rand(bs * n_chunks, n_heads, N_c, N_c)
+
+    aws_ref = aws.new_zeros(bs, n_heads, emax, emax)
+    aws_chunks = aws.view(bs, n_chunks, n_heads, N_c, N_c)
+    for chunk_idx in range(n_chunks):
+        offset = chunk_idx * N_c
+        emax_chunk = aws_ref[:, :, offset:offset + N_c].size(2)
+        aws_ref[:, :, offset:offset + N_c, offset:offset + N_c] = aws_chunks[:, chunk_idx, :, :emax_chunk, :emax_chunk]
+
+    assert torch.equal(module.merge_chunkwise_attention(aws, bs, emax), aws_ref)
@@ -0,0 +1,49 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Utilities shared by the LM tests."""
+
+import torch
+
+
+def forward_neural_cache_ref(lm, ys, n_caches, bptt):
+    """Per-token reference of the continuous cache model.
+
+    Args:
+        lm (LMBase): language model in the evaluation mode
+        ys (np.ndarray): `[B, L + 1]`
+        n_caches (int): number of tokens in the cache
+        bptt (int): BPTT length of each window
+    Returns:
+        loss (float): average negative log-likelihood per token
+
+    """
+    ys = torch.from_numpy(ys)
+    bs = ys.size(0)
+    probs, outs = [], []
+    state = None
+    with torch.no_grad():
+        for t in range(0, ys.size(1) - 1, bptt):
+            logits, out, state = lm.decode(ys[:, t:t + bptt], state=state, mems=state)
+            if lm.adaptive_softmax is None:
+                probs.append(torch.softmax(logits, dim=-1))
+            else:
+                probs.append(lm.adaptive_softmax.log_prob(
+                    logits.reshape(-1, logits.size(2))).exp().view(bs, logits.size(1), -1))
+            outs.append(out)
+    probs, out = torch.cat(probs, dim=1), torch.cat(outs, dim=1)
+    ys_out = ys[:, 1:]
+    ylen = ys_out.size(1)
+    nll = torch.zeros(bs, ylen)
+    for b in range(bs):
+        for t in range(ylen):
+            p = probs[b, t].clone()
+            start = max(0, t - n_caches)
+            if t > 0:
+                attn = torch.softmax(lm.cache_theta * torch.matmul(out[b, start:t], out[b, t]), dim=0)
+                cache_p = torch.zeros_like(p)
+                for offset in range(t - start):
+                    cache_p[ys_out[b, start + offset]] += attn[offset]
+                p = (1 - lm.cache_lambda) * p + lm.cache_lambda * cache_p
+            nll[b, t] = -torch.log(p[ys_out[b, t]])
+    return nll.mean().item()
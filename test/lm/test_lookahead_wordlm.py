@@ -0,0 +1,179 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for look-ahead word-level LM fusion."""
+
+import argparse
+import importlib
+import pytest
+import torch
+
+
+WORDS = ['a', 'ab', 'abc', 'b', 'ba', 'cab', 'cc', 'dab']
+LM_VOCAB = 4 + len(WORDS)  # <blank>, <unk>, <eos>, <pad>
+CHARS = {'<space>': 4, 'a': 5, 'b': 6, 'c': 7, 'd': 8, 'e': 9}
+WPS = {'▁a': 4, '▁b': 5, '▁c': 6, '▁d': 7, 'a': 8, 'b': 9, 'c': 10, '▁e': 11, 'e': 12}
+UNK = 1
+EOS = 2
+
+
+def make_args_rnnlm(**kwargs):
+    args = dict(
+        lm_type='lstm',
+        n_units=32,
+        n_projs=0,
+        n_layers=2,
+        residual=False,
+        use_glu=False,
+        n_units_null_context=0,
+        bottleneck_dim=16,
+        emb_dim=16,
+        vocab=LM_VOCAB,
+        dropout_in=0.1,
+        dropout_hidden=0.1,
+        lsm_prob=0.0,
+        param_init=0.1,
+        adaptive_softmax=False,
+        tie_embedding=False,
+    )
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+
+def spell(word, unit):
+    if unit == 'char':
+        return [CHARS[c] for c in word]
+    # NOTE: each word is segmented into one piece per character
+    return [WPS['▁' + word[0]]] + [WPS[c] for c in word[1:]]
+
+
+def build_wordlm(unit, lm_type='lstm'):
+    module_rnnlm = importlib.import_module('neural_sp.models.lm.rnnlm')
+    lm = module_rnnlm.RNNLM(make_args_rnnlm(lm_type=lm_type))
+    lm.eval()
+    lexicon = [(4 + i, spell(w, unit)) for i, w in enumerate(WORDS)]
+    module = importlib.import_module('neural_sp.models.lm.lookahead_wordlm')
+    if unit == 'char':
+        return module.LookAheadWordLM(lm, lexicon, max(CHARS.values()) + 1, space=CHARS['<space>'])
+    return module.LookAheadWordLM(lm, lexicon, max(WPS.values()) + 1,
+                                  word_start_ids=[v for k, v in WPS.items() if k[0] == '▁'])
+
+
+def tokenize(words, unit):
+    tokens = []
+    for i, w in enumerate(words):
+        if unit == 'char':
+            if i > 0:
+                tokens.append(CHARS['<space>'])
+            tokens += [CHARS[c] for c in w]
+        else:
+            tokens += spell(w, unit)
+    return tokens + [EOS]
+
+
+def word_lm_score(lm, words):
+    ys = torch.tensor([[EOS] + [WORDS.index(w) + 4 if w in WORDS else UNK for w in words] + [EOS]])
+    _, _, log_probs = lm.predict(ys[:, :-1], None)
+    return sum([log_probs[0, t, ys[0, t + 1]].item() for t in range(ys.size(1) - 1)])
+
+
+def test_lexicon_prefix_tree():
+    module = importlib.import_module('neural_sp.models.lm.lookahead_wordlm')
+    lexicon = [(4 + i, spell(w, 'char')) for i, w in enumerate(WORDS)]
+    tree = module.LexiconPrefixTree(lexicon)
+    assert tree.n_words == len(WORDS)
+    assert sorted(tree.dfs_word_ids.tolist()) == list(range(4, LM_VOCAB))
+
+    # all words sharing the prefix of a node occupy its range
+    def walk(tokens):
+        node = 0
+        for t in tokens:
+            node = tree.children[node][t]
+        return node
+
+    for w in WORDS:
+        for i in range(1, len(w) + 1):
+            node = walk(spell(w[:i], 'char'))
+            words_under = sorted(WORDS[idx - 4] for idx in tree.dfs_word_ids[tree.lo[node]:tree.hi[node]])
+            assert words_under == sorted(v for v in WORDS if v.startswith(w[:i]))
+        assert tree.word_ids[walk(spell(w, 'char'))] == WORDS.index(w) + 4
+
+
+@pytest.mark.parametrize(
+    "unit, lm_type, words",
+    [
+        ('char', 'lstm', ['ab', 'cab', 'a']),
+        ('char', 'lstm', ['abc']),
+        ('char', 'gru', ['cc', 'b', 'ba']),
+        ('char', 'lstm', ['ee', 'ab']),  # out-of-lexicon word
+        ('char', 'lstm', ['da', 'dab']),  # prefix only
+        ('wp', 'lstm', ['ab', 'cab', 'a']),
+        ('wp', 'lstm', ['a', 'ab', 'abc']),
+        ('wp', 'gru', ['cc', 'b', 'ba']),
+    ]
+)
+def test_predict(unit, lm_type, words):
+    wordlm = build_wordlm(unit, lm_type)
+    tokens = tokenize(words, unit)
+
+    # scores of tokens sum up to the word LM probability
+    with torch.no_grad():
+        total = 0.
+        state = None
+        y_prev = EOS
+        for y in tokens:
+            _, state, log_probs = wordlm.predict(torch.tensor([[y_prev]]), state)
+            assert log_probs.size() == (1, 1, wordlm.vocab)
+            total += log_probs[0, 0, y].item()
+            y_prev = y
+        total_ref = word_lm_score(wordlm.lm, words)
+    if all(w in WORDS for w in words) or unit == 'char':
+        assert abs(total - total_ref) < 1e-4
+
+
+@pytest.mark.parametrize("unit", ['char', 'wp'])
+def test_predict_batch(unit):
+    wordlm = build_wordlm(unit)
+    hyps = [tokenize(['ab', 'c'], unit)[:-1],
+            tokenize(['cab', 'b'], unit)[:-1],
+            tokenize(['ee'], unit)[:-1],
+            tokenize(['ab', 'c'], unit)[:-1]]
+    max_len = max(len(hyp) for hyp in hyps)
+
+    with torch.no_grad():
+        # batched
+        states = [None] * len(hyps)
+        scores = []
+        for t in range(max_len):
+            ys = torch.tensor([[([EOS] + hyp)[min(t, len(hyp))]] for hyp in hyps])
+            _, new_states, log_probs = wordlm.predict(ys, states)
+            states = [new_states[j] if t < len(hyp) else states[j] for j, hyp in enumerate(hyps)]
+            scores.append(log_probs)
+
+        # one by one
+        for j, hyp in enumerate(hyps):
+            state = None
+            for t in range(len(hyp)):
+                _, state, log_probs = wordlm.predict(torch.tensor([[([EOS] + hyp)[t]]]), state)
+                assert torch.allclose(log_probs[0], scores[t][j], atol=1e-5)
+
+
+def test_load_lexicon(tmp_path):
+    lm_dict_path = tmp_path / 'dict_lm.txt'
+    asr_dict_path = tmp_path / 'dict.txt'
+    with open(lm_dict_path, 'w') as f:
+        f.write('<unk> 1\n<eos> 2\n<pad> 3\n')
+        for i, w in enumerate(WORDS + ['xyz']):
+            f.write('%s %d\n' % (w, i + 4))
+    with open(asr_dict_path, 'w') as f:
+        f.write('<unk> 1\n<eos> 2\n<pad> 3\n')
+        for c, idx in CHARS.items():
+            f.write('%s %d\n' % (c, idx))
+
+    module = importlib.import_module('neural_sp.models.lm.lookahead_wordlm')
+    lexicon, vocab, space, word_start_ids = module.load_lexicon(str(lm_dict_path), str(asr_dict_path))
+    assert vocab == max(CHARS.values()) + 1
+    assert space == CHARS['<space>']
+    assert word_start_ids == []
+    # 'xyz' cannot be spelled with ASR tokens
+    assert lexicon == [(i + 4, spell(w, 'char')) for i, w in enumerate(WORDS)]
@@ -0,0 +1,132 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for n-gram LM."""
+
+import gzip
+import importlib
+import numpy as np
+import os
+import pytest
+import torch
+
+
+TOKENS = ['a', 'b', 'c', 'd']  # index: 4-7
+VOCAB = 8
+BOS = '<s>'
+EOS = '</s>'
+
+# log10 probabilities and back-off weights
+UNIGRAMS = [(-99., BOS, -0.5), (-0.8, EOS, 0.), (-1.5, '<unk>', 0.),
+            (-0.6, 'a', -0.3), (-0.7, 'b', -0.2), (-0.9, 'c', -0.4), (-1.2, 'd', -0.1)]
+BIGRAMS = [(-0.3, BOS, 'a', -0.2), (-0.6, BOS, 'b', -0.1), (-0.4, 'a', 'b', -0.3),
+           (-0.5, 'a', EOS, 0.), (-0.2, 'b', 'c', -0.2), (-0.7, 'c', 'a', 0.), (-0.9, 'd', EOS, 0.)]
+TRIGRAMS = [(-0.1, BOS, 'a', 'b'), (-0.2, 'a', 'b', 'c'), (-0.4, 'b', 'c', 'a'), (-0.3, 'a', 'b', EOS)]
+
+
+def write_arpa(path, order=3):
+    ngrams = [UNIGRAMS, BIGRAMS, TRIGRAMS][:order]
+    lines = ['\\data\\']
+    lines += ['ngram %d=%d' % (n + 1, len(entries)) for n, entries in enumerate(ngrams)]
+    for n, entries in enumerate(ngrams):
+        lines += ['', '\\%d-grams:' % (n + 1)]
+        for e in entries:
+            fields = ['%.2f' % e[0]] + list(e[1:n + 2])
+            if n + 1 < order and len(e) > n + 2:
+                fields.append('%.2f' % e[-1])
+            lines.append('\t'.join([fields[0], ' '.join(fields[1:n + 2])] + fields[n + 2:]))
+    lines += ['', '\\end\\', '']
+    if path.endswith('.gz'):
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            f.write('\n'.join(lines))
+    else:
+        with open(path, 'w') as f:
+            f.write('\n'.join(lines))
+
+
+def write_dict(path):
+    with open(path, 'w') as f:
+        f.write('<unk> 1\n<eos> 2\n<pad> 3\n')
+        for i, t in enumerate(TOKENS):
+            f.write('%s %d\n' % (t, i + 4))
+
+
+def log_prob_ref(context, token, order):
+    """Compute log10 p(token|context) with back-off recursively."""
+    ngrams = {}
+    for n, entries in enumerate([UNIGRAMS, BIGRAMS, TRIGRAMS][:order]):
+        for e in entries:
+            ngrams[tuple(e[1:n + 2])] = (e[0], e[-1] if n + 1 < order and len(e) > n + 2 else 0.)
+    context = tuple(context[-(order - 1):]) if order > 1 else ()
+    while True:
+        if context + (token,) in ngrams:
+            return ngrams[context + (token,)][0]
+        if len(context) == 0:
+            return ngrams[('<unk>',)][0]
+        bow = ngrams[context][1] if context in ngrams else 0.
+        return bow + log_prob_ref(context[1:], token, len(context))
+
+
+def token2idx(token):
+    if token == EOS:
+        return 2
+    return TOKENS.index(token) + 4
+
+
+def build_ngram(tmp_path, order=3, ext='.arpa'):
+    arpa_path = os.path.join(str(tmp_path), 'lm' + ext)
+    dict_path = os.path.join(str(tmp_path), 'dict.txt')
+    write_arpa(arpa_path, order)
+    write_dict(dict_path)
+    module = importlib.import_module('neural_sp.models.lm.ngram')
+    return module.NgramLM(arpa_path, dict_path), arpa_path, dict_path
+
+
+@pytest.mark.parametrize(
+    "order, ext",
+    [
+        (1, '.arpa'),
+        (2, '.arpa'),
+        (3, '.arpa'),
+        (3, '.arpa.gz'),
+    ]
+)
+def test_predict(tmp_path, order, ext):
+    lm, _, _ = build_ngram(tmp_path, order, ext)
+    assert lm.order == order
+
+    hyps = [['a', 'b', 'c', 'a'], ['b', 'c'], ['d', 'd', 'a', 'b'], ['c', 'a', 'b']]
+    max_len = max(len(hyp) for hyp in hyps)
+    state = None
+    for t in range(max_len + 1):
+        ys = torch.tensor([[2 if t == 0 else token2idx(hyp[min(t, len(hyp)) - 1])] for hyp in hyps])
+        _, state, log_probs = lm.predict(ys, state)
+        assert log_probs.size() == (len(hyps), 1, VOCAB)
+        for j, hyp in enumerate(hyps):
+            if t > len(hyp):
+                continue
+            context = [BOS] + hyp[:t]
+            for token in TOKENS + [EOS]:
+                ref = log_prob_ref(context, token, order) * np.log(10)
+                assert abs(log_probs[j, 0, token2idx(token)].item() - ref) < 1e-4
+
+
+def test_cache(tmp_path, monkeypatch):
+    lm, arpa_path, dict_path = build_ngram(tmp_path)
+    assert os.path.isfile(arpa_path + '.npz')
+
+    module = importlib.import_module('neural_sp.models.lm.ngram')
+    # load from the cache without parsing the ARPA file
+    monkeypatch.setattr(module, 'read_arpa', None)
+    lm_cache = module.NgramLM(arpa_path, dict_path)
+    monkeypatch.undo()
+    for n in range(1, lm.order + 1):
+        assert np.array_equal(lm.keys[n], lm_cache.keys[n])
+        assert np.array_equal(lm.logps[n], lm_cache.logps[n])
+        assert np.array_equal(lm.bows[n], lm_cache.bows[n])
+
+    # the cache is updated when the ARPA file is changed
+    write_arpa(arpa_path, order=2)
+    os.utime(arpa_path, (0, 0))
+    lm_new = module.NgramLM(arpa_path, dict_path)
+    assert lm_new.order == 2
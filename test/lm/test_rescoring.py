@@ -0,0 +1,144 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for batched N-best rescoring."""
+
+import argparse
+import importlib
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+
+
+VOCAB = 20
+
+
+def make_args_rnnlm(**kwargs):
+    args = dict(
+        lm_type='lstm',
+        n_units=32,
+        n_projs=0,
+        n_layers=2,
+        residual=False,
+        use_glu=False,
+        n_units_null_context=0,
+        bottleneck_dim=16,
+        emb_dim=16,
+        vocab=VOCAB,
+        dropout_in=0.1,
+        dropout_hidden=0.1,
+        lsm_prob=0.0,
+        param_init=0.1,
+        adaptive_softmax=False,
+        tie_embedding=False,
+    )
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+
+def make_args_transformerlm(**kwargs):
+    args = dict(
+        lm_type='transformer',
+        transformer_n_heads=4,
+        n_layers=2,
+        transformer_d_model=16,
+        transformer_d_ff=64,
+        transformer_layer_norm_eps=1e-12,
+        transformer_ffn_activation='relu',
+        transformer_pe_type='add',
+        vocab=VOCAB,
+        dropout_in=0.1,
+        dropout_hidden=0.1,
+        dropout_att=0.1,
+        dropout_layer=0.0,
+        lsm_prob=0.0,
+        transformer_param_init='xavier_uniform',
+        mem_len=0,
+        recog_mem_len=0,
+        adaptive_softmax=False,
+        tie_embedding=False,
+    )
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+
+def build_lm(lm_type):
+    if lm_type == 'transformer':
+        module = importlib.import_module('neural_sp.models.lm.transformerlm')
+        lm = module.TransformerLM(make_args_transformerlm())
+    else:
+        module = importlib.import_module('neural_sp.models.lm.rnnlm')
+        lm = module.RNNLM(make_args_rnnlm(lm_type=lm_type))
+    lm.eval()
+    return lm
+
+
+def score_sequences_ref(lm, ys, reverse, normalize_length):
+    """Score each sequence separately."""
+    scores = []
+    for y in ys:
+        y = y[::-1] if reverse else y
+        if len(y) < 2:
+            scores.append(0.)
+            continue
+        y = torch.tensor([y], dtype=torch.int64)
+        with torch.no_grad():
+            _, _, log_probs = lm.predict(y[:, :-1], None)
+        score = sum([log_probs[0, t, y[0, t + 1]].item() for t in range(y.size(1) - 1)])
+        if normalize_length:
+            score /= (y.size(1) - 1)
+        scores.append(score)
+    return np.array(scores)
+
+
+@pytest.mark.parametrize(
+    "lm_type, reverse, normalize_length, batch_size",
+    [
+        ('lstm', False, False, 0),
+        ('lstm', True, False, 0),
+        ('lstm', False, True, 0),
+        ('lstm', False, True, 3),
+        ('gru', False, False, 4),
+        ('transformer', False, False, 0),
+        ('transformer', True, True, 2),
+    ]
+)
+def test_score_sequences(lm_type, reverse, normalize_length, batch_size):
+    lm = build_lm(lm_type)
+    eos = lm.eos
+
+    ylens = [5, 1, 8, 3, 0, 6, 2]
+    ys = [[eos] + np.random.randint(4, VOCAB, ylen).tolist() + [eos] for ylen in ylens]
+    ys += [[eos]]  # no token to score
+
+    module = importlib.import_module('neural_sp.models.lm.rescoring')
+    scores = module.score_sequences(lm, ys, reverse=reverse, normalize_length=normalize_length,
+                                    batch_size=batch_size)
+    assert scores.shape == (len(ys),)
+    scores_ref = score_sequences_ref(lm, ys, reverse, normalize_length)
+    assert np.allclose(scores, scores_ref, atol=1e-4)
+
+
+def test_rescore_nbest():
+    lm = build_lm('lstm')
+    lm_bwd = build_lm('lstm')
+
+    nbest = []
+    for utt_id in ['utt1', 'utt2']:
+        for n in range(4):
+            ylen = np.random.randint(1, 6)
+            nbest.append({'utt_id': utt_id, 'score': -float(n),
+                          'token_id': ' '.join(map(str, np.random.randint(4, VOCAB, ylen)))})
+    df = pd.DataFrame(nbest)
+
+    module = importlib.import_module('neural_sp.bin.lm.rescore_nbest')
+    df_rescored = module.rescore(df, lm.eos, lm, 0.5, lm_bwd, 0.3, batch_size=3)
+    assert len(df_rescored) == len(df)
+    assert list(df_rescored['utt_id']) == ['utt1'] * 4 + ['utt2'] * 4
+    for _, df_utt in df_rescored.groupby('utt_id'):
+        assert list(df_utt['rank']) == [1, 2, 3, 4]
+        assert np.all(np.diff(df_utt['score'].values) <= 0)
+    df_rescored = df_rescored.sort_index()
+    assert np.allclose(df_rescored['score'],
+                       df['score'] + df_rescored['score_lm'] * 0.5 + df_rescored['score_lm_bwd'] * 0.3)
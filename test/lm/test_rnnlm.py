@@ -7,6 +7,9 @@ import argparse
 import importlib
 import numpy as np
 import pytest
+import torch
+
+from lm_utils import forward_neural_cache_ref
 
 
 VOCAB = 100  # large for adaptive softmax
@@ -72,3 +75,39 @@ def test_forward(args):
     # assert loss.size(0) == 1
     assert loss.item() >= 0
     assert isinstance(observation, dict)
+
+
+@pytest.mark.parametrize(
+    "args,n_caches,bptt", [
+        ({'lm_type': 'lstm'}, 5, 4),
+        ({'lm_type': 'lstm'}, 3, 8),
+        ({'lm_type': 'gru'}, 10, 6),
+        ({'adaptive_softmax': True}, 5, 4),
+    ]
+)
+def test_forward_neural_cache(args, n_caches, bptt):
+    args = make_args(**args)
+
+    bs, n_windows = 3, 4
+    # NOTE: avoid the padding index
+    ys = np.random.randint(4, VOCAB, (bs, bptt * n_windows + 1)).astype(np.int64)
+
+    module = importlib.import_module('neural_sp.models.lm.rnnlm')
+    lm = module.RNNLM(args)
+    lm.eval()
+    loss_ref = forward_neural_cache_ref(lm, ys, n_caches, bptt)
+
+    # evaluate whole BPTT windows of all streams at once
+    lm.reset_neural_cache()
+    state = None
+    losses = []
+    for i in range(n_windows):
+        ys_window = ys[:, i * bptt:(i + 1) * bptt + 1]
+        loss, state, _ = lm(ys_window, state=state, is_eval=True, n_caches=n_caches)
+        losses.append(loss.item())
+    assert np.allclose(np.mean(losses), loss_ref, atol=1e-5)
+
+    assert lm.cache_ids.size() == (bs, min(n_caches, bptt * n_windows))
+    assert lm.cache_keys.size() == (bs, min(n_caches, bptt * n_windows), args.n_units)
+    assert len(lm.cache_attn) == n_caches
+    assert lm.cache_attn[-1].shape == (bs, n_caches)
@@ -7,6 +7,9 @@ import argparse
 import importlib
 import numpy as np
 import pytest
+import torch
+
+from lm_utils import forward_neural_cache_ref
 
 
 VOCAB = 100  # large for adaptive softmax
@@ -82,3 +85,78 @@ def test_forward(args):
     # assert loss.size(0) == 1
     assert loss.item() >= 0
     assert isinstance(observation, dict)
+
+
+@pytest.mark.parametrize(
+    "args,mlen", [
+        ({'transformer_n_heads': 1}, 0),
+        ({'transformer_n_heads': 4}, 0),
+        ({'transformer_n_heads': 4}, 5),
+        ({'zero_center_offset': True}, 5),
+        ({'adaptive_softmax': True}, 5),
+    ]
+)
+def test_decode_incremental(args, mlen):
+    args = make_args(**args)
+    bs, ylen = 4, 8
+
+    module = importlib.import_module('neural_sp.models.lm.transformer_xl')
+    lm = module.TransformerXL(args)
+    lm.eval()
+
+    with torch.no_grad():
+        mems = None
+        if mlen > 0:
+            _, _, mems = lm.decode(torch.randint(4, VOCAB, (1, mlen)))
+            # NOTE: memory is shared by all hypotheses
+            assert mems[0].size(0) == 1
+
+        ys = torch.randint(4, VOCAB, (bs, ylen))
+        cache = None
+        for t in range(1, ylen + 1):
+            # reorder hypotheses as in beam search
+            index = torch.randperm(bs)
+            ys = ys[index]
+            if cache is not None:
+                cache = lm.reorder_state(cache, index)
+                assert cache[0]['k'].size(2) == t - 1
+            logits, out, cache = lm.decode(ys[:, :t], mems=mems, cache=cache, incremental=True)
+            assert logits.size(1) == 1
+
+            # re-encode the whole prefix
+            mems_ref = [m.expand(bs, -1, -1) for m in mems] if mlen > 0 else None
+            logits_ref, out_ref, _ = lm.decode(ys[:, :t], mems=mems_ref)
+            assert torch.allclose(out[:, -1], out_ref[:, -1], atol=1e-4)
+            assert torch.allclose(logits[:, -1], logits_ref[:, -1], atol=1e-4)
+
+
+@pytest.mark.parametrize(
+    "args,n_caches,bptt", [
+        ({}, 5, 4),
+        ({}, 3, 8),
+        ({'adaptive_softmax': True}, 5, 4),
+    ]
+)
+def test_forward_neural_cache(args, n_caches, bptt):
+    args = make_args(**args)
+
+    bs, n_windows = 3, 4
+    # NOTE: avoid the padding index
+    ys = np.random.randint(4, VOCAB, (bs, bptt * n_windows + 1)).astype(np.int64)
+
+    module = importlib.import_module('neural_sp.models.lm.transformer_xl')
+    lm = module.TransformerXL(args)
+    lm.eval()
+    loss_ref = forward_neural_cache_ref(lm, ys, n_caches, bptt)
+
+    # evaluate whole BPTT windows of all streams at once
+    lm.reset_neural_cache()
+    state = None
+    losses = []
+    for i in range(n_windows):
+        ys_window = ys[:, i * bptt:(i + 1) * bptt + 1]
+        loss, state, _ = lm(ys_window, state=state, is_eval=True, n_caches=n_caches)
+        losses.append(loss.item())
+    assert np.allclose(np.mean(losses), loss_ref, atol=1e-5)
+
+    assert lm.cache_ids.size() == (bs, min(n_caches, bptt * n_windows))
@@ -7,6 +7,9 @@ import argparse
 import importlib
 import numpy as np
 import pytest
+import torch
+
+from lm_utils import forward_neural_cache_ref
 
 
 VOCAB = 100  # large for adaptive softmax
@@ -79,3 +82,35 @@ def test_forward(args):
     # assert loss.size(0) == 1
     assert loss.item() >= 0
     assert isinstance(observation, dict)
+
+
+@pytest.mark.parametrize(
+    "args,n_caches,bptt", [
+        ({}, 5, 4),
+        ({}, 3, 8),
+        ({'adaptive_softmax': True}, 5, 4),
+    ]
+)
+def test_forward_neural_cache(args, n_caches, bptt):
+    args = make_args(**args)
+
+    bs, n_windows = 3, 4
+    # NOTE: avoid the padding index
+    ys = np.random.randint(4, VOCAB, (bs, bptt * n_windows + 1)).astype(np.int64)
+
+    module = importlib.import_module('neural_sp.models.lm.transformerlm')
+    lm = module.TransformerLM(args)
+    lm.eval()
+    loss_ref = forward_neural_cache_ref(lm, ys, n_caches, bptt)
+
+    # evaluate whole BPTT windows of all streams at once
+    lm.reset_neural_cache()
+    state = None
+    losses = []
+    for i in range(n_windows):
+        ys_window = ys[:, i * bptt:(i + 1) * bptt + 1]
+        loss, state, _ = lm(ys_window, state=state, is_eval=True, n_caches=n_caches)
+        losses.append(loss.item())
+    assert np.allclose(np.mean(losses), loss_ref, atol=1e-5)
+
+    assert lm.cache_ids.size() == (bs, min(n_caches, bptt * n_windows))
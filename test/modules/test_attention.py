@@ -67,3 +67,67 @@ def test_forward(args):
         cv, aws, _, _ = out
         assert cv.size() == (batch_size, 1, value.size(2))
         assert aws.size() == (batch_size, 1, 1, klen)
+
+
+@pytest.mark.parametrize(
+    "atype",
+    ['location', 'add', 'dot', 'luong_dot', 'luong_general', 'luong_concat']
+)
+def test_forward_beam(atype):
+    args = make_args(atype=atype, dropout=0.)
+
+    beam_width = 4
+    klen = 40
+    key = torch.randn(1, klen, args['kdim'])
+    query = torch.randn(beam_width, 1, args['qdim'])
+    aws_prev = torch.softmax(torch.randn(beam_width, 1, 1, klen), dim=-1)
+
+    module = importlib.import_module('neural_sp.models.modules.attention')
+    attention = module.AttentionMechanism(**args)
+    attention.eval()
+
+    # reference with encoder outputs copied for each hypothesis
+    key_rep = key.repeat([beam_width, 1, 1])
+    cv_ref, aws_ref, _, _ = attention(key_rep, key_rep, query, aw_prev=aws_prev)
+
+    # the first step with a single hypothesis
+    attention.reset()
+    attention(key, key, query[:1], aw_prev=aws_prev[:1], cache=True)
+    assert attention.key.size(0) == 1
+    key_exp = key.expand(beam_width, -1, -1)
+    cv, aws, _, _ = attention(key_exp, key_exp, query, aw_prev=aws_prev, cache=True)
+    assert attention.key.size(0) == 1
+    assert torch.allclose(cv, cv_ref, atol=1e-6)
+    assert torch.allclose(aws, aws_ref, atol=1e-6)
+
+    # encoder outputs broadcast across hypotheses are projected once without cache
+    cv, aws, _, _ = attention(key_exp, key_exp, query, aw_prev=aws_prev, cache=False)
+    assert attention.key.size(0) == 1
+    assert torch.allclose(cv, cv_ref, atol=1e-6)
+
+
+@pytest.mark.parametrize(
+    "lookahead",
+    [0, 2]
+)
+def test_triggered_attention(lookahead):
+    args = make_args(atype='triggered_attention', lookahead=lookahead, dropout=0.)
+
+    batch_size = 4
+    klen = 40
+    key = torch.randn(batch_size, klen, args['kdim'])
+    query = torch.randn(batch_size, 1, args['qdim'])
+    src_mask = torch.ones(batch_size, 1, klen).byte()
+    src_mask[1:, :, -3:] = 0
+    trigger_point = torch.IntTensor([0, 10, klen - 1, 36])
+
+    module = importlib.import_module('neural_sp.models.modules.attention')
+    attention = module.AttentionMechanism(**args)
+    attention.eval()
+
+    cv, aws, _, _ = attention(key, key, query, mask=src_mask, trigger_point=trigger_point)
+    assert cv.size() == (batch_size, 1, args['kdim'])
+    for b in range(batch_size):
+        boundary = trigger_point[b] + lookahead + 1
+        assert aws[b, :, :, boundary:].sum() == 0
+        assert torch.allclose(aws[b].sum(-1), torch.ones(1))
@@ -44,3 +44,34 @@ def test_forward(args):
 
     out = conv1d(xs)
     assert out.size() == (batch_size, max_len, args['out_channels'])
+
+
+@pytest.mark.parametrize(
+    "args, chunk_size",
+    [
+        ({'kernel_size': 3}, 4),
+        ({'kernel_size': 5, 'dilation': 2}, 4),
+        ({'kernel_size': 7}, 1),
+        ({'kernel_size': 1}, 4),
+    ]
+)
+def test_forward_chunk(args, chunk_size):
+    args = make_args(**args)
+
+    batch_size = 4
+    max_len = 40
+    device = "cpu"
+
+    xs = torch.randn(batch_size, max_len, args['in_channels'], device=device)
+
+    module = importlib.import_module('neural_sp.models.modules.causal_conv')
+    conv1d = module.CausalConv1d(**args)
+    conv1d = conv1d.to(device)
+
+    out = conv1d(xs)
+    cache = None
+    out_chunks = []
+    for t in range(0, max_len, chunk_size):
+        out_chunk, cache = conv1d.forward_chunk(xs[:, t:t + chunk_size], cache)
+        out_chunks.append(out_chunk)
+    assert torch.allclose(torch.cat(out_chunks, dim=1), out, atol=1e-6)
@@ -83,3 +83,90 @@ def test_forward_incremental(args):
         assert cv.size() == (batch_size, 1, args['enc_dim'])
         assert alpha.size() == (batch_size, xmax)
         assert aws.size() == (batch_size, 1, xmax)
+
+
+def integrate_and_fire_reference(alpha, beta, ymax):
+    """Sequential integrate-and-fire for a single utterance."""
+    aws = alpha.new_zeros(ymax + 1, alpha.size(0))
+    n_tokens, accum = 0, 0.
+    for t in range(alpha.size(0)):
+        a = alpha[t].item()
+        while accum + a >= beta and n_tokens < ymax:
+            # A boundary is located
+            ak1 = beta - accum
+            aws[n_tokens, t] += ak1
+            a -= ak1
+            accum = 0.
+            n_tokens += 1
+        aws[n_tokens, t] += a
+        accum += a
+    return aws[:ymax]
+
+
+@pytest.mark.parametrize("threshold", [1.0, 0.9])
+def test_forward_parallel_batch(threshold):
+    args = make_args(threshold=threshold)
+
+    batch_size = 3
+    xmax = 30
+    device = "cpu"
+
+    eouts = torch.randn(batch_size, xmax, args['enc_dim'], device=device)
+    elens = torch.IntTensor([30, 25, 12])
+    ylens = torch.IntTensor([6, 4, 3])
+
+    module = importlib.import_module('neural_sp.models.modules.cif')
+    cif = module.CIF(**args)
+    cif = cif.to(device)
+    cif.eval()
+
+    cv, alpha, aws = cif(eouts, elens, ylens, mode='parallel')
+    assert cv.size() == (batch_size, ylens.max(), args['enc_dim'])
+    for b in range(batch_size):
+        alpha_b = alpha[b, :elens[b]]
+        alpha_b = alpha_b / alpha_b.sum() * ylens[b] * threshold
+        aws_ref = integrate_and_fire_reference(alpha_b, threshold, ylens[b].item())
+        assert torch.allclose(aws[b, :ylens[b], :elens[b]], aws_ref, atol=1e-5)
+        assert aws[b, ylens[b]:].sum() == 0
+        assert aws[b, :, elens[b]:].sum() == 0
+        assert torch.allclose(cv[b, :ylens[b]], torch.matmul(aws_ref, eouts[b, :elens[b]]), atol=1e-5)
+
+
+@pytest.mark.parametrize("threshold", [1.0, 0.9])
+def test_forward_incremental_batch(threshold):
+    args = make_args(threshold=threshold)
+
+    batch_size = 3
+    xmax = 30
+    n_steps = 20
+    device = "cpu"
+
+    elens = torch.IntTensor([30, 25, 12])
+    eouts = torch.randn(batch_size, xmax, args['enc_dim'], device=device)
+    for b in range(batch_size):
+        eouts[b, elens[b]:] = 0
+
+    module = importlib.import_module('neural_sp.models.modules.cif')
+    cif = module.CIF(**args)
+    cif = cif.to(device)
+    cif.eval()
+
+    cif.reset()
+    outs = [cif(eouts, elens, mode='incremental') for _ in range(n_steps)]
+    for b in range(batch_size):
+        cif.reset()
+        outs_b = [cif(eouts[b:b + 1, :elens[b]], elens[b:b + 1], mode='incremental') for _ in range(n_steps)]
+        for (cv, _, _), (cv_b, _, _) in zip(outs, outs_b):
+            assert torch.allclose(cv[b], cv_b[0], atol=1e-5)
+
+        # all tokens are fired one by one
+        alpha_b = outs_b[0][1][0]
+        aws_ref = integrate_and_fire_reference(alpha_b, threshold, n_steps)
+        n_tokens = int(alpha_b.sum().item() // threshold)
+        if alpha_b.sum().item() - n_tokens * threshold >= 0.5:
+            n_tokens += 1  # tail
+        for i, (cv_b, _, aws_b) in enumerate(outs_b):
+            if i < n_tokens:
+                assert torch.allclose(aws_b[0, 0], aws_ref[i], atol=1e-5)
+            else:
+                assert aws_b.sum() == 0
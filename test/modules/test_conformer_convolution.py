@@ -46,3 +46,48 @@ def test_forward(args):
         xs = conv(xs)
 
         assert xs.size() == (batch_size, xmax, args['d_model'])
+
+
+@pytest.mark.parametrize(
+    "kernel_size, chunk_size",
+    [
+        (3, 8),
+        (7, 8),
+        (17, 4),
+        (1, 8),
+        (7, 12),
+    ]
+)
+def test_forward_chunk(kernel_size, chunk_size):
+    args = make_args(kernel_size=kernel_size)
+
+    batch_size = 4
+    xmax = 40
+    device = "cpu"
+
+    module = importlib.import_module('neural_sp.models.modules.conformer_convolution')
+    conv = module.ConformerConvBlock(**args)
+    conv = conv.to(device)
+    conv.eval()
+
+    xs = torch.randn(batch_size, xmax, args['d_model'], device=device)
+    out = conv(xs, chunk_size=chunk_size)
+    assert out.size() == xs.size()
+
+    # lookahead frames are not used for the right context of current frames
+    context = (kernel_size - 1) // 2
+    cache = None
+    out_chunks = []
+    for t in range(0, xmax, chunk_size):
+        out_chunk, cache = conv.forward_chunk(xs[:, t:t + chunk_size + context], cache,
+                                              n_current=min(chunk_size, xmax - t))
+        assert out_chunk.size(1) == min(chunk_size + context, xmax - t)
+        assert cache.size(2) <= context
+        out_chunks.append(out_chunk[:, :chunk_size])
+    assert torch.allclose(torch.cat(out_chunks, dim=1), out, atol=1e-5)
+
+    # the same as the full-context convolution within each chunk
+    out_full = conv(xs)
+    for t in range(0, xmax, chunk_size):
+        n_inner = max(0, min(chunk_size, xmax - t) - context)
+        assert torch.allclose(out[:, t:t + n_inner], out_full[:, t:t + n_inner], atol=1e-5)
@@ -170,3 +170,117 @@ def test_forward_hard(args):
         if args['chunk_size'] > 1:
             assert beta is not None
             assert beta.size() == (batch_size, args['n_heads_mono'] * args['n_heads_chunk'], 1, klen)
+
+
+def recursive_reference(p_choose, aw_prev):
+    bs, n_heads, qlen, klen = p_choose.size()
+    alpha = []
+    for i in range(qlen):
+        q = p_choose.new_zeros(bs, n_heads, 1, klen + 1)
+        for j in range(klen):
+            decay = 1 if j == 0 else 1 - p_choose[:, :, i:i + 1, j - 1]
+            q[:, :, :, j + 1] = decay * q[:, :, :, j] + aw_prev[:, :, :, j]
+        aw_prev = p_choose[:, :, i:i + 1] * q[:, :, :, 1:]
+        alpha.append(aw_prev)
+    return torch.cat(alpha, dim=2)
+
+
+@pytest.mark.parametrize("n_heads_mono", [1, 4])
+def test_recursive_parallel(n_heads_mono):
+    args = make_args(n_heads_mono=n_heads_mono, atype='scaled_dot', noise_std=0., eps=1e-10)
+
+    batch_size = 4
+    klen = 20
+    qlen = 5
+
+    module = importlib.import_module('neural_sp.models.modules.mocha')
+    mocha = module.MoChA(**args)
+
+    e_ma = torch.randn(batch_size, n_heads_mono, qlen, klen)
+    aw_prev = torch.zeros(batch_size, n_heads_mono, 1, klen)
+    aw_prev[:, :, :, 0] = 1
+    alpha_rec, p_choose = mocha.recursive(e_ma, aw_prev)
+    assert torch.allclose(alpha_rec, recursive_reference(p_choose, aw_prev), atol=1e-6)
+    alpha_par, _ = mocha.parallel(e_ma, aw_prev, trigger_point=None)
+    assert torch.allclose(alpha_rec, alpha_par, atol=1e-4)
+
+
+def test_parallel_decot():
+    args = make_args(decot=True, lookahead=2, noise_std=0.)
+
+    batch_size = 3
+    klen = 20
+    qlen = 5
+
+    module = importlib.import_module('neural_sp.models.modules.mocha')
+    mocha = module.MoChA(**args)
+
+    e_ma = torch.randn(batch_size, 1, qlen, klen)
+    aw_prev = torch.zeros(batch_size, 1, 1, klen)
+    aw_prev[:, :, :, 0] = 1
+    trigger_point = torch.IntTensor([3, 10, klen - 1])
+    alpha, _ = mocha.parallel(e_ma, aw_prev, trigger_point)
+    alpha_ref, _ = mocha.parallel(e_ma, aw_prev, None)
+    for b in range(batch_size):
+        tp = trigger_point[b].item() + args['lookahead'] + 1
+        assert alpha[b, :, :, tp:].sum() == 0
+        # NOTE: alpha depends on the masked alpha at the previous step
+        assert torch.allclose(alpha[b, :, 0, :tp], alpha_ref[b, :, 0, :tp])
+
+
+def head_synchronous_boundary_reference(alpha, eps_wait):
+    bs, n_heads_mono = alpha.size()[:2]
+    for b in range(bs):
+        if alpha[b].sum() == 0:
+            continue
+        leftmost = alpha[b, :, 0].nonzero()[:, -1].min().item()
+        rightmost = alpha[b, :, 0].nonzero()[:, -1].max().item()
+        for h in range(n_heads_mono):
+            if alpha[b, h, 0].sum().item() == 0:
+                alpha[b, h, 0, min(rightmost, leftmost + eps_wait)] = 1
+                continue
+            if alpha[b, h, 0].nonzero()[:, -1].min().item() >= leftmost + eps_wait:
+                alpha[b, h, 0, :] = 0
+                alpha[b, h, 0, leftmost + eps_wait] = 1
+    return alpha
+
+
+def hard_chunkwise_mask_reference(alpha, chunk_size):
+    bs, n_heads_mono, _, klen = alpha.size()
+    mask = alpha.clone().byte()
+    for b in range(bs):
+        for h in range(n_heads_mono):
+            if alpha[b, h, 0].sum() > 0:
+                boundary = alpha[b, h, 0].nonzero()[:, -1].min().item()
+                if chunk_size == -1:
+                    mask[b, h, 0, 0:boundary + 1] = 1
+                else:
+                    mask[b, h, 0, max(0, boundary - chunk_size + 1):boundary + 1] = 1
+    return mask
+
+
+@pytest.mark.parametrize("eps_wait", [1, 2, 5])
+def test_head_synchronous_boundary(eps_wait):
+    batch_size = 8
+    n_heads_mono = 4
+    klen = 20
+
+    module = importlib.import_module('neural_sp.models.modules.mocha')
+
+    for _ in range(10):
+        boundary = torch.randint(0, klen + 4, (batch_size, n_heads_mono))
+        alpha = torch.zeros(batch_size, n_heads_mono, 1, klen + 4)
+        alpha.scatter_(3, boundary[:, :, None, None], 1)
+        alpha = alpha[:, :, :, :klen]  # some heads have no boundary
+        alpha[0] = 0  # no boundary for all heads
+
+        alpha_ref = head_synchronous_boundary_reference(alpha.clone(), eps_wait)
+        assert torch.equal(module.head_synchronous_boundary(alpha, eps_wait), alpha_ref)
+
+        for chunk_size in [-1, 1, 4]:
+            u = torch.randn(batch_size, 1, 1, klen)
+            beta = module.hard_chunkwise_attention(alpha_ref, u, None, chunk_size, 1, 1.0, True)
+            mask = hard_chunkwise_mask_reference(alpha_ref, chunk_size)
+            beta_ref = torch.softmax(u.repeat([1, n_heads_mono, 1, 1]).masked_fill(
+                mask == 0, float(torch.finfo(u.dtype).min)), dim=-1)
+            assert torch.allclose(beta, beta_ref)
@@ -63,3 +63,85 @@ def test_forward(args):
         cv, aws, _, _ = out
         assert cv.size() == (batch_size, 1, value.size(2))
         assert aws.size() == (batch_size, args['n_heads'], 1, klen)
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ({'n_heads': 4}),
+        ({'n_heads': 4, 'atype': 'add'}),
+    ]
+)
+def test_forward_autocast(args):
+    args = make_args(**args)
+
+    batch_size = 4
+    klen = 40
+    qlen = 5
+    device = "cpu"
+
+    key = torch.randn(batch_size, klen, args['kdim'], device=device)
+    value = torch.randn(batch_size, klen, args['kdim'], device=device)
+    query = torch.randn(batch_size, qlen, args['qdim'], device=device)
+    src_mask = torch.ones(batch_size, qlen, klen, device=device).byte()
+
+    module = importlib.import_module('neural_sp.models.modules.multihead_attention')
+    attention = module.MultiheadAttentionMechanism(**args)
+    attention = attention.to(device)
+
+    attention.eval()
+    with torch.autocast('cpu', dtype=torch.bfloat16):
+        cv, aws, _, _ = attention(key, value, query, mask=src_mask)
+    assert cv.size() == (batch_size, qlen, value.size(2))
+    assert aws.size() == (batch_size, args['n_heads'], qlen, klen)
+    assert torch.allclose(aws.float().sum(-1), torch.ones(1), atol=1e-2)
+
+
+def mha_reference(attention, key, value, query, mask):
+    bs, n_heads, d_k = key.size(0), attention.n_heads, attention.d_k
+    k = attention.w_key(key).view(bs, -1, n_heads, d_k)
+    v = attention.w_value(value).view(bs, -1, n_heads, d_k)
+    q = attention.w_query(query).view(bs, -1, n_heads, d_k)
+    e = torch.einsum("bihd,bjhd->bijh", (q, k)) / attention.scale
+    mask = mask.unsqueeze(3).repeat([1, 1, 1, n_heads])
+    e = e.masked_fill_(mask == 0, float(torch.finfo(e.dtype).min))
+    aw = torch.softmax(e, dim=2)
+    cv = torch.einsum("bijh,bjhd->bihd", (aw, v)).contiguous().view(bs, -1, n_heads * d_k)
+    return attention.w_out(cv), aw.permute(0, 3, 1, 2)
+
+
+@pytest.mark.parametrize(
+    "n_heads, mask_qlen",
+    [
+        (1, 1),
+        (4, 1),
+        (4, 5),
+    ]
+)
+def test_fused_attention(n_heads, mask_qlen):
+    args = make_args(n_heads=n_heads)
+
+    batch_size = 4
+    klen = 40
+    qlen = 5
+    xlens = torch.IntTensor([klen, klen - 3, 10, 1])
+
+    key = torch.randn(batch_size, klen, args['kdim'])
+    query = torch.randn(batch_size, qlen, args['qdim'])
+    mask = (torch.arange(klen).unsqueeze(0) < xlens.unsqueeze(1)).unsqueeze(1)
+    mask = mask.repeat([1, mask_qlen, 1]).byte()
+    if mask_qlen > 1:
+        mask[:, -1] = 0  # fully-masked query
+
+    module = importlib.import_module('neural_sp.models.modules.multihead_attention')
+    attention = module.MultiheadAttentionMechanism(**args)
+    attention.eval()
+
+    cv_ref, aws_ref = mha_reference(attention, key, key, query, mask)
+    cv, aws, _, _ = attention(key, key, query, mask=mask)
+    assert torch.allclose(cv, cv_ref, atol=1e-5)
+    assert torch.allclose(aws, aws_ref, atol=1e-6)
+
+    cv_fused, aws, _, _ = attention(key, key, query, mask=mask, need_weights=False)
+    assert aws is None
+    assert torch.allclose(cv_fused, cv_ref, atol=1e-5)
@@ -0,0 +1,48 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for positional embeddings."""
+
+import importlib
+import pytest
+import torch
+
+
+def xl_positional_embedding_reference(inv_freq, xs, mlen, clamp_len, zero_center_offset):
+    if zero_center_offset:
+        pos_idxs = torch.arange(mlen - 1, -xs.size(1) - 1, -1.0, dtype=torch.float)
+    else:
+        pos_idxs = torch.arange(mlen + xs.size(1) - 1, -1, -1.0, dtype=torch.float)
+    if clamp_len > 0:
+        pos_idxs.clamp_(max=clamp_len)
+    sinusoid_inp = torch.einsum("i,j->ij", pos_idxs, inv_freq)
+    return torch.cat([sinusoid_inp.sin(), sinusoid_inp.cos()], dim=-1).unsqueeze(1)
+
+
+@pytest.mark.parametrize(
+    "mlen, clamp_len, zero_center_offset",
+    [
+        (0, -1, False),
+        (0, -1, True),
+        (20, -1, False),
+        (20, -1, True),
+        (0, 10, False),
+        (20, 10, True),
+        (20, 100, True),
+    ]
+)
+def test_xl_positional_embedding(mlen, clamp_len, zero_center_offset):
+    d_model = 16
+
+    module = importlib.import_module('neural_sp.models.modules.positional_embedding')
+    pos_emb = module.XLPositionalEmbedding(d_model, dropout=0.1)
+    pos_emb.eval()
+
+    # the sinusoid table is extended for longer inputs
+    for xmax in [5, 40, 3]:
+        xs = torch.randn(2, xmax, d_model)
+        out = pos_emb(xs, mlen=mlen, clamp_len=clamp_len, zero_center_offset=zero_center_offset)
+        out_ref = xl_positional_embedding_reference(pos_emb.inv_freq, xs, mlen, clamp_len,
+                                                    zero_center_offset)
+        assert out.size() == (mlen + xmax, 1, d_model)
+        assert torch.equal(out, out_ref)
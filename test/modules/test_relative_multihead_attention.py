@@ -82,3 +82,81 @@ def test_forward(args):
     cv, aws = out
     assert cv.size() == (batch_size, qlen, args['kdim'])
     assert aws.size() == (batch_size, args['n_heads'], qlen, qlen + mlen)
+
+
+def rel_shift_reference(xs):
+    # `[B, qlen, klen, H]`
+    bs, qlen, klen, n_heads = xs.size()
+    xs = xs.permute(1, 2, 0, 3).contiguous().view(qlen, klen, bs * n_heads)
+    zero_pad = xs.new_zeros((qlen, 1, bs * n_heads))
+    xs_shifted = (torch.cat([zero_pad, xs], dim=1)
+                  .view(klen + 1, qlen, bs * n_heads)[1:]
+                  .view_as(xs))
+    return xs_shifted.view(qlen, klen, bs, n_heads).permute(2, 0, 1, 3)
+
+
+def relative_mha_reference(attention, key, query, pos_embs, mask, u_bias, v_bias):
+    bs, qlen = query.size()[:2]
+    n_heads, d_k = attention.n_heads, attention.d_k
+    k = attention.w_key(key).view(bs, -1, n_heads, d_k)
+    v = attention.w_value(key).view(bs, -1, n_heads, d_k)
+    q = attention.w_query(key[:, -qlen:]).view(bs, -1, n_heads, d_k)
+    w_pos = attention.w_pos if attention.xl_like else attention.w_value
+    _pos_embs = w_pos(pos_embs).view(-1, n_heads, d_k)
+    AC = torch.einsum("bihd,bjhd->bijh", ((q if u_bias is None else q + u_bias[None, None]), k))
+    BD = torch.einsum("bihd,jhd->bijh", ((q if v_bias is None else q + v_bias[None, None]), _pos_embs))
+    e = (AC + rel_shift_reference(BD)) / attention.scale
+    e = e.masked_fill_(mask.unsqueeze(3) == 0, float(torch.finfo(e.dtype).min))
+    aw = torch.softmax(e, dim=2)
+    cv = torch.einsum("bijh,bjhd->bihd", (aw, v)).contiguous().view(bs, -1, n_heads * d_k)
+    return attention.w_out(cv), aw.permute(0, 3, 1, 2)
+
+
+@pytest.mark.parametrize(
+    "xl_like, mlen, clamp_len",
+    [
+        (False, 0, -1),
+        (False, 0, 8),
+        (True, 0, -1),
+        (True, 20, -1),
+    ]
+)
+def test_forward_equivalence(xl_like, mlen, clamp_len):
+    args = make_args(xl_like=xl_like, bias=True)
+
+    batch_size = 4
+    qlen = 30
+    query = torch.randn(batch_size, qlen, args['qdim'])
+    cat = torch.cat([torch.randn(batch_size, mlen, args['kdim']), query], dim=1)
+    mask = torch.ones(batch_size, qlen, qlen + mlen).byte()
+    mask[1:, :, -5:] = 0
+
+    module_embedding = importlib.import_module('neural_sp.models.modules.positional_embedding')
+    pos_emb = module_embedding.XLPositionalEmbedding(args['kdim'], args['dropout'])
+    pos_emb.eval()
+
+    if xl_like:
+        u_bias = torch.randn(args['n_heads'], args['adim'] // args['n_heads'])
+        v_bias = torch.randn(args['n_heads'], args['adim'] // args['n_heads'])
+    else:
+        u_bias, v_bias = None, None
+
+    module_mha = importlib.import_module('neural_sp.models.modules.relative_multihead_attention')
+    attention = module_mha.RelativeMultiheadAttentionMechanism(**args)
+    attention.eval()
+
+    with torch.no_grad():
+        for _ in range(2):
+            # the second iteration uses the cached projection
+            pos_embs = pos_emb(query, mlen=mlen, clamp_len=clamp_len, zero_center_offset=not xl_like)
+            cv_ref, aws_ref = relative_mha_reference(attention, cat, query, pos_embs, mask, u_bias, v_bias)
+            cv, aws = attention(cat, query, pos_embs, mask, u_bias=u_bias, v_bias=v_bias)
+            assert torch.allclose(cv, cv_ref, atol=1e-5)
+            assert torch.allclose(aws, aws_ref, atol=1e-6)
+
+        # the cache is invalidated when parameters are updated
+        w_pos = attention.w_pos if xl_like else attention.w_value
+        w_pos.weight.add_(1.)
+        cv_ref, _ = relative_mha_reference(attention, cat, query, pos_embs, mask, u_bias, v_bias)
+        cv, _ = attention(cat, query, pos_embs, mask, u_bias=u_bias, v_bias=v_bias)
+        assert torch.allclose(cv, cv_ref, atol=1e-5)
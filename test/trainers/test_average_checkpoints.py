@@ -0,0 +1,72 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for checkpoint averaging."""
+
+import os
+import pytest
+import torch
+
+from neural_sp.bin.eval_utils import average_checkpoints
+
+
+def make_model():
+    return torch.nn.Sequential(torch.nn.Linear(4, 3), torch.nn.BatchNorm1d(3))
+
+
+def save_checkpoints(save_path, epochs, legacy=False):
+    state_dicts = {}
+    for ep in epochs:
+        model = make_model()
+        model[1].num_batches_tracked.fill_(ep * 10)
+        state_dicts[ep] = model.state_dict()
+        torch.save({'model_state_dict': model.state_dict(), 'optimizer_state_dict': {}},
+                   os.path.join(save_path, 'model.epoch-' + str(ep)),
+                   _use_new_zipfile_serialization=not legacy)
+    return state_dicts
+
+
+@pytest.mark.parametrize(
+    "n_average,topk_list,epochs_avg,legacy",
+    [
+        (2, [], [3, 2], False),
+        (3, [], [3, 2, 1], False),
+        (3, [], [3, 2, 1], True),  # not memory-mapped
+        (2, [(3, 0.1), (1, 0.2), (2, 0.3)], [3, 1], False),
+        (2, [(5, 0.1), (1, 0.2), (2, 0.3)], [1, 2], False),  # missing checkpoint is skipped
+    ]
+)
+def test_average_checkpoints(tmpdir, n_average, topk_list, epochs_avg, legacy):
+    save_path = str(tmpdir)
+    state_dicts = save_checkpoints(save_path, [1, 2, 3], legacy)
+
+    model = make_model()
+    best_model_path = os.path.join(save_path, 'model.epoch-3')
+    model = average_checkpoints(model, best_model_path, n_average, topk_list)
+
+    state_dict_ref = {}
+    for k, v in state_dicts[epochs_avg[0]].items():
+        if v.is_floating_point():
+            v = sum(state_dicts[ep][k].double() for ep in epochs_avg) / len(epochs_avg)
+        # NOTE: integer buffers are taken from the first checkpoint
+        state_dict_ref[k] = v.to(state_dicts[epochs_avg[0]][k].dtype)
+    for k, v in model.state_dict().items():
+        assert v.dtype == state_dict_ref[k].dtype
+        assert torch.allclose(v, state_dict_ref[k])
+    assert model[1].num_batches_tracked.item() == epochs_avg[0] * 10
+
+    checkpoint_avg = torch.load(os.path.join(save_path, 'model-avg' + str(n_average)))
+    for k, v in checkpoint_avg['model_state_dict'].items():
+        assert torch.equal(v, state_dict_ref[k])
+
+
+def test_average_single_checkpoint(tmpdir):
+    save_path = str(tmpdir)
+    save_checkpoints(save_path, [1, 2])
+
+    model = make_model()
+    state_dict = {k: v.clone() for k, v in model.state_dict().items()}
+    model = average_checkpoints(model, os.path.join(save_path, 'model.epoch-2'), 1)
+    for k, v in model.state_dict().items():
+        assert torch.equal(v, state_dict[k])
+    assert not os.path.isfile(os.path.join(save_path, 'model-avg1'))
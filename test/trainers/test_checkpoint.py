@@ -0,0 +1,67 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for checkpoint writer and loader."""
+
+import json
+import os
+import pytest
+import torch
+
+from neural_sp.bin.train_utils import (
+    load_checkpoint,
+    read_checkpoint
+)
+from neural_sp.trainers.checkpoint import CheckpointWriter
+from neural_sp.trainers.ema import ExponentialMovingAverage
+
+
+@pytest.mark.parametrize(
+    "asynchronous",
+    [True, False]
+)
+def test_save(tmpdir, asynchronous):
+    save_path = str(tmpdir)
+    writer = CheckpointWriter(save_path, asynchronous=asynchronous)
+
+    param = torch.zeros(4)
+    for epoch in range(1, 5):
+        param.fill_(epoch)
+        writer.save({'model_state_dict': {'w': param}}, epoch, keep_epochs=[1, 3, epoch - 1])
+        param.fill_(-1)  # must not affect the snapshot
+    writer.close()
+
+    assert sorted(os.listdir(save_path)) == [
+        'checkpoints.json', 'model.epoch-1', 'model.epoch-3', 'model.epoch-4']
+    for epoch in [1, 3, 4]:
+        checkpoint = torch.load(os.path.join(save_path, 'model.epoch-' + str(epoch)))
+        assert (checkpoint['model_state_dict']['w'] == epoch).all()
+    with open(os.path.join(save_path, 'checkpoints.json')) as f:
+        assert [item['epoch'] for item in json.load(f)] == ['1', '3', '4']
+
+    # resume from the manifest
+    writer = CheckpointWriter(save_path, asynchronous=asynchronous)
+    writer.save({'model_state_dict': {'w': param}}, 5, keep_epochs=[4])
+    writer.close()
+    assert sorted(os.listdir(save_path)) == ['checkpoints.json', 'model.epoch-4', 'model.epoch-5']
+
+
+def test_load_checkpoint_once(tmpdir):
+    model = torch.nn.Linear(4, 4)
+    ema = ExponentialMovingAverage(model, decay=0.5)
+    checkpoint_path = os.path.join(str(tmpdir), 'model.epoch-3')
+    torch.save({'model_state_dict': model.state_dict(),
+                'ema_state_dict': ema.state_dict()}, checkpoint_path)
+
+    checkpoint = read_checkpoint(checkpoint_path)
+    os.remove(checkpoint_path)  # components are restored from memory
+
+    model_new = torch.nn.Linear(4, 4)
+    load_checkpoint(checkpoint_path, model_new, checkpoint=checkpoint)
+    assert torch.equal(model_new.weight, model.weight)
+    ema_new = ExponentialMovingAverage(torch.nn.Linear(4, 4), decay=0.9)
+    load_checkpoint(checkpoint_path, ema=ema_new, checkpoint=checkpoint)
+    assert torch.equal(ema_new.shadow['weight'], ema.shadow['weight'])
+
+    with pytest.raises(ValueError):
+        load_checkpoint(checkpoint_path, model_new)
@@ -0,0 +1,33 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for exponential moving average of parameters."""
+
+import pytest
+import torch
+
+from neural_sp.trainers.ema import ExponentialMovingAverage
+
+
+@pytest.mark.parametrize(
+    "warmup",
+    [True, False]
+)
+def test_update(warmup):
+    model = torch.nn.Linear(4, 4)
+    with torch.no_grad():
+        model.weight.fill_(1.)
+    ema = ExponentialMovingAverage(model, decay=0.5, warmup=warmup)
+
+    with torch.no_grad():
+        model.weight.fill_(3.)
+    ema.update(model)
+    decay = min(0.5, 2 / 11) if warmup else 0.5
+    assert torch.allclose(ema.shadow['weight'], torch.full((4, 4), decay * 1 + (1 - decay) * 3))
+
+    # restore from state dict
+    ema_new = ExponentialMovingAverage(torch.nn.Linear(4, 4), decay=0.9)
+    ema_new.load_state_dict(ema.state_dict())
+    assert ema_new.n_updates == 1
+    ema_new.copy_to(model)
+    assert torch.allclose(model.weight, ema.shadow['weight'])
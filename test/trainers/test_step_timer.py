@@ -0,0 +1,74 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Test for step-time breakdown during training."""
+
+import os
+import pytest
+import torch
+
+from neural_sp.trainers.step_timer import ProfilerWindow
+from neural_sp.trainers.step_timer import StepTimer
+
+
+class ToyModel(torch.nn.Module):
+
+    def __init__(self):
+        super().__init__()
+        self.enc = torch.nn.Linear(4, 4)
+        self.dec_fwd = torch.nn.Linear(4, 4)
+        self.dec_bwd = torch.nn.Linear(4, 4)
+
+    def forward(self, xs):
+        xs = self.enc(xs.clone())
+        return self.dec_fwd(xs).sum() + self.dec_bwd(xs).sum()
+
+
+@pytest.mark.parametrize(
+    "n_steps",
+    [1, 3]
+)
+def test_summary(n_steps):
+    model = ToyModel()
+    timer = StepTimer(use_cuda=False)
+    timer.attach(model)
+
+    for _ in range(n_steps):
+        with timer.section('data', host=True):
+            xs = torch.randn(2, 5, 4)
+        with timer.section('forward'):
+            loss = model(xs)
+        with timer.section('backward'):
+            loss.backward()
+        timer.step(n_frames=10, n_tokens=4)
+
+    # forward in the evaluation mode is not measured
+    model.eval()
+    model(xs)
+
+    times, throughput = timer.summary()
+    assert list(times.keys()) == ['data', 'h2d', 'enc', 'dec_fwd', 'dec_bwd', 'forward', 'backward']
+    assert all(v >= 0 for v in times.values())
+    assert times['forward'] >= times['enc']
+    assert throughput['frames_per_sec'] > 0
+    assert throughput['tokens_per_sec'] > 0
+
+    # records are cleared after summary
+    times, _ = timer.summary()
+    assert len(times) == 0
+
+    timer.detach()
+    model.train()
+    model(xs)
+    times, _ = timer.summary()
+    assert len(times) == 0
+
+
+def test_profiler_window(tmp_path):
+    model = ToyModel()
+    profiler = ProfilerWindow(str(tmp_path), start_step=2, n_steps=2)
+    for step in range(1, 6):
+        model(torch.randn(2, 5, 4)).backward()
+        profiler.step(step)
+    profiler.close()
+    assert os.path.isfile(os.path.join(str(tmp_path), 'trace.step2-4.json'))
@@ -0,0 +1,97 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Report memory and throughput of the encoder with activation checkpointing.
+
+Encoder options are the same as those of training, e.g.,
+    benchmark_activation_checkpointing.py --enc_type conv_conformer \
+        --enc_n_layers 12 --transformer_d_model 256 --n_gpus 1 \
+        --checkpoint_list 0_1_2_4 --n_frames 1600
+
+"""
+
+import argparse
+import sys
+import time
+import torch
+
+from neural_sp.bin.args_asr import parse_args_train
+from neural_sp.models.seq2seq.encoders.build import build_encoder
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--checkpoint_list', type=str, default='0_1_2',
+                    help='values of --activation_checkpointing to compare, separated by "_"')
+parser.add_argument('--input_dim', type=int, default=80,
+                    help='dimension of input features')
+parser.add_argument('--n_frames', type=int, default=1600,
+                    help='number of input frames per utterance')
+parser.add_argument('--n_steps', type=int, default=10,
+                    help='number of measured training steps')
+parser.add_argument('--n_warmup_steps', type=int, default=2,
+                    help='number of training steps before measurement')
+
+
+def benchmark(args, n_frames, n_steps, n_warmup_steps):
+    """Measure forward/backward of the encoder.
+
+    Args:
+        args (Namespace): training options
+        n_frames (int): number of input frames
+        n_steps (int): number of measured steps
+        n_warmup_steps (int): number of steps before measurement
+    Returns:
+        sec_per_step (float): elapsed time per step
+        peak_mem (int): peak GPU memory in bytes (-1 on CPU)
+
+    """
+    device = torch.device('cuda' if args.n_gpus >= 1 else 'cpu')
+    torch.manual_seed(1)
+    encoder = build_encoder(args).to(device)
+    encoder.train()
+
+    xs = torch.randn(args.batch_size, n_frames, args.input_dim, device=device)
+    xlens = torch.IntTensor([n_frames] * args.batch_size)
+
+    def step():
+        eouts = encoder(xs, xlens, task='all')['ys']['xs']
+        eouts.sum().backward()
+        encoder.zero_grad()
+
+    for _ in range(n_warmup_steps):
+        step()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+    start = time.time()
+    for _ in range(n_steps):
+        step()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    sec_per_step = (time.time() - start) / n_steps
+    peak_mem = torch.cuda.max_memory_allocated() if device.type == 'cuda' else -1
+    return sec_per_step, peak_mem
+
+
+def main():
+
+    bench_args, train_argv = parser.parse_known_args()
+    # NOTE: parse_args_train reads sys.argv
+    sys.argv = sys.argv[:1] + train_argv
+    args = parse_args_train(train_argv)
+    args.input_dim = bench_args.input_dim
+
+    print('%-10s %-12s %-12s %-10s' % ('every_n', 'sec/step', 'frames/sec', 'peak(MB)'))
+    for n in [int(n) for n in bench_args.checkpoint_list.split('_')]:
+        args.activation_checkpointing = n
+        sec_per_step, peak_mem = benchmark(args, bench_args.n_frames,
+                                           bench_args.n_steps, bench_args.n_warmup_steps)
+        print('%-10d %-12.4f %-12.1f %-10s' % (
+            n, sec_per_step, args.batch_size * bench_args.n_frames / sec_per_step,
+            'n/a' if peak_mem < 0 else '%.1f' % (peak_mem / 1024 ** 2)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Report throughput of relative positional embeddings and attention on long inputs."""
+
+import argparse
+import time
+import torch
+
+from neural_sp.models.modules.positional_embedding import XLPositionalEmbedding
+from neural_sp.models.modules.relative_multihead_attention import RelativeMultiheadAttentionMechanism
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--batch_size', type=int, default=4,
+                    help='mini-batch size')
+parser.add_argument('--n_frames', type=int, default=3000,
+                    help='number of input frames per utterance')
+parser.add_argument('--d_model', type=int, default=256,
+                    help='dimension of the MHA layer')
+parser.add_argument('--n_heads', type=int, default=4,
+                    help='number of heads in the MHA layer')
+parser.add_argument('--n_layers', type=int, default=12,
+                    help='number of layers sharing positional embeddings')
+parser.add_argument('--n_steps', type=int, default=5,
+                    help='number of measured steps')
+parser.add_argument('--xl_like', action='store_true',
+                    help='use TransformerXL like relative positional encoding')
+parser.add_argument('--cuda', action='store_true',
+                    help='run on GPU')
+args = parser.parse_args()
+
+
+def benchmark(step):
+    """Measure elapsed time per step.
+
+    Args:
+        step (callable):
+    Returns:
+        sec_per_step (float):
+
+    """
+    step()  # warmup
+    if args.cuda:
+        torch.cuda.synchronize()
+    start = time.time()
+    for _ in range(args.n_steps):
+        step()
+    if args.cuda:
+        torch.cuda.synchronize()
+    return (time.time() - start) / args.n_steps
+
+
+def main():
+
+    device = torch.device('cuda' if args.cuda else 'cpu')
+    xs = torch.randn(args.batch_size, args.n_frames, args.d_model, device=device)
+    d_k = args.d_model // args.n_heads
+    u_bias = torch.zeros(args.n_heads, d_k, device=device) if args.xl_like else None
+    v_bias = torch.zeros(args.n_heads, d_k, device=device) if args.xl_like else None
+
+    pos_emb = XLPositionalEmbedding(args.d_model, dropout=0.1).to(device).eval()
+    layers = [RelativeMultiheadAttentionMechanism(
+        kdim=args.d_model, qdim=args.d_model, adim=args.d_model, odim=args.d_model,
+        n_heads=args.n_heads, dropout=0.1, xl_like=args.xl_like).to(device).eval()
+        for _ in range(args.n_layers)]
+
+    def step_pos_emb():
+        pos_embs = pos_emb(xs, zero_center_offset=True)
+        for layer in layers:
+            layer._project_pos_embs(pos_embs)
+
+    def step_rel_shift():
+        pos_embs = pos_emb(xs, zero_center_offset=True)
+        q = torch.randn(args.batch_size, args.n_heads, args.n_frames, d_k, device=device)
+        layers[0]._rel_shift(torch.matmul(q, layers[0]._project_pos_embs(pos_embs))).sum()
+
+    def step_attention():
+        pos_embs = pos_emb(xs, zero_center_offset=True)
+        for layer in layers:
+            layer(xs, xs, pos_embs, None, u_bias, v_bias)
+
+    print('%-24s %-12s %-12s' % ('type', 'msec/step', 'frames/sec'))
+    with torch.no_grad():
+        for name, step in [('pos_emb+projection', step_pos_emb),
+                           ('rel_shift', step_rel_shift),
+                           ('attention(%d layers)' % args.n_layers, step_attention)]:
+            sec_per_step = benchmark(step)
+            print('%-24s %-12.3f %-12.1f' % (
+                name, sec_per_step * 1000, args.batch_size * args.n_frames / sec_per_step))
+
+
+if __name__ == '__main__':
+    main()
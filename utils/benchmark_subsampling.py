@@ -0,0 +1,86 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2020 Kyoto University (Hirofumi Inaguma)
+#  Apache 2.0  (http://www.apache.org/licenses/LICENSE-2.0)
+
+"""Report throughput of subsampling layers between encoder layers."""
+
+import argparse
+import time
+import torch
+
+from neural_sp.models.seq2seq.encoders.subsampling import (
+    ConcatSubsampler,
+    Conv1dSubsampler,
+    DropSubsampler,
+    MaxpoolSubsampler
+)
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--batch_size', type=int, default=32,
+                    help='mini-batch size')
+parser.add_argument('--n_frames', type=int, default=800,
+                    help='number of input frames per utterance')
+parser.add_argument('--n_units', type=int, default=512,
+                    help='dimension of input features')
+parser.add_argument('--factor', type=int, default=2,
+                    help='subsampling factor')
+parser.add_argument('--n_steps', type=int, default=20,
+                    help='number of measured steps')
+parser.add_argument('--backward', action='store_true',
+                    help='measure backward pass as well')
+parser.add_argument('--cuda', action='store_true',
+                    help='run on GPU')
+args = parser.parse_args()
+
+
+def benchmark(subsampler, xs, xlens):
+    """Measure elapsed time per step.
+
+    Args:
+        subsampler (nn.Module):
+        xs (FloatTensor): `[B, T, F]`
+        xlens (IntTensor): `[B]` (on CPU)
+    Returns:
+        sec_per_step (float):
+
+    """
+    def step():
+        xs_sub, _ = subsampler(xs, xlens)
+        if args.backward:
+            xs_sub.sum().backward()
+
+    step()  # warmup
+    if args.cuda:
+        torch.cuda.synchronize()
+    start = time.time()
+    for _ in range(args.n_steps):
+        step()
+    if args.cuda:
+        torch.cuda.synchronize()
+    return (time.time() - start) / args.n_steps
+
+
+def main():
+
+    device = torch.device('cuda' if args.cuda else 'cpu')
+    xs = torch.randn(args.batch_size, args.n_frames, args.n_units, device=device,
+                     requires_grad=args.backward)
+    xlens = torch.IntTensor([args.n_frames - i for i in range(args.batch_size)])
+
+    subsamplers = {
+        'concat': ConcatSubsampler(args.factor, args.n_units),
+        'drop': DropSubsampler(args.factor),
+        'max_pool': MaxpoolSubsampler(args.factor),
+        'conv1d': Conv1dSubsampler(args.factor, args.n_units),
+    }
+    print('%-10s %-12s %-12s' % ('type', 'msec/step', 'frames/sec'))
+    for name, subsampler in subsamplers.items():
+        sec_per_step = benchmark(subsampler.to(device), xs, xlens)
+        print('%-10s %-12.3f %-12.1f' % (
+            name, sec_per_step * 1000, args.batch_size * args.n_frames / sec_per_step))
+
+
+if __name__ == '__main__':
+    main()